@@ -0,0 +1,493 @@
+#!/usr/bin/env python3
+"""
+Delete package versions that a declarative retention policy no longer keeps.
+
+Every push to main and every scheduled build leaves a version tagged with the
+commit SHA behind, and each time latest moves on the previous manifest and its
+attestations stay in the package untagged. This script evaluates a policy over
+the full version listing, logs the resulting plan, and unless --dry-run is
+given deletes the versions the plan marks, concurrently.
+
+The policy is a JSON file holding an ordered list of rules:
+
+    {
+      "rules": [
+        {"action": "keep", "tags": "latest"},
+        {"action": "keep", "tags": "[0-9a-f]{40}", "newest": 30},
+        {"action": "delete", "tags": "[0-9a-f]{40}"},
+        {"action": "delete", "untagged": true, "older_than_days": 7}
+      ]
+    }
+
+Each version is decided by the first rule that matches it, and a version no
+rule matches is kept. A rule matches on:
+
+- tags: a regular expression that must match a whole tag. A keep rule matches
+  a version with any matching tag; a delete rule only matches a version whose
+  tags all match, so deleting it never removes a tag the rule does not name.
+- untagged: true to match only versions without tags.
+- older_than_days: to match only versions created more than that many days ago.
+- newest: to match only the newest that many versions matching the rule's
+  other conditions, wherever they sit in the listing.
+
+Attestations are never decided by the rules. An attestation pushed to the
+registry is stored under the OCI referrers tag of the image it describes,
+sha256-<hex>, with the attestation manifests themselves untagged. The tagged
+index follows its image: it is deleted with the image and kept otherwise. The
+untagged manifests a kept index lists are kept whatever the rules say, and
+the ones a deleted index lists are deleted with it.
+
+A kept image may itself be an index: a multi-platform image, or one buildx
+pushed with provenance or SBOM manifests. The platform and attestation
+manifests it lists are untagged, so the manifest of every kept tagged version
+is fetched and the untagged manifests an index lists are kept with it. If any
+index or manifest cannot be read, no untagged version is deleted.
+
+Exit codes:
+    0: Success (plan applied, or dry run)
+    1: Error (invalid policy, API failure, or a delete failed)
+"""
+
+import argparse
+import json
+import re
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Pattern, Set
+from urllib.error import HTTPError, URLError
+
+import cleanup_pr_image
+import github_actions_utils
+import oci_registry
+from cleanup_pr_image import VersionIndex
+from github_actions_utils import PackageVersion
+
+DAY_SECONDS = 24 * 60 * 60
+
+# OCI referrers tag fallback: the index of artifacts attached to sha256:<hex>
+REFERRERS_TAG = re.compile(r"sha256-([0-9a-f]{64})")
+
+RULE_KEYS = {"action", "tags", "untagged", "older_than_days", "newest"}
+
+# Media types of a manifest that lists other manifests
+INDEX_MEDIA_TYPES = (
+    "application/vnd.oci.image.index.v1+json",
+    "application/vnd.docker.distribution.manifest.list.v2+json",
+)
+
+
+def index_digests(manifest: bytes) -> Set[str]:
+    """
+    Read the digests an image index lists.
+    
+    Args:
+        manifest: Manifest as stored in the registry
+        
+    Returns:
+        Listed digests, or an empty set if the manifest is not an index
+        
+    Raises:
+        ValueError, KeyError, TypeError, AttributeError: If the manifest is malformed
+    """
+    document = json.loads(manifest)
+    # mediaType is optional in an OCI index, which is then told apart by its manifests
+    media_type = document.get("mediaType")
+    if media_type not in INDEX_MEDIA_TYPES and (media_type is not None or "manifests" not in document):
+        return set()
+    return {entry["digest"] for entry in document["manifests"] if "digest" in entry}
+
+
+def created_timestamp(version: PackageVersion) -> float:
+    """
+    Get the creation time of a version as a Unix timestamp.
+    
+    Args:
+        version: Package version
+        
+    Returns:
+        Seconds since the epoch, or 0 if the creation time is missing or unreadable
+    """
+    try:
+        created = datetime.fromisoformat(version.created_at.replace("Z", "+00:00"))
+    except ValueError:
+        return 0.0
+    if created.tzinfo is None:
+        created = created.replace(tzinfo=timezone.utc)
+    return created.timestamp()
+
+
+class RetentionRule:
+    """
+    One rule of a retention policy.
+    
+    Args:
+        action: 'keep' or 'delete'
+        tags: Regular expression matching whole tags, if the rule matches by tag
+        untagged: Whether the rule matches only versions without tags
+        older_than_days: Minimum age in days of the versions the rule matches, if any
+        newest: Number of newest matching versions the rule is limited to, if any
+        
+    Raises:
+        ValueError: If the rule is not valid
+    """
+    
+    def __init__(
+        self,
+        action: str,
+        tags: Optional[str] = None,
+        untagged: bool = False,
+        older_than_days: Optional[float] = None,
+        newest: Optional[int] = None,
+    ) -> None:
+        if action not in ("keep", "delete"):
+            raise ValueError(f"Rule action must be 'keep' or 'delete', not {action!r}")
+        if (tags is None) == (not untagged):
+            raise ValueError("A rule must give exactly one of 'tags' and 'untagged'")
+        if older_than_days is not None and older_than_days < 0:
+            raise ValueError("'older_than_days' must not be negative")
+        if newest is not None and newest < 0:
+            raise ValueError("'newest' must not be negative")
+        self.action = action
+        self.untagged = untagged
+        self.older_than_days = older_than_days
+        self.newest = newest
+        try:
+            self.tags: Optional[Pattern[str]] = re.compile(tags) if tags is not None else None
+        except re.error as e:
+            raise ValueError(f"Invalid tag pattern {tags!r}: {e}") from e
+    
+    @classmethod
+    def from_dict(cls, spec: Dict[str, Any]) -> "RetentionRule":
+        """
+        Build a rule from its JSON form.
+        
+        Args:
+            spec: Rule as written in the policy file
+            
+        Returns:
+            Rule
+            
+        Raises:
+            ValueError: If the rule has unknown keys or is not valid
+        """
+        unknown = set(spec) - RULE_KEYS
+        if unknown:
+            raise ValueError(f"Unknown rule keys: {', '.join(sorted(unknown))}")
+        if "action" not in spec:
+            raise ValueError("A rule must give an 'action'")
+        return cls(
+            spec["action"],
+            tags=spec.get("tags"),
+            untagged=bool(spec.get("untagged", False)),
+            older_than_days=spec.get("older_than_days"),
+            newest=spec.get("newest"),
+        )
+    
+    def describe(self) -> str:
+        """Short description of the rule for plan output."""
+        parts = [self.action]
+        if self.newest is not None:
+            parts.append(f"newest {self.newest}")
+        parts.append("untagged" if self.untagged else f"tagged {self.tags.pattern if self.tags else ''}")
+        if self.older_than_days is not None:
+            parts.append(f"older than {self.older_than_days:g} days")
+        return " ".join(parts)
+    
+    def conditions_match(self, version: PackageVersion, now: float) -> bool:
+        """
+        Check the rule's conditions other than 'newest' against a version.
+        
+        Args:
+            version: Package version
+            now: Current time as a Unix timestamp
+            
+        Returns:
+            True if the version meets every condition
+        """
+        if self.untagged:
+            if version.tags:
+                return False
+        else:
+            assert self.tags is not None
+            matches = [self.tags.fullmatch(tag) is not None for tag in version.tags]
+            if not version.tags or not (all(matches) if self.action == "delete" else any(matches)):
+                return False
+        if self.older_than_days is not None:
+            # A version of unknown age is never old enough
+            created = created_timestamp(version)
+            return bool(created) and now - created > self.older_than_days * DAY_SECONDS
+        return True
+
+
+class RetentionPlan:
+    """
+    The outcome of evaluating a policy: the versions to keep and delete, and why.
+    
+    Attributes:
+        keep: Version ID to the reason it is kept
+        delete: Version ID to the reason it is deleted
+    """
+    
+    def __init__(self) -> None:
+        self.keep: Dict[int, str] = {}
+        self.delete: Dict[int, str] = {}
+    
+    def decide(self, version_id: int, delete: bool, reason: str) -> None:
+        """Record or change the decision for a version."""
+        self.keep.pop(version_id, None)
+        self.delete.pop(version_id, None)
+        (self.delete if delete else self.keep)[version_id] = reason
+
+
+class RetentionPolicy:
+    """
+    Ordered retention rules, evaluated over a full version listing.
+    
+    Args:
+        rules: Rules, the first matching rule deciding each version
+        
+    Example:
+        >>> policy = RetentionPolicy.load('.github/retention-policy.json')
+        >>> plan = policy.evaluate(VersionIndex(versions), fetch_manifest)
+    """
+    
+    def __init__(self, rules: List[RetentionRule]) -> None:
+        self.rules = rules
+    
+    @classmethod
+    def load(cls, path: str) -> "RetentionPolicy":
+        """
+        Read a policy file.
+        
+        Args:
+            path: Path to the JSON policy
+            
+        Returns:
+            Policy
+            
+        Raises:
+            OSError: If the file cannot be read
+            ValueError: If the file is not a valid policy
+        """
+        with open(path, encoding="utf-8") as f:
+            spec = json.load(f)
+        if not isinstance(spec, dict) or not isinstance(spec.get("rules"), list):
+            raise ValueError("A policy must be an object with a 'rules' list")
+        rules = []
+        for number, rule in enumerate(spec["rules"], 1):
+            if not isinstance(rule, dict):
+                raise ValueError(f"Rule {number} must be an object")
+            try:
+                rules.append(RetentionRule.from_dict(rule))
+            except ValueError as e:
+                raise ValueError(f"Rule {number}: {e}") from e
+        return cls(rules)
+    
+    def _apply_rules(self, versions: List[PackageVersion], now: float, plan: RetentionPlan) -> None:
+        """Decide each version by the first rule that matches it."""
+        matching: List[Set[int]] = []
+        for rule in self.rules:
+            candidates = [version for version in versions if rule.conditions_match(version, now)]
+            if rule.newest is not None:
+                candidates.sort(key=created_timestamp, reverse=True)
+                candidates = candidates[:rule.newest]
+            matching.append({version.id for version in candidates})
+        for version in versions:
+            for number, (rule, ids) in enumerate(zip(self.rules, matching), 1):
+                if version.id in ids:
+                    plan.decide(version.id, rule.action == "delete", f"rule {number}: {rule.describe()}")
+                    break
+            else:
+                plan.decide(version.id, False, "no rule matches")
+    
+    def evaluate(
+        self, index: VersionIndex, fetch_manifest: Callable[[str], bytes], now: Optional[float] = None
+    ) -> RetentionPlan:
+        """
+        Work out which versions to keep and delete.
+        
+        Args:
+            index: Index over the full version listing
+            fetch_manifest: Returns the manifest stored under a tag or digest
+            now: Current time as a Unix timestamp (defaults to the clock)
+            
+        Returns:
+            Plan
+        """
+        now = time.time() if now is None else now
+        versions = list(index)
+        plan = RetentionPlan()
+        self._apply_rules(versions, now, plan)
+        
+        # Attestation indexes follow the image they describe
+        attached: Dict[int, Set[str]] = {}
+        unreadable: Optional[str] = None
+        for version in versions:
+            for tag in version.tags:
+                match = REFERRERS_TAG.fullmatch(tag)
+                if not match:
+                    continue
+                subject = index.find_digest(f"sha256:{match.group(1)}")
+                if subject is None:
+                    plan.decide(version.id, False, "attestations of an image not in the listing")
+                elif subject in plan.delete:
+                    plan.decide(version.id, True, f"attestations of deleted version {subject}")
+                else:
+                    plan.decide(version.id, False, f"attestations of kept version {subject}")
+                try:
+                    listed = json.loads(fetch_manifest(tag)).get("manifests", [])
+                    attached[version.id] = {entry["digest"] for entry in listed if "digest" in entry}
+                except (HTTPError, URLError, ValueError, KeyError, TypeError, AttributeError) as e:
+                    github_actions_utils.github_action_log("warning", f"Could not read attestations {tag}: {e}")
+                    unreadable = "attestations could not be read"
+        
+        # A kept image that is an index keeps the platform and attestation manifests it lists
+        listed_by: Dict[int, Set[str]] = {}
+        for version in versions:
+            if not version.tags or version.id in plan.delete or any(map(REFERRERS_TAG.fullmatch, version.tags)):
+                continue
+            reference = version.name or version.tags[0]
+            try:
+                listed_by[version.id] = index_digests(fetch_manifest(reference))
+            except (HTTPError, URLError, ValueError, KeyError, TypeError, AttributeError) as e:
+                github_actions_utils.github_action_log("warning", f"Could not read manifest {reference}: {e}")
+                unreadable = "an image manifest could not be read"
+        
+        # Attestation manifests follow their index, and are never deleted blind;
+        # deleted indexes go first so that a manifest a kept index also lists is kept
+        for index_id, digests in sorted(attached.items(), key=lambda item: item[0] not in plan.delete):
+            delete = index_id in plan.delete
+            for digest in digests:
+                version_id = index.find_digest(digest)
+                if version_id is None or index.version(version_id).tags:
+                    continue
+                if delete:
+                    plan.decide(version_id, True, f"listed by deleted attestations {index_id}")
+                else:
+                    plan.decide(version_id, False, f"listed by kept attestations {index_id}")
+        for index_id, digests in listed_by.items():
+            for digest in digests:
+                version_id = index.find_digest(digest)
+                if version_id is not None and not index.version(version_id).tags:
+                    plan.decide(version_id, False, f"listed by kept index {index_id}")
+        if unreadable:
+            for version_id in list(plan.delete):
+                if not index.version(version_id).tags:
+                    plan.decide(version_id, False, unreadable)
+        return plan
+
+
+def log_plan(index: VersionIndex, plan: RetentionPlan) -> None:
+    """
+    Log each planned deletion and a summary of the plan.
+    
+    Args:
+        index: Index the plan was made from
+        plan: Plan to log
+    """
+    for version_id, reason in sorted(plan.delete.items()):
+        version = index.version(version_id)
+        label = ", ".join(version.tags) or version.name
+        github_actions_utils.log_info(f"Delete version {version_id} ({label}, {version.created_at}): {reason}")
+    github_actions_utils.log_info(f"Retention plan: {len(plan.keep)} kept, {len(plan.delete)} to delete")
+
+
+def parse_args() -> argparse.Namespace:
+    """
+    Parse command line arguments.
+    
+    Returns:
+        Parsed arguments
+    """
+    parser = argparse.ArgumentParser(
+        description="Delete package versions that a retention policy no longer keeps"
+    )
+    parser.add_argument(
+        "--policy",
+        required=True,
+        help="Path to the JSON retention policy"
+    )
+    parser.add_argument(
+        "--repository",
+        required=True,
+        help="Repository in format 'owner/repo'"
+    )
+    parser.add_argument(
+        "--owner",
+        required=True,
+        help="Repository owner"
+    )
+    parser.add_argument(
+        "--token",
+        required=True,
+        help="GitHub token with packages:write permission"
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Log the plan without deleting anything"
+    )
+    parser.add_argument(
+        "--max-workers",
+        type=int,
+        default=cleanup_pr_image.DEFAULT_MAX_WORKERS,
+        help=f"Maximum concurrent deletes (default: {cleanup_pr_image.DEFAULT_MAX_WORKERS})"
+    )
+    
+    args = parser.parse_args()
+    if args.max_workers < 1:
+        parser.error("--max-workers must be at least 1")
+    return args
+
+
+def main() -> None:
+    """Main entry point for the retention script."""
+    args = parse_args()
+    package_name = args.repository.split("/")[-1].lower()
+    
+    try:
+        policy = RetentionPolicy.load(args.policy)
+    except (OSError, ValueError) as e:
+        github_actions_utils.github_action_log("error", f"Invalid retention policy {args.policy}: {e}")
+        sys.exit(1)
+    
+    try:
+        versions = cleanup_pr_image.get_package_versions(args.owner, package_name, args.token)
+    except (HTTPError, URLError) as e:
+        github_actions_utils.github_action_log("error", f"Failed to fetch package versions: {e}")
+        sys.exit(1)
+    if versions is None:
+        github_actions_utils.log_info("No package found, nothing to do")
+        sys.exit(0)
+    
+    registry = oci_registry.RegistryClient(
+        args.repository, args.owner, args.token, scheduler=github_actions_utils.RequestScheduler()
+    )
+    try:
+        index = VersionIndex(versions)
+        plan = policy.evaluate(index, lambda reference: registry.get_manifest(reference)[1])
+    except (HTTPError, URLError) as e:
+        github_actions_utils.github_action_log("error", f"Failed to fetch package versions: {e}")
+        sys.exit(1)
+    finally:
+        registry.close()
+    
+    log_plan(index, plan)
+    if args.dry_run:
+        github_actions_utils.log_info("Dry run: nothing deleted")
+        sys.exit(0)
+    
+    deleted, failed = cleanup_pr_image.delete_package_versions(
+        args.owner, package_name, plan.delete, args.token, args.max_workers
+    )
+    for version_id in sorted(failed):
+        github_actions_utils.github_action_log("error", f"Failed to delete version {version_id}")
+    github_actions_utils.log_info(f"Retention summary: {len(deleted)} deleted, {len(failed)} failed")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    github_actions_utils.tracer.report_at_exit()
+    github_actions_utils.metrics.report_at_exit()
+    github_actions_utils.run_profiled(main)
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Builders for small `docker save` archives.
+
+Shared by the tests and benchmarks that read or push image archives, so they
+all build the same layouts: the legacy '<id>/layer.tar' layout, and the
+digest-named blob layout Docker 25 and later save.
+"""
+
+import hashlib
+import io
+import json
+import tarfile
+from typing import Dict, List
+
+
+def sha256(data: bytes) -> str:
+    """Digest of some bytes in 'sha256:<hex>' form."""
+    return "sha256:" + hashlib.sha256(data).hexdigest()
+
+
+def write_members(path: str, members: Dict[str, bytes]) -> None:
+    """Write an archive holding the given name to bytes mapping."""
+    with tarfile.open(path, "w") as archive:
+        for name, data in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+
+
+def image_config(layers: List[bytes]) -> bytes:
+    """Config bytes for an image made of the given layers."""
+    return json.dumps({
+        "architecture": "amd64",
+        "os": "linux",
+        "rootfs": {"type": "layers", "diff_ids": [sha256(layer) for layer in layers]},
+    }).encode()
+
+
+def write_archive(path: str, layers: List[bytes], oci_layout: bool = False) -> bytes:
+    """
+    Write a single-image `docker save` archive with only manifest.json.
+    
+    Args:
+        path: Archive path
+        layers: Layer contents, base layer first
+        oci_layout: Name blobs by digest as Docker 25 and later do, rather
+            than using the legacy '<id>/layer.tar' layout
+            
+    Returns:
+        Config bytes
+    """
+    config = image_config(layers)
+    if oci_layout:
+        config_name = f"blobs/sha256/{sha256(config)[7:]}"
+        layer_names = [f"blobs/sha256/{sha256(layer)[7:]}" for layer in layers]
+    else:
+        config_name = f"{sha256(config)[7:]}.json"
+        layer_names = [f"{index}/layer.tar" for index in range(len(layers))]
+    members = {config_name: config, **dict(zip(layer_names, layers))}
+    members["manifest.json"] = json.dumps([{
+        "Config": config_name,
+        "RepoTags": ["candidate_image:latest"],
+        "Layers": layer_names,
+    }]).encode()
+    write_members(path, members)
+    return config
@@ -0,0 +1,479 @@
+#!/usr/bin/env python3
+"""
+Asyncio client for the GitHub Packages API.
+
+cleanup_pr_image.py makes its requests through the blocking GitHubAPIClient
+and overlaps them with a thread per request in flight. This module offers
+the same package version operations as coroutines, so a bulk operation over
+thousands of versions overlaps its network waits on a single thread.
+
+It uses the standard library only: HTTP/1.1 is spoken directly over
+asyncio.open_connection, with TLS for https origins, and connections are
+kept alive and reused between requests. A semaphore bounds the number of
+requests in flight. Requests are paced and retried by the same
+RequestScheduler as the blocking client, and take their timeouts from the
+shared deadline; bulk deletes still outstanding when it runs out are
+cancelled.
+
+Example:
+    >>> async def clean(owner, package_name, token):
+    ...     async with AsyncGitHubAPIClient(token) as client:
+    ...         versions = await client.list_versions(owner, package_name)
+    ...         return await client.delete_versions(owner, package_name, [v.id for v in versions], timeout=60)
+    >>> deleted, failed = asyncio.run(clean('owner', 'repo', 'gh_token_123'))
+"""
+
+import asyncio
+import email.parser
+import http.client
+import io
+import json
+import ssl
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlsplit
+
+import github_actions_utils
+from github_actions_utils import (
+    VERSION_DELETES, VERSIONS_PER_PAGE, APIResponse, PackageVersion, package_versions_path, parse_next_link
+)
+
+# Requests in flight at once; the same bound as the threaded delete pool
+DEFAULT_MAX_CONCURRENCY = 8
+
+# Longest status or header line accepted from the server
+MAX_LINE_BYTES = 64 * 1024
+
+# Most header lines accepted in one response
+MAX_HEADERS = 100
+
+# Errors meaning a kept-alive connection was closed by the server while idle
+STALE_CONNECTION_ERRORS = (ConnectionResetError, BrokenPipeError)
+
+# Reader and writer of one open connection
+Connection = Tuple[asyncio.StreamReader, asyncio.StreamWriter]
+
+
+class AsyncGitHubAPIClient:
+    """
+    Keep-alive asyncio client for the GitHub REST API.
+    
+    At most max_concurrency requests are in flight at once; further requests
+    wait for a slot without holding a connection or a thread. Idle
+    connections are reused, so a bulk operation opens at most
+    max_concurrency connections. Requests carry the authentication and API
+    version headers, and errors are raised as urllib's HTTPError and
+    URLError, as GitHubAPIClient raises them.
+    
+    With a request scheduler, requests are paced by the rate limit and
+    transient failures of idempotent requests are retried, exactly as for
+    GitHubAPIClient; a request waiting to be retried gives up its slot.
+    Each attempt's timeout is drawn from the shared deadline, and an attempt
+    that would start, or is still running, when it runs out raises
+    DeadlineExceeded naming the request.
+    
+    Use as an async context manager, or call close() when done. A client
+    belongs to the event loop it is first used on.
+    
+    Args:
+        token: GitHub API token for authentication
+        base_url: API origin (overridable for local testing)
+        max_concurrency: Maximum number of requests in flight at once
+        timeout: Seconds allowed for each attempt at a request
+        context: SSL context for HTTPS connections (defaults to system trust)
+        scheduler: Scheduler pacing and retrying requests, if any
+        
+    Example:
+        >>> async with AsyncGitHubAPIClient('gh_token_123') as client:
+        ...     version = await client.get_version('owner', 'repo', 123456)
+    """
+    
+    def __init__(
+        self,
+        token: str,
+        base_url: str = github_actions_utils.GITHUB_API_URL,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        timeout: float = 30.0,
+        context: Optional[ssl.SSLContext] = None,
+        scheduler: Optional[github_actions_utils.RequestScheduler] = None,
+    ) -> None:
+        parts = urlsplit(base_url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise ValueError(f"Unsupported base URL: {base_url}")
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == "https" else 80)
+        self.origin = f"{parts.scheme}://{parts.netloc}"
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.scheduler = scheduler
+        self.connections = 0
+        self._ssl = (context or ssl.create_default_context()) if parts.scheme == "https" else None
+        self._headers = github_actions_utils.github_api_headers(token)
+        self._headers["User-Agent"] = github_actions_utils.USER_AGENT
+        self._headers["Host"] = parts.netloc
+        self._idle: List[Connection] = []
+        # Created on first use, inside the event loop that runs the requests
+        self._slots: Optional[asyncio.Semaphore] = None
+    
+    async def __aenter__(self) -> "AsyncGitHubAPIClient":
+        return self
+    
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.close()
+    
+    def _path(self, url: str) -> str:
+        """
+        Convert a path or absolute URL into a request path on the API origin.
+        
+        Raises:
+            URLError: If an absolute URL points at another origin, so the
+                token is never sent to a host named in a response header
+        """
+        if url.startswith("/"):
+            return url
+        if not url.startswith(f"{self.origin}/"):
+            raise URLError(f"Refusing to send GitHub API request to {url}")
+        return url[len(self.origin):]
+    
+    async def _connect(self) -> Connection:
+        """Open a new connection to the origin."""
+        connection = await asyncio.open_connection(
+            self.host, self.port, ssl=self._ssl, server_hostname=self.host if self._ssl else None,
+            limit=MAX_LINE_BYTES,
+        )
+        self.connections += 1
+        return connection
+    
+    @staticmethod
+    def _close(connection: Connection) -> None:
+        """Close a connection without waiting for the close to complete."""
+        connection[1].close()
+    
+    async def _exchange(
+        self, connection: Connection, method: str, path: str, body: Optional[bytes], headers: Dict[str, str]
+    ) -> Tuple[APIResponse, bool]:
+        """
+        Send one request on a connection and read the whole response.
+        
+        Returns:
+            Tuple of the response and whether the connection can be reused
+            
+        Raises:
+            ConnectionResetError: If the server closed the connection before responding
+            OSError: If the request cannot be sent or the response cannot be read
+            asyncio.IncompleteReadError: If the connection closes part way through the body
+            ValueError: If the server sends an invalid response
+        """
+        reader, writer = connection
+        lines = [f"{method} {path} HTTP/1.1"] + [f"{name}: {value}" for name, value in headers.items()]
+        if body is not None:
+            lines.append(f"Content-Length: {len(body)}")
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + (body or b""))
+        await writer.drain()
+        
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError("Server closed the connection before responding")
+        version, _, rest = status_line.decode("latin-1").partition(" ")
+        if not version.startswith("HTTP/1.") or not rest[:3].isdigit():
+            raise ValueError(f"Invalid status line: {status_line!r}")
+        status = int(rest[:3])
+        
+        header_lines = []
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            header_lines.append(line)
+            if len(header_lines) > MAX_HEADERS:
+                raise ValueError(f"More than {MAX_HEADERS} response headers")
+        response_headers = email.parser.BytesParser(_class=http.client.HTTPMessage).parsebytes(b"".join(header_lines))
+        
+        reusable = version != "HTTP/1.0" and response_headers.get("Connection", "").lower() != "close"
+        if method == "HEAD" or status in (204, 304) or 100 <= status < 200:
+            data = b""
+        elif response_headers.get("Transfer-Encoding", "").lower() == "chunked":
+            data = await self._read_chunked(reader)
+        elif response_headers.get("Content-Length") is not None:
+            data = await reader.readexactly(int(response_headers["Content-Length"]))
+        else:
+            # Without a length the body runs to the end of the connection
+            data = await reader.read()
+            reusable = False
+        return APIResponse(status, response_headers, data), reusable
+    
+    @staticmethod
+    async def _read_chunked(reader: asyncio.StreamReader) -> bytes:
+        """Read a body sent with chunked transfer coding."""
+        chunks: List[bytes] = []
+        while True:
+            size_line = await reader.readline()
+            size = int(size_line.split(b";", 1)[0].strip(), 16)
+            if size == 0:
+                # Skip any trailer fields up to the blank line ending the body
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                return b"".join(chunks)
+            chunks.append(await reader.readexactly(size))
+            await reader.readexactly(2)
+    
+    async def _send(self, method: str, path: str, body: Optional[bytes], headers: Dict[str, str]) -> APIResponse:
+        """
+        Send a request on a pooled connection.
+        
+        A request on a reused connection that the server closed while it sat
+        idle is retried once on a new connection. A connection is only put
+        back in the pool after a complete exchange, so a request cancelled
+        part way through never leaves a half-read response behind.
+        """
+        start = asyncio.get_running_loop().time()
+        if self._idle:
+            connection, reused = self._idle.pop(), True
+        else:
+            connection, reused = await self._connect(), False
+        try:
+            try:
+                response, reusable = await self._exchange(connection, method, path, body, headers)
+            except STALE_CONNECTION_ERRORS:
+                if not reused:
+                    raise
+                self._close(connection)
+                connection = await self._connect()
+                response, reusable = await self._exchange(connection, method, path, body, headers)
+        except BaseException:
+            self._close(connection)
+            raise
+        if github_actions_utils.metrics.enabled:
+            github_actions_utils.HTTP_REQUEST_SECONDS.observe(
+                asyncio.get_running_loop().time() - start, host=self.host, method=method,
+                endpoint=github_actions_utils.endpoint_label(path), status=response.status,
+            )
+        if reusable:
+            self._idle.append(connection)
+        else:
+            self._close(connection)
+        return response
+    
+    async def request(
+        self, method: str, url: str, body: Any = None, allowed_statuses: Tuple[int, ...] = ()
+    ) -> APIResponse:
+        """
+        Send an API request.
+        
+        Args:
+            method: HTTP method
+            url: Path on the API origin or absolute URL on the same origin
+            body: Value to send as a JSON request body, if any
+            allowed_statuses: Error statuses to return instead of raising
+            
+        Returns:
+            Response with a 2xx or 3xx status, or one of allowed_statuses
+            
+        Raises:
+            HTTPError: If the API returns any other 4xx or 5xx status
+            URLError: If the API cannot be reached, does not answer within the
+                timeout, or the URL is on another origin
+            DeadlineExceeded: If the time budget is used up
+        """
+        path = self._path(url)
+        headers = dict(self._headers)
+        data = None
+        if body is not None:
+            data = json.dumps(body).encode()
+            headers["Content-Type"] = "application/json"
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+        slots = self._slots
+        phase = f"{method} {github_actions_utils.endpoint_label(path)}"
+        
+        async def send() -> APIResponse:
+            async with slots:
+                # Drawn once a slot is free, so time spent queued comes off the deadline
+                timeout = github_actions_utils.deadline.timeout(phase, self.timeout)
+                try:
+                    return await asyncio.wait_for(self._send(method, path, data, headers), timeout)
+                except github_actions_utils.DeadlineExceeded:
+                    raise
+                except asyncio.TimeoutError as e:
+                    if github_actions_utils.deadline.used_up():
+                        raise github_actions_utils.deadline.exceeded(phase, timeout) from e
+                    raise URLError(e) from e
+                except (OSError, asyncio.IncompleteReadError, ValueError) as e:
+                    raise URLError(e) from e
+        
+        response = await (self.scheduler.call_async(method, send) if self.scheduler else send())
+        if response.status >= 400 and response.status not in allowed_statuses:
+            raise HTTPError(
+                f"{self.origin}{path}",
+                response.status,
+                http.client.responses.get(response.status, ""),
+                response.headers,
+                io.BytesIO(response.body),
+            )
+        return response
+    
+    async def list_versions(self, owner: str, package_name: str) -> Optional[List[PackageVersion]]:
+        """
+        List every version of a package, following the Link header across pages.
+        
+        Args:
+            owner: Package owner
+            package_name: Package name
+            
+        Returns:
+            Package versions, or None if the package does not exist
+            
+        Raises:
+            HTTPError: If the API returns an error status other than 404 for the first page
+            URLError: If the API cannot be reached
+        """
+        url: Optional[str] = f"{package_versions_path(owner, package_name)}?per_page={VERSIONS_PER_PAGE}"
+        versions: List[PackageVersion] = []
+        first_page = True
+        while url is not None:
+            try:
+                response = await self.request("GET", url)
+            except HTTPError as e:
+                if e.code == 404 and first_page:
+                    return None
+                raise
+            first_page = False
+            versions.extend(
+                PackageVersion.from_api(version) for version in response.json()
+                if isinstance(version, dict) and version.get("id") is not None
+            )
+            url = parse_next_link(response.headers.get("Link"))
+        return versions
+    
+    async def get_version(self, owner: str, package_name: str, version_id: int) -> PackageVersion:
+        """
+        Fetch one version of a package.
+        
+        Args:
+            owner: Package owner
+            package_name: Package name
+            version_id: Version ID
+            
+        Returns:
+            The package version
+            
+        Raises:
+            HTTPError: If the API returns an error status, such as 404 for an unknown version
+            URLError: If the API cannot be reached
+        """
+        response = await self.request("GET", f"{package_versions_path(owner, package_name)}/{version_id}")
+        return PackageVersion.from_api(response.json())
+    
+    async def delete_version(self, owner: str, package_name: str, version_id: int) -> bool:
+        """
+        Delete one version of a package, logging any failure.
+        
+        As with cleanup_pr_image.delete_package_version, a retried DELETE
+        answered with 404 counts as deleted, since the first attempt may have
+        gone through.
+        
+        Args:
+            owner: Package owner
+            package_name: Package name
+            version_id: Version ID
+            
+        Returns:
+            True if the version was deleted, False otherwise
+        """
+        try:
+            response = await self.request(
+                "DELETE", f"{package_versions_path(owner, package_name)}/{version_id}", allowed_statuses=(404,)
+            )
+        except HTTPError as e:
+            VERSION_DELETES.inc(result=f"http_{e.code}")
+            github_actions_utils.github_action_log(
+                "error", f"Failed to delete package version {version_id} (HTTP {e.code}): {e.read().decode()}"
+            )
+            return False
+        except URLError as e:
+            VERSION_DELETES.inc(result="network_error")
+            github_actions_utils.github_action_log(
+                "error", f"Network error deleting package version {version_id}: {e}"
+            )
+            return False
+        VERSION_DELETES.inc(result=f"http_{response.status}")
+        if response.status == 404 and response.attempts == 1:
+            github_actions_utils.github_action_log(
+                "error", f"Failed to delete package version {version_id} (HTTP 404): {response.body.decode()}"
+            )
+            return False
+        if response.status == 404:
+            github_actions_utils.log_info(
+                f"Version {version_id} was already gone when the DELETE was retried, "
+                "so an earlier attempt deleted it"
+            )
+        elif response.status != 204:
+            github_actions_utils.github_action_log(
+                "error", f"Unexpected response code {response.status} when deleting version {version_id}"
+            )
+            return False
+        return True
+    
+    async def delete_versions(
+        self, owner: str, package_name: str, version_ids: Iterable[int], timeout: Optional[float] = None
+    ) -> Tuple[List[int], List[int]]:
+        """
+        Delete versions of a package concurrently, within an optional deadline.
+        
+        Every delete is started at once and waits for one of the client's
+        max_concurrency slots. When the timeout expires, the deletes still
+        waiting or in flight are cancelled and reported as failed: a delete
+        cancelled in flight may or may not have reached GitHub. Without a
+        timeout, the deletes get what is left of the shared deadline.
+        
+        Args:
+            owner: Package owner
+            package_name: Package name
+            version_ids: Version IDs to delete
+            timeout: Seconds allowed for all the deletes, or None for the shared deadline
+            
+        Returns:
+            Tuple of (deleted, failed) version ID lists
+            
+        Raises:
+            DeadlineExceeded: If a delete ran out of the shared time budget
+        """
+        tasks = {
+            asyncio.ensure_future(self.delete_version(owner, package_name, vid)): vid for vid in version_ids
+        }
+        if not tasks:
+            return [], []
+        if timeout is None and github_actions_utils.deadline.budget is not None:
+            timeout = max(0.0, github_actions_utils.deadline.remaining())
+        done, pending = await asyncio.wait(tasks, timeout=timeout)
+        if pending:
+            for task in pending:
+                task.cancel()
+            # Let the cancelled requests close their connections before returning
+            await asyncio.wait(pending)
+            github_actions_utils.github_action_log(
+                "warning", f"Deadline of {timeout:.1f}s reached, cancelled {len(pending)} unfinished deletes"
+            )
+        for task in done:
+            error = None if task.cancelled() else task.exception()
+            if isinstance(error, github_actions_utils.DeadlineExceeded):
+                raise error
+        deleted: List[int] = []
+        failed: List[int] = []
+        for task, vid in tasks.items():
+            succeeded = task in done and not task.cancelled() and task.exception() is None and task.result()
+            (deleted if succeeded else failed).append(vid)
+        return deleted, failed
+    
+    async def close(self) -> None:
+        """Close all idle connections."""
+        idle, self._idle = self._idle, []
+        for connection in idle:
+            self._close(connection)
+        for _, writer in idle:
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
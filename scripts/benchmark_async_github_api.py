@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Benchmark the asyncio GitHub Packages client against the threaded delete pool.
+
+Runs a local HTTPS stand-in server, in its own process so that it does not
+compete with the clients for the interpreter lock, which answers every
+DELETE after a fixed delay standing in for the GitHub API's latency. Deletes
+the same batch of versions the way cleanup_pr_image.delete_package_versions
+does (a pooled GitHubAPIClient driven by a thread per request in flight) and
+through AsyncGitHubAPIClient on a single thread, at each concurrency level.
+
+Usage:
+    python3 scripts/benchmark_async_github_api.py [--versions N] [--latency S] [--concurrency N ...]
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import ssl
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.connection import Connection
+from typing import List, Tuple
+
+import github_actions_utils
+from async_github_api import AsyncGitHubAPIClient
+from stand_in_server import StandInRequest, StandInResponse, StandInServer
+
+VERSIONS_PATH = "/users/owner/packages/container/repo/versions"
+
+
+def serve(latency: float, conn: Connection) -> None:
+    """Run the stand-in server until the parent process says it is done."""
+    def handler(request: StandInRequest) -> StandInResponse:
+        time.sleep(latency)
+        return 204, {}, b""
+    
+    with StandInServer(handler, tls=True) as server:
+        conn.send((server.base_url, server.certfile))
+        conn.recv()
+
+
+def run_threaded(
+    base_url: str, context: ssl.SSLContext, version_ids: List[int], workers: int
+) -> Tuple[float, int]:
+    """Time the deletes through a pooled client and a thread pool."""
+    client = github_actions_utils.GitHubAPIClient("token", base_url, pool_size=workers, context=context)
+    start = time.perf_counter()
+    peak_threads = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(client.request, "DELETE", f"{VERSIONS_PATH}/{vid}") for vid in version_ids]
+        peak_threads = max(peak_threads, threading.active_count())
+        for future in futures:
+            future.result()
+            peak_threads = max(peak_threads, threading.active_count())
+    elapsed = time.perf_counter() - start
+    client.close()
+    return elapsed, peak_threads
+
+
+def run_async(
+    base_url: str, context: ssl.SSLContext, version_ids: List[int], concurrency: int
+) -> Tuple[float, int]:
+    """Time the deletes through the asyncio client."""
+    async def main() -> Tuple[float, int]:
+        async with AsyncGitHubAPIClient(
+            "token", base_url, max_concurrency=concurrency, context=context
+        ) as client:
+            start = time.perf_counter()
+            deleted, failed = await client.delete_versions("owner", "repo", version_ids)
+            elapsed = time.perf_counter() - start
+            assert not failed and len(deleted) == len(version_ids)
+            return elapsed, threading.active_count()
+    return asyncio.run(main())
+
+
+def main() -> None:
+    """Run the benchmark and print a comparison."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--versions", type=int, default=1000, help="Versions deleted per run")
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds the server takes per request")
+    parser.add_argument(
+        "--concurrency", type=int, nargs="+", default=[8, 32, 128], help="Requests in flight at once"
+    )
+    args = parser.parse_args()
+    
+    parent_conn, child_conn = multiprocessing.Pipe()
+    server = multiprocessing.Process(target=serve, args=(args.latency, child_conn), daemon=True)
+    server.start()
+    base_url, certfile = parent_conn.recv()
+    context = ssl.create_default_context(cafile=certfile)
+    version_ids = list(range(args.versions))
+    
+    print(f"{args.versions} deletes, {args.latency * 1000:.0f} ms server latency")
+    print(f"{'approach':<10} {'in flight':>10} {'threads':>8} {'seconds':>8} {'req/s':>8}")
+    try:
+        for concurrency in args.concurrency:
+            for name, run in [("threaded", run_threaded), ("asyncio", run_async)]:
+                seconds, threads = run(base_url, context, version_ids, concurrency)
+                print(f"{name:<10} {concurrency:>10} {threads:>8} {seconds:>8.3f} {args.versions / seconds:>8.0f}")
+    finally:
+        parent_conn.send(None)
+        server.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Benchmark the keep-alive GitHub API client against one urlopen per request.
+
+Runs a local HTTPS stand-in server with a self-signed certificate and times the
+same sequence of list and delete requests made the way cleanup_pr_image.py used
+to make them (a new urllib request, and so a new TCP connection and TLS
+handshake, per call) and through GitHubAPIClient's connection pool.
+
+Usage:
+    python3 scripts/benchmark_github_api_client.py [--requests N]
+"""
+
+import argparse
+import json
+import time
+from typing import List, Tuple
+from urllib import request as urllib_request
+
+import github_actions_utils
+from stand_in_server import StandInRequest, StandInResponse, StandInServer
+
+VERSIONS_PAGE = json.dumps(
+    [{"id": i, "metadata": {"container": {"tags": [f"pr-{i}"]}}} for i in range(100)]
+).encode()
+
+
+def handler(request: StandInRequest) -> StandInResponse:
+    """Serve a page of versions for GET and accept every DELETE."""
+    if request.method == "DELETE":
+        return 204, {}, b""
+    return 200, {"Content-Type": "application/json"}, VERSIONS_PAGE
+
+
+def paths(count: int) -> List[Tuple[str, str]]:
+    """Build a list-then-delete sequence of requests."""
+    return [("GET", "/versions")] + [("DELETE", f"/versions/{i}") for i in range(count - 1)]
+
+
+def run_urlopen(server: StandInServer, count: int) -> float:
+    """Time the requests with a new urllib connection per call."""
+    start = time.perf_counter()
+    for method, path in paths(count):
+        req = urllib_request.Request(f"{server.base_url}{path}", method=method)
+        github_actions_utils.add_github_api_headers(req, "token")
+        with urllib_request.urlopen(req, timeout=30, context=server.ssl_context) as response:
+            response.read()
+    return time.perf_counter() - start
+
+
+def run_client(server: StandInServer, count: int) -> float:
+    """Time the requests through the pooled client."""
+    client = github_actions_utils.GitHubAPIClient(
+        "token", server.base_url, context=server.ssl_context
+    )
+    start = time.perf_counter()
+    for method, path in paths(count):
+        client.request(method, path)
+    elapsed = time.perf_counter() - start
+    client.close()
+    return elapsed
+
+
+def main() -> None:
+    """Run the benchmark and print a comparison."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=200, help="Requests per run")
+    args = parser.parse_args()
+    
+    with StandInServer(handler, tls=True) as server:
+        urlopen_seconds = run_urlopen(server, args.requests)
+        urlopen_connections = server.connections
+        client_seconds = run_client(server, args.requests)
+        client_connections = server.connections - urlopen_connections
+    
+    print(f"{'approach':<20} {'seconds':>8} {'req/s':>8} {'connections':>12}")
+    for name, seconds, connections in [
+        ("urlopen per call", urlopen_seconds, urlopen_connections),
+        ("pooled client", client_seconds, client_connections),
+    ]:
+        print(f"{name:<20} {seconds:>8.3f} {args.requests / seconds:>8.0f} {connections:>12}")
+    print(f"speed-up: {urlopen_seconds / client_seconds:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Benchmark parallel chunked blob uploads against serial monolithic uploads.
+
+Builds a `docker save` archive with several random layers, then pushes it to a
+local registry stand-in that limits each request to a fixed bandwidth and drops
+the upload in flight with 503 once every so many MiB received. The same archive is pushed one blob at a
+time in single requests, where a failure resends the whole blob, and by a pool
+of workers in chunks, where a failure resends one chunk.
+
+Usage:
+    python3 scripts/benchmark_registry_push.py [--layers N] [--layer-mb MB] [--fail-every-mb MB]
+"""
+
+import argparse
+import os
+import tempfile
+import threading
+import time
+from typing import List, Tuple
+
+import github_actions_utils
+import oci_registry
+import registry_push
+from archive_fixtures import write_archive
+from registry_stand_in import StandInRegistry
+from stand_in_server import Handler, StandInRequest, StandInResponse, StandInServer
+
+MIB = 1024 * 1024
+
+
+def flaky_link(handler: Handler, bandwidth: float, fail_every: int) -> Handler:
+    """
+    Wrap a handler with a per-request bandwidth limit and injected failures.
+    
+    Args:
+        handler: Handler to wrap
+        bandwidth: Bytes per second each request body is received at
+        fail_every: Fail the request during which each further fail_every bytes
+            are received, so failures are spread over bytes rather than requests
+    """
+    lock = threading.Lock()
+    received = [0]
+    
+    def wrapped(request: StandInRequest) -> StandInResponse:
+        if not request.body:
+            return handler(request)
+        time.sleep(len(request.body) / bandwidth)
+        with lock:
+            before = received[0]
+            received[0] += len(request.body)
+            fail = fail_every > 0 and received[0] // fail_every > before // fail_every
+        if fail:
+            return 503, {}, b""
+        return handler(request)
+    
+    return wrapped
+
+
+def run(
+    image_tar: str, bandwidth: float, fail_every: int, workers: int, chunk_size: int
+) -> Tuple[float, int, int]:
+    """
+    Push the archive to a fresh stand-in.
+    
+    Returns:
+        Seconds taken, bytes sent and requests made
+    """
+    registry = StandInRegistry()
+    with StandInServer(flaky_link(registry.handle, bandwidth, fail_every)) as server:
+        scheduler = github_actions_utils.RequestScheduler(base_delay=0.05, max_delay=0.5)
+        client = oci_registry.RegistryClient("owner/repo", "user", "secret", server.base_url, scheduler=scheduler)
+        start = time.perf_counter()
+        registry_push.push_archive(client, image_tar, "latest", chunk_size, workers)
+        elapsed = time.perf_counter() - start
+        client.close()
+    return elapsed, sum(len(r.body) for r in server.requests), len(server.requests)
+
+
+def main() -> None:
+    """Run the benchmark and print a comparison."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--layers", type=int, default=4, help="Layers in the image")
+    parser.add_argument("--layer-mb", type=int, default=32, help="Size of each layer in MiB")
+    parser.add_argument("--bandwidth-mb", type=float, default=64, help="Bandwidth of each request in MiB/s")
+    parser.add_argument("--fail-every-mb", type=int, default=40, help="MiB received between failures (0 for none)")
+    parser.add_argument("--chunk-mb", type=int, default=4, help="Chunk size of the chunked uploads in MiB")
+    parser.add_argument("--workers", type=int, default=registry_push.DEFAULT_UPLOAD_WORKERS, help="Upload workers")
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as directory:
+        image_tar = os.path.join(directory, "image.tar")
+        write_archive(image_tar, [os.urandom(args.layer_mb * MIB) for _ in range(args.layers)])
+        bandwidth = args.bandwidth_mb * MIB
+        fail_every = args.fail_every_mb * MIB
+        results: List[Tuple[str, float, int, int]] = [
+            ("serial, monolithic", *run(image_tar, bandwidth, fail_every, 1, 1 << 62)),
+            ("parallel, chunked", *run(image_tar, bandwidth, fail_every, args.workers, args.chunk_mb * MIB)),
+        ]
+    
+    image_mb = args.layers * args.layer_mb
+    print(f"{image_mb} MiB image, {args.bandwidth_mb:g} MiB/s per request, a failure every {args.fail_every_mb} MiB")
+    print(f"{'approach':<20} {'seconds':>8} {'MiB sent':>9} {'requests':>9}")
+    for name, seconds, sent, requests in results:
+        print(f"{name:<20} {seconds:>8.2f} {sent / MIB:>9.0f} {requests:>9}")
+    print(f"speed-up: {results[0][1] / results[1][1]:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
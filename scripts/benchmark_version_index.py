@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Benchmark VersionIndex lookups against scanning the listing for every tag.
+
+Builds a listing of package versions shaped like a busy repository's (PR
+images, commit SHA tags, latest and untagged layers), then looks up a batch
+of tags the way find_version_id_by_tag used to, with one scan of the listing
+per tag, and through a VersionIndex built once from the same listing. Also
+times the pr-* prefix query the sweep makes.
+
+Usage:
+    python3 scripts/benchmark_version_index.py [--versions N] [--lookups N]
+"""
+
+import argparse
+import random
+import time
+from typing import Any, Dict, List, Optional
+
+import cleanup_pr_image
+import github_actions_utils
+
+
+def api_versions(count: int) -> List[Dict[str, Any]]:
+    """Build a listing as returned by the GitHub API."""
+    versions: List[Dict[str, Any]] = []
+    for i in range(count):
+        if i % 4 == 3:
+            tags: List[str] = []
+        elif i % 4 == 2:
+            tags = [f"{i:040x}"]
+        else:
+            tags = [f"pr-{i}"]
+        if i == 0:
+            tags.append("latest")
+        versions.append({
+            "id": i,
+            "name": f"sha256:{i:064x}",
+            "created_at": "2024-05-01T12:00:00Z",
+            "metadata": {"package_type": "container", "container": {"tags": tags}},
+        })
+    return versions
+
+
+def scan(versions: List[Dict[str, Any]], tag: str) -> Optional[int]:
+    """Find a tag the old way: a scan with chained lookups per version."""
+    for version in versions:
+        if tag in version.get("metadata", {}).get("container", {}).get("tags", []):
+            return int(version["id"])
+    return None
+
+
+def main() -> None:
+    """Run the benchmark and print a comparison."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--versions", type=int, default=50_000, help="Versions in the listing")
+    parser.add_argument("--lookups", type=int, default=200, help="Tags looked up")
+    args = parser.parse_args()
+    
+    listing = api_versions(args.versions)
+    records = [github_actions_utils.PackageVersion.from_api(version) for version in listing]
+    random.seed(0)
+    tags = [f"pr-{random.randrange(0, args.versions, 4)}" for _ in range(args.lookups)]
+    
+    start = time.perf_counter()
+    scanned = [scan(listing, tag) for tag in tags]
+    scan_seconds = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    index = cleanup_pr_image.VersionIndex(records)
+    len(index)  # index the whole listing up front
+    build_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    indexed = [index.find(tag) for tag in tags]
+    lookup_seconds = time.perf_counter() - start
+    assert indexed == scanned
+    
+    start = time.perf_counter()
+    pr_tags = index.tags_with_prefix("pr-")
+    prefix_seconds = time.perf_counter() - start
+    
+    print(f"{args.versions} versions, {args.lookups} lookups")
+    print(f"{'approach':<24} {'seconds':>10} {'per lookup (us)':>16}")
+    print(f"{'scan per tag':<24} {scan_seconds:>10.4f} {scan_seconds / args.lookups * 1e6:>16.1f}")
+    print(f"{'index build':<24} {build_seconds:>10.4f} {'':>16}")
+    print(f"{'index lookups':<24} {lookup_seconds:>10.4f} {lookup_seconds / args.lookups * 1e6:>16.2f}")
+    print(f"{'pr-* prefix query':<24} {prefix_seconds:>10.4f} {len(pr_tags):>16} tags")
+    print(f"speed-up: {scan_seconds / (build_seconds + lookup_seconds):.0f}x including the build")
+
+
+if __name__ == "__main__":
+    main()
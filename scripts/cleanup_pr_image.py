@@ -4,7 +4,34 @@ Deletes a PR-specific Docker image from GitHub Container Registry.
 
 This script uses the GitHub Packages API to identify and delete a specific
 image tag associated with a pull request. It is designed to clean up temporary
-PR images when the pull request is closed or merged.
+PR images when the pull request is closed or merged. The tag is first resolved
+to a manifest digest through the registry, so a missing tag costs one
+registry request and no listing.
+
+A tag that exists still means reading the version listing. The GitHub
+Packages API has no endpoint that maps a tag or digest to a version ID, and
+deleting needs the ID. The listing is read page by page only until the
+version holding the tag or named by the digest turns up.
+
+In sweep mode (--sweep) it instead deletes every `pr-<number>` image whose pull
+request is not in the given set of open pull requests, catching images left
+behind when the cleanup for a closed pull request failed or never ran.
+
+With one or more --target PACKAGE:PATTERN arguments, or a --targets-file, it
+cleans up several packages under the owner in one run: each target names a
+package and a glob pattern for the tags to delete, such as
+`fork-image:pr-42` or `other-image:pr-*`. The packages are listed and their
+versions deleted through one shared, bounded pool of workers, and a result
+table with a row per package is added to the job's step summary.
+
+With --time-budget, every API request takes its timeout from what is left
+of one overall budget. Once it has run out, whether before a request or
+while one is waiting on the server, the script fails at once, naming the
+request.
+
+Listing pages and deletions are timed, and the timings are added to the job's
+step summary. With SCRIPT_METRICS_FILE set, request latencies and deletion
+results are also written to that file in OpenMetrics text format.
 
 Exit codes:
     0: Success (image deleted or not found)
@@ -12,13 +39,25 @@ Exit codes:
 """
 
 import argparse
+import bisect
+import fnmatch
 import json
+import re
 import sys
-from typing import Optional, Any, Dict, List, cast
-from urllib import request as urllib_request
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, as_completed, wait
+from typing import Optional, Any, Callable, Dict, Iterable, Iterator, List, Set, Tuple, Union
 from urllib.error import HTTPError, URLError
 
 import github_actions_utils
+import oci_registry
+
+GITHUB_API_URL = github_actions_utils.GITHUB_API_URL
+
+PR_TAG_PATTERN = re.compile(r"pr-(\d+)")
+
+# Deletes are independent, so a small pool hides API latency without
+# tripping GitHub's secondary rate limits on concurrent requests
+DEFAULT_MAX_WORKERS = 8
 
 
 def parse_args() -> argparse.Namespace:
@@ -33,13 +72,11 @@ def parse_args() -> argparse.Namespace:
     )
     parser.add_argument(
         "--pr-number",
-        required=True,
-        help="Pull request number"
+        help="Pull request number (required unless --sweep is given)"
     )
     parser.add_argument(
         "--repository",
-        required=True,
-        help="Repository in format 'owner/repo'"
+        help="Repository in format 'owner/repo' (required unless targets are given)"
     )
     parser.add_argument(
         "--owner",
@@ -51,15 +88,297 @@ def parse_args() -> argparse.Namespace:
         required=True,
         help="GitHub token with packages:write permission"
     )
+    parser.add_argument(
+        "--sweep",
+        action="store_true",
+        help="Delete every pr-<number> image whose pull request is not open"
+    )
+    parser.add_argument(
+        "--open-prs",
+        help="Open pull request numbers, separated by commas or whitespace (sweep mode)"
+    )
+    parser.add_argument(
+        "--open-prs-file",
+        help="File listing open pull request numbers, separated by commas or whitespace (sweep mode)"
+    )
+    parser.add_argument(
+        "--target",
+        action="append",
+        default=[],
+        metavar="PACKAGE:PATTERN",
+        help="Package and glob pattern of the tags to delete from it; may be repeated"
+    )
+    parser.add_argument(
+        "--targets-file",
+        help="JSON file listing targets as [{\"package\": ..., \"tags\": ...}]"
+    )
+    parser.add_argument(
+        "--time-budget",
+        type=float,
+        help="Seconds the whole cleanup may take; every request's timeout is drawn from what is left"
+    )
+    parser.add_argument(
+        "--max-workers",
+        type=int,
+        default=DEFAULT_MAX_WORKERS,
+        help=f"Maximum concurrent requests in sweep and target modes (default: {DEFAULT_MAX_WORKERS})"
+    )
+    
+    args = parser.parse_args()
+    
+    if args.target or args.targets_file:
+        if args.sweep or args.pr_number:
+            parser.error("--target and --targets-file cannot be combined with --pr-number or --sweep")
+    elif not args.repository:
+        parser.error("--repository is required unless --target or --targets-file is given")
+    elif args.sweep:
+        # An empty open set would mark every PR image stale, so it must be explicit
+        if args.open_prs is None and args.open_prs_file is None:
+            parser.error("--sweep requires --open-prs or --open-prs-file")
+    elif not args.pr_number:
+        parser.error("--pr-number is required unless --sweep is given")
+    if args.max_workers < 1:
+        parser.error("--max-workers must be at least 1")
+    if args.time_budget is not None and args.time_budget <= 0:
+        parser.error("--time-budget must be positive")
+    
+    return args
+
+
+def parse_pr_numbers(text: str) -> Set[int]:
+    """
+    Parse pull request numbers separated by commas or whitespace.
+    
+    Args:
+        text: Text containing pull request numbers
+        
+    Returns:
+        Set of pull request numbers
+        
+    Raises:
+        ValueError: If any entry is not a number
+        
+    Example:
+        >>> sorted(parse_pr_numbers("12, 15\n17"))
+        [12, 15, 17]
+    """
+    return {int(number) for number in re.split(r"[,\s]+", text.strip()) if number}
+
+
+class VersionIndex:
+    """
+    Tag and digest lookups over a package version listing.
+    
+    Versions are drawn from the listing and indexed only as far as a lookup
+    needs, so a lazily paginated listing is still fetched no further than
+    the page holding what was asked for. Lookups that have been answered
+    once, or that fall within the part already indexed, are dictionary hits
+    however many tags are asked about. Prefix queries, such as every pr-*
+    tag, bisect a sorted list of tags and so index the whole listing.
+    
+    Args:
+        versions: Package versions, such as the iterator from get_package_versions
+        
+    Example:
+        >>> index = VersionIndex(get_package_versions(owner, package_name, token))
+        >>> index.find('pr-42')
+        123456
+        >>> index.tags_with_prefix('pr-')
+        ['pr-12', 'pr-42']
+    """
+    
+    def __init__(self, versions: Iterable[github_actions_utils.PackageVersion]) -> None:
+        self._source: Optional[Iterator[github_actions_utils.PackageVersion]] = iter(versions)
+        self._versions: Dict[int, github_actions_utils.PackageVersion] = {}
+        self._by_tag: Dict[str, int] = {}
+        self._by_digest: Dict[str, int] = {}
+        self._sorted_tags: Optional[List[str]] = None
+        self._untagged = 0
+    
+    def _add(self, version: github_actions_utils.PackageVersion) -> None:
+        """Index one version."""
+        self._versions[version.id] = version
+        for tag in version.tags:
+            self._by_tag.setdefault(tag, version.id)
+        if version.name:
+            self._by_digest.setdefault(version.name, version.id)
+        if not version.tags:
+            self._untagged += 1
+        self._sorted_tags = None
+    
+    def _index_until(self, found: Callable[[], bool]) -> None:
+        """
+        Index versions from the listing until found() is true or the listing ends.
+        
+        Raises:
+            HTTPError: If fetching a later page of the listing fails
+            URLError: If the API cannot be reached while fetching a later page
+        """
+        while self._source is not None and not found():
+            version = next(self._source, None)
+            if version is None:
+                self._source = None
+            else:
+                self._add(version)
+    
+    def _index_all(self) -> None:
+        """Index the rest of the listing."""
+        self._index_until(lambda: False)
+    
+    def find(self, tag: str, digest: Optional[str] = None) -> Optional[int]:
+        """
+        Find the version a tag points at, or, if known, the version holding its digest.
+        
+        Args:
+            tag: Tag to look up
+            digest: Manifest digest the tag resolves to, if known
+            
+        Returns:
+            Version ID, or None if no version has the tag or digest
+        """
+        self._index_until(lambda: tag in self._by_tag or (digest is not None and digest in self._by_digest))
+        if tag in self._by_tag:
+            return self._by_tag[tag]
+        return self._by_digest.get(digest) if digest is not None else None
+    
+    def find_digest(self, digest: str) -> Optional[int]:
+        """
+        Find the version holding a manifest digest.
+        
+        Args:
+            digest: Manifest digest
+            
+        Returns:
+            Version ID, or None if no version holds the digest
+        """
+        self._index_until(lambda: digest in self._by_digest)
+        return self._by_digest.get(digest)
+    
+    def version(self, version_id: int) -> github_actions_utils.PackageVersion:
+        """
+        Get an indexed version by ID.
+        
+        Raises:
+            KeyError: If no version with that ID has been indexed
+        """
+        return self._versions[version_id]
+    
+    def tags_with_prefix(self, prefix: str) -> List[str]:
+        """
+        Every tag starting with a prefix, in sorted order.
+        
+        Args:
+            prefix: Tag prefix, such as 'pr-'
+            
+        Returns:
+            Sorted list of matching tags
+        """
+        self._index_all()
+        if self._sorted_tags is None:
+            self._sorted_tags = sorted(self._by_tag)
+        start = bisect.bisect_left(self._sorted_tags, prefix)
+        end = start
+        while end < len(self._sorted_tags) and self._sorted_tags[end].startswith(prefix):
+            end += 1
+        return self._sorted_tags[start:end]
+    
+    def versions_with_tag_prefix(self, prefix: str) -> List[github_actions_utils.PackageVersion]:
+        """
+        Every version with a tag starting with a prefix, each once.
+        
+        Args:
+            prefix: Tag prefix, such as 'pr-'
+            
+        Returns:
+            Versions in the order of their first matching tag
+        """
+        version_ids = dict.fromkeys(self._by_tag[tag] for tag in self.tags_with_prefix(prefix))
+        return [self._versions[version_id] for version_id in version_ids]
+    
+    @property
+    def untagged_count(self) -> int:
+        """Number of versions without any tag."""
+        self._index_all()
+        return self._untagged
+    
+    def __len__(self) -> int:
+        self._index_all()
+        return len(self._versions)
     
-    return parser.parse_args()
+    def __iter__(self) -> Iterator[github_actions_utils.PackageVersion]:
+        self._index_all()
+        return iter(list(self._versions.values()))
 
 
+@github_actions_utils.span("fetch_versions_page")
+def _fetch_versions_page(url: str, token: str) -> Tuple[List[github_actions_utils.PackageVersion], Optional[str]]:
+    """
+    Fetch one page of package versions.
+    
+    The page is decoded from the socket as it arrives, and only the fields in
+    PackageVersion are kept, so neither the raw page nor the full metadata of
+    its versions is ever held in memory.
+    
+    Args:
+        url: Page URL
+        token: GitHub token
+        
+    Returns:
+        Tuple of the versions on the page and the URL of the next page (or None)
+        
+    Raises:
+        HTTPError: If the API returns an error status
+        URLError: If the API cannot be reached or the URL is not on the API origin
+        ValueError: If the page is not a JSON array
+    """
+    client = github_actions_utils.get_github_api_client(token)
+    with client.stream(url) as (response, body):
+        versions = [
+            github_actions_utils.PackageVersion.from_api(version)
+            for version in github_actions_utils.iter_json_array(body)
+            if version.get("id") is not None
+        ]
+    github_actions_utils.annotate(versions=len(versions))
+    # Chunked responses have no length, and the body is never held to measure it
+    if response.headers.get("Content-Length"):
+        github_actions_utils.annotate(bytes=int(response.headers["Content-Length"]))
+    return versions, github_actions_utils.parse_next_link(response.headers.get("Link"))
+
+
+def _iter_version_pages(
+    versions: List[github_actions_utils.PackageVersion], next_url: Optional[str], token: str
+) -> Iterator[github_actions_utils.PackageVersion]:
+    """
+    Yield versions from a fetched page, then fetch and yield later pages on demand.
+    
+    Args:
+        versions: Versions from the page already fetched
+        next_url: URL of the next page or None
+        token: GitHub token
+        
+    Raises:
+        HTTPError: If fetching a later page fails
+        URLError: If the API cannot be reached while fetching a later page
+    """
+    yield from versions
+    while next_url is not None:
+        versions, next_url = _fetch_versions_page(next_url, token)
+        yield from versions
+
+
+@github_actions_utils.span("get_package_versions")
 def get_package_versions(
     owner: str, package_name: str, token: str
-) -> Optional[List[Dict[str, Any]]]:
+) -> Optional[Iterator[github_actions_utils.PackageVersion]]:
     """
-    Fetch all versions of a package from GitHub Container Registry.
+    Stream the versions of a package from GitHub Container Registry.
+    
+    Versions are requested a full page at a time and later pages are only
+    fetched, by following the Link header, as the caller consumes the iterator.
+    A caller that stops early, such as once a tag has been found, does not pay
+    for the rest of the listing. The first page is fetched before returning so
+    that a missing package is reported up front. Each page is decoded as it
+    is read, so memory use stays flat however many versions the package holds.
     
     Args:
         owner: Repository owner
@@ -67,62 +386,97 @@ def get_package_versions(
         token: GitHub token
         
     Returns:
-        List of package versions or None if not found
+        Iterator over package versions or None if the package does not exist
+        
+    Raises:
+        HTTPError: If the API answers with an error other than 404, after retries
+        URLError: If the API cannot be reached
     """
-    url = f"https://api.github.com/users/{owner}/packages/container/{package_name}/versions"
-    
-    req = urllib_request.Request(url)
-    github_actions_utils.add_github_api_headers(req, token)
+    github_actions_utils.annotate(package=package_name)
+    url = (
+        f"{GITHUB_API_URL}{github_actions_utils.package_versions_path(owner, package_name)}"
+        f"?per_page={github_actions_utils.VERSIONS_PER_PAGE}"
+    )
     
     try:
-        with urllib_request.urlopen(req, timeout=30) as response:
-            data = response.read().decode()
-            result = json.loads(data)
-            return cast(List[Dict[str, Any]], result)
+        versions, next_url = _fetch_versions_page(url, token)
     except HTTPError as e:
-        if e.code == 404:
-            github_actions_utils.github_action_log(
-                "warning",
-                f"Package not found (HTTP {e.code}). The PR image may not exist."
-            )
-            return None
+        if e.code != 404:
+            raise
         github_actions_utils.github_action_log(
             "warning",
-            f"Failed to fetch package versions (HTTP {e.code}). "
-            "The PR image may not exist or may have already been deleted."
+            f"Package not found (HTTP {e.code}). The PR image may not exist."
         )
         return None
-    except URLError as e:
-        github_actions_utils.github_action_log("error", f"Network error fetching package versions: {e}")
-        return None
+    
+    return _iter_version_pages(versions, next_url, token)
 
 
-def find_version_id_by_tag(versions: List[Dict[str, Any]], tag: str) -> Optional[int]:
+def find_version_id_by_tag(
+    versions: Union[VersionIndex, Iterable[github_actions_utils.PackageVersion]],
+    tag: str,
+    digest: Optional[str] = None,
+) -> Optional[int]:
     """
     Find the version ID for a specific tag.
     
+    Stops consuming the versions as soon as the tag is found, so a lazily
+    paginated listing is not fetched beyond the page holding the tag. When the
+    tag's manifest digest is known, a version whose name is that digest also
+    matches.
+    
     Args:
-        versions: List of package versions from GitHub API
+        versions: Index of package versions, or the versions to index
         tag: Tag to search for
+        digest: Manifest digest the tag resolves to, if known
         
     Returns:
         Version ID if found, None otherwise
     """
-    for version in versions:
-        tags = version.get("metadata", {}).get("container", {}).get("tags", [])
-        if tag in tags:
-            vid = version.get("id")
-            if vid is not None:
-                return int(vid)
-    return None
+    index = versions if isinstance(versions, VersionIndex) else VersionIndex(versions)
+    return index.find(tag, digest)
 
 
+def resolve_tag_digest(repository: str, tag: str, owner: str, token: str) -> Optional[str]:
+    """
+    Resolve an image tag to its manifest digest through the registry.
+    
+    Costs a single HEAD request (plus a token exchange) however many
+    versions the package holds.
+    
+    Args:
+        repository: Repository in format 'owner/repo'
+        tag: Tag to resolve
+        owner: Repository owner, used as the registry username
+        token: GitHub token
+        
+    Returns:
+        Manifest digest, or None if the tag does not exist
+        
+    Raises:
+        HTTPError: If the registry returns an error other than 404
+        URLError: If the registry cannot be reached
+    """
+    # Short budget: the version listing is a working fallback
+    scheduler = github_actions_utils.RequestScheduler(time_budget=30)
+    client = oci_registry.RegistryClient(repository, owner, token, scheduler=scheduler)
+    try:
+        return client.resolve_tag(tag)
+    finally:
+        client.close()
+
+
+@github_actions_utils.span("delete_package_version")
 def delete_package_version(
     owner: str, package_name: str, version_id: int, token: str
 ) -> bool:
     """
     Delete a specific package version.
     
+    A DELETE that fails to connect or gets a 5xx is retried, and the first
+    attempt may have gone through; a retry answered with 404 therefore
+    counts as deleted. A 404 on the first attempt is still a failure.
+    
     Args:
         owner: Repository owner
         package_name: Package name
@@ -132,60 +486,493 @@ def delete_package_version(
     Returns:
         True if deletion successful, False otherwise
     """
-    url = f"https://api.github.com/users/{owner}/packages/container/{package_name}/versions/{version_id}"
+    url = f"{GITHUB_API_URL}{github_actions_utils.package_versions_path(owner, package_name)}/{version_id}"
     
-    req = urllib_request.Request(url, method="DELETE")
-    github_actions_utils.add_github_api_headers(req, token)
+    client = github_actions_utils.get_github_api_client(token)
     
     try:
-        with urllib_request.urlopen(req, timeout=30) as response:
-            if response.status == 204:
-                return True
+        response = client.request("DELETE", url, allowed_statuses=(404,))
+        github_actions_utils.annotate(version_id=version_id, status=response.status)
+        github_actions_utils.VERSION_DELETES.inc(result=f"http_{response.status}")
+        if response.status == 404 and response.attempts == 1:
             github_actions_utils.github_action_log(
                 "error",
-                f"Unexpected response code {response.status} when deleting version"
+                f"Failed to delete package version (HTTP 404): {response.body.decode()}"
             )
             return False
+        if response.status == 404:
+            github_actions_utils.log_info(
+                f"Version {version_id} was already gone when the DELETE was retried, "
+                "so an earlier attempt deleted it"
+            )
+        if response.status in (204, 404):
+            # Cached listings of this package would still show the deleted version
+            client.invalidate_cache(
+                f"{GITHUB_API_URL}{github_actions_utils.package_versions_path(owner, package_name)}"
+            )
+            return True
+        github_actions_utils.github_action_log(
+            "error",
+            f"Unexpected response code {response.status} when deleting version"
+        )
+        return False
     except HTTPError as e:
+        github_actions_utils.annotate(version_id=version_id, status=e.code)
+        github_actions_utils.VERSION_DELETES.inc(result=f"http_{e.code}")
         github_actions_utils.github_action_log(
             "error",
             f"Failed to delete package version (HTTP {e.code}): {e.read().decode()}"
         )
         return False
     except URLError as e:
+        github_actions_utils.VERSION_DELETES.inc(result="network_error")
         github_actions_utils.github_action_log("error", f"Network error deleting package version: {e}")
         return False
 
 
-def main() -> None:
-    """Main entry point for the cleanup script."""
-    # Parse command line arguments
-    args = parse_args()
+def find_stale_pr_versions(
+    versions: Union[VersionIndex, Iterable[github_actions_utils.PackageVersion]], open_prs: Set[int]
+) -> Tuple[Dict[int, List[str]], Dict[int, List[str]]]:
+    """
+    Split versions tagged pr-<number> into stale and skipped versions.
+    
+    A version is stale when every one of its tags is a pr-<number> tag for a
+    pull request that is not open. A version that also carries another tag,
+    such as latest or a commit SHA, is skipped because deleting it would
+    remove that tag too. Versions without any pr-<number> tag are ignored.
+    
+    Args:
+        versions: Index of package versions, or the versions to index
+        open_prs: Numbers of pull requests that are still open
+        
+    Returns:
+        Tuple of (stale, skipped) dictionaries mapping version ID to tags
+    """
+    index = versions if isinstance(versions, VersionIndex) else VersionIndex(versions)
+    stale: Dict[int, List[str]] = {}
+    skipped: Dict[int, List[str]] = {}
+    for version in index.versions_with_tag_prefix("pr-"):
+        tags = version.tags
+        pr_matches = [m for m in map(PR_TAG_PATTERN.fullmatch, tags) if m]
+        if not pr_matches:
+            continue
+        still_open = any(int(m.group(1)) in open_prs for m in pr_matches)
+        if still_open or len(pr_matches) != len(tags):
+            skipped[version.id] = tags
+        else:
+            stale[version.id] = tags
+    return stale, skipped
+
+
+def delete_package_versions(
+    owner: str, package_name: str, version_ids: Iterable[int], token: str, max_workers: int
+) -> Tuple[List[int], List[int]]:
+    """
+    Delete package versions concurrently through a bounded thread pool.
+    
+    Args:
+        owner: Repository owner
+        package_name: Package name
+        version_ids: Version IDs to delete
+        token: GitHub token
+        max_workers: Maximum number of deletes in flight at once
+        
+    Returns:
+        Tuple of (deleted, failed) version ID lists
+    """
+    deleted: List[int] = []
+    failed: List[int] = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(delete_package_version, owner, package_name, vid, token): vid
+            for vid in version_ids
+        }
+        for future in as_completed(futures):
+            vid = futures[future]
+            try:
+                succeeded = future.result()
+            except github_actions_utils.DeadlineExceeded:
+                raise
+            except Exception as e:  # a crashed worker must not hide the other results
+                github_actions_utils.github_action_log("error", f"Error deleting version {vid}: {e}")
+                succeeded = False
+            (deleted if succeeded else failed).append(vid)
+    return deleted, failed
+
+
+def sweep_stale_pr_images(
+    owner: str, package_name: str, token: str, open_prs: Set[int], max_workers: int
+) -> int:
+    """
+    Delete every PR image whose pull request is not open and report a summary.
+    
+    Args:
+        owner: Repository owner
+        package_name: Package name
+        token: GitHub token
+        open_prs: Numbers of pull requests that are still open
+        max_workers: Maximum number of deletes in flight at once
+        
+    Returns:
+        Exit code: 0 if every stale version was deleted, 1 otherwise
+    """
+    github_actions_utils.log_info(
+        f"Sweeping stale PR images from package: {package_name} "
+        f"({len(open_prs)} open pull requests)"
+    )
+    
+    try:
+        versions = get_package_versions(owner, package_name, token)
+        if versions is None:
+            github_actions_utils.log_info("No package found, nothing to sweep")
+            return 0
+        stale, skipped = find_stale_pr_versions(versions, open_prs)
+    except (HTTPError, URLError) as e:
+        github_actions_utils.github_action_log("error", f"Failed to fetch package versions: {e}")
+        return 1
+    
+    for vid, tags in sorted(skipped.items()):
+        github_actions_utils.log_info(f"Skipping version {vid} ({', '.join(tags)})")
+    
+    deleted, failed = delete_package_versions(owner, package_name, stale, token, max_workers)
+    
+    for vid in sorted(deleted):
+        github_actions_utils.log_info(f"Deleted version {vid} ({', '.join(stale[vid])})")
+    for vid in sorted(failed):
+        github_actions_utils.github_action_log(
+            "error", f"Failed to delete version {vid} ({', '.join(stale[vid])})"
+        )
+    github_actions_utils.log_info(
+        f"Sweep summary: {len(deleted)} deleted, {len(failed)} failed, {len(skipped)} skipped"
+    )
+    return 1 if failed else 0
+
+
+class CleanupTarget:
+    """
+    A package and the glob pattern of the tags to delete from it.
+    
+    Patterns use shell-style wildcards and match whole tags, case-sensitively.
+    
+    Args:
+        package: Package name under the owner
+        pattern: Glob pattern of the tags to delete, such as 'pr-*'
+        
+    Example:
+        >>> target = CleanupTarget.parse('other-image:pr-*')
+        >>> target.matches('pr-42'), target.matches('latest')
+        (True, False)
+    """
+    
+    __slots__ = ("package", "pattern")
+    
+    def __init__(self, package: str, pattern: str) -> None:
+        if not package or not pattern:
+            raise ValueError("A target needs both a package and a tag pattern")
+        self.package = package.lower()
+        self.pattern = pattern
+    
+    @classmethod
+    def parse(cls, text: str) -> "CleanupTarget":
+        """
+        Parse a target given as PACKAGE:PATTERN.
+        
+        Raises:
+            ValueError: If the text is not in PACKAGE:PATTERN form
+        """
+        package, separator, pattern = text.partition(":")
+        if not separator:
+            raise ValueError(f"Invalid target {text!r}, expected PACKAGE:PATTERN")
+        return cls(package.strip(), pattern.strip())
+    
+    @property
+    def prefix(self) -> str:
+        """Literal start of the pattern, up to its first wildcard."""
+        return re.split(r"[*?\[]", self.pattern, maxsplit=1)[0]
+    
+    def matches(self, tag: str) -> bool:
+        """Whether a tag matches the pattern."""
+        return fnmatch.fnmatchcase(tag, self.pattern)
+    
+    def __repr__(self) -> str:
+        return f"CleanupTarget({self.package!r}, {self.pattern!r})"
+
+
+def load_targets(path: str) -> List[CleanupTarget]:
+    """
+    Read cleanup targets from a JSON file.
     
+    The file holds a list of objects with a package and a tag pattern:
+    `[{"package": "other-image", "tags": "pr-*"}]`.
+    
+    Args:
+        path: Path to the targets file
+        
+    Returns:
+        List of targets, in file order
+        
+    Raises:
+        OSError: If the file cannot be read
+        ValueError: If the file is not a valid list of targets
+    """
+    with open(path, encoding="utf-8") as f:
+        entries = json.load(f)
+    if not isinstance(entries, list):
+        raise ValueError("Targets file must hold a JSON list")
+    targets = []
+    for number, entry in enumerate(entries, start=1):
+        if not isinstance(entry, dict) or not isinstance(entry.get("package"), str) \
+                or not isinstance(entry.get("tags"), str):
+            raise ValueError(f"Target {number} must be an object with string package and tags")
+        targets.append(CleanupTarget(entry["package"], entry["tags"]))
+    return targets
+
+
+def find_target_versions(
+    versions: Union[VersionIndex, Iterable[github_actions_utils.PackageVersion]], targets: List[CleanupTarget]
+) -> Tuple[Dict[int, List[str]], Dict[int, List[str]]]:
+    """
+    Split versions with a tag matching any target into matched and skipped versions.
+    
+    As in the sweep, a version is only matched when every one of its tags
+    matches a target; one that also carries another tag is skipped because
+    deleting it would remove that tag too.
+    
+    Args:
+        versions: Index of package versions, or the versions to index
+        targets: Targets for the package the versions belong to
+        
+    Returns:
+        Tuple of (matched, skipped) dictionaries mapping version ID to tags
+    """
+    index = versions if isinstance(versions, VersionIndex) else VersionIndex(versions)
+    matched: Dict[int, List[str]] = {}
+    skipped: Dict[int, List[str]] = {}
+    for target in targets:
+        for version in index.versions_with_tag_prefix(target.prefix):
+            if version.id in matched or version.id in skipped:
+                continue
+            if not any(target.matches(tag) for tag in version.tags):
+                continue
+            if all(any(t.matches(tag) for t in targets) for tag in version.tags):
+                matched[version.id] = version.tags
+            else:
+                skipped[version.id] = version.tags
+    return matched, skipped
+
+
+class CleanupResult:
+    """Outcome of cleaning up one package, as a row of the result table."""
+    
+    __slots__ = ("package", "patterns", "status", "matched", "deleted", "failed", "skipped")
+    
+    def __init__(self, package: str, patterns: List[str]) -> None:
+        self.package = package
+        self.patterns = patterns
+        self.status = "ok"
+        self.matched: Dict[int, List[str]] = {}
+        self.deleted: List[int] = []
+        self.failed: List[int] = []
+        self.skipped: Dict[int, List[str]] = {}
+    
+    def row(self) -> List[str]:
+        """Cells of the result table row."""
+        status = self.status if self.status != "ok" or not self.failed else "failed deletes"
+        return [
+            self.package, " ".join(self.patterns), str(len(self.matched)), str(len(self.deleted)),
+            str(len(self.failed)), str(len(self.skipped)), status,
+        ]
+
+
+RESULT_HEADERS = ["Package", "Tags", "Matched", "Deleted", "Failed", "Skipped", "Result"]
+
+
+def _list_target_versions(
+    owner: str, package_name: str, targets: List[CleanupTarget], token: str
+) -> Optional[Tuple[Dict[int, List[str]], Dict[int, List[str]]]]:
+    """List a package and match its versions against its targets, or None if it does not exist."""
+    versions = get_package_versions(owner, package_name, token)
+    if versions is None:
+        return None
+    return find_target_versions(versions, targets)
+
+
+def cleanup_targets(owner: str, targets: List[CleanupTarget], token: str, max_workers: int) -> int:
+    """
+    Delete the versions matching each target across packages and report a result table.
+    
+    Listings and deletions share one bounded thread pool: a package's deletes
+    are queued as soon as its listing completes, behind any listings still
+    waiting, so a slow or large package does not hold up the others and the
+    number of requests in flight never exceeds max_workers. Targets for the
+    same package are merged so that it is listed once.
+    
+    Args:
+        owner: Owner of the packages
+        targets: Packages and tag patterns to clean up
+        token: GitHub token
+        max_workers: Maximum number of requests in flight at once
+        
+    Returns:
+        Exit code: 0 if every listing and matched version's delete succeeded, 1 otherwise
+    """
+    by_package: Dict[str, List[CleanupTarget]] = {}
+    for target in targets:
+        package_targets = by_package.setdefault(target.package, [])
+        if all(t.pattern != target.pattern for t in package_targets):
+            package_targets.append(target)
+    results = {
+        package: CleanupResult(package, [t.pattern for t in package_targets])
+        for package, package_targets in by_package.items()
+    }
+    github_actions_utils.log_info(
+        f"Cleaning up {len(results)} packages with up to {max_workers} concurrent requests"
+    )
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # Each future maps to its package and, for deletes, the version being deleted
+        pending: Dict[Future[Any], Tuple[str, Optional[int]]] = {
+            executor.submit(_list_target_versions, owner, package, package_targets, token): (package, None)
+            for package, package_targets in by_package.items()
+        }
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                package, vid = pending.pop(future)
+                result = results[package]
+                if vid is not None:
+                    try:
+                        succeeded = future.result()
+                    except github_actions_utils.DeadlineExceeded:
+                        raise
+                    except Exception as e:  # a crashed worker must not hide the other results
+                        github_actions_utils.github_action_log(
+                            "error", f"Error deleting {package} version {vid}: {e}"
+                        )
+                        succeeded = False
+                    (result.deleted if succeeded else result.failed).append(vid)
+                    continue
+                try:
+                    listing = future.result()
+                except (HTTPError, URLError) as e:
+                    github_actions_utils.github_action_log("error", f"Failed to fetch {package} versions: {e}")
+                    result.status = "listing failed"
+                    continue
+                if listing is None:
+                    result.status = "not found"
+                    continue
+                result.matched, result.skipped = listing
+                for matched_vid in result.matched:
+                    delete = executor.submit(delete_package_version, owner, package, matched_vid, token)
+                    pending[delete] = (package, matched_vid)
+    
+    for result in results.values():
+        for vid, tags in sorted(result.skipped.items()):
+            github_actions_utils.log_info(f"Skipping {result.package} version {vid} ({', '.join(tags)})")
+        for vid in sorted(result.deleted):
+            github_actions_utils.log_info(
+                f"Deleted {result.package} version {vid} ({', '.join(result.matched[vid])})"
+            )
+        for vid in sorted(result.failed):
+            github_actions_utils.github_action_log(
+                "error", f"Failed to delete {result.package} version {vid} ({', '.join(result.matched[vid])})"
+            )
+    
+    rows = [result.row() for result in results.values()]
+    for row in rows:
+        github_actions_utils.log_info(
+            "Cleanup summary: "
+            + ", ".join(f"{header.lower()}={cell}" for header, cell in zip(RESULT_HEADERS, row))
+        )
+    github_actions_utils.append_step_summary(
+        "### Package cleanup\n\n"
+        + "| " + " | ".join(RESULT_HEADERS) + " |\n"
+        + "|" + "---|" * len(RESULT_HEADERS) + "\n"
+        + "".join("| " + " | ".join(row) + " |\n" for row in rows)
+        + "\n"
+    )
+    return 1 if any(r.failed or r.status == "listing failed" for r in results.values()) else 0
+
+
+def run_cleanup(args: argparse.Namespace) -> None:
+    """
+    Run the cleanup the arguments ask for and exit with its result.
+    
+    Args:
+        args: Parsed arguments
+        
+    Raises:
+        SystemExit: With the exit code of the cleanup
+        DeadlineExceeded: If the time budget is used up
+    """
     pr_number = args.pr_number
     repository = args.repository
     owner = args.owner
     token = args.token
     
+    if args.target or args.targets_file:
+        try:
+            targets = [CleanupTarget.parse(text) for text in args.target]
+            if args.targets_file is not None:
+                targets += load_targets(args.targets_file)
+        except (OSError, ValueError) as e:
+            github_actions_utils.github_action_log("error", f"Invalid cleanup targets: {e}")
+            sys.exit(1)
+        sys.exit(cleanup_targets(owner, targets, token, args.max_workers))
+    
     # Extract package name from repository
     package_name = repository.split("/")[-1].lower()
+    
+    if args.sweep:
+        try:
+            open_prs = parse_pr_numbers(args.open_prs or "")
+            if args.open_prs_file is not None:
+                with open(args.open_prs_file, encoding="utf-8") as f:
+                    open_prs |= parse_pr_numbers(f.read())
+        except (OSError, ValueError) as e:
+            github_actions_utils.github_action_log("error", f"Invalid open pull request list: {e}")
+            sys.exit(1)
+        sys.exit(sweep_stale_pr_images(owner, package_name, token, open_prs, args.max_workers))
+    
     tag = f"pr-{pr_number}"
     image_name = f"ghcr.io/{repository}"
     
     github_actions_utils.log_info(f"Attempting to delete image tag: {image_name}:{tag}")
     github_actions_utils.log_info(f"Looking for package: {package_name} with tag: {tag}")
     
-    # Fetch package versions
-    versions = get_package_versions(owner, package_name, token)
-    if versions is None:
+    # Resolve the tag through the registry first: a missing tag costs one registry
+    # request and no listing. The Packages API cannot look a version up by digest,
+    # so a tag that exists is still found in the listing, matched by name or tag
+    digest = None
+    try:
+        digest = resolve_tag_digest(repository, tag, owner, token)
+        if digest is None:
+            github_actions_utils.log_info(
+                f"No image found with tag: {tag} "
+                "(this is expected if the PR was closed before the image was published)"
+            )
+            sys.exit(0)
+        github_actions_utils.log_info(f"Tag {tag} resolves to {digest}")
+    except (HTTPError, URLError) as e:
         github_actions_utils.log_info(
-            f"No image found with tag: {tag} "
-            "(this is expected if the PR was closed before the image was published)"
+            f"Could not resolve {image_name}:{tag} through the registry ({e}), "
+            "falling back to the version listing"
         )
-        sys.exit(0)
     
-    # Find version ID for the PR tag
-    version_id = find_version_id_by_tag(versions, tag)
+    # Fetch package versions, and find the version ID for the PR tag, fetching
+    # further pages only until it turns up
+    try:
+        versions = get_package_versions(owner, package_name, token)
+        if versions is None:
+            github_actions_utils.log_info(
+                f"No image found with tag: {tag} "
+                "(this is expected if the PR was closed before the image was published)"
+            )
+            sys.exit(0)
+        version_id = find_version_id_by_tag(versions, tag, digest)
+    except (HTTPError, URLError) as e:
+        github_actions_utils.github_action_log("error", f"Failed to fetch package versions: {e}")
+        sys.exit(1)
     if version_id is None:
         github_actions_utils.log_info(
             f"No image found with tag: {tag} "
@@ -204,5 +991,20 @@ def main() -> None:
         sys.exit(1)
 
 
+def main() -> None:
+    """Main entry point for the cleanup script."""
+    # Parse command line arguments
+    args = parse_args()
+    github_actions_utils.deadline.start(args.time_budget)
+    
+    try:
+        run_cleanup(args)
+    except github_actions_utils.DeadlineExceeded as e:
+        github_actions_utils.github_action_log("error", f"Cleanup failed: {e}")
+        sys.exit(1)
+
+
 if __name__ == "__main__":
-    main()
+    github_actions_utils.tracer.report_at_exit()
+    github_actions_utils.metrics.report_at_exit()
+    github_actions_utils.run_profiled(main)
@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""
+Client for the Docker Engine API over the daemon's unix socket.
+
+Forking the docker CLI for every load, tag and push pays for process startup
+and CLI config loading each time, and the CLI's output is only available as
+text once the command has finished. This client talks HTTP to the daemon
+directly: the image archive is streamed into `POST /images/load` from disk,
+and the newline-delimited JSON progress of a load or push is handled record by
+record as the daemon writes it, with the pushed digest taken from the push's
+`aux` record instead of being matched out of text.
+
+The daemon does not see logins stored by the CLI, so pushes carry registry
+credentials in the X-Registry-Auth header.
+
+Errors are raised as urllib's HTTPError for error statuses and URLError when
+the daemon cannot be reached or reports an error partway through a stream,
+like the registry client's.
+
+Example:
+    >>> engine = engine_from_environment()
+    >>> engine.tag('candidate_image:latest', 'ghcr.io/owner/repo:latest')
+    >>> engine.push('ghcr.io/owner/repo:latest', registry_auth('owner', 'token', 'ghcr.io'))
+    'sha256:...'
+"""
+
+import base64
+import http.client
+import io
+import json
+import os
+import socket
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+from urllib.error import HTTPError, URLError
+from urllib.parse import quote, urlencode
+
+import github_actions_utils
+
+DOCKER_SOCKET = "/var/run/docker.sock"
+
+# Default request timeouts in seconds, the same as the CLI calls they replace
+LOAD_TIMEOUT = 300
+TAG_TIMEOUT = 60
+PUSH_TIMEOUT = 600
+
+# Called with each JSON record of a load or push progress stream
+ProgressCallback = Callable[[Dict[str, Any]], None]
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """
+    HTTP/1.1 connection over a unix domain socket.
+    
+    Args:
+        socket_path: Path of the socket
+        timeout: Socket timeout in seconds
+    """
+    
+    def __init__(self, socket_path: str, timeout: float) -> None:
+        # The Host header is required by HTTP/1.1 but ignored by the daemon
+        super().__init__("localhost", timeout=timeout, blocksize=github_actions_utils.STREAM_BLOCK_SIZE)
+        self.socket_path = socket_path
+    
+    def connect(self) -> None:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+        except BaseException:
+            sock.close()
+            raise
+        self.sock = sock
+
+
+def registry_auth(username: str, password: str, server: str) -> str:
+    """
+    Encode registry credentials for the X-Registry-Auth header.
+    
+    Example:
+        >>> registry_auth('owner', 'token', 'ghcr.io')
+        'eyJ1c2VybmFtZSI6...'
+    """
+    config = {"username": username, "password": password, "serveraddress": server}
+    return base64.urlsafe_b64encode(json.dumps(config).encode()).decode()
+
+
+def split_reference(reference: str) -> Tuple[str, str]:
+    """
+    Split an image reference into repository and tag.
+    
+    Example:
+        >>> split_reference('localhost:5000/repo:pr-42')
+        ('localhost:5000/repo', 'pr-42')
+        >>> split_reference('ghcr.io/owner/repo')
+        ('ghcr.io/owner/repo', 'latest')
+    """
+    repository, _, tag = reference.rpartition(":")
+    # A colon before the last slash separates a registry host from its port
+    if not repository or "/" in tag:
+        return reference, "latest"
+    return repository, tag
+
+
+class DockerEngine:
+    """
+    Client for the Docker daemon listening on a unix socket.
+    
+    Each request opens its own connection, which over a local socket costs
+    far less than the request itself.
+    
+    Args:
+        socket_path: Path of the daemon's socket
+    """
+    
+    def __init__(self, socket_path: str = DOCKER_SOCKET) -> None:
+        self.socket_path = socket_path
+    
+    @staticmethod
+    def _image_path(name: str, action: str) -> str:
+        """Path of an image endpoint; names keep their slashes and colons."""
+        # No API version prefix, so the daemon serves its current version;
+        # recent daemons refuse old versions a pinned prefix would go stale at
+        return f"/images/{quote(name, safe='/:@')}/{action}"
+    
+    def _error(self, path: str, response: http.client.HTTPResponse) -> HTTPError:
+        """Build the error for a response with an error status."""
+        body = response.read()
+        try:
+            message = json.loads(body).get("message") or body.decode("utf-8", "replace")
+        except (ValueError, AttributeError):
+            message = body.decode("utf-8", "replace")
+        return HTTPError(
+            f"unix://{self.socket_path}{path}", response.status, message.strip(), response.msg, io.BytesIO(body)
+        )
+    
+    @contextmanager
+    def _request(
+        self,
+        method: str,
+        path: str,
+        timeout: float,
+        body: github_actions_utils.RequestBody = None,
+        headers: Optional[Dict[str, str]] = None,
+        allowed_statuses: Tuple[int, ...] = (),
+    ) -> Iterator[http.client.HTTPResponse]:
+        """
+        Send a request and yield the unread response.
+        
+        Raises:
+            HTTPError: If the daemon returns an error status not in allowed_statuses
+            URLError: If the daemon cannot be reached
+        """
+        conn = UnixHTTPConnection(self.socket_path, timeout)
+        try:
+            try:
+                conn.request(method, path, body=body, headers=headers or {})
+                response = conn.getresponse()
+            except (OSError, http.client.HTTPException) as e:
+                raise URLError(e) from e
+            if response.status >= 400 and response.status not in allowed_statuses:
+                raise self._error(path, response)
+            yield response
+        finally:
+            conn.close()
+    
+    def _call(
+        self,
+        method: str,
+        path: str,
+        timeout: float,
+        allowed_statuses: Tuple[int, ...] = (),
+    ) -> Tuple[int, bytes]:
+        """Send a bodiless request and read the whole response."""
+        with self._request(method, path, timeout, allowed_statuses=allowed_statuses) as response:
+            try:
+                return response.status, response.read()
+            except (OSError, http.client.HTTPException) as e:
+                raise URLError(e) from e
+    
+    def _stream(
+        self,
+        path: str,
+        timeout: float,
+        body: github_actions_utils.RequestBody = None,
+        headers: Optional[Dict[str, str]] = None,
+        on_progress: Optional[ProgressCallback] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        POST a request and yield the records of its progress stream as they arrive.
+        
+        The timeout bounds the whole stream, not only each read, so a daemon
+        that keeps reporting progress cannot hold the call open past it.
+        
+        Raises:
+            HTTPError: If the daemon returns an error status
+            URLError: If the daemon cannot be reached, reports an error in the
+                stream, sends a record that is not a JSON object, or is still
+                streaming when the timeout expires
+        """
+        expires = time.monotonic() + timeout
+        with self._request("POST", path, timeout, body, headers) as response:
+            while True:
+                try:
+                    line = response.readline()
+                except (OSError, http.client.HTTPException) as e:
+                    raise URLError(e) from e
+                if time.monotonic() > expires:
+                    raise URLError(TimeoutError(f"timed out after {timeout:.0f}s"))
+                if not line:
+                    return
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError as e:
+                    raise URLError(e) from e
+                if not isinstance(record, dict):
+                    raise URLError(f"Unexpected progress record: {line[:200]!r}")
+                if on_progress is not None:
+                    on_progress(record)
+                if record.get("error"):
+                    raise URLError(record["error"])
+                yield record
+    
+    def image_id(self, name: str, timeout: float = TAG_TIMEOUT) -> Optional[str]:
+        """
+        Look up the ID of an image.
+        
+        Args:
+            name: Image name, tag or ID
+            timeout: Request timeout in seconds
+            
+        Returns:
+            Image ID, or None if the daemon has no such image
+            
+        Raises:
+            HTTPError: If the daemon returns an error other than 404
+            URLError: If the daemon cannot be reached
+        """
+        status, body = self._call("GET", self._image_path(name, "json"), timeout, allowed_statuses=(404,))
+        if status == 404:
+            return None
+        image_id: Optional[str] = json.loads(body).get("Id")
+        return image_id
+    
+    def load(
+        self, image_tar: str, on_progress: Optional[ProgressCallback] = None, timeout: float = LOAD_TIMEOUT
+    ) -> None:
+        """
+        Load a `docker save` archive, streaming it from disk.
+        
+        Args:
+            image_tar: Path to the archive
+            on_progress: Called with each progress record as it arrives
+            timeout: Seconds allowed for the whole load
+            
+        Raises:
+            HTTPError: If the daemon rejects the archive
+            URLError: If the daemon cannot be reached or fails the load
+        """
+        with open(image_tar, "rb") as archive:
+            headers = {
+                "Content-Type": "application/x-tar",
+                "Content-Length": str(os.fstat(archive.fileno()).st_size),
+            }
+            for _ in self._stream("/images/load?quiet=1", timeout, archive, headers, on_progress):
+                pass
+    
+    def tag(self, source: str, target: str, timeout: float = TAG_TIMEOUT) -> None:
+        """
+        Tag an image.
+        
+        Args:
+            source: Image name, tag or ID
+            target: New reference, for example 'ghcr.io/owner/repo:latest'
+            timeout: Request timeout in seconds
+            
+        Raises:
+            HTTPError: If the source image does not exist or the daemon returns an error
+            URLError: If the daemon cannot be reached
+        """
+        repository, tag = split_reference(target)
+        query = urlencode({"repo": repository, "tag": tag})
+        self._call("POST", f"{self._image_path(source, 'tag')}?{query}", timeout)
+    
+    def push(
+        self,
+        image: str,
+        auth: str,
+        on_progress: Optional[ProgressCallback] = None,
+        timeout: float = PUSH_TIMEOUT,
+    ) -> Optional[str]:
+        """
+        Push an image and read its digest from the progress stream.
+        
+        Args:
+            image: Reference to push, for example 'ghcr.io/owner/repo:latest'
+            auth: Credentials from registry_auth()
+            on_progress: Called with each progress record as it arrives
+            timeout: Seconds allowed for the whole push
+            
+        Returns:
+            Manifest digest from the push's aux record, or None if it sent none
+            
+        Raises:
+            HTTPError: If the daemon returns an error status
+            URLError: If the daemon cannot be reached or the push fails
+        """
+        repository, tag = split_reference(image)
+        path = f"{self._image_path(repository, 'push')}?{urlencode({'tag': tag})}"
+        digest: Optional[str] = None
+        for record in self._stream(path, timeout, headers={"X-Registry-Auth": auth}, on_progress=on_progress):
+            aux = record.get("aux")
+            if isinstance(aux, dict) and aux.get("Digest"):
+                digest = aux["Digest"]
+        return digest
+
+
+def engine_from_environment() -> Optional[DockerEngine]:
+    """
+    Find the daemon the docker CLI would talk to, if it listens on a unix socket.
+    
+    Honours DOCKER_HOST like the CLI does.
+    
+    Returns:
+        Client for the daemon, or None if DOCKER_HOST names another kind of
+        endpoint or the socket does not exist
+    """
+    host = os.environ.get("DOCKER_HOST", "")
+    if host and not host.startswith("unix://"):
+        return None
+    socket_path = host[len("unix://"):] if host else DOCKER_SOCKET
+    if not os.path.exists(socket_path):
+        return None
+    return DockerEngine(socket_path)
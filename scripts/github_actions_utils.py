@@ -3,15 +3,112 @@
 Shared utilities for GitHub Actions workflow scripts.
 
 This module provides common functionality used across multiple workflow scripts,
-including logging, output variable setting, and GitHub Actions workflow commands.
+including logging, output variable setting, GitHub Actions workflow commands,
+per-phase tracing, OpenMetrics export, opt-in profiling, an overall time budget
+and a keep-alive HTTP client for the GitHub API.
 """
 
+import asyncio
+import atexit
+import bisect
+import codecs
+import hashlib
+import http.client
+import io
+import json
+import math
+import os
+import queue
+import random
+import re
+import ssl
 import sys
-from typing import TYPE_CHECKING
+import threading
+import time
+from contextlib import ContextDecorator, ExitStack, contextmanager
+from typing import (
+    TYPE_CHECKING, Any, IO, Awaitable, Callable, Dict, Iterator, List, Mapping, Optional, Tuple, Union, cast
+)
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlsplit
 
 if TYPE_CHECKING:
     from urllib.request import Request
 
+GITHUB_API_URL = "https://api.github.com"
+
+# GitHub rejects API requests without a User-Agent header
+USER_AGENT = "terraform-bootstrap-gcp-scripts"
+
+# Directory for the on-disk GitHub API response cache; the cache is off when unset
+API_CACHE_DIR_ENV = "GITHUB_API_CACHE_DIR"
+
+DEFAULT_API_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# Path to write a Chrome trace-event JSON file of the recorded spans to at exit
+TRACE_FILE_ENV = "SCRIPT_TRACE_FILE"
+
+# Path to write OpenMetrics text to at exit; metrics are not collected when unset
+METRICS_FILE_ENV = "SCRIPT_METRICS_FILE"
+
+# Comma-separated profilers to run main() under: 'cpu' (cProfile) and/or 'memory' (tracemalloc)
+PROFILE_ENV = "SCRIPT_PROFILE"
+
+# Directory profiles are written to
+PROFILE_DIR_ENV = "SCRIPT_PROFILE_DIR"
+
+# Allocation sites listed in the memory profile
+PROFILE_TOP_ALLOCATIONS = 25
+
+# Histogram buckets for durations in seconds, from a fast API call to a slow push
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+# Methods that can safely be sent again after a failure (RFC 9110 section 9.2.2)
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "PUT", "DELETE", "OPTIONS"})
+
+# Server errors worth retrying; other 5xx statuses are not expected to clear up
+RETRYABLE_STATUSES = frozenset({500, 502, 503, 504})
+
+# Largest page size the GitHub REST API accepts for package version listings
+VERSIONS_PER_PAGE = 100
+
+# Read size when streaming a file request body; http.client's 8 KiB default
+# means hundreds of thousands of small writes for a large image layer
+STREAM_BLOCK_SIZE = 1024 * 1024
+
+# Request body: bytes, a zero-copy view (such as a slice of a memory-mapped
+# file), or a seekable binary stream
+RequestBody = Union[bytes, memoryview, IO[bytes], None]
+
+# Bytes read from a response at a time when decoding a JSON array from it
+JSON_BLOCK_SIZE = 64 * 1024
+
+# JSON insignificant whitespace (RFC 8259 section 2)
+JSON_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+# Multiple of a transfer's expected duration, at the throughput measured so
+# far, that it may take before it is taken to be stuck rather than slow
+TRANSFER_SLACK = 4.0
+
+# Throughput assumed for a kind of transfer until one has been measured, so
+# that the first transfer of a large archive is still given time by its size
+ASSUMED_TRANSFER_THROUGHPUT = 10 * 1024 * 1024
+
+# Shortest timeout derived from a measured throughput, so that a small
+# transfer is not failed by a timeout no connection could meet
+MIN_TRANSFER_TIMEOUT = 10.0
+
+# Smallest request body timed as a throughput sample; smaller requests are
+# dominated by latency
+MIN_TRANSFER_SAMPLE_BYTES = 1024 * 1024
+
+# Errors raised when a kept-alive connection was closed by the server while idle
+STALE_CONNECTION_ERRORS = (
+    http.client.RemoteDisconnected,
+    ConnectionResetError,
+    BrokenPipeError,
+)
+
 
 def github_action_log(level: str, message: str) -> None:
     """
@@ -66,6 +163,661 @@ def set_github_output(name: str, value: str) -> None:
     print(f"{name}={value}")
 
 
+def append_step_summary(markdown: str) -> None:
+    """
+    Append Markdown to the job's step summary, if the job has one.
+    
+    Outside GitHub Actions, where GITHUB_STEP_SUMMARY is unset, this does
+    nothing.
+    
+    Args:
+        markdown: Markdown to append
+    """
+    path = os.environ.get("GITHUB_STEP_SUMMARY")
+    if not path:
+        return
+    try:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(markdown)
+    except OSError as e:
+        github_action_log("warning", f"Could not write step summary: {e}")
+
+
+# Label values of one metric sample, as sorted (name, value) pairs
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    """Hashable, order-independent form of some label values."""
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    """Label set in OpenMetrics text form, such as '{method="GET",le="0.5"}'."""
+    pairs = key + extra
+    if not pairs:
+        return ""
+    escaped = (
+        name + '="' + value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for name, value in pairs
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+class Counter:
+    """
+    Monotonically increasing total, per set of label values.
+    
+    Args:
+        registry: Registry the counter belongs to
+        name: Metric family name, without the '_total' suffix
+        help_text: Description of the metric
+    """
+    
+    def __init__(self, registry: "MetricsRegistry", name: str, help_text: str) -> None:
+        self.registry = registry
+        self.name = name
+        self.help_text = help_text
+        self.values: Dict[LabelKey, float] = {}
+    
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        """Add to the total for some label values; does nothing while metrics are disabled."""
+        if not self.registry.enabled:
+            return
+        key = _label_key(labels)
+        with self.registry.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+    
+    def render(self) -> List[str]:
+        """OpenMetrics text lines for the counter."""
+        lines = [f"# TYPE {self.name} counter", f"# HELP {self.name} {self.help_text}"]
+        for key, value in sorted(self.values.items()):
+            lines.append(f"{self.name}_total{_format_labels(key)} {value!r}")
+        return lines
+
+
+class Gauge:
+    """
+    Value that can go up and down, per set of label values.
+    
+    Args:
+        registry: Registry the gauge belongs to
+        name: Metric family name
+        help_text: Description of the metric
+    """
+    
+    def __init__(self, registry: "MetricsRegistry", name: str, help_text: str) -> None:
+        self.registry = registry
+        self.name = name
+        self.help_text = help_text
+        self.values: Dict[LabelKey, float] = {}
+    
+    def set(self, value: float, **labels: Any) -> None:
+        """Set the value for some label values; does nothing while metrics are disabled."""
+        if not self.registry.enabled:
+            return
+        with self.registry.lock:
+            self.values[_label_key(labels)] = float(value)
+    
+    def render(self) -> List[str]:
+        """OpenMetrics text lines for the gauge."""
+        lines = [f"# TYPE {self.name} gauge", f"# HELP {self.name} {self.help_text}"]
+        for key, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_format_labels(key)} {value!r}")
+        return lines
+
+
+class Histogram:
+    """
+    Distribution of observed values in fixed buckets, per set of label values.
+    
+    Fixed buckets keep an observation to a bisect and an increment, and let
+    percentiles be estimated across many runs by adding bucket counts.
+    
+    Args:
+        registry: Registry the histogram belongs to
+        name: Metric family name
+        help_text: Description of the metric
+        buckets: Ascending upper bounds; an unbounded bucket is added
+    """
+    
+    def __init__(
+        self, registry: "MetricsRegistry", name: str, help_text: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS
+    ) -> None:
+        self.registry = registry
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(sorted(buckets))
+        # Per label values: count in each bucket (not cumulative), then sum
+        self.values: Dict[LabelKey, Tuple[List[int], List[float]]] = {}
+    
+    def observe(self, value: float, **labels: Any) -> None:
+        """Record one observation; does nothing while metrics are disabled."""
+        if not self.registry.enabled:
+            return
+        key = _label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.registry.lock:
+            counts, total = self.values.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[index] += 1
+            total[0] += value
+    
+    def render(self) -> List[str]:
+        """OpenMetrics text lines for the histogram, with cumulative bucket counts."""
+        lines = [f"# TYPE {self.name} histogram", f"# HELP {self.name} {self.help_text}"]
+        for key, (counts, total) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(float(bound))
+                lines.append(f"{self.name}_bucket{_format_labels(key, (('le', le),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {total[0]!r}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Counters, gauges and histograms written out in OpenMetrics text format.
+    
+    While the registry is disabled, updating a metric returns after a single
+    attribute check, so instrumented code costs nothing measurable. The
+    shared registry, `metrics`, is enabled when SCRIPT_METRICS_FILE is set
+    and is written to that file at exit by scripts that call
+    report_at_exit(). The registry is thread safe.
+    
+    Args:
+        enabled: Whether updates are recorded
+        
+    Example:
+        >>> pushed = metrics.counter('push_bytes', 'Bytes uploaded')
+        >>> pushed.inc(1024, mode='registry')
+    """
+    
+    def __init__(self, enabled: bool = False) -> None:
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self._metrics: Dict[str, Union[Counter, Gauge, Histogram]] = {}
+    
+    def _register(self, metric: Union[Counter, Gauge, Histogram]) -> Any:
+        """Add a metric, or return the one already registered under its name."""
+        with self.lock:
+            return self._metrics.setdefault(metric.name, metric)
+    
+    def counter(self, name: str, help_text: str) -> Counter:
+        """Get or create a counter."""
+        counter: Counter = self._register(Counter(self, name, help_text))
+        return counter
+    
+    def gauge(self, name: str, help_text: str) -> Gauge:
+        """Get or create a gauge."""
+        gauge: Gauge = self._register(Gauge(self, name, help_text))
+        return gauge
+    
+    def histogram(self, name: str, help_text: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        """Get or create a histogram."""
+        histogram: Histogram = self._register(Histogram(self, name, help_text, buckets))
+        return histogram
+    
+    def render(self) -> str:
+        """All metrics in OpenMetrics text format."""
+        lines: List[str] = []
+        with self.lock:
+            for metric in self._metrics.values():
+                if metric.values:
+                    lines.extend(metric.render())
+        return "\n".join(lines + ["# EOF"]) + "\n"
+    
+    def report_at_exit(self) -> None:
+        """Write the metrics to SCRIPT_METRICS_FILE when the interpreter exits."""
+        atexit.register(self.write)
+    
+    def write(self) -> None:
+        """Write the metrics to SCRIPT_METRICS_FILE, if it is set."""
+        path = os.environ.get(METRICS_FILE_ENV)
+        if not path or not self.enabled:
+            return
+        try:
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(self.render())
+        except OSError as e:
+            github_action_log("warning", f"Could not write metrics: {e}")
+
+
+metrics = MetricsRegistry(enabled=bool(os.environ.get(METRICS_FILE_ENV)))
+
+PHASE_SECONDS = metrics.histogram("script_phase_seconds", "Duration of each timed phase of a script")
+HTTP_REQUEST_SECONDS = metrics.histogram("http_request_seconds", "Duration of HTTP requests by endpoint")
+HTTP_RETRIES = metrics.counter("http_retries", "HTTP requests retried, by reason")
+VERSION_DELETES = metrics.counter(
+    "package_version_deletes", "Package version deletions attempted, by result"
+)
+
+
+def endpoint_label(path: str) -> str:
+    """
+    Request path with IDs, digests, upload sessions and references replaced by placeholders.
+    
+    Keeps the number of distinct label values bounded.
+    
+    Example:
+        >>> endpoint_label('/users/o/packages/container/p/versions/123?per_page=100')
+        '/users/o/packages/container/p/versions/{id}'
+    """
+    path = path.split("?", 1)[0]
+    path = re.sub(r"/uploads/[^/]+$", "/uploads/{session}", path)
+    path = re.sub(r"/manifests/[^/]+$", "/manifests/{reference}", path)
+    path = re.sub(r"[a-z0-9]+:[a-f0-9]{32,}", "{digest}", path)
+    return re.sub(r"/\d+(?=/|$)", "/{id}", path)
+
+
+class Span:
+    """
+    One timed phase of a script.
+    
+    Attributes:
+        name: Phase name, for example 'docker_push'
+        attributes: Details recorded with the phase, such as tags or byte counts
+        start: Monotonic start time in seconds
+        duration: Seconds taken, once the phase has ended
+        outcome: 'ok', or the exception the phase ended with
+        thread: Identifier of the thread the phase ran on
+    """
+    
+    def __init__(self, name: str, attributes: Dict[str, Any]) -> None:
+        self.name = name
+        self.attributes = attributes
+        self.start = time.monotonic()
+        self.duration = 0.0
+        self.outcome = "ok"
+        self.thread = threading.get_ident()
+
+
+class Tracer:
+    """
+    Records spans and reports them when the script exits.
+    
+    Once a script has called report_at_exit(), a Markdown timing table of
+    the recorded spans is appended at exit to the file named by
+    GITHUB_STEP_SUMMARY, and a Chrome trace-event file, which chrome://tracing
+    and Perfetto open, is written to the path in SCRIPT_TRACE_FILE. Either is
+    skipped when its variable is unset. Spans recorded by code imported
+    elsewhere, such as in unit tests, are never written out. The tracer is
+    thread safe.
+    """
+    
+    def __init__(self) -> None:
+        self.spans: List[Span] = []
+        self.origin = time.monotonic()
+        self._lock = threading.Lock()
+        self._active = threading.local()
+    
+    def _stack(self) -> List[Span]:
+        stack: Optional[List[Span]] = getattr(self._active, "stack", None)
+        if stack is None:
+            stack = self._active.stack = []
+        return stack
+    
+    def begin(self, name: str, attributes: Dict[str, Any]) -> Span:
+        """Start a span on this thread."""
+        current = Span(name, dict(attributes))
+        self._stack().append(current)
+        return current
+    
+    def end(self, error: Optional[BaseException]) -> None:
+        """End the innermost span on this thread, with the exception it ended with, if any."""
+        current = self._stack().pop()
+        current.duration = time.monotonic() - current.start
+        if isinstance(error, SystemExit):
+            if error.code not in (None, 0):
+                current.outcome = f"exit {error.code}"
+        elif error is not None:
+            current.outcome = type(error).__name__
+        PHASE_SECONDS.observe(current.duration, phase=current.name, outcome=current.outcome)
+        with self._lock:
+            self.spans.append(current)
+    
+    def annotate(self, **attributes: Any) -> None:
+        """Add details to the innermost span open on this thread, if any."""
+        stack = self._stack()
+        if stack:
+            stack[-1].attributes.update(attributes)
+    
+    def chrome_trace(self) -> Dict[str, Any]:
+        """Recorded spans as Chrome trace events."""
+        pid = os.getpid()
+        with self._lock:
+            spans = list(self.spans)
+        return {
+            "displayTimeUnit": "ms",
+            "traceEvents": [
+                {
+                    "name": span.name,
+                    "cat": "script",
+                    "ph": "X",
+                    "ts": round((span.start - self.origin) * 1e6),
+                    "dur": round(span.duration * 1e6),
+                    "pid": pid,
+                    "tid": span.thread,
+                    "args": {**{key: str(value) for key, value in span.attributes.items()}, "outcome": span.outcome},
+                }
+                for span in spans
+            ],
+        }
+    
+    def summary_table(self) -> str:
+        """Recorded spans as a Markdown table with one row per phase name."""
+        rows: Dict[str, List[Span]] = {}
+        with self._lock:
+            for span in self.spans:
+                rows.setdefault(span.name, []).append(span)
+        lines = [
+            f"### Timings: {os.path.basename(sys.argv[0])}",
+            "",
+            "| Phase | Calls | Total (s) | Max (s) | MB | Failed |",
+            "| --- | ---: | ---: | ---: | ---: | ---: |",
+        ]
+        for name, spans in rows.items():
+            megabytes = sum(int(span.attributes.get("bytes", 0)) for span in spans) / 1_000_000
+            failed = sum(1 for span in spans if span.outcome != "ok")
+            lines.append(
+                f"| {name} | {len(spans)} | {sum(span.duration for span in spans):.2f} "
+                f"| {max(span.duration for span in spans):.2f} | {megabytes:.0f} | {failed} |"
+            )
+        return "\n".join(lines) + "\n"
+    
+    def report_at_exit(self) -> None:
+        """Write the recorded spans out when the interpreter exits."""
+        atexit.register(self.write)
+    
+    def write(self) -> None:
+        """Write the step summary table and the trace file, where configured."""
+        if not self.spans:
+            return
+        summary_path = os.environ.get("GITHUB_STEP_SUMMARY")
+        trace_path = os.environ.get(TRACE_FILE_ENV)
+        try:
+            if summary_path:
+                with open(summary_path, "a", encoding="utf-8") as f:
+                    f.write(self.summary_table())
+            if trace_path:
+                with open(trace_path, "w", encoding="utf-8") as f:
+                    json.dump(self.chrome_trace(), f)
+        except OSError as e:
+            github_action_log("warning", f"Could not write timings: {e}")
+
+
+tracer = Tracer()
+
+
+class span(ContextDecorator):
+    """
+    Time a phase of the script, as a context manager or a decorator.
+    
+    Spans are reported when the script exits; see Tracer. A decorated
+    function is timed on every call, on whichever thread makes it.
+    
+    Args:
+        name: Phase name
+        **attributes: Details recorded with the phase
+        
+    Example:
+        >>> with span('docker_push', tag='latest'):
+        ...     push()
+        >>> @span('load_image')
+        ... def load_image(image_tar): ...
+    """
+    
+    def __init__(self, name: str, **attributes: Any) -> None:
+        self.name = name
+        self.attributes = attributes
+    
+    def __enter__(self) -> Span:
+        return tracer.begin(self.name, self.attributes)
+    
+    def __exit__(self, exc_type: Any, exc: Optional[BaseException], traceback: Any) -> None:
+        tracer.end(exc)
+
+
+def annotate(**attributes: Any) -> None:
+    """
+    Record details, such as byte counts, on the innermost open span.
+    
+    A 'bytes' attribute is totalled in the step summary table.
+    
+    Example:
+        >>> annotate(bytes=os.path.getsize(image_tar))
+    """
+    tracer.annotate(**attributes)
+
+
+class DeadlineExceeded(TimeoutError):
+    """
+    Raised when the time budget is used up, before or during a call.
+    
+    It is a TimeoutError, and so an OSError, but the API clients let it
+    through rather than wrapping it in URLError like other network failures,
+    so that a script fails at once instead of treating it as a failed request.
+    
+    Args:
+        phase: The call that ran out of time
+        budget: The time budget in seconds
+        message: Description of the failure, if the call was cut off while running
+        
+    Attributes:
+        phase: The call that ran out of time
+    """
+    
+    def __init__(self, phase: str, budget: float, message: Optional[str] = None) -> None:
+        super().__init__(message or f"time budget of {budget:.0f}s used up before {phase}")
+        self.phase = phase
+
+
+class Deadline:
+    """
+    Overall time budget for a script, from which each call takes its timeout.
+    
+    Until start() is given a budget, every call keeps its own fixed timeout.
+    With a budget, a call gets its fixed timeout or the time left, whichever
+    is shorter. A transfer of known size instead gets TRANSFER_SLACK times as
+    long as it should take at the throughput measured so far for its kind of
+    transfer, so a large archive is given the time it needs while one that
+    has stalled is cut off long before a fixed timeout would have noticed.
+    Until a transfer of its kind has been measured, the throughput is taken
+    to be ASSUMED_TRANSFER_THROUGHPUT, and the fixed timeout is kept if that
+    gives less.
+    
+    A call that would start with no time left raises DeadlineExceeded naming
+    it, and exceeded() gives the same error for a call that timed out having
+    used up the budget, so the script fails at once with the phase that ran
+    out of time. The deadline is thread safe; scripts share the module's
+    `deadline` and start it from their --time-budget argument.
+    
+    Args:
+        clock: Monotonic clock (overridable for testing)
+        
+    Example:
+        >>> deadline.start(1500)
+        >>> size = os.path.getsize(image_tar)
+        >>> timeout = deadline.timeout('load_image', 300, size, 'docker_load')
+        >>> subprocess.run(['docker', 'load', '-i', image_tar], timeout=timeout)
+        >>> deadline.record_transfer('docker_load', size, elapsed)
+    """
+    
+    def __init__(self, clock: Callable[[], float] = time.monotonic) -> None:
+        self.budget: Optional[float] = None
+        self._clock = clock
+        self._expires = math.inf
+        self._transfers: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+    
+    def start(self, budget: Optional[float]) -> None:
+        """
+        Start the budget from now.
+        
+        Args:
+            budget: Seconds the script may run for, or None for no budget
+        """
+        self.budget = budget
+        self._expires = self._clock() + budget if budget is not None else math.inf
+    
+    def remaining(self) -> float:
+        """Seconds left in the budget; infinite without one."""
+        return self._expires - self._clock()
+    
+    def record_transfer(self, kind: str, size: int, seconds: float) -> None:
+        """
+        Add a completed transfer to the throughput measured for its kind.
+        
+        Args:
+            kind: Kind of transfer, such as 'docker_load' or a registry host
+            size: Bytes transferred
+            seconds: Time the transfer took
+        """
+        if size <= 0 or seconds <= 0:
+            return
+        with self._lock:
+            total_size, total_seconds = self._transfers.get(kind, (0.0, 0.0))
+            self._transfers[kind] = (total_size + size, total_seconds + seconds)
+    
+    def throughput(self, kind: str) -> Optional[float]:
+        """Bytes per second measured for a kind of transfer, or None if none has completed."""
+        with self._lock:
+            measured = self._transfers.get(kind)
+        return measured[0] / measured[1] if measured else None
+    
+    def timeout(self, phase: str, default: float, size: int = 0, kind: Optional[str] = None) -> float:
+        """
+        Timeout for a call about to start.
+        
+        Args:
+            phase: Name of the call, used when the budget is used up
+            default: Fixed timeout the call has without a budget
+            size: Bytes the call transfers, if known
+            kind: Kind of transfer whose measured throughput scales the timeout
+            
+        Returns:
+            Timeout in seconds
+            
+        Raises:
+            DeadlineExceeded: If the budget is used up
+        """
+        if self.budget is None:
+            return default
+        left = self.remaining()
+        if left <= 0:
+            raise DeadlineExceeded(phase, self.budget)
+        allowed = default
+        if kind is not None and size > 0:
+            rate = self.throughput(kind)
+            if rate:
+                allowed = max(MIN_TRANSFER_TIMEOUT, TRANSFER_SLACK * size / rate)
+            else:
+                allowed = max(default, TRANSFER_SLACK * size / ASSUMED_TRANSFER_THROUGHPUT)
+        return min(allowed, left)
+    
+    def used_up(self) -> bool:
+        """Whether the budget has run out, to within a second; never without a budget."""
+        return self.budget is not None and self.remaining() <= 1
+    
+    def timeout_message(self, phase: str, timeout: float) -> str:
+        """
+        Describe a call that timed out, saying whether it used up the budget.
+        
+        Args:
+            phase: Name of the call
+            timeout: Timeout the call was given
+            
+        Returns:
+            Message for the error log
+        """
+        if self.used_up():
+            return f"{phase} timed out after {timeout:.0f}s, using up the time budget of {self.budget:.0f}s"
+        return f"{phase} timed out after {timeout:.0f}s"
+    
+    def exceeded(self, phase: str, timeout: float) -> DeadlineExceeded:
+        """
+        Error for a call that timed out having used up the budget.
+        
+        Args:
+            phase: Name of the call
+            timeout: Timeout the call was given
+            
+        Returns:
+            DeadlineExceeded carrying timeout_message() for the call
+        """
+        return DeadlineExceeded(phase, self.budget or 0, self.timeout_message(phase, timeout))
+
+
+deadline = Deadline()
+
+
+def run_profiled(main: Callable[[], Any]) -> None:
+    """
+    Run a script's main(), under cProfile and/or tracemalloc if SCRIPT_PROFILE asks for them.
+    
+    SCRIPT_PROFILE lists the profilers to use, 'cpu' and 'memory'. Profiles
+    are written to SCRIPT_PROFILE_DIR (default: the working directory) when
+    main() returns or exits, named after the script:
+    
+    - <script>.prof: cProfile statistics, readable with pstats or snakeviz
+    - <script>_memory.txt: peak RSS, and with 'memory' the traced peak and
+      the top allocation sites still holding memory
+      
+    cProfile only sees the main thread; tracemalloc sees every thread. The
+    profilers are imported only when asked for, so with SCRIPT_PROFILE unset
+    this is a plain call to main().
+    
+    Args:
+        main: Script entry point
+        
+    Example:
+        >>> run_profiled(main)  # SCRIPT_PROFILE=cpu,memory SCRIPT_PROFILE_DIR=/tmp/profile
+    """
+    profilers = {name.strip() for name in os.environ.get(PROFILE_ENV, "").split(",") if name.strip()}
+    if not profilers:
+        main()
+        return
+    unknown = profilers - {"cpu", "memory"}
+    if unknown:
+        github_action_log("warning", f"Ignoring unknown profilers in {PROFILE_ENV}: {', '.join(sorted(unknown))}")
+    
+    import cProfile
+    import resource
+    import tracemalloc
+    
+    directory = os.environ.get(PROFILE_DIR_ENV) or "."
+    script = os.path.splitext(os.path.basename(sys.argv[0]))[0] or "script"
+    profiler = cProfile.Profile() if "cpu" in profilers else None
+    if "memory" in profilers:
+        tracemalloc.start()
+    try:
+        if profiler:
+            profiler.runcall(main)
+        else:
+            main()
+    finally:
+        # main() usually ends in sys.exit(), so the profiles are written on the way out
+        try:
+            os.makedirs(directory, exist_ok=True)
+            if profiler:
+                profiler.dump_stats(os.path.join(directory, f"{script}.prof"))
+            # ru_maxrss is in kilobytes on Linux
+            lines = [f"Peak RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MB"]
+            if tracemalloc.is_tracing():
+                snapshot = tracemalloc.take_snapshot()
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                lines.append(f"Peak traced Python memory: {peak / 1024 / 1024:.1f} MB")
+                lines.append(f"Top {PROFILE_TOP_ALLOCATIONS} allocation sites still holding memory:")
+                lines.extend(str(stat) for stat in snapshot.statistics("lineno")[:PROFILE_TOP_ALLOCATIONS])
+            with open(os.path.join(directory, f"{script}_memory.txt"), "w", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+            log_info(f"Profiles written to {directory}")
+        except OSError as e:
+            github_action_log("warning", f"Could not write profiles: {e}")
+
+
 def add_github_api_headers(req: "Request", token: str) -> None:
     """
     Add standard GitHub API headers to an HTTP request.
@@ -82,6 +834,1098 @@ def add_github_api_headers(req: "Request", token: str) -> None:
         >>> req = Request('https://api.github.com/...')
         >>> add_github_api_headers(req, 'gh_token_123')
     """
-    req.add_header("Accept", "application/vnd.github+json")
-    req.add_header("Authorization", f"Bearer {token}")
-    req.add_header("X-GitHub-Api-Version", "2022-11-28")
+    for name, value in github_api_headers(token).items():
+        req.add_header(name, value)
+
+
+def github_api_headers(token: str) -> Dict[str, str]:
+    """
+    Build the standard GitHub API headers.
+    
+    Args:
+        token: GitHub API token for authentication
+        
+    Returns:
+        Dictionary of the Accept, Authorization and X-GitHub-Api-Version headers
+    """
+    return {
+        "Accept": "application/vnd.github+json",
+        "Authorization": f"Bearer {token}",
+        "X-GitHub-Api-Version": "2022-11-28",
+    }
+
+
+def parse_next_link(link_header: Optional[str]) -> Optional[str]:
+    """
+    Extract the URL of the next page from a GitHub API Link header.
+    
+    Args:
+        link_header: Value of the Link response header, if any
+        
+    Returns:
+        URL of the next page or None if this is the last page
+        
+    Example:
+        >>> parse_next_link('<https://api.github.com/x?page=2>; rel="next"')
+        'https://api.github.com/x?page=2'
+    """
+    if not link_header:
+        return None
+    for link in link_header.split(","):
+        match = re.match(r'\s*<([^>]+)>\s*;\s*rel="next"', link)
+        if match:
+            return match.group(1)
+    return None
+
+
+def _version_tags(version: Dict[str, Any]) -> List[str]:
+    """
+    Get the tags of a package version.
+    
+    Args:
+        version: Package version from GitHub API
+        
+    Returns:
+        List of tags, empty if the version is untagged or has no metadata
+    """
+    return cast(List[str], (version.get("metadata") or {}).get("container", {}).get("tags", []))
+
+
+class PackageVersion:
+    """
+    The fields of a package version that the cleanup uses.
+    
+    Listings are projected onto these records as they are decoded, so the
+    rest of each version's metadata is dropped as soon as it has been read.
+    
+    Attributes:
+        id: Version ID
+        name: Manifest digest the version holds
+        tags: Tags pointing at the version
+        created_at: Creation time as an ISO 8601 string
+    """
+    
+    __slots__ = ("id", "name", "tags", "created_at")
+    
+    def __init__(self, id: int, name: str = "", tags: Optional[List[str]] = None, created_at: str = "") -> None:
+        self.id = id
+        self.name = name
+        self.tags = tags or []
+        self.created_at = created_at
+    
+    @classmethod
+    def from_api(cls, version: Dict[str, Any]) -> "PackageVersion":
+        """
+        Project a package version as returned by the GitHub API.
+        
+        Args:
+            version: Package version from GitHub API, with an 'id'
+            
+        Returns:
+            Compact package version
+        """
+        return cls(
+            int(version["id"]), version.get("name") or "", _version_tags(version), version.get("created_at") or ""
+        )
+    
+    def __repr__(self) -> str:
+        return f"PackageVersion(id={self.id!r}, name={self.name!r}, tags={self.tags!r})"
+
+
+def package_versions_path(owner: str, package_name: str) -> str:
+    """
+    API path of the versions of a user's container package.
+    
+    Example:
+        >>> package_versions_path('owner', 'repo')
+        '/users/owner/packages/container/repo/versions'
+    """
+    return f"/users/{owner}/packages/container/{package_name}/versions"
+
+
+class APIResponse:
+    """
+    HTTP response whose body has been read in full.
+    
+    Attributes:
+        status: HTTP status code
+        headers: Response headers
+        body: Raw response body
+        attempts: Times the request was sent, counting retries
+    """
+    
+    def __init__(self, status: int, headers: http.client.HTTPMessage, body: bytes) -> None:
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.attempts = 1
+    
+    def json(self) -> Any:
+        """
+        Decode the body as JSON.
+        
+        Returns:
+            Decoded JSON value
+        """
+        return json.loads(self.body)
+
+
+def iter_json_array(stream: IO[bytes], block_size: int = JSON_BLOCK_SIZE) -> Iterator[Any]:
+    """
+    Decode a JSON array from a stream one element at a time.
+    
+    The stream is read a block at a time and each element is yielded as
+    soon as it has been read, so decoding overlaps the network reads and
+    only the element being decoded and one block are held in memory,
+    however long the array is. Anything after the closing bracket is not read.
+    
+    Args:
+        stream: Binary stream holding a UTF-8 JSON array
+        block_size: Bytes read at a time
+        
+    Yields:
+        Decoded array elements
+        
+    Raises:
+        ValueError: If the stream does not hold a well-formed JSON array
+        
+    Example:
+        >>> list(iter_json_array(io.BytesIO(b'[{"id": 1}, {"id": 2}]')))
+        [{'id': 1}, {'id': 2}]
+    """
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    pos = 0
+    eof = False
+    
+    def read_more() -> bool:
+        """Append the next block to the buffer, dropping what has been decoded; False at the end."""
+        nonlocal buffer, pos, eof
+        if eof:
+            return False
+        block = stream.read(block_size)
+        eof = not block
+        buffer = buffer[pos:] + text.decode(block, final=eof)
+        pos = 0
+        return True
+    
+    def next_char() -> str:
+        """Skip whitespace, reading more as needed; '' at the end of the stream."""
+        nonlocal pos
+        while True:
+            pos = cast("re.Match[str]", JSON_WHITESPACE.match(buffer, pos)).end()
+            if pos < len(buffer):
+                return buffer[pos]
+            if not read_more():
+                return ""
+    
+    if next_char() != "[":
+        raise ValueError("Expected a JSON array")
+    pos += 1
+    if next_char() == "]":
+        return
+    while True:
+        if not next_char():
+            raise ValueError("JSON array ended early")
+        try:
+            value, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            # The element may just be cut off at the end of the buffer
+            if read_more():
+                continue
+            raise
+        # A number at the end of the buffer may have more digits to come
+        if end == len(buffer) and read_more():
+            continue
+        pos = end
+        yield value
+        separator = next_char()
+        if separator == "]":
+            return
+        if separator != ",":
+            raise ValueError(f"Expected ',' or ']' in JSON array, found {separator or 'end of stream'!r}")
+        pos += 1
+
+
+class ConnectionPool:
+    """
+    Pool of persistent HTTP/1.1 connections to a single origin.
+    
+    Connections are kept alive and reused between requests so that only the
+    first request on each connection pays for the TCP and TLS handshakes. The
+    pool is thread safe. Up to max_size idle connections are kept; when more
+    requests than that are in flight at once, the extra connections are
+    opened on demand and closed after use rather than blocking the caller.
+    
+    Args:
+        base_url: Origin to connect to, for example 'https://api.github.com'
+        max_size: Maximum number of idle connections kept open
+        timeout: Socket timeout in seconds
+        context: SSL context for HTTPS connections (defaults to system trust)
+    """
+    
+    def __init__(
+        self,
+        base_url: str,
+        max_size: int = 8,
+        timeout: float = 30.0,
+        context: Optional[ssl.SSLContext] = None,
+    ) -> None:
+        parts = urlsplit(base_url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise ValueError(f"Unsupported base URL: {base_url}")
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port
+        self.origin = f"{parts.scheme}://{parts.netloc}"
+        self.timeout = timeout
+        self._context = context or ssl.create_default_context()
+        self._idle: "queue.LifoQueue[http.client.HTTPConnection]" = queue.LifoQueue(maxsize=max_size)
+    
+    def _connect(self) -> http.client.HTTPConnection:
+        """Open a new connection to the origin."""
+        if self.scheme == "https":
+            return http.client.HTTPSConnection(
+                self.host, self.port, timeout=self.timeout, context=self._context,
+                blocksize=STREAM_BLOCK_SIZE
+            )
+        return http.client.HTTPConnection(
+            self.host, self.port, timeout=self.timeout, blocksize=STREAM_BLOCK_SIZE
+        )
+    
+    def _release(self, conn: http.client.HTTPConnection) -> None:
+        """Return a connection to the pool, closing it if the pool is full."""
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+    
+    @contextmanager
+    def stream(
+        self,
+        method: str,
+        path: str,
+        body: RequestBody = None,
+        headers: Optional[Mapping[str, str]] = None,
+    ) -> Iterator[http.client.HTTPResponse]:
+        """
+        Send a request and yield the unread response.
+        
+        The connection goes back to the pool when the caller has read the
+        whole body, and is closed otherwise. A request on a reused connection
+        that the server closed while it sat idle is retried once on a new
+        connection; any other connection error propagates.
+        
+        The socket timeout is taken from the shared deadline: the pool's
+        timeout, or for a large request body, a multiple of the time it
+        should take at the upload throughput measured so far to this host,
+        and never more than the budget has left. A timeout that uses up the
+        budget is raised as DeadlineExceeded.
+        
+        Args:
+            method: HTTP method
+            path: Request path including any query string
+            body: Request body
+            headers: Request headers
+            
+        Yields:
+            Response with its body still to be read
+            
+        Raises:
+            DeadlineExceeded: If the time budget is used up, before or during the request
+            OSError: If the request cannot be sent or the response cannot be read
+            http.client.HTTPException: If the server sends an invalid response
+        """
+        if isinstance(body, (bytes, memoryview)):
+            size = len(body)
+        else:
+            size = int((headers or {}).get("Content-Length") or 0)
+        phase = f"{method} {endpoint_label(path)}"
+        timeout = deadline.timeout(phase, self.timeout, size, self.host)
+        start = time.monotonic()
+        try:
+            conn, reused = self._idle.get_nowait(), True
+        except queue.Empty:
+            conn, reused = self._connect(), False
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        try:
+            try:
+                conn.request(method, path, body=body, headers=dict(headers or {}))
+                response = conn.getresponse()
+            except STALE_CONNECTION_ERRORS:
+                if not reused or (body is not None and not isinstance(body, (bytes, memoryview))):
+                    raise
+                conn.close()
+                conn = self._connect()
+                conn.timeout = timeout
+                conn.request(method, path, body=body, headers=dict(headers or {}))
+                response = conn.getresponse()
+            yield response
+        except TimeoutError as e:
+            conn.close()
+            if isinstance(e, DeadlineExceeded) or not deadline.used_up():
+                raise
+            raise deadline.exceeded(phase, timeout) from e
+        except BaseException:
+            conn.close()
+            raise
+        elapsed = time.monotonic() - start
+        if size >= MIN_TRANSFER_SAMPLE_BYTES and response.status < 400:
+            deadline.record_transfer(self.host, size, elapsed)
+        if metrics.enabled:
+            HTTP_REQUEST_SECONDS.observe(
+                elapsed, host=self.host, method=method, endpoint=endpoint_label(path), status=response.status,
+            )
+        if response.isclosed() and not response.will_close:
+            self._release(conn)
+        else:
+            conn.close()
+    
+    def request(
+        self,
+        method: str,
+        path: str,
+        body: RequestBody = None,
+        headers: Optional[Mapping[str, str]] = None,
+    ) -> APIResponse:
+        """
+        Send a request and read the whole response.
+        
+        Args:
+            method: HTTP method
+            path: Request path including any query string
+            body: Request body
+            headers: Request headers
+            
+        Returns:
+            Response with its body read
+        """
+        with self.stream(method, path, body, headers) as response:
+            data = response.read()
+        return APIResponse(response.status, response.msg, data)
+    
+    def close(self) -> None:
+        """Close all idle connections."""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class ResponseCache:
+    """
+    Bounded on-disk cache of GET responses for conditional requests.
+    
+    Each entry is keyed by URL and keeps the response's ETag and
+    Last-Modified validators along with its headers and body. A client sends
+    the validators back as If-None-Match and If-Modified-Since, and when the
+    server answers 304 Not Modified it serves the stored response instead.
+    Entries are files named by a hash of the URL; reading an entry refreshes
+    its modification time, and the least recently used entries are evicted
+    once the cache grows past max_bytes. Writes are atomic, so several
+    processes can share a cache directory.
+    
+    Args:
+        directory: Directory to keep entries in (created if missing)
+        max_bytes: Maximum total size of all entries
+    """
+    
+    def __init__(self, directory: str, max_bytes: int = DEFAULT_API_CACHE_MAX_BYTES) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+    
+    def _entry_path(self, url: str) -> str:
+        """Path of the entry file for a URL."""
+        return os.path.join(self.directory, hashlib.sha256(url.encode()).hexdigest() + ".entry")
+    
+    def _read(self, path: str) -> Tuple[Dict[str, Any], bytes]:
+        """Read an entry's metadata line and body."""
+        with open(path, "rb") as f:
+            meta = json.loads(f.readline())
+            return cast(Dict[str, Any], meta), f.read()
+    
+    def get(self, url: str) -> Optional[Tuple[Dict[str, str], APIResponse]]:
+        """
+        Look up the stored response for a URL.
+        
+        Args:
+            url: Request URL
+            
+        Returns:
+            Tuple of (conditional request headers, stored response) or None
+        """
+        path = self._entry_path(url)
+        try:
+            meta, body = self._read(path)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        if meta.get("url") != url:
+            return None
+        headers = http.client.HTTPMessage()
+        for name, value in meta["headers"]:
+            headers[name] = value
+        conditions = {}
+        if headers.get("ETag"):
+            conditions["If-None-Match"] = headers["ETag"]
+        if headers.get("Last-Modified"):
+            conditions["If-Modified-Since"] = headers["Last-Modified"]
+        return conditions, APIResponse(meta["status"], headers, body)
+    
+    def put(self, url: str, response: APIResponse) -> None:
+        """
+        Store a response if it carries a validator, then evict to stay in bounds.
+        
+        Args:
+            url: Request URL
+            response: Response to store
+        """
+        writer = self.writer(url, response)
+        if writer is not None:
+            writer.write(response.body)
+            writer.commit()
+    
+    def writer(self, url: str, response: APIResponse) -> Optional["CacheEntryWriter"]:
+        """
+        Start storing a response whose body is still to be read.
+        
+        Args:
+            url: Request URL
+            response: Response, whose body is written to the entry separately
+            
+        Returns:
+            Writer for the entry, or None if the response carries no validator
+        """
+        if not (response.headers.get("ETag") or response.headers.get("Last-Modified")):
+            return None
+        meta = {"url": url, "status": response.status, "headers": list(response.headers.items())}
+        return CacheEntryWriter(self, self._entry_path(url), json.dumps(meta).encode() + b"\n")
+    
+    def invalidate(self, url_prefix: str) -> int:
+        """
+        Remove every entry whose URL starts with a prefix.
+        
+        Args:
+            url_prefix: URL prefix to match
+            
+        Returns:
+            Number of entries removed
+        """
+        removed = 0
+        for path in self._entry_paths():
+            try:
+                meta, _ = self._read(path)
+                if str(meta.get("url", "")).startswith(url_prefix):
+                    os.remove(path)
+                    removed += 1
+            except (OSError, ValueError):
+                continue
+        return removed
+    
+    def _entry_paths(self) -> List[str]:
+        """Paths of all entry files."""
+        return [
+            os.path.join(self.directory, name)
+            for name in os.listdir(self.directory)
+            if name.endswith(".entry")
+        ]
+    
+    def _evict(self) -> None:
+        """Remove least recently used entries until the cache fits in max_bytes."""
+        entries = []
+        for path in self._entry_paths():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+
+class CacheEntryWriter:
+    """
+    Writes a ResponseCache entry as its body is read.
+    
+    The entry goes to a temporary file and only replaces the stored one on
+    commit(), so a body that is never read to the end is never served.
+    Failing to write only turns caching off for this entry.
+    
+    Args:
+        cache: Cache the entry belongs to
+        path: Path of the entry file
+        header: Serialized metadata line
+    """
+    
+    def __init__(self, cache: ResponseCache, path: str, header: bytes) -> None:
+        self._cache = cache
+        self._path = path
+        self._temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        self._file: Optional[IO[bytes]] = None
+        try:
+            self._file = open(self._temp_path, "wb")
+            self._file.write(header)
+        except OSError as e:
+            self._fail(e)
+    
+    def _fail(self, error: OSError) -> None:
+        """Log a write failure and drop the entry."""
+        log_info(f"Could not write API cache entry: {error}")
+        self.discard()
+    
+    def write(self, data: Union[bytes, memoryview]) -> None:
+        """Append part of the body."""
+        if self._file is None:
+            return
+        try:
+            self._file.write(data)
+        except OSError as e:
+            self._fail(e)
+    
+    def commit(self) -> None:
+        """Store the entry, then evict to stay in bounds."""
+        if self._file is None:
+            return
+        try:
+            self._file.close()
+            self._file = None
+            os.replace(self._temp_path, self._path)
+        except OSError as e:
+            self._fail(e)
+            return
+        self._cache._evict()
+    
+    def discard(self) -> None:
+        """Drop the entry unless it has been committed."""
+        if self._file is None:
+            return
+        try:
+            self._file.close()
+        except OSError:
+            pass
+        self._file = None
+        try:
+            os.remove(self._temp_path)
+        except OSError:
+            pass
+
+
+class _CachingReader(io.RawIOBase):
+    """Raw stream that copies everything read from a response body into a cache entry."""
+    
+    def __init__(self, source: http.client.HTTPResponse, writer: CacheEntryWriter) -> None:
+        super().__init__()
+        self._source = source
+        self._writer = writer
+    
+    def readable(self) -> bool:
+        return True
+    
+    def readinto(self, buffer: Any) -> int:
+        count = self._source.readinto(buffer)
+        self._writer.write(memoryview(buffer)[:count])
+        return count
+
+
+class RequestScheduler:
+    """
+    Paces requests by the rate limit and retries transient failures.
+    
+    After every response the scheduler records X-RateLimit-Remaining and
+    X-RateLimit-Reset. When the remaining allowance drops to min_remaining,
+    the next request waits for the reset rather than running into the limit.
+    Idempotent requests are retried with jittered exponential backoff when
+    they fail to connect or get a 500, 502, 503 or 504, and after the wait
+    GitHub asks for when they hit a primary or secondary rate limit
+    (Retry-After, or X-RateLimit-Reset when nothing is remaining, or at
+    least a minute otherwise).
+    
+    Each request's waits come out of a time budget of its own, and never
+    run past the shared deadline: a retry that would wait beyond either is
+    not made and the last failure is returned to the caller. Every wait is
+    logged, and the running total is kept in throttled_seconds so the share
+    of job time spent throttled is visible. The scheduler is thread safe and
+    is meant to be shared by all requests made with a token, however long
+    the script runs. The attempts made are recorded on the response.
+    
+    call() sends blocking requests; call_async() paces and retries
+    coroutines the same way, waiting with asyncio so that other requests on
+    the event loop carry on meanwhile.
+    
+    Args:
+        time_budget: Seconds the scheduler may spend waiting for any one request
+        max_attempts: Maximum attempts per request, including the first
+        base_delay: Backoff delay before the first retry, in seconds
+        max_delay: Cap on a single backoff delay, in seconds
+        min_remaining: Remaining allowance at which requests wait for the reset
+        sleep: Function used to wait (overridable for testing)
+        async_sleep: Coroutine function used to wait in call_async (overridable for testing)
+        clock: Monotonic clock (overridable for testing)
+        wall_clock: Wall clock for rate limit reset times (overridable for testing)
+    """
+    
+    def __init__(
+        self,
+        time_budget: float = 300.0,
+        max_attempts: int = 6,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+        min_remaining: int = 1,
+        sleep: Callable[[float], None] = time.sleep,
+        async_sleep: Callable[[float], Awaitable[None]] = asyncio.sleep,
+        clock: Callable[[], float] = time.monotonic,
+        wall_clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.min_remaining = min_remaining
+        self.throttled_seconds = 0.0
+        self._sleep = sleep
+        self._async_sleep = async_sleep
+        self._clock = clock
+        self._wall_clock = wall_clock
+        self.time_budget = time_budget
+        self._remaining: Optional[int] = None
+        self._reset: Optional[float] = None
+        self._lock = threading.Lock()
+    
+    def _admit_wait(self, seconds: float, reason: str, until: float) -> bool:
+        """
+        Decide whether the time budget allows a wait, and log and count it if so.
+        
+        Args:
+            seconds: Time to wait
+            reason: Why the request waits, for the log
+            until: Clock time at which the request's own budget runs out
+            
+        Returns:
+            True if the request should wait, False if the wait would exceed the budget
+        """
+        if self._clock() + seconds > until or seconds >= deadline.remaining():
+            log_info(f"Not waiting {seconds:.1f}s ({reason}): time budget exhausted")
+            return False
+        with self._lock:
+            self.throttled_seconds += seconds
+            total = self.throttled_seconds
+        log_info(f"Waiting {seconds:.1f}s ({reason}), {total:.1f}s spent throttled so far")
+        return True
+    
+    def _wait(self, seconds: float, reason: str, until: float) -> bool:
+        """
+        Wait if the time budget allows it.
+        
+        Returns:
+            True if the scheduler waited, False if the wait would exceed the budget
+        """
+        if not self._admit_wait(seconds, reason, until):
+            return False
+        self._sleep(seconds)
+        return True
+    
+    async def _wait_async(self, seconds: float, reason: str, until: float) -> bool:
+        """Wait on the event loop if the time budget allows it, as _wait() does."""
+        if not self._admit_wait(seconds, reason, until):
+            return False
+        await self._async_sleep(seconds)
+        return True
+    
+    def _observe(self, headers: http.client.HTTPMessage) -> None:
+        """Record the rate limit state reported by a response."""
+        remaining = headers.get("X-RateLimit-Remaining")
+        reset = headers.get("X-RateLimit-Reset")
+        if remaining is None or reset is None:
+            return
+        try:
+            with self._lock:
+                self._remaining, self._reset = int(remaining), float(reset)
+        except ValueError:
+            return
+    
+    def _reset_wait(self) -> float:
+        """Seconds to wait for the rate limit reset, or 0 while allowance remains."""
+        with self._lock:
+            if self._remaining is None or self._reset is None or self._remaining > self.min_remaining:
+                return 0.0
+            wait = self._reset - self._wall_clock() + 1
+            # Only one request waits for the reset; the rest follow it
+            self._remaining = None
+        return max(0.0, wait)
+    
+    def _pace(self, until: float) -> None:
+        """Wait for the rate limit reset when the allowance is used up."""
+        wait = self._reset_wait()
+        if wait > 0:
+            self._wait(wait, "rate limit nearly used up", until)
+    
+    def _backoff(self, attempt: int) -> float:
+        """Jittered exponential backoff delay for a retry attempt."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+    
+    def _retry_delay(self, response: APIResponse, attempt: int) -> Optional[float]:
+        """
+        Decide how long to wait before retrying a response, if at all.
+        
+        Returns:
+            Delay in seconds, or None if the response should not be retried
+        """
+        headers = response.headers
+        if response.status in (403, 429):
+            retry_after = headers.get("Retry-After")
+            if retry_after is not None and retry_after.isdigit():
+                return float(retry_after)
+            if headers.get("X-RateLimit-Remaining") == "0" and headers.get("X-RateLimit-Reset"):
+                try:
+                    return max(0.0, float(headers["X-RateLimit-Reset"]) - self._wall_clock()) + 1
+                except ValueError:
+                    pass
+            if response.status == 429 or b"secondary rate limit" in response.body.lower():
+                return max(60.0, self._backoff(attempt))
+            return None
+        if response.status in RETRYABLE_STATUSES:
+            return self._backoff(attempt)
+        return None
+    
+    def call(self, method: str, send: Callable[[], APIResponse]) -> APIResponse:
+        """
+        Send a request, pacing it and retrying it when that is safe.
+        
+        Args:
+            method: HTTP method, used to decide whether a retry is safe
+            send: Function sending the request; raises URLError when the
+                server cannot be reached
+                
+        Returns:
+            The first response that is not retried, or the last response
+            once attempts or the time budget run out
+            
+        Raises:
+            URLError: If the server cannot be reached on the last attempt
+        """
+        retryable = method.upper() in IDEMPOTENT_METHODS
+        until = self._clock() + self.time_budget
+        attempt = 0
+        while True:
+            self._pace(until)
+            attempt += 1
+            last_attempt = not retryable or attempt >= self.max_attempts
+            try:
+                response = send()
+            except URLError as e:
+                if last_attempt or not self._wait(self._backoff(attempt), f"{method} failed: {e.reason}", until):
+                    raise
+                HTTP_RETRIES.inc(reason="connection")
+                continue
+            response.attempts = attempt
+            self._observe(response.headers)
+            delay = self._retry_delay(response, attempt)
+            if delay is None or last_attempt:
+                return response
+            if not self._wait(delay, f"{method} got HTTP {response.status}", until):
+                return response
+            HTTP_RETRIES.inc(reason=f"http_{response.status}")
+    
+    async def call_async(self, method: str, send: Callable[[], Awaitable[APIResponse]]) -> APIResponse:
+        """
+        Send a request from a coroutine, pacing it and retrying it as call() does.
+        
+        Args:
+            method: HTTP method, used to decide whether a retry is safe
+            send: Coroutine function sending the request; raises URLError
+                when the server cannot be reached
+                
+        Returns:
+            The first response that is not retried, or the last response
+            once attempts or the time budget run out
+            
+        Raises:
+            URLError: If the server cannot be reached on the last attempt
+        """
+        retryable = method.upper() in IDEMPOTENT_METHODS
+        until = self._clock() + self.time_budget
+        attempt = 0
+        while True:
+            wait = self._reset_wait()
+            if wait > 0:
+                await self._wait_async(wait, "rate limit nearly used up", until)
+            attempt += 1
+            last_attempt = not retryable or attempt >= self.max_attempts
+            try:
+                response = await send()
+            except URLError as e:
+                if last_attempt or not await self._wait_async(
+                    self._backoff(attempt), f"{method} failed: {e.reason}", until
+                ):
+                    raise
+                HTTP_RETRIES.inc(reason="connection")
+                continue
+            response.attempts = attempt
+            self._observe(response.headers)
+            delay = self._retry_delay(response, attempt)
+            if delay is None or last_attempt:
+                return response
+            if not await self._wait_async(delay, f"{method} got HTTP {response.status}", until):
+                return response
+            HTTP_RETRIES.inc(reason=f"http_{response.status}")
+
+
+class GitHubAPIClient:
+    """
+    Keep-alive client for the GitHub REST API.
+    
+    Requests share a pool of persistent connections and carry the
+    authentication and API version headers, so list-then-delete and bulk
+    flows pay for the TLS handshake once per connection rather than once per
+    call. Errors are raised as urllib's HTTPError and URLError so callers can
+    handle them exactly as they would for urlopen.
+    
+    With a response cache, GET requests are made conditional on the stored
+    validators and a 304 Not Modified is answered from the cache. GitHub does
+    not count 304 responses against the primary rate limit, and the body is
+    neither transferred nor stored again.
+    
+    With a request scheduler, requests are paced by the rate limit and
+    transient failures of idempotent requests are retried.
+    
+    Args:
+        token: GitHub API token for authentication
+        base_url: API origin (overridable for local testing)
+        pool_size: Maximum number of idle connections kept open
+        timeout: Socket timeout in seconds
+        context: SSL context for HTTPS connections (defaults to system trust)
+        cache: Response cache for conditional GET requests, if any
+        scheduler: Scheduler pacing and retrying requests, if any
+        
+    Example:
+        >>> client = GitHubAPIClient('gh_token_123')
+        >>> versions = client.request('GET', '/user/packages?package_type=container').json()
+    """
+    
+    def __init__(
+        self,
+        token: str,
+        base_url: str = GITHUB_API_URL,
+        pool_size: int = 8,
+        timeout: float = 30.0,
+        context: Optional[ssl.SSLContext] = None,
+        cache: Optional[ResponseCache] = None,
+        scheduler: Optional[RequestScheduler] = None,
+    ) -> None:
+        self._pool = ConnectionPool(base_url, pool_size, timeout, context)
+        self._headers = github_api_headers(token)
+        self._headers["User-Agent"] = USER_AGENT
+        self.cache = cache
+        self.scheduler = scheduler
+    
+    def _path(self, url: str) -> str:
+        """
+        Convert a path or absolute URL into a request path on the API origin.
+        
+        Raises:
+            URLError: If an absolute URL points at another origin, so the
+                token is never sent to a host named in a response header
+        """
+        if url.startswith("/"):
+            return url
+        if not url.startswith(f"{self._pool.origin}/"):
+            raise URLError(f"Refusing to send GitHub API request to {url}")
+        return url[len(self._pool.origin):]
+    
+    def request(
+        self, method: str, url: str, body: Any = None, allowed_statuses: Tuple[int, ...] = ()
+    ) -> APIResponse:
+        """
+        Send an API request.
+        
+        Args:
+            method: HTTP method
+            url: Path on the API origin or absolute URL on the same origin
+            body: Value to send as a JSON request body, if any
+            allowed_statuses: Error statuses to return instead of raising
+            
+        Returns:
+            Response with a 2xx or 3xx status, or one of allowed_statuses
+            
+        Raises:
+            HTTPError: If the API returns any other 4xx or 5xx status
+            URLError: If the API cannot be reached or the URL is on another origin
+            DeadlineExceeded: If the time budget is used up
+        """
+        path = self._path(url)
+        full_url = f"{self._pool.origin}{path}"
+        headers = dict(self._headers)
+        data = None
+        if body is not None:
+            data = json.dumps(body).encode()
+            headers["Content-Type"] = "application/json"
+        cached = self.cache.get(full_url) if self.cache and method == "GET" else None
+        if cached is not None:
+            headers.update(cached[0])
+        
+        def send() -> APIResponse:
+            try:
+                return self._pool.request(method, path, data, headers)
+            except DeadlineExceeded:
+                raise
+            except (OSError, http.client.HTTPException) as e:
+                raise URLError(e) from e
+        
+        response = self.scheduler.call(method, send) if self.scheduler else send()
+        if cached is not None and response.status == 304:
+            log_info(f"Served {path} from cache (304 Not Modified)")
+            return cached[1]
+        if self.cache and method == "GET" and response.status == 200:
+            self.cache.put(full_url, response)
+        if response.status >= 400 and response.status not in allowed_statuses:
+            raise self._http_error(path, response)
+        return response
+    
+    def _http_error(self, path: str, response: APIResponse) -> HTTPError:
+        """HTTPError for an error response, carrying its body."""
+        return HTTPError(
+            f"{self._pool.origin}{path}",
+            response.status,
+            http.client.responses.get(response.status, ""),
+            response.headers,
+            io.BytesIO(response.body),
+        )
+    
+    @contextmanager
+    def stream(self, url: str) -> Iterator[Tuple[APIResponse, IO[bytes]]]:
+        """
+        Send a GET request and yield the response with its body unread.
+        
+        The body is read from the socket as the caller consumes it, so a
+        large listing never has to be held in memory whole; pair it with
+        iter_json_array. Requests are paced and retried as far as the
+        response headers, and an error response is read in full and raised.
+        With a response cache the request is conditional: a 304 is answered
+        with the stored body, and a fresh body is written to the cache as it
+        is read, then stored once the caller is done with it.
+        
+        Args:
+            url: Path on the API origin or absolute URL on the same origin
+            
+        Yields:
+            Tuple of the response, whose body is left empty, and a stream of the body
+            
+        Raises:
+            HTTPError: If the API returns a 4xx or 5xx status
+            URLError: If the API cannot be reached, the body cannot be read,
+                or the URL is on another origin
+            DeadlineExceeded: If the time budget is used up
+            
+        Example:
+            >>> with client.stream('/user/packages?package_type=container') as (response, body):
+            ...     names = [package['name'] for package in iter_json_array(body)]
+        """
+        path = self._path(url)
+        full_url = f"{self._pool.origin}{path}"
+        headers = dict(self._headers)
+        cached = self.cache.get(full_url) if self.cache else None
+        if cached is not None:
+            headers.update(cached[0])
+        with ExitStack() as stack:
+            opened: List[http.client.HTTPResponse] = []
+            
+            def send() -> APIResponse:
+                attempt = ExitStack()
+                try:
+                    response = attempt.enter_context(self._pool.stream("GET", path, None, headers))
+                    if response.status >= 300:
+                        # Error bodies are small and the scheduler reads them to decide on retries
+                        with attempt:
+                            return APIResponse(response.status, response.msg, response.read())
+                except DeadlineExceeded:
+                    raise
+                except (OSError, http.client.HTTPException) as e:
+                    raise URLError(e) from e
+                # The connection is released once the caller has read the body
+                stack.push(attempt)
+                opened.append(response)
+                return APIResponse(response.status, response.msg, b"")
+            
+            response = self.scheduler.call("GET", send) if self.scheduler else send()
+            if response.status >= 400:
+                raise self._http_error(path, response)
+            if cached is not None and response.status == 304:
+                log_info(f"Served {path} from cache (304 Not Modified)")
+                yield cached[1], io.BytesIO(cached[1].body)
+                return
+            if not opened:
+                yield response, io.BytesIO(response.body)
+                return
+            body: IO[bytes] = opened[0]
+            writer = self.cache.writer(full_url, response) if self.cache and response.status == 200 else None
+            if writer is not None:
+                stack.callback(writer.discard)
+                body = io.BufferedReader(_CachingReader(opened[0], writer), JSON_BLOCK_SIZE)
+            try:
+                yield response, body
+                if writer is not None:
+                    # The caller may stop at the end of the JSON; the entry needs the whole body
+                    while body.read(JSON_BLOCK_SIZE):
+                        pass
+                    writer.commit()
+            except (OSError, http.client.HTTPException) as e:
+                if isinstance(e, TimeoutError) and deadline.used_up():
+                    # The pool, which knows the request's timeout, raises it as DeadlineExceeded
+                    raise
+                raise URLError(e) from e
+    
+    def invalidate_cache(self, url: str) -> None:
+        """
+        Drop cached responses for a URL and every URL beneath it.
+        
+        Args:
+            url: Path on the API origin or absolute URL on the same origin
+        """
+        if self.cache:
+            self.cache.invalidate(f"{self._pool.origin}{self._path(url)}")
+    
+    def close(self) -> None:
+        """Close all idle connections."""
+        self._pool.close()
+
+
+_clients: Dict[Tuple[str, str], GitHubAPIClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_github_api_client(token: str, base_url: str = GITHUB_API_URL) -> GitHubAPIClient:
+    """
+    Get the shared GitHub API client for a token.
+    
+    Every caller in the process gets the same client, and so the same pool
+    of connections and the same request scheduler, for a given token and
+    origin. When the GITHUB_API_CACHE_DIR environment variable is set, the
+    client keeps a response cache in that directory.
+    
+    Args:
+        token: GitHub API token for authentication
+        base_url: API origin
+        
+    Returns:
+        Shared client
+    """
+    with _clients_lock:
+        client = _clients.get((token, base_url))
+        if client is None:
+            cache_dir = os.environ.get(API_CACHE_DIR_ENV)
+            cache = ResponseCache(cache_dir) if cache_dir else None
+            client = _clients[(token, base_url)] = GitHubAPIClient(
+                token, base_url, cache=cache, scheduler=RequestScheduler()
+            )
+        return client
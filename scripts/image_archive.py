@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+Memory-mapped reader for `docker save` and OCI layout tar archives.
+
+The archive is mapped into memory and its tar headers are scanned once to
+build an index of where each member's contents start and how long they are.
+Members are then served as memoryview slices of the mapping, so hashing or
+uploading a multi-GB layer reads it straight from the page cache without
+extracting it, copying it through tarfile's buffers, or holding more than the
+pages in use in memory.
+
+Only what `docker save` writes is supported: uncompressed ustar archives,
+with GNU long names and pax extended headers for long paths and large sizes.
+Symbolic and hard links, which the legacy layout uses for layers shared by
+several images, are served as the contents of the file they point at.
+
+Example:
+    >>> with ImageArchive('/tmp/candidate_image.tar') as archive:
+    ...     manifest = json.loads(bytes(archive.read('manifest.json')))
+"""
+
+import mmap
+import posixpath
+from typing import Any, Dict, List, Optional
+
+BLOCK_SIZE = 512
+
+# Type flags of members whose contents are file data
+REGULAR_TYPES = (b"0", b"\0", b"7")
+DIRECTORY = b"5"
+HARD_LINK = b"1"
+SYMBOLIC_LINK = b"2"
+
+# Links followed before a member is taken to be part of a loop
+MAX_LINK_DEPTH = 16
+
+# Type flags of headers describing the member that follows them
+GNU_LONG_NAME = b"L"
+GNU_LONG_LINK = b"K"
+PAX_HEADER = b"x"
+PAX_GLOBAL_HEADER = b"g"
+
+
+class ArchiveMember:
+    """
+    Location of one archive member's contents.
+    
+    Attributes:
+        name: Member path within the archive
+        offset: Offset of the first byte of the contents within the file
+        size: Length of the contents in bytes
+        regular: True for regular files, False for directories, links and others
+        link: Archive path of the member a symbolic or hard link points at, else None
+    """
+    
+    def __init__(self, name: str, offset: int, size: int, regular: bool, link: Optional[str] = None) -> None:
+        self.name = name
+        self.offset = offset
+        self.size = size
+        self.regular = regular
+        self.link = link
+
+
+def _parse_number(field: bytes) -> int:
+    """
+    Parse a numeric header field.
+    
+    Raises:
+        ValueError: If the field is not a number
+    """
+    # GNU base-256 encoding, used for sizes of 8 GiB and above
+    if field and field[0] & 0x80:
+        return int.from_bytes(bytes([field[0] & 0x7F]) + field[1:], "big")
+    text = field.rstrip(b"\0 ").lstrip(b" ")
+    return int(text, 8) if text else 0
+
+
+def _parse_string(field: bytes) -> str:
+    """Parse a NUL-terminated header field."""
+    return field.split(b"\0", 1)[0].decode("utf-8", "surrogateescape")
+
+
+def _parse_pax(data: bytes) -> Dict[str, str]:
+    """
+    Parse pax extended header records of the form '<length> <key>=<value>\\n'.
+    
+    Raises:
+        ValueError: If a record is malformed
+    """
+    records = {}
+    position = 0
+    while position < len(data):
+        space = data.index(b" ", position)
+        length = int(data[position:space])
+        if length <= 0:
+            raise ValueError("Malformed pax header")
+        key, _, value = data[space + 1:position + length - 1].partition(b"=")
+        records[key.decode("utf-8")] = value.decode("utf-8", "surrogateescape")
+        position += length
+    return records
+
+
+def _padded(size: int) -> int:
+    """Size rounded up to a whole number of tar blocks."""
+    return (size + BLOCK_SIZE - 1) // BLOCK_SIZE * BLOCK_SIZE
+
+
+class ImageArchive:
+    """
+    Read-only, memory-mapped tar archive with an index of its members.
+    
+    Views returned by read() and view() are slices of the mapping. They must
+    not be used after the archive is closed, and the mapping is only released
+    once the last of them has gone.
+    
+    Args:
+        path: Path to the archive
+        
+    Raises:
+        OSError: If the archive cannot be opened
+        ValueError: If the archive is not a well-formed uncompressed tar archive
+        
+    Example:
+        >>> with ImageArchive('image.tar') as archive:
+        ...     layer = archive.read('blobs/sha256/abc...')
+        ...     hashlib.sha256(layer).hexdigest()
+    """
+    
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.members: Dict[str, ArchiveMember] = {}
+        self._file = open(path, "rb")
+        self._map: Optional[mmap.mmap] = None
+        self._view = memoryview(b"")
+        try:
+            # mmap cannot map an empty file, which is not an archive anyway
+            if self._file.seek(0, 2) == 0:
+                raise ValueError(f"Empty archive {path}")
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._view = memoryview(self._map)
+            self._scan()
+        except BaseException:
+            self.close()
+            raise
+    
+    def _scan(self) -> None:
+        """
+        Index every member by reading the headers only.
+        
+        Raises:
+            ValueError: If a header is corrupt or the archive is truncated
+        """
+        view = self._view
+        position = 0
+        long_name: Optional[str] = None
+        long_link: Optional[str] = None
+        pax: Dict[str, str] = {}
+        while position + BLOCK_SIZE <= len(view):
+            header = bytes(view[position:position + BLOCK_SIZE])
+            if header == bytes(BLOCK_SIZE):
+                # An all-zero block marks the end of the archive
+                return
+            checksum = _parse_number(header[148:156])
+            if checksum != sum(header[:148]) + 8 * ord(" ") + sum(header[156:]):
+                raise ValueError(f"Corrupt tar header at offset {position} in {self.path}")
+            
+            type_flag = header[156:157]
+            size = _parse_number(header[124:136])
+            if type_flag not in (GNU_LONG_NAME, GNU_LONG_LINK, PAX_HEADER, PAX_GLOBAL_HEADER) and "size" in pax:
+                size = int(pax["size"])
+            offset = position + BLOCK_SIZE
+            if offset + size > len(view):
+                raise ValueError(f"Truncated archive {self.path}: member at offset {position} runs past the end")
+            
+            if type_flag == GNU_LONG_NAME:
+                long_name = _parse_string(bytes(view[offset:offset + size]))
+            elif type_flag == GNU_LONG_LINK:
+                long_link = _parse_string(bytes(view[offset:offset + size]))
+            elif type_flag == PAX_HEADER:
+                pax = _parse_pax(bytes(view[offset:offset + size]))
+            elif type_flag != PAX_GLOBAL_HEADER:
+                name = pax.get("path") or long_name or self._header_name(header)
+                if type_flag == DIRECTORY:
+                    name = name.rstrip("/")
+                link = None
+                if type_flag in (HARD_LINK, SYMBOLIC_LINK):
+                    link = pax.get("linkpath") or long_link or _parse_string(header[157:257])
+                    if type_flag == SYMBOLIC_LINK:
+                        # Symbolic links are relative to the directory holding them
+                        link = posixpath.normpath(posixpath.join(posixpath.dirname(name), link))
+                    # Links carry no data of their own, whatever their size field says
+                    size = 0
+                self.members[name] = ArchiveMember(name, offset, size, type_flag in REGULAR_TYPES, link)
+                long_name = None
+                long_link = None
+                pax = {}
+            position = offset + _padded(size)
+        raise ValueError(f"Truncated archive {self.path}: no end-of-archive marker")
+    
+    @staticmethod
+    def _header_name(header: bytes) -> str:
+        """Member name from a ustar header, joining the prefix field if set."""
+        name = _parse_string(header[0:100])
+        # POSIX ustar only; GNU archives use the prefix field for other things
+        if header[257:263] == b"ustar\0":
+            prefix = _parse_string(header[345:500])
+            if prefix:
+                name = f"{prefix}/{name}"
+        return name
+    
+    def __contains__(self, name: object) -> bool:
+        return name in self.members
+    
+    def names(self) -> List[str]:
+        """Names of all members, in archive order."""
+        return list(self.members)
+    
+    def getmember(self, name: str) -> ArchiveMember:
+        """
+        Look up a regular file in the archive, following links to it.
+        
+        Raises:
+            ValueError: If the member is missing, is not a regular file or a
+                link to one, or is part of a loop of links
+        """
+        member = self.members.get(name)
+        for _ in range(MAX_LINK_DEPTH):
+            if member is None or member.link is None:
+                break
+            member = self.members.get(member.link)
+        if member is None or not member.regular:
+            raise ValueError(f"Image archive has no file {name}")
+        return member
+    
+    def view(self, offset: int, size: int) -> memoryview:
+        """
+        Zero-copy view of a range of the archive file.
+        
+        Args:
+            offset: Offset of the first byte
+            size: Number of bytes
+        """
+        return self._view[offset:offset + size]
+    
+    def read(self, name: str) -> memoryview:
+        """
+        Zero-copy view of a member's contents.
+        
+        Args:
+            name: Member name
+            
+        Raises:
+            ValueError: If the member is missing or is not a regular file or a link to one
+        """
+        member = self.getmember(name)
+        return self.view(member.offset, member.size)
+    
+    def close(self) -> None:
+        """Close the archive, unmapping it once no views remain."""
+        self._view.release()
+        if self._map is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                # Views handed out are still alive; the mapping is released with them
+                pass
+        self._file.close()
+    
+    def __enter__(self) -> "ImageArchive":
+        return self
+    
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
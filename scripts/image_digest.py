@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+"""
+Work out the manifest and manifest digest of the image in a `docker save` archive.
+
+The digest that attestations are made for is the SHA-256 of the manifest bytes
+the registry stores. When the archive is pushed as it is, that manifest is
+known before anything is uploaded, so the digest can be computed locally and
+checked against the Docker-Content-Digest the registry answers with, instead
+of being read out of `docker push` output.
+
+The manifest comes from the archive itself where it has one: Docker 25 and
+later write an OCI image layout, whose index.json names the image manifest
+blob, and that manifest is used byte for byte. Older archives only have
+manifest.json, and an OCI manifest is built for them from the config and
+layer files. The config is hashed straight from the memory-mapped archive;
+layer digests come from the blob names or the config's rootfs.diff_ids, and
+the registry checks every blob against its digest on upload.
+"""
+
+import hashlib
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import image_archive
+
+OCI_MANIFEST_MEDIA_TYPE = "application/vnd.oci.image.manifest.v1+json"
+OCI_CONFIG_MEDIA_TYPE = "application/vnd.oci.image.config.v1+json"
+OCI_LAYER_MEDIA_TYPE = "application/vnd.oci.image.layer.v1.tar"
+OCI_GZIP_LAYER_MEDIA_TYPE = "application/vnd.oci.image.layer.v1.tar+gzip"
+DOCKER_MANIFEST_MEDIA_TYPE = "application/vnd.docker.distribution.manifest.v2+json"
+
+# Image manifest media types that can be pushed verbatim from an OCI layout
+IMAGE_MANIFEST_MEDIA_TYPES = (OCI_MANIFEST_MEDIA_TYPE, DOCKER_MANIFEST_MEDIA_TYPE)
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+# Blobs hashed at once when verifying; hashlib releases the GIL on large
+# buffers, so each one can run on its own core
+DEFAULT_VERIFY_WORKERS = os.cpu_count() or 1
+
+# Errors reading a malformed or unreadable archive can raise: missing keys,
+# short lists and fields of the wrong JSON type as well as I/O and parse errors
+ARCHIVE_ERRORS = (OSError, ValueError, KeyError, IndexError, TypeError)
+
+# Config file name in the legacy layout, '<hex digest>.json'
+LEGACY_CONFIG_NAME = re.compile(r"(?:.*/)?([a-f0-9]{64})\.json")
+
+
+def sha256_digest(data: Union[bytes, memoryview]) -> str:
+    """
+    Digest of some bytes in the 'sha256:<hex>' form registries use.
+    
+    Example:
+        >>> sha256_digest(b"")
+        'sha256:e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855'
+    """
+    return "sha256:" + hashlib.sha256(data).hexdigest()
+
+
+class Blob:
+    """
+    Content-addressed blob stored in an image archive.
+    
+    Attributes:
+        digest: Blob digest, for example 'sha256:...'
+        size: Size in bytes
+        media_type: OCI media type of the blob
+        member: Name of the archive member holding the blob
+        offset: Offset of the blob's contents within the archive file
+    """
+    
+    def __init__(self, digest: str, size: int, media_type: str, member: str, offset: int) -> None:
+        self.digest = digest
+        self.size = size
+        self.media_type = media_type
+        self.member = member
+        self.offset = offset
+    
+    def descriptor(self) -> Dict[str, object]:
+        """OCI content descriptor for the blob."""
+        return {"mediaType": self.media_type, "digest": self.digest, "size": self.size}
+
+
+class ArchiveImage:
+    """
+    Image read from a `docker save` archive.
+    
+    Args:
+        config: Image config blob
+        layers: Layer blobs, base layer first
+        manifest: Manifest stored in the archive, if any; otherwise an OCI
+            manifest is built from the config and layers
+        media_type: Media type of a stored manifest
+        
+    Attributes:
+        config: Image config blob
+        layers: Layer blobs, base layer first
+        manifest: Serialized image manifest, exactly as it will be pushed
+        media_type: Media type of the manifest
+        digest: Manifest digest
+    """
+    
+    def __init__(
+        self,
+        config: Blob,
+        layers: List[Blob],
+        manifest: Optional[bytes] = None,
+        media_type: str = OCI_MANIFEST_MEDIA_TYPE,
+    ) -> None:
+        self.config = config
+        self.layers = layers
+        self.media_type = media_type
+        if manifest is None:
+            # Compact separators and a fixed key order make the bytes, and so
+            # the digest, the same every time for the same archive
+            manifest = json.dumps({
+                "schemaVersion": 2,
+                "mediaType": self.media_type,
+                "config": config.descriptor(),
+                "layers": [layer.descriptor() for layer in layers],
+            }, separators=(",", ":")).encode()
+        self.manifest = manifest
+        self.digest = sha256_digest(manifest)
+    
+    @property
+    def blobs(self) -> List[Blob]:
+        """Config and layer blobs."""
+        return [self.config] + self.layers
+
+
+def _member_digest(name: str) -> Optional[str]:
+    """Digest encoded in an OCI layout member name such as 'blobs/sha256/<hex>'."""
+    parts = name.split("/")
+    if len(parts) == 3 and parts[0] == "blobs":
+        return f"{parts[1]}:{parts[2]}"
+    return None
+
+
+def _blob_member(digest: str) -> str:
+    """OCI layout member name of a blob."""
+    algorithm, _, encoded = digest.partition(":")
+    return f"blobs/{algorithm}/{encoded}"
+
+
+def _load_json(archive: image_archive.ImageArchive, name: str) -> Any:
+    """
+    Parse a JSON archive member.
+    
+    Raises:
+        ValueError: If the member is missing or is not valid JSON
+    """
+    return json.loads(bytes(archive.read(name)))
+
+
+def _member_blob(archive: image_archive.ImageArchive, name: str, digest: str, media_type: str) -> Blob:
+    """Describe the archive member holding a blob."""
+    member = archive.getmember(name)
+    return Blob(digest, member.size, media_type, name, member.offset)
+
+
+def _read_oci_layout(archive: image_archive.ImageArchive) -> Optional[ArchiveImage]:
+    """
+    Read the image manifest an OCI layout's index.json points at.
+    
+    Returns:
+        Image with the stored manifest, or None if the archive has no
+        index.json or it does not name a single image manifest
+        
+    Raises:
+        ValueError: If the stored manifest does not match its digest
+    """
+    if "index.json" not in archive:
+        return None
+    index: Dict[str, Any] = _load_json(archive, "index.json")
+    manifests = index.get("manifests", [])
+    if len(manifests) != 1 or manifests[0].get("mediaType") not in IMAGE_MANIFEST_MEDIA_TYPES:
+        return None
+    descriptor = manifests[0]
+    manifest = bytes(archive.read(_blob_member(descriptor["digest"])))
+    if sha256_digest(manifest) != descriptor["digest"]:
+        raise ValueError(f"Image manifest in the archive does not match {descriptor['digest']}")
+    parsed = json.loads(manifest)
+    config = parsed["config"]
+    layers = [
+        _member_blob(archive, _blob_member(layer["digest"]), layer["digest"], layer["mediaType"])
+        for layer in parsed["layers"]
+    ]
+    return ArchiveImage(
+        _member_blob(archive, _blob_member(config["digest"]), config["digest"], config["mediaType"]),
+        layers,
+        manifest,
+        descriptor["mediaType"],
+    )
+
+
+def read_archive_image(archive: image_archive.ImageArchive) -> ArchiveImage:
+    """
+    Read the image in a `docker save` archive.
+    
+    Uses the image manifest stored in an OCI layout archive when there is
+    one. Otherwise builds an OCI manifest from manifest.json, which works with
+    both the legacy layout, where layers are '<id>/layer.tar' and their
+    digests come from the config's rootfs.diff_ids, and archives where every
+    blob is named by its digest.
+    
+    Args:
+        archive: Open archive
+        
+    Returns:
+        Image with the manifest that pushing the archive stores
+        
+    Raises:
+        ValueError: If the archive is not a single-image `docker save` archive
+    """
+    image = _read_oci_layout(archive)
+    if image is not None:
+        return image
+    
+    entries = _load_json(archive, "manifest.json")
+    if len(entries) != 1:
+        raise ValueError(f"Expected one image in the archive, found {len(entries)}")
+    entry = entries[0]
+    
+    config_name = entry["Config"]
+    config_digest = sha256_digest(archive.read(config_name))
+    config = _member_blob(archive, config_name, config_digest, OCI_CONFIG_MEDIA_TYPE)
+    diff_ids = _load_json(archive, config_name)["rootfs"]["diff_ids"]
+    
+    layers = []
+    for index, name in enumerate(entry["Layers"]):
+        compressed = archive.read(name)[:2] == GZIP_MAGIC
+        digest = _member_digest(name) or diff_ids[index]
+        media_type = OCI_GZIP_LAYER_MEDIA_TYPE if compressed else OCI_LAYER_MEDIA_TYPE
+        layers.append(_member_blob(archive, name, digest, media_type))
+    return ArchiveImage(config, layers)
+
+
+def expected_digest(blob: Blob) -> str:
+    """
+    Digest a blob's name in the archive commits it to.
+    
+    OCI layout blobs and legacy configs are named by their digest; legacy
+    layers are committed to by the config's rootfs.diff_ids instead.
+    """
+    digest = _member_digest(blob.member)
+    if digest:
+        return digest
+    match = LEGACY_CONFIG_NAME.fullmatch(blob.member)
+    if match:
+        return f"sha256:{match.group(1)}"
+    return blob.digest
+
+
+def _verify_blob(archive: image_archive.ImageArchive, blob: Blob) -> None:
+    """
+    Hash one blob and compare it with the digest it is named by.
+    
+    Raises:
+        ValueError: If the blob does not match
+    """
+    expected = expected_digest(blob)
+    actual = sha256_digest(archive.view(blob.offset, blob.size))
+    if actual != expected:
+        raise ValueError(f"Blob {blob.member} is corrupt: expected {expected}, contents hash to {actual}")
+
+
+def verify_archive(image_tar: str, workers: int = DEFAULT_VERIFY_WORKERS) -> Tuple[int, float]:
+    """
+    Re-hash every config and layer blob in an archive against its digest.
+    
+    Blobs are hashed on a pool of threads, largest first. The first mismatch
+    is raised as soon as it is found; blobs not yet started are skipped.
+    
+    Args:
+        image_tar: Path to the archive
+        workers: Blobs hashed at once
+        
+    Returns:
+        Bytes hashed and seconds taken
+        
+    Raises:
+        ValueError: If the archive is truncated or malformed, or a blob does
+            not match its digest
+    """
+    with image_archive.ImageArchive(image_tar) as archive:
+        image = read_archive_image(archive)
+        blobs = sorted(image.blobs, key=lambda blob: blob.size, reverse=True)
+        start = time.perf_counter()
+        executor = ThreadPoolExecutor(max_workers=workers)
+        try:
+            futures = [executor.submit(_verify_blob, archive, blob) for blob in blobs]
+            for future in as_completed(futures):
+                future.result()
+        finally:
+            # Blobs already being hashed finish before the archive is unmapped
+            executor.shutdown(wait=True, cancel_futures=True)
+        return sum(blob.size for blob in blobs), time.perf_counter() - start
+
+
+def archive_config_digest(image_tar: str) -> str:
+    """
+    Read the config digest, which Docker uses as the image ID, of a `docker save` archive.
+    
+    The digest is taken from the config's name in manifest.json, which both
+    layouts name by digest, so nothing is hashed.
+    
+    Args:
+        image_tar: Path to the archive
+        
+    Returns:
+        Config digest, for example 'sha256:...'
+        
+    Raises:
+        ValueError: If the archive is not a single-image `docker save` archive
+        
+    Example:
+        >>> archive_config_digest('/tmp/candidate_image.tar')
+        'sha256:...'
+    """
+    with image_archive.ImageArchive(image_tar) as archive:
+        entries = _load_json(archive, "manifest.json")
+        if len(entries) != 1:
+            raise ValueError(f"Expected one image in the archive, found {len(entries)}")
+        name = entries[0]["Config"]
+        match = LEGACY_CONFIG_NAME.fullmatch(name)
+        digest = _member_digest(name) or (f"sha256:{match.group(1)}" if match else None)
+        return digest or sha256_digest(archive.read(name))
+
+
+def archive_manifest_digest(image_tar: str) -> str:
+    """
+    Compute the manifest digest pushing a `docker save` archive will produce.
+    
+    Args:
+        image_tar: Path to the archive
+        
+    Returns:
+        Manifest digest
+        
+    Raises:
+        ValueError: If the archive cannot be read as a `docker save` archive
+        
+    Example:
+        >>> archive_manifest_digest('/tmp/candidate_image.tar')
+        'sha256:...'
+    """
+    with image_archive.ImageArchive(image_tar) as archive:
+        return read_archive_image(archive).digest
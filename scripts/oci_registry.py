@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+"""
+Client for the OCI distribution API of a container registry.
+
+The GitHub Packages API can only find a version by listing every version of a
+package. The registry itself answers questions about a single tag or digest
+directly, so scripts use this client to resolve tags to manifest digests
+without a listing, and to push image blobs and manifests without the Docker
+daemon.
+
+The client implements the token authentication flow used by ghcr.io and other
+registries: an unauthenticated request is answered with 401 and a
+WWW-Authenticate challenge naming a token service, the client fetches a bearer
+token from that service with its credentials, and retries the request.
+"""
+
+import base64
+import http.client
+import io
+import json
+import re
+import ssl
+from typing import Dict, Mapping, Optional, Tuple, Union
+from urllib import request as urllib_request
+from urllib.error import HTTPError, URLError
+from urllib.parse import quote, urlencode, urljoin, urlsplit
+
+import github_actions_utils
+
+REGISTRY_URL = "https://ghcr.io"
+
+# Manifest media types accepted when resolving a tag, so the registry reports
+# the digest of whatever was pushed rather than converting it
+MANIFEST_MEDIA_TYPES = ", ".join([
+    "application/vnd.oci.image.manifest.v1+json",
+    "application/vnd.oci.image.index.v1+json",
+    "application/vnd.docker.distribution.manifest.v2+json",
+    "application/vnd.docker.distribution.manifest.list.v2+json",
+])
+
+
+def parse_bearer_challenge(header: str) -> Optional[Dict[str, str]]:
+    """
+    Parse a Bearer WWW-Authenticate challenge.
+    
+    Args:
+        header: Value of the WWW-Authenticate response header
+        
+    Returns:
+        Challenge parameters such as realm, service and scope, or None if the
+        challenge is not a Bearer challenge
+        
+    Example:
+        >>> parse_bearer_challenge('Bearer realm="https://ghcr.io/token",service="ghcr.io"')
+        {'realm': 'https://ghcr.io/token', 'service': 'ghcr.io'}
+    """
+    scheme, _, params = header.strip().partition(" ")
+    if scheme.lower() != "bearer":
+        return None
+    return dict(re.findall(r'(\w+)="([^"]*)"', params))
+
+
+class RegistryClient:
+    """
+    Client for one repository on an OCI distribution registry.
+    
+    Requests reuse persistent connections from a shared pool and, when a
+    scheduler is given, are paced and retried like GitHub API requests.
+    Errors are raised as urllib's HTTPError and URLError.
+    
+    Args:
+        repository: Repository name on the registry, for example 'owner/repo'
+        username: Username for the token service
+        password: Password or token for the token service
+        registry_url: Registry origin (overridable for local testing)
+        context: SSL context for HTTPS connections (defaults to system trust)
+        scheduler: Scheduler pacing and retrying requests, if any
+        
+    Example:
+        >>> client = RegistryClient('owner/repo', 'owner', 'gh_token_123')
+        >>> client.resolve_tag('latest')
+        'sha256:...'
+    """
+    
+    def __init__(
+        self,
+        repository: str,
+        username: str,
+        password: str,
+        registry_url: str = REGISTRY_URL,
+        context: Optional[ssl.SSLContext] = None,
+        scheduler: Optional[github_actions_utils.RequestScheduler] = None,
+    ) -> None:
+        # Registry repository names must be lowercase
+        self.repository = repository.lower()
+        self._credentials = base64.b64encode(f"{username}:{password}".encode()).decode()
+        self._pool = github_actions_utils.ConnectionPool(registry_url, context=context)
+        self._context = context
+        self._token: Optional[str] = None
+        self.scheduler = scheduler
+    
+    def _fetch_token(self, challenge: Dict[str, str]) -> None:
+        """
+        Fetch a bearer token from the token service named in a challenge.
+        
+        Raises:
+            URLError: If the token service is not trusted with the credentials
+                or cannot be reached
+            HTTPError: If the token service rejects the credentials
+            DeadlineExceeded: If the time budget is used up
+        """
+        realm = challenge.get("realm", "")
+        # Credentials only ever travel over TLS, or to the registry's own origin
+        if not (realm.startswith("https://") or realm.startswith(f"{self._pool.origin}/")):
+            raise URLError(f"Refusing to send registry credentials to {realm}")
+        query = {key: value for key, value in challenge.items() if key in ("service", "scope")}
+        separator = "&" if urlsplit(realm).query else "?"
+        req = urllib_request.Request(f"{realm}{separator}{urlencode(query)}")
+        req.add_header("Authorization", f"Basic {self._credentials}")
+        timeout = github_actions_utils.deadline.timeout("registry token request", 30)
+        try:
+            with urllib_request.urlopen(req, timeout=timeout, context=self._context) as response:
+                data = json.loads(response.read())
+        except (TimeoutError, URLError) as e:
+            reason = e.reason if isinstance(e, URLError) else e
+            if isinstance(reason, TimeoutError) and github_actions_utils.deadline.used_up():
+                raise github_actions_utils.deadline.exceeded("registry token request", timeout) from e
+            raise
+        token = data.get("token") or data.get("access_token")
+        if not token:
+            raise URLError(f"Token service at {realm} returned no token")
+        self._token = token
+    
+    def _send(
+        self,
+        method: str,
+        path: str,
+        body: github_actions_utils.RequestBody,
+        headers: Mapping[str, str],
+    ) -> github_actions_utils.APIResponse:
+        """Send one request with the current token."""
+        request_headers = {"User-Agent": github_actions_utils.USER_AGENT, **headers}
+        if self._token:
+            request_headers["Authorization"] = f"Bearer {self._token}"
+        # A streamed body is rewound so that a retried request sends it again in full
+        start = body.tell() if body is not None and not isinstance(body, (bytes, memoryview)) else 0
+        
+        def send() -> github_actions_utils.APIResponse:
+            if body is not None and not isinstance(body, (bytes, memoryview)):
+                body.seek(start)
+            try:
+                return self._pool.request(method, path, body, request_headers)
+            except github_actions_utils.DeadlineExceeded:
+                raise
+            except (OSError, http.client.HTTPException) as e:
+                raise URLError(e) from e
+        
+        return self.scheduler.call(method, send) if self.scheduler else send()
+    
+    def request(
+        self,
+        method: str,
+        path: str,
+        body: github_actions_utils.RequestBody = None,
+        headers: Optional[Mapping[str, str]] = None,
+        allowed_statuses: Tuple[int, ...] = (),
+    ) -> github_actions_utils.APIResponse:
+        """
+        Send a request to the registry, authenticating when challenged.
+        
+        Args:
+            method: HTTP method
+            path: Path on the registry, for example '/v2/owner/repo/manifests/latest'
+            body: Request body, as bytes, a memoryview or a seekable binary stream
+            headers: Request headers
+            allowed_statuses: Error statuses to return instead of raising
+            
+        Returns:
+            Response with a 2xx or 3xx status, or one of allowed_statuses
+            
+        Raises:
+            HTTPError: If the registry returns any other 4xx or 5xx status
+            URLError: If the registry or its token service cannot be reached
+            DeadlineExceeded: If the time budget is used up
+        """
+        headers = headers or {}
+        response = self._send(method, path, body, headers)
+        if response.status == 401:
+            challenge = parse_bearer_challenge(response.headers.get("WWW-Authenticate", ""))
+            if challenge is not None:
+                self._fetch_token(challenge)
+                response = self._send(method, path, body, headers)
+        if response.status >= 400 and response.status not in allowed_statuses:
+            raise HTTPError(
+                f"{self._pool.origin}{path}",
+                response.status,
+                http.client.responses.get(response.status, ""),
+                response.headers,
+                io.BytesIO(response.body),
+            )
+        return response
+    
+    def resolve_tag(self, tag: str) -> Optional[str]:
+        """
+        Resolve a tag to its manifest digest with a single HEAD request.
+        
+        Args:
+            tag: Tag to resolve
+            
+        Returns:
+            Manifest digest, or None if the tag does not exist
+            
+        Raises:
+            HTTPError: If the registry returns an error other than 404
+            URLError: If the registry cannot be reached or reports no digest
+        """
+        response = self.request(
+            "HEAD",
+            f"/v2/{self.repository}/manifests/{tag}",
+            headers={"Accept": MANIFEST_MEDIA_TYPES},
+            allowed_statuses=(404,),
+        )
+        if response.status == 404:
+            return None
+        digest = response.headers.get("Docker-Content-Digest")
+        if not digest:
+            raise URLError(f"Registry returned no digest for tag {tag}")
+        return digest
+    
+    def _location_path(self, response: github_actions_utils.APIResponse) -> str:
+        """
+        Get the path of an upload session from a response's Location header.
+        
+        Raises:
+            URLError: If the Location is missing or on another origin, so the
+                token is never sent to a host named in a response header
+        """
+        location = response.headers.get("Location")
+        if not location:
+            raise URLError("Registry returned no upload location")
+        url = urljoin(f"{self._pool.origin}/", location)
+        if not url.startswith(f"{self._pool.origin}/"):
+            raise URLError(f"Refusing to upload to {url}")
+        return url[len(self._pool.origin):]
+    
+    def blob_exists(self, digest: str) -> bool:
+        """
+        Check whether the repository already has a blob.
+        
+        Args:
+            digest: Blob digest
+            
+        Returns:
+            True if the blob exists
+        """
+        response = self.request(
+            "HEAD", f"/v2/{self.repository}/blobs/{digest}", allowed_statuses=(404,)
+        )
+        return response.status != 404
+    
+    def start_upload(self) -> str:
+        """
+        Open a blob upload session.
+        
+        Returns:
+            Path of the upload session
+        """
+        response = self.request(
+            "POST", f"/v2/{self.repository}/blobs/uploads/", headers={"Content-Length": "0"}
+        )
+        return self._location_path(response)
+    
+    def upload_chunk(self, location: str, data: Union[bytes, memoryview], offset: int) -> str:
+        """
+        Append a chunk to a blob upload session.
+        
+        Args:
+            location: Path of the upload session
+            data: Chunk contents
+            offset: Offset of the chunk within the blob
+            
+        Returns:
+            Path of the upload session for the next request
+        """
+        response = self.request("PATCH", location, data, headers={
+            "Content-Type": "application/octet-stream",
+            "Content-Length": str(len(data)),
+            "Content-Range": f"{offset}-{offset + len(data) - 1}",
+        })
+        return self._location_path(response)
+    
+    def upload_status(self, location: str) -> Tuple[str, int]:
+        """
+        Ask how much of a blob upload session the registry has committed.
+        
+        Args:
+            location: Path of the upload session
+            
+        Returns:
+            Path of the upload session for the next request, and the offset
+            the next chunk must start at
+            
+        Raises:
+            HTTPError: If the session has expired (404) or the registry returns an error
+        """
+        response = self.request("GET", location)
+        # Range is inclusive, "0-<last byte>". Registries also answer "0-0" for
+        # an empty session, which is read as empty: chunks are never one byte.
+        _, _, last = response.headers.get("Range", "0-0").partition("-")
+        offset = int(last) + 1 if last and int(last) > 0 else 0
+        return self._location_path(response), offset
+    
+    def finish_upload(
+        self, location: str, digest: str, body: github_actions_utils.RequestBody = b"", size: int = 0
+    ) -> None:
+        """
+        Close a blob upload session, sending any remaining contents.
+        
+        Args:
+            location: Path of the upload session
+            digest: Digest of the whole blob, checked by the registry
+            body: Remaining contents (all of them for a monolithic upload)
+            size: Size of body in bytes
+        """
+        separator = "&" if "?" in location else "?"
+        self.request("PUT", f"{location}{separator}digest={quote(digest)}", body, headers={
+            "Content-Type": "application/octet-stream",
+            "Content-Length": str(size),
+        })
+    
+    def get_manifest(self, reference: str) -> Tuple[str, bytes]:
+        """
+        Fetch a manifest exactly as it was stored.
+        
+        Args:
+            reference: Tag or digest
+            
+        Returns:
+            Manifest media type and bytes
+            
+        Raises:
+            HTTPError: If the manifest does not exist or the registry returns an error
+        """
+        response = self.request(
+            "GET",
+            f"/v2/{self.repository}/manifests/{reference}",
+            headers={"Accept": MANIFEST_MEDIA_TYPES},
+        )
+        return response.headers.get("Content-Type", ""), response.body
+    
+    def put_manifest(self, reference: str, manifest: bytes, media_type: str) -> str:
+        """
+        Store a manifest under a tag or digest.
+        
+        Args:
+            reference: Tag or digest
+            manifest: Manifest bytes
+            media_type: Manifest media type
+            
+        Returns:
+            Manifest digest reported by the registry
+            
+        Raises:
+            URLError: If the registry reports no digest
+        """
+        response = self.request("PUT", f"/v2/{self.repository}/manifests/{reference}", manifest, {
+            "Content-Type": media_type,
+            "Content-Length": str(len(manifest)),
+        })
+        digest = response.headers.get("Docker-Content-Digest")
+        if not digest:
+            raise URLError(f"Registry returned no digest for manifest {reference}")
+        return digest
+    
+    def close(self) -> None:
+        """Close all idle connections."""
+        self._pool.close()
@@ -3,7 +3,52 @@
 Push Docker images with appropriate tags and extract digest.
 
 This script handles conditional image tagging and pushing based on the event type
-(pull request or main branch push), and extracts the digest for attestation.
+(pull request or main branch push), and determines the digest for attestation.
+
+By default the image is loaded into the Docker daemon and pushed with the
+Docker CLI. With --push-mode registry the `docker save` archive is instead
+uploaded straight to the registry over the OCI distribution API, which skips
+`docker load` entirely and does not need a Docker daemon. Registry mode reads
+its credentials from the GITHUB_TOKEN environment variable, uploads blobs
+concurrently, and with --upload-state resumes large blobs where a failed run
+left off.
+
+In registry mode the manifest digest is computed from the archive before the
+upload and checked against the registry's Docker-Content-Digest. In docker
+mode it is read from the registry after the push, and only taken from the
+`docker push` output when the registry cannot be asked.
+
+Docker mode talks to the Docker Engine API over the daemon's unix socket when
+it can, streaming the archive into the load and reading the pushed digest from
+the push's progress stream, and forks the docker CLI otherwise. It skips the
+load when the daemon already holds an image with the archive's image ID, and
+logs each decision as an image cache hit or miss. Each phase is timed, and
+the timings are added to the job's step summary. With SCRIPT_METRICS_FILE
+set, request latencies, retries and bytes pushed are also written to that
+file in OpenMetrics text format.
+
+With --verify, every blob in the archive is first re-hashed against its
+digest, so a corrupt or truncated artifact fails with the name of the bad
+blob before anything is loaded or pushed.
+
+With --time-budget, every Docker and registry call takes its timeout from
+what is left of one overall budget, and the load and push timeouts are
+scaled by the archive's size and the throughput measured so far. A call
+that is still running when the budget runs out, or that would start after
+it has, fails the script with the name of that phase.
+
+Before pushing, the manifest digest computed from the archive is compared
+with the digest the target tag already resolves to. When they match, as on
+a re-run of the same workflow, the upload is skipped and logged as a publish
+cache hit, and the digest and tag outputs are written as usual. Docker mode
+needs GITHUB_TOKEN for the check, and compares the archive's image ID with
+the config of the manifest the tag points at, since the daemon recompresses
+the layers it pushes and so never stores the archive's own manifest.
+
+In either mode the image is pushed once. Further tags (latest on main, and any
+--extra-tag) are added by storing the pushed manifest under each tag, which
+costs one small request per tag. Docker mode falls back to pushing every tag
+with the Docker CLI when GITHUB_TOKEN is not set.
 
 Exit codes:
     0: Success
@@ -11,11 +56,20 @@ Exit codes:
 """
 
 import argparse
-import re
+import json
+import os
 import subprocess
 import sys
+import time
+from typing import Any, Dict, List, NoReturn, Optional, Tuple
+from urllib.error import HTTPError, URLError
 
+import docker_engine
 import github_actions_utils
+import image_digest
+import oci_registry
+import push_progress
+import registry_push
 
 
 def parse_args() -> argparse.Namespace:
@@ -53,6 +107,49 @@ def parse_args() -> argparse.Namespace:
         required=True,
         help="Path to the image tar file"
     )
+    parser.add_argument(
+        "--push-mode",
+        choices=["docker", "registry"],
+        default="docker",
+        help="Push through the Docker daemon, or upload the archive straight to the registry"
+    )
+    parser.add_argument(
+        "--registry-username",
+        default=os.environ.get("GITHUB_ACTOR"),
+        help="Registry username for registry push mode (defaults to GITHUB_ACTOR)"
+    )
+    parser.add_argument(
+        "--extra-tag",
+        action="append",
+        default=[],
+        help="Additional tag for the pushed image (can be repeated)"
+    )
+    parser.add_argument(
+        "--verify",
+        action="store_true",
+        help="Re-hash every blob in the image tar against its digest before pushing"
+    )
+    parser.add_argument(
+        "--verify-workers",
+        type=int,
+        default=image_digest.DEFAULT_VERIFY_WORKERS,
+        help="Blobs hashed at once by --verify (default: number of CPUs)"
+    )
+    parser.add_argument(
+        "--upload-workers",
+        type=int,
+        default=registry_push.DEFAULT_UPLOAD_WORKERS,
+        help=f"Blobs uploaded at once in registry push mode (default: {registry_push.DEFAULT_UPLOAD_WORKERS})"
+    )
+    parser.add_argument(
+        "--upload-state",
+        help="File recording upload progress in registry push mode, so a retried run resumes large blobs"
+    )
+    parser.add_argument(
+        "--time-budget",
+        type=float,
+        help="Seconds the whole push may take; every call's timeout is drawn from what is left"
+    )
     
     args = parser.parse_args()
     
@@ -60,28 +157,154 @@ def parse_args() -> argparse.Namespace:
     if args.event_name == "pull_request" and not args.pr_number:
         parser.error("--pr-number is required for pull_request events")
     
+    if args.upload_workers < 1:
+        parser.error("--upload-workers must be at least 1")
+    if args.verify_workers < 1:
+        parser.error("--verify-workers must be at least 1")
+    if args.time_budget is not None and args.time_budget <= 0:
+        parser.error("--time-budget must be positive")
+    
+    if args.push_mode == "registry":
+        if not args.registry_username:
+            parser.error("--registry-username or GITHUB_ACTOR is required for registry push mode")
+        if not os.environ.get("GITHUB_TOKEN"):
+            parser.error("GITHUB_TOKEN environment variable is required for registry push mode")
+    
     return args
 
 
-def load_image(image_tar: str) -> None:
+@github_actions_utils.span("verify_image")
+def verify_image(image_tar: str, workers: int) -> None:
     """
-    Load Docker image from tar archive.
+    Check every blob in the image tar against its digest.
     
     Args:
         image_tar: Path to tar archive
+        workers: Blobs hashed at once
+        
+    Raises:
+        SystemExit: If the archive is corrupt, truncated or unreadable
+    """
+    github_actions_utils.log_info(f"Verifying {image_tar}")
+    try:
+        size, seconds = image_digest.verify_archive(image_tar, workers)
+    except image_digest.ARCHIVE_ERRORS as e:
+        github_actions_utils.github_action_log("error", f"Image archive failed verification: {e}")
+        sys.exit(1)
+    github_actions_utils.annotate(bytes=size)
+    megabytes = size / 1_000_000
+    github_actions_utils.log_info(
+        f"Verified {megabytes:.0f} MB in {seconds:.2f}s ({megabytes / max(seconds, 1e-9):.0f} MB/s)"
+    )
+
+
+def engine_call_failed(action: str, error: OSError, timeout: Optional[float] = None) -> NoReturn:
+    """
+    Report a failed Docker Engine API call and exit.
+    
+    Args:
+        action: What failed, for example 'load image'
+        error: HTTPError, URLError or other OSError raised by the call
+        timeout: Timeout the call was given, to report a call that ran out of time
+    """
+    reason = getattr(error, "reason", None) or error
+    if timeout is not None and isinstance(reason, TimeoutError):
+        message = github_actions_utils.deadline.timeout_message(f"Docker Engine call to {action}", timeout)
+        github_actions_utils.github_action_log("error", message)
+    else:
+        github_actions_utils.github_action_log("error", f"Failed to {action}: {reason}")
+    sys.exit(1)
+
+
+def log_progress(record: Dict[str, Any]) -> None:
+    """Log the messages of a Docker progress stream, leaving out per-layer progress."""
+    message = record.get("stream") or record.get("status")
+    if message and not record.get("progressDetail"):
+        github_actions_utils.log_info(str(message).strip())
+
+
+def daemon_has_image(image_id: str, engine: Optional[docker_engine.DockerEngine] = None) -> bool:
+    """
+    Check whether the Docker daemon already holds an image.
+    
+    Args:
+        image_id: Image ID, for example 'sha256:...'
+        engine: Docker Engine API client, or None to use the docker CLI
+        
+    Returns:
+        True if an image with exactly that ID is present
+    """
+    timeout = github_actions_utils.deadline.timeout("image_inspect", 60)
+    if engine is not None:
+        try:
+            return engine.image_id(image_id, timeout) == image_id
+        except OSError:
+            return False
+    try:
+        result = subprocess.run(
+            ["docker", "image", "inspect", "--format", "{{.Id}}", image_id],
+            capture_output=True,
+            text=True,
+            timeout=timeout
+        )
+    except subprocess.TimeoutExpired:
+        return False
+    return result.returncode == 0 and result.stdout.strip() == image_id
+
+
+@github_actions_utils.span("load_image")
+def load_image(image_tar: str, engine: Optional[docker_engine.DockerEngine] = None) -> None:
+    """
+    Load Docker image from tar archive, unless the daemon already has it.
+    
+    The image ID is read from the archive's manifest.json. When the daemon
+    holds an image with that ID, as after a re-run or an earlier step on a
+    runner with a warm daemon, the load is skipped and the image is tagged
+    candidate_image:latest instead.
+    
+    Args:
+        image_tar: Path to tar archive
+        engine: Docker Engine API client, or None to use the docker CLI
         
     Raises:
         SystemExit: If loading fails
     """
+    try:
+        image_id: Optional[str] = image_digest.archive_config_digest(image_tar)
+    except image_digest.ARCHIVE_ERRORS as e:
+        github_actions_utils.github_action_log("warning", f"Could not read the image ID from {image_tar}: {e}")
+        image_id = None
+    
+    if image_id is not None and daemon_has_image(image_id, engine):
+        github_actions_utils.annotate(cache="hit")
+        github_actions_utils.log_info(f"Image cache hit: {image_id} is already loaded, skipping docker load")
+        # The tag may still point at an image from an earlier run
+        docker_tag(image_id, "candidate_image:latest", engine)
+        return
+    
+    github_actions_utils.log_info(f"Image cache miss: {image_id or 'unknown image'} is not loaded")
+    size = os.path.getsize(image_tar) if os.path.exists(image_tar) else 0
+    github_actions_utils.annotate(cache="miss", bytes=size)
     github_actions_utils.log_info(f"Loading image from {image_tar}")
+    timeout = github_actions_utils.deadline.timeout("load_image", docker_engine.LOAD_TIMEOUT, size, "docker_load")
+    start = time.monotonic()
+    if engine is not None:
+        try:
+            engine.load(image_tar, log_progress, timeout)
+        except OSError as e:
+            engine_call_failed("load image", e, timeout)
+        github_actions_utils.deadline.record_transfer("docker_load", size, time.monotonic() - start)
+        github_actions_utils.log_info(f"Successfully loaded image from {image_tar}")
+        return
     try:
         result = subprocess.run(
             ["docker", "load", "-i", image_tar],
             check=True,
             capture_output=True,
             text=True,
-            timeout=300
+            timeout=timeout
         )
+        github_actions_utils.deadline.record_transfer("docker_load", size, time.monotonic() - start)
         github_actions_utils.log_info(f"Successfully loaded image from {image_tar}")
         if result.stdout:
             github_actions_utils.log_info(result.stdout.strip())
@@ -90,29 +313,42 @@ def load_image(image_tar: str) -> None:
         github_actions_utils.github_action_log("error", f"Failed to load image: {error_msg}")
         sys.exit(1)
     except subprocess.TimeoutExpired:
-        github_actions_utils.github_action_log("error", "Image load timed out after 300 seconds")
+        github_actions_utils.github_action_log(
+            "error", github_actions_utils.deadline.timeout_message("Image load", timeout)
+        )
         sys.exit(1)
 
 
-def docker_tag(source: str, target: str) -> None:
+@github_actions_utils.span("docker_tag")
+def docker_tag(source: str, target: str, engine: Optional[docker_engine.DockerEngine] = None) -> None:
     """
     Tag a Docker image.
     
     Args:
         source: Source image
         target: Target image
+        engine: Docker Engine API client, or None to use the docker CLI
         
     Raises:
         SystemExit: If tagging fails
     """
     github_actions_utils.log_info(f"Tagging {source} as {target}")
+    github_actions_utils.annotate(target=target)
+    timeout = github_actions_utils.deadline.timeout("docker_tag", docker_engine.TAG_TIMEOUT)
+    if engine is not None:
+        try:
+            engine.tag(source, target, timeout)
+        except OSError as e:
+            engine_call_failed("tag image", e, timeout)
+        github_actions_utils.log_info(f"Successfully tagged as {target}")
+        return
     try:
         subprocess.run(
             ["docker", "tag", source, target],
             check=True,
             capture_output=True,
             text=True,
-            timeout=60
+            timeout=timeout
         )
         github_actions_utils.log_info(f"Successfully tagged as {target}")
     except subprocess.CalledProcessError as e:
@@ -120,92 +356,430 @@ def docker_tag(source: str, target: str) -> None:
         github_actions_utils.github_action_log("error", f"Failed to tag image: {error_msg}")
         sys.exit(1)
     except subprocess.TimeoutExpired:
-        github_actions_utils.github_action_log("error", "Image tagging timed out after 60 seconds")
+        github_actions_utils.github_action_log(
+            "error", github_actions_utils.deadline.timeout_message("Image tagging", timeout)
+        )
         sys.exit(1)
 
 
-def docker_push(image: str) -> str:
+@github_actions_utils.span("docker_push")
+def docker_push(
+    image: str,
+    engine: Optional[docker_engine.DockerEngine] = None,
+    auth: Optional[str] = None,
+    size: int = 0,
+) -> Optional[str]:
     """
-    Push a Docker image and extract its digest.
+    Push a Docker image and extract its digest from the push output.
+    
+    The output is read as it is written: progress is logged every few
+    seconds, and only the last lines are kept to report a failure with.
+    
+    The digest is only read from the output as a fallback for when the
+    registry cannot be asked directly, so output it cannot be found in is a
+    warning rather than an error.
+    
+    The Engine API is only used with credentials: the daemon does not see
+    logins stored by the CLI, so without them the push goes through the CLI.
     
     Args:
         image: Image to push
+        engine: Docker Engine API client, or None to use the docker CLI
+        auth: Registry credentials from docker_engine.registry_auth()
+        size: Size of the image archive, which bounds the bytes pushed
         
     Returns:
-        Image digest
+        Image digest, or None if the output does not mention one
         
     Raises:
-        SystemExit: If push fails or digest cannot be extracted
+        SystemExit: If push fails
     """
     github_actions_utils.log_info(f"Pushing {image}")
+    progress = push_progress.PushProgress()
+    timeout = github_actions_utils.deadline.timeout("docker_push", docker_engine.PUSH_TIMEOUT, size, "docker_push")
+    start = time.monotonic()
     try:
-        result = subprocess.run(
-            ["docker", "push", image],
-            check=True,
-            capture_output=True,
-            text=True,
-            timeout=600
+        if engine is not None and auth is not None:
+            engine.push(image, auth, progress.record, timeout)
+        else:
+            push_progress.run_streaming(["docker", "push", image], timeout, progress.line)
+    except OSError as e:
+        engine_call_failed("push image", e, timeout)
+    except subprocess.CalledProcessError:
+        github_actions_utils.github_action_log("error", f"Failed to push image:\n{progress.output()}")
+        sys.exit(1)
+    except subprocess.TimeoutExpired:
+        github_actions_utils.github_action_log(
+            "error", github_actions_utils.deadline.timeout_message("Image push", timeout)
         )
+        sys.exit(1)
+    # Layers the registry already has are not sent, so only the bytes sent are a throughput sample
+    github_actions_utils.deadline.record_transfer("docker_push", progress.bytes_sent, time.monotonic() - start)
+    progress.report()
+    github_actions_utils.annotate(image=image, bytes=progress.bytes_sent)
+    registry_push.PUSH_BYTES.inc(progress.bytes_sent, mode="docker", result="uploaded")
+    github_actions_utils.log_info(f"Successfully pushed {image}")
+    
+    if progress.digest is None:
+        github_actions_utils.github_action_log("warning", "Could not extract digest from docker push output")
+        github_actions_utils.log_info(f"Docker push output:\n{progress.output()}")
+    return progress.digest
+
+
+def registry_tag_digest(client: oci_registry.RegistryClient, tag: str) -> str:
+    """
+    Ask the registry for the manifest digest a pushed tag points at.
+    
+    Args:
+        client: Registry client for the target repository
+        tag: Pushed tag
         
-        # Extract digest from output
-        output = result.stdout + result.stderr
-        digest_match = re.search(r"digest:\s+(sha256:[a-f0-9]{64})", output)
+    Returns:
+        Manifest digest from the registry's Docker-Content-Digest header
         
-        if not digest_match:
-            github_actions_utils.github_action_log("error", "Could not extract digest from docker push output")
-            github_actions_utils.log_info(f"Docker push output:\n{output}")
-            sys.exit(1)
+    Raises:
+        SystemExit: If the registry cannot be asked or does not have the tag
+    """
+    try:
+        digest = client.resolve_tag(tag)
+    except HTTPError as e:
+        github_actions_utils.github_action_log("error", f"Registry rejected digest lookup: HTTP {e.code} {e.reason}")
+        sys.exit(1)
+    except URLError as e:
+        github_actions_utils.github_action_log("error", f"Failed to look up pushed digest: {e.reason}")
+        sys.exit(1)
+    if digest is None:
+        github_actions_utils.github_action_log("error", f"Registry has no tag {tag} after pushing it")
+        sys.exit(1)
+    return digest
+
+
+def tag_config_digest(client: oci_registry.RegistryClient, tag: str) -> Optional[Tuple[str, str]]:
+    """
+    Fetch the manifest a tag points at and read the digest of its image config.
+    
+    Args:
+        client: Registry client for the target repository
+        tag: Tag to look up
         
-        digest = digest_match.group(1)
-        github_actions_utils.log_info(f"Successfully pushed {image}")
-        github_actions_utils.log_info(f"Digest: {digest}")
-        return digest
+    Returns:
+        Tuple of the manifest digest and the config digest, or None if the tag does not exist
         
-    except subprocess.CalledProcessError as e:
-        error_msg = str(e.stderr) if e.stderr is not None else str(e)
-        github_actions_utils.github_action_log("error", f"Failed to push image: {error_msg}")
+    Raises:
+        HTTPError: If the registry returns an error other than 404
+        URLError: If the registry cannot be reached
+        ValueError: If the manifest is not an image manifest with a config
+    """
+    try:
+        _, manifest = client.get_manifest(tag)
+    except HTTPError as e:
+        if e.code == 404:
+            return None
+        raise
+    try:
+        config_digest = json.loads(manifest)["config"]["digest"]
+    except (KeyError, TypeError) as e:
+        raise ValueError(f"manifest of {tag} names no image config") from e
+    if not isinstance(config_digest, str):
+        raise ValueError(f"manifest of {tag} names no image config")
+    # The manifest is fetched exactly as stored, so its hash is the registry's digest for it
+    return image_digest.sha256_digest(manifest), config_digest
+
+
+@github_actions_utils.span("published_digest")
+def published_digest(
+    client: oci_registry.RegistryClient, image_tar: str, tag: str, by_config: bool = False
+) -> Optional[str]:
+    """
+    Check whether a tag already points at the image in an archive.
+    
+    The manifest digest that pushing the archive stores is computed locally
+    and compared with the digest the registry resolves the tag to. A match
+    means the registry already holds exactly this image under the tag, as it
+    does when a workflow is re-run, so the push can be skipped.
+    
+    A push through the Docker daemon recompresses the layers, so its manifest
+    never matches one computed from the archive. With by_config, the config
+    digest (the image ID) is compared instead with the config of the manifest
+    the tag points at: the config lists the digests of the uncompressed
+    layers, so it identifies the image however its layers were compressed.
+    
+    Each outcome is logged as a publish cache hit or miss. Failing to read the
+    archive or to ask the registry only counts as a miss, so the push goes
+    ahead and reports the problem itself.
+    
+    Args:
+        client: Registry client for the target repository
+        image_tar: Path to tar archive
+        tag: Tag the image would be pushed under
+        by_config: Compare image configs rather than manifests
+        
+    Returns:
+        Manifest digest the tag points at if it is the archive's image, otherwise None
+    """
+    kind = "image config" if by_config else "manifest"
+    try:
+        if by_config:
+            local_digest = image_digest.archive_config_digest(image_tar)
+        else:
+            local_digest = image_digest.archive_manifest_digest(image_tar)
+    except image_digest.ARCHIVE_ERRORS as e:
+        github_actions_utils.log_info(f"Publish cache miss: could not read the archive's {kind} digest: {e}")
+        return None
+    try:
+        if by_config:
+            found = tag_config_digest(client, tag)
+            manifest_digest, remote_digest = found if found is not None else (None, None)
+        else:
+            manifest_digest = remote_digest = client.resolve_tag(tag)
+    except HTTPError as e:
+        github_actions_utils.log_info(f"Publish cache miss: lookup of {tag} was rejected: HTTP {e.code} {e.reason}")
+        return None
+    except URLError as e:
+        github_actions_utils.log_info(f"Publish cache miss: failed to look up {tag}: {e.reason}")
+        return None
+    except ValueError as e:
+        github_actions_utils.log_info(f"Publish cache miss: could not read the manifest of {tag}: {e}")
+        return None
+    if manifest_digest is None or remote_digest != local_digest:
+        github_actions_utils.log_info(
+            f"Publish cache miss: the {kind} of {client.repository}:{tag} is {remote_digest or 'not present'}, "
+            f"the archive's is {local_digest}"
+        )
+        return None
+    github_actions_utils.log_info(
+        f"Publish cache hit: {client.repository}:{tag} already points at {manifest_digest}, skipping the push"
+    )
+    return manifest_digest
+
+
+@github_actions_utils.span("registry_push_archive")
+def registry_push_archive(
+    client: oci_registry.RegistryClient,
+    image_tar: str,
+    tag: str,
+    workers: int = registry_push.DEFAULT_UPLOAD_WORKERS,
+    state: Optional[registry_push.UploadState] = None,
+) -> str:
+    """
+    Upload a `docker save` archive straight to the registry under a tag.
+    
+    Args:
+        client: Registry client for the target repository
+        image_tar: Path to tar archive
+        tag: Tag to push
+        workers: Blobs uploaded at once
+        state: Upload sessions to resume and record progress in
+        
+    Returns:
+        Manifest digest
+        
+    Raises:
+        SystemExit: If the archive cannot be read or the push fails
+    """
+    github_actions_utils.log_info(f"Pushing {image_tar} to {client.repository}:{tag}")
+    github_actions_utils.annotate(tag=tag, bytes=os.path.getsize(image_tar) if os.path.exists(image_tar) else 0)
+    try:
+        digest = registry_push.push_archive(client, image_tar, tag, workers=workers, state=state)
+    except HTTPError as e:
+        github_actions_utils.github_action_log("error", f"Registry rejected push: HTTP {e.code} {e.reason}")
         sys.exit(1)
-    except subprocess.TimeoutExpired:
-        github_actions_utils.github_action_log("error", "Image push timed out after 600 seconds")
+    except URLError as e:
+        github_actions_utils.github_action_log("error", f"Failed to reach registry: {e.reason}")
+        sys.exit(1)
+    except github_actions_utils.DeadlineExceeded:
+        raise
+    except image_digest.ARCHIVE_ERRORS as e:
+        github_actions_utils.github_action_log("error", f"Failed to read image archive: {e}")
         sys.exit(1)
+    github_actions_utils.log_info(f"Successfully pushed {client.repository}:{tag}")
+    github_actions_utils.log_info(f"Digest: {digest}")
+    return digest
 
 
-def main() -> None:
-    """Main function."""
-    args = parse_args()
+def registry_client(args: argparse.Namespace) -> oci_registry.RegistryClient:
+    """
+    Create a registry client for the target repository.
+    
+    Args:
+        args: Parsed arguments
+        
+    Returns:
+        Registry client authenticating with GITHUB_TOKEN
+    """
+    return oci_registry.RegistryClient(
+        args.repository,
+        args.registry_username,
+        os.environ["GITHUB_TOKEN"],
+        scheduler=github_actions_utils.RequestScheduler(),
+    )
+
+
+@github_actions_utils.span("retag_image")
+def retag_image(client: oci_registry.RegistryClient, digest: str, tags: List[str]) -> None:
+    """
+    Add tags to a pushed image by storing its manifest under each tag.
+    
+    Args:
+        client: Registry client for the target repository
+        digest: Manifest digest of the pushed image
+        tags: Tags to add
+        
+    Raises:
+        SystemExit: If retagging fails
+    """
+    try:
+        registry_push.retag(client, digest, tags)
+    except HTTPError as e:
+        github_actions_utils.github_action_log("error", f"Registry rejected retag: HTTP {e.code} {e.reason}")
+        sys.exit(1)
+    except URLError as e:
+        github_actions_utils.github_action_log("error", f"Failed to retag image: {e.reason}")
+        sys.exit(1)
+
+
+def push_from_archive(args: argparse.Namespace, primary_tag: str, extra_tags: List[str]) -> str:
+    """
+    Push the image in registry push mode.
+    
+    Args:
+        args: Parsed arguments
+        primary_tag: Tag the archive is pushed under
+        extra_tags: Tags added afterwards by retagging
+        
+    Returns:
+        Manifest digest
+        
+    Raises:
+        SystemExit: If the push fails
+    """
+    client = registry_client(args)
+    try:
+        digest = published_digest(client, args.image_tar, primary_tag)
+        if digest is None:
+            digest = registry_push_archive(
+                client,
+                args.image_tar,
+                primary_tag,
+                args.upload_workers,
+                registry_push.UploadState(args.upload_state),
+            )
+        retag_image(client, digest, extra_tags)
+    finally:
+        client.close()
+    return digest
+
+
+def push_with_docker(args: argparse.Namespace, primary_tag: str, extra_tags: List[str]) -> str:
+    """
+    Push the image in docker push mode.
+    
+    Only the primary tag is pushed through the Docker daemon. When registry
+    credentials are available, the other tags are added by retagging the
+    pushed manifest, which uploads no blobs, and the digest is taken from the
+    registry and checked against the push output; otherwise each tag is
+    pushed with the Docker CLI and the digest comes from its output.
+    
+    With credentials, the image is neither loaded nor pushed when the primary
+    tag already points at a manifest whose config is the archive's. The
+    daemon recompresses the layers it pushes, so the manifest itself never
+    matches the archive's, but the config, and so the image ID, does.
+    
+    Args:
+        args: Parsed arguments
+        primary_tag: Tag pushed through the Docker daemon
+        extra_tags: Tags added afterwards
+        
+    Returns:
+        Manifest digest
+        
+    Raises:
+        SystemExit: If the push fails
+    """
+    registry = f"ghcr.io/{args.repository}"
+    engine = docker_engine.engine_from_environment()
+    if engine is None:
+        github_actions_utils.log_info("Docker Engine socket not found, using the docker CLI")
+    credentials = bool(args.registry_username and os.environ.get("GITHUB_TOKEN"))
+    auth = None
+    if credentials:
+        auth = docker_engine.registry_auth(args.registry_username, os.environ["GITHUB_TOKEN"], "ghcr.io")
+        client = registry_client(args)
+        try:
+            digest = published_digest(client, args.image_tar, primary_tag, by_config=True)
+            if digest is not None:
+                retag_image(client, digest, extra_tags)
+                return digest
+        finally:
+            client.close()
     
     # Load the image from tar
-    load_image(args.image_tar)
+    load_image(args.image_tar, engine)
+    size = os.path.getsize(args.image_tar) if os.path.exists(args.image_tar) else 0
+    
+    docker_tag("candidate_image:latest", f"{registry}:{primary_tag}", engine)
+    output_digest = docker_push(f"{registry}:{primary_tag}", engine, auth, size)
+    
+    if credentials:
+        client = registry_client(args)
+        try:
+            # The registry's own answer is what gets attested, not the CLI's output
+            digest = registry_tag_digest(client, primary_tag)
+            if output_digest is not None and output_digest != digest:
+                github_actions_utils.github_action_log(
+                    "error", f"docker push reported {output_digest} but the registry has {digest}"
+                )
+                sys.exit(1)
+            retag_image(client, digest, extra_tags)
+        finally:
+            client.close()
+        return digest
     
-    # Prepare tag names
+    if output_digest is None:
+        github_actions_utils.github_action_log("error", "Could not determine the pushed digest")
+        sys.exit(1)
+    # Same image, so same digest
+    for tag in extra_tags:
+        docker_tag("candidate_image:latest", f"{registry}:{tag}", engine)
+        docker_push(f"{registry}:{tag}", engine, auth, size)
+    return output_digest
+
+
+def main() -> None:
+    """Main function."""
+    args = parse_args()
     registry = f"ghcr.io/{args.repository}"
+    github_actions_utils.deadline.start(args.time_budget)
     
     if args.event_name == "pull_request":
         # For PRs: push with pr-{number} tag only
-        pr_tag = f"{registry}:pr-{args.pr_number}"
-        
-        docker_tag("candidate_image:latest", pr_tag)
-        digest = docker_push(pr_tag)
-        github_actions_utils.set_github_output("digest", digest)
-        github_actions_utils.set_github_output("tag", pr_tag)
-        
+        primary_tag = f"pr-{args.pr_number}"
+        extra_tags = list(args.extra_tag)
+        output_tag = primary_tag
     else:
-        # On main: push with both SHA and latest tags
-        sha_tag = f"{registry}:{args.sha}"
-        latest_tag = f"{registry}:latest"
-        
-        # Tag and push SHA version first
-        docker_tag("candidate_image:latest", sha_tag)
-        digest = docker_push(sha_tag)
-        github_actions_utils.set_github_output("digest", digest)
+        # On main: push the SHA tag first, then point latest at the same manifest
+        primary_tag = args.sha
+        extra_tags = ["latest"] + args.extra_tag
+        output_tag = "latest"
+    
+    try:
+        if args.verify:
+            verify_image(args.image_tar, args.verify_workers)
         
-        # Push the latest tag (same image, so same digest)
-        docker_tag("candidate_image:latest", latest_tag)
-        docker_push(latest_tag)
-        github_actions_utils.set_github_output("tag", latest_tag)
+        if args.push_mode == "registry":
+            digest = push_from_archive(args, primary_tag, extra_tags)
+        else:
+            digest = push_with_docker(args, primary_tag, extra_tags)
+    except github_actions_utils.DeadlineExceeded as e:
+        github_actions_utils.github_action_log("error", f"Push failed: {e}")
+        sys.exit(1)
     
+    github_actions_utils.set_github_output("digest", digest)
+    github_actions_utils.set_github_output("tag", f"{registry}:{output_tag}")
     github_actions_utils.log_info("Image push completed successfully")
 
 
 if __name__ == "__main__":
-    main()
+    github_actions_utils.tracer.report_at_exit()
+    github_actions_utils.metrics.report_at_exit()
+    github_actions_utils.run_profiled(main)
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Live, bounded-memory progress reporting for `docker push`.
+
+A push of a large image can run for ten minutes. Capturing its output and
+reading it afterwards shows nothing until the end and holds every progress
+line in memory. Here the output is handled line by line as it is written:
+per-layer progress is coalesced into a log line every few seconds, the
+digest is picked up the moment it appears, and only the last lines are kept
+for error reports.
+
+The docker CLI only reports per-layer states such as 'Pushing' and 'Pushed'
+when its output is not a terminal, so pushes through the CLI report layer
+counts. The Docker Engine API's progress records carry byte counts, so pushes
+through it also report bytes sent and throughput.
+
+Example:
+    >>> progress = PushProgress()
+    >>> run_streaming(['docker', 'push', image], 600, progress.line)
+    >>> progress.digest
+    'sha256:...'
+"""
+
+import re
+import subprocess
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Set
+
+import github_actions_utils
+
+# Seconds between coalesced progress lines
+PROGRESS_INTERVAL = 10.0
+
+# Output lines kept for error reports
+PROGRESS_TAIL_LINES = 50
+
+DIGEST_PATTERN = re.compile(r"digest:\s+(sha256:[a-f0-9]{64})")
+
+# '<short layer ID>: <status>' lines written by the CLI
+LAYER_LINE = re.compile(r"([a-f0-9]{12}): (.+)")
+
+# Statuses of layers that need no more uploading
+DONE_STATUSES = ("Pushed", "Layer already exists", "Mounted from")
+
+
+class PushProgress:
+    """
+    Coalesce the progress of one push into periodic log lines.
+    
+    Feed it CLI output with line() or Engine API progress records with
+    record(). Nothing is logged more often than every `interval` seconds,
+    except the digest, which is logged as soon as it is seen.
+    
+    Args:
+        interval: Seconds between progress lines
+        tail_lines: Output lines kept for error reports
+        clock: Monotonic clock, replaceable for testing
+        
+    Attributes:
+        digest: Pushed manifest digest, once it has been reported
+        tail: Last lines of output
+    """
+    
+    def __init__(
+        self,
+        interval: float = PROGRESS_INTERVAL,
+        tail_lines: int = PROGRESS_TAIL_LINES,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.interval = interval
+        self.digest: Optional[str] = None
+        self.tail: Deque[str] = deque(maxlen=tail_lines)
+        self._clock = clock
+        self._start = self._last_report = clock()
+        self._layers: Set[str] = set()
+        self._done: Set[str] = set()
+        self._sent: Dict[str, int] = {}
+        self._totals: Dict[str, int] = {}
+    
+    def _found_digest(self, digest: str) -> None:
+        if self.digest is None:
+            self.digest = digest
+            github_actions_utils.log_info(f"Digest: {digest}")
+    
+    def _layer_status(self, layer: str, status: str) -> None:
+        self._layers.add(layer)
+        if status.startswith(DONE_STATUSES):
+            self._done.add(layer)
+            # Finished layers count in full, whatever the last progress record said
+            if layer in self._totals:
+                self._sent[layer] = self._totals[layer]
+    
+    def line(self, line: str) -> None:
+        """
+        Handle one line of `docker push` output.
+        
+        Args:
+            line: Output line, with or without its newline
+        """
+        line = line.rstrip("\r\n")
+        self.tail.append(line)
+        match = DIGEST_PATTERN.search(line)
+        if match:
+            self._found_digest(match.group(1))
+        layer = LAYER_LINE.fullmatch(line)
+        if layer:
+            self._layer_status(layer.group(1), layer.group(2))
+        self._report_if_due()
+    
+    def record(self, record: Dict[str, Any]) -> None:
+        """
+        Handle one Docker Engine API push progress record.
+        
+        Args:
+            record: Decoded JSON record
+        """
+        status = str(record.get("status") or "")
+        layer = record.get("id")
+        self.tail.append(f"{layer}: {status}" if layer else status)
+        detail = record.get("progressDetail") or {}
+        if layer:
+            if "current" in detail:
+                self._sent[layer] = int(detail["current"])
+                if detail.get("total"):
+                    self._totals[layer] = int(detail["total"])
+            self._layer_status(layer, status)
+        aux = record.get("aux")
+        if isinstance(aux, dict) and aux.get("Digest"):
+            self._found_digest(aux["Digest"])
+        else:
+            match = DIGEST_PATTERN.search(status)
+            if match:
+                self._found_digest(match.group(1))
+        self._report_if_due()
+    
+    def _report_if_due(self) -> None:
+        if self._clock() - self._last_report >= self.interval:
+            self.report()
+    
+    def report(self) -> None:
+        """Log the progress so far."""
+        now = self._clock()
+        self._last_report = now
+        message = f"Pushed {len(self._done)}/{len(self._layers)} layers"
+        sent = self.bytes_sent
+        if sent:
+            megabytes = sent / 1_000_000
+            elapsed = max(now - self._start, 1e-9)
+            message += f", {megabytes:.0f} MB sent ({megabytes / elapsed:.1f} MB/s)"
+        github_actions_utils.log_info(f"{message} after {now - self._start:.0f}s")
+    
+    @property
+    def bytes_sent(self) -> int:
+        """Bytes reported sent so far; always 0 for pushes through the CLI."""
+        return sum(self._sent.values())
+    
+    def output(self) -> str:
+        """Last lines of output, for error reports."""
+        return "\n".join(self.tail)
+
+
+def run_streaming(command: List[str], timeout: float, on_line: Callable[[str], None]) -> None:
+    """
+    Run a command, handing each line of its output to a callback as it is written.
+    
+    Standard error is merged into standard output, and nothing is buffered
+    beyond the current line.
+    
+    Args:
+        command: Command and arguments
+        timeout: Seconds after which the command is killed
+        on_line: Called with each output line
+        
+    Raises:
+        subprocess.CalledProcessError: If the command exits with an error
+        subprocess.TimeoutExpired: If the command runs past the timeout
+    """
+    expired = threading.Event()
+    with subprocess.Popen(
+        command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1
+    ) as process:
+        
+        def kill() -> None:
+            expired.set()
+            process.kill()
+        
+        # Reading blocks until the command writes, so the timeout is enforced from another thread
+        timer = threading.Timer(timeout, kill)
+        timer.daemon = True
+        timer.start()
+        try:
+            assert process.stdout is not None
+            for line in process.stdout:
+                on_line(line)
+            returncode = process.wait()
+        finally:
+            timer.cancel()
+            if process.poll() is None:
+                process.kill()
+    if expired.is_set():
+        raise subprocess.TimeoutExpired(command, timeout)
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, command)
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+Push a `docker save` archive straight to a registry over the OCI distribution API.
+
+The archive produced by `docker save` already holds the image config and every
+layer, so there is no need to load it into the Docker daemon only for the
+daemon to upload it again. This module takes the image manifest worked out by
+image_digest, uploads any config and layer blobs the registry does not
+already have, and stores the manifest under a tag, checking that the registry
+reports the digest computed from the archive. Further tags are added by
+storing the same manifest again, without touching any blobs.
+
+Blobs are uploaded concurrently, each worker sending its blob as a slice of
+the memory-mapped archive, so nothing is extracted or copied into memory.
+Large blobs are sent as a series of chunks; a chunk that fails is resent
+from the offset the registry reports it has committed, and with an upload
+state file the sessions survive into a retried run.
+
+Layers are pushed exactly as they are stored in the archive. `docker save`
+stores them uncompressed, so they are pushed with the uncompressed OCI layer
+media type rather than recompressed, which keeps the push a plain copy of the
+archive.
+"""
+
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional, Tuple
+from urllib.error import HTTPError, URLError
+
+import github_actions_utils
+import image_archive
+import image_digest
+import oci_registry
+
+# Blobs larger than this are uploaded in chunks rather than in a single request
+DEFAULT_CHUNK_SIZE = 64 * 1024 * 1024
+
+# Blobs uploaded at once; each holds one registry connection
+DEFAULT_UPLOAD_WORKERS = 4
+
+# Consecutive failed chunks of one blob before the upload gives up
+MAX_CHUNK_RETRIES = 5
+
+PUSH_BYTES = github_actions_utils.metrics.counter("push_blob_bytes", "Blob bytes uploaded or found already pushed")
+
+
+class UploadState:
+    """
+    Blob upload sessions in progress and the bytes each has committed.
+    
+    With a path, the state is written to that file after every chunk, so a
+    retried run can resume each session from its last committed offset rather
+    than from byte zero. The file is removed once every upload has finished.
+    
+    Args:
+        path: File to persist the state in, or None to keep it in memory
+        
+    Example:
+        >>> state = UploadState('/tmp/upload_state.json')
+        >>> push_archive(client, 'image.tar', 'latest', state=state)
+    """
+    
+    def __init__(self, path: Optional[str] = None) -> None:
+        self.path = path
+        self._uploads: Dict[str, Dict[str, object]] = {}
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    self._uploads = json.load(f)["uploads"]
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                github_actions_utils.github_action_log(
+                    "warning", f"Ignoring unreadable upload state {path}: {e}"
+                )
+    
+    def get(self, key: str) -> Optional[Tuple[str, int]]:
+        """
+        Get the session location and committed offset recorded for an upload.
+        
+        Args:
+            key: Upload key, the repository and blob digest
+        """
+        with self._lock:
+            entry = self._uploads.get(key)
+        if not entry:
+            return None
+        return str(entry["location"]), int(str(entry["offset"]))
+    
+    def record(self, key: str, location: str, offset: int) -> None:
+        """Record that an upload session has committed offset bytes."""
+        with self._lock:
+            self._uploads[key] = {"location": location, "offset": offset}
+            self._save()
+    
+    def forget(self, key: str) -> None:
+        """Drop a finished or abandoned upload."""
+        with self._lock:
+            if self._uploads.pop(key, None) is not None:
+                self._save()
+    
+    def _save(self) -> None:
+        """Write the state atomically, or remove the file when it is empty."""
+        if not self.path:
+            return
+        if not self._uploads:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            return
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"uploads": self._uploads}, f)
+        os.replace(temp_path, self.path)
+
+
+def _upload_chunks(
+    client: oci_registry.RegistryClient,
+    contents: memoryview,
+    blob: image_digest.Blob,
+    chunk_size: int,
+    state: UploadState,
+) -> None:
+    """
+    Upload a blob as a series of chunks, resuming a recorded session if possible.
+    
+    A chunk that fails with a network error, a server error or a range
+    mismatch is resent from the offset the registry says it has committed.
+    
+    Raises:
+        HTTPError: If the registry rejects a chunk outright, or chunks keep failing
+        URLError: If the registry cannot be reached
+    """
+    key = f"{client.repository}@{blob.digest}"
+    location: Optional[str] = None
+    offset = 0
+    saved = state.get(key)
+    if saved:
+        try:
+            location, offset = client.upload_status(saved[0])
+            github_actions_utils.log_info(f"Resuming upload of {blob.digest} at byte {offset}")
+        except HTTPError as e:
+            if e.code != 404:
+                raise
+            github_actions_utils.log_info(f"Upload session for {blob.digest} expired, starting again")
+    if location is None:
+        location = client.start_upload()
+        offset = 0
+        state.record(key, location, offset)
+    
+    failures = 0
+    while offset < blob.size:
+        chunk = contents[offset:offset + chunk_size]
+        try:
+            location = client.upload_chunk(location, chunk, offset)
+        except URLError as e:
+            # 416 means the registry committed a different amount than we sent
+            if isinstance(e, HTTPError) and e.code < 500 and e.code != 416:
+                raise
+            failures += 1
+            if failures > MAX_CHUNK_RETRIES:
+                raise
+            github_actions_utils.github_action_log(
+                "warning", f"Chunk at byte {offset} of {blob.digest} failed ({e}), resuming"
+            )
+            location, offset = client.upload_status(location)
+            continue
+        failures = 0
+        offset += len(chunk)
+        PUSH_BYTES.inc(len(chunk), mode="registry", result="uploaded")
+        state.record(key, location, offset)
+    client.finish_upload(location, blob.digest)
+
+
+def push_blob(
+    client: oci_registry.RegistryClient,
+    archive: image_archive.ImageArchive,
+    blob: image_digest.Blob,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    state: Optional[UploadState] = None,
+) -> bool:
+    """
+    Upload a blob unless the registry already has it.
+    
+    Blobs up to chunk_size are uploaded in a single request; larger blobs are
+    sent as a series of chunks so that no single request has to carry the
+    whole blob and a failure only costs the chunk in flight.
+    
+    Args:
+        client: Registry client
+        archive: Archive holding the blob
+        blob: Blob to upload
+        chunk_size: Largest blob uploaded in one request, and the chunk size above that
+        state: Upload sessions to resume and record progress in
+        
+    Returns:
+        True if the blob was uploaded, False if the registry already had it
+    """
+    state = state or UploadState()
+    key = f"{client.repository}@{blob.digest}"
+    if client.blob_exists(blob.digest):
+        github_actions_utils.log_info(f"Blob {blob.digest} already exists, skipping")
+        state.forget(key)
+        PUSH_BYTES.inc(blob.size, mode="registry", result="skipped")
+        return False
+    
+    contents = archive.view(blob.offset, blob.size)
+    if blob.size <= chunk_size and state.get(key) is None:
+        location = client.start_upload()
+        client.finish_upload(location, blob.digest, contents, blob.size)
+        PUSH_BYTES.inc(blob.size, mode="registry", result="uploaded")
+    else:
+        _upload_chunks(client, contents, blob, chunk_size, state)
+    state.forget(key)
+    github_actions_utils.log_info(f"Uploaded blob {blob.digest} ({blob.size} bytes)")
+    return True
+
+
+def push_archive(
+    client: oci_registry.RegistryClient,
+    image_tar: str,
+    tag: str,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    workers: int = DEFAULT_UPLOAD_WORKERS,
+    state: Optional[UploadState] = None,
+) -> str:
+    """
+    Push the image in a `docker save` archive to a registry under a tag.
+    
+    Blobs are uploaded by a pool of workers, largest first so that the biggest
+    layer is not left running on its own at the end. The first failed upload
+    is raised as soon as it happens; blobs not yet started are skipped.
+    
+    Args:
+        client: Registry client for the target repository
+        image_tar: Path to the archive
+        tag: Tag to store the manifest under
+        chunk_size: Largest blob uploaded in one request
+        workers: Blobs uploaded at once
+        state: Upload sessions to resume and record progress in
+        
+    Returns:
+        Manifest digest, computed from the archive and confirmed by the registry
+        
+    Raises:
+        ValueError: If the archive cannot be read as a `docker save` archive
+        HTTPError: If the registry rejects a request
+        URLError: If the registry cannot be reached, or reports a digest other
+            than the one computed from the archive
+    """
+    state = state or UploadState()
+    with image_archive.ImageArchive(image_tar) as archive:
+        image = image_digest.read_archive_image(archive)
+        github_actions_utils.log_info(f"Manifest digest computed from the archive: {image.digest}")
+        blobs = sorted(image.blobs, key=lambda blob: blob.size, reverse=True)
+        executor = ThreadPoolExecutor(max_workers=workers)
+        try:
+            futures = [executor.submit(push_blob, client, archive, blob, chunk_size, state) for blob in blobs]
+            for future in as_completed(futures):
+                future.result()
+        finally:
+            # After a failure, blobs not yet started are dropped; those being
+            # uploaded finish before the archive is unmapped
+            executor.shutdown(wait=True, cancel_futures=True)
+    digest = client.put_manifest(tag, image.manifest, image.media_type)
+    if digest != image.digest:
+        raise URLError(f"Registry stored the manifest as {digest}, expected {image.digest}")
+    return digest
+
+
+def retag(client: oci_registry.RegistryClient, digest: str, tags: List[str]) -> None:
+    """
+    Point more tags at a manifest that is already in the registry.
+    
+    The manifest is fetched once by digest and stored unchanged under each
+    tag, so every tag costs one small request and no blobs are uploaded.
+    
+    Args:
+        client: Registry client for the target repository
+        digest: Digest of the manifest to tag
+        tags: Tags to add
+        
+    Raises:
+        HTTPError: If the registry rejects a request
+        URLError: If the registry cannot be reached, or stores a tag under a
+            different digest
+    """
+    if not tags:
+        return
+    media_type, manifest = client.get_manifest(digest)
+    for tag in tags:
+        stored = client.put_manifest(tag, manifest, media_type)
+        if stored != digest:
+            raise URLError(f"Registry stored tag {tag} as {stored}, expected {digest}")
+        github_actions_utils.log_info(f"Tagged {digest} as {tag}")
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+In-memory stand-in for an OCI distribution registry such as ghcr.io.
+
+Serve it with stand_in_server.StandInServer to exercise the registry client in
+tests and benchmarks without network access. It implements the token
+authentication challenge and the manifest, blob and blob upload endpoints of
+the distribution API.
+"""
+
+import base64
+import hashlib
+import json
+import re
+import threading
+import uuid
+from typing import Dict, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from stand_in_server import StandInRequest, StandInResponse
+
+MANIFEST_PATH = re.compile(r"^/v2/(?P<name>.+)/manifests/(?P<reference>[^/]+)$")
+BLOB_PATH = re.compile(r"^/v2/(?P<name>.+)/blobs/(?P<digest>sha256:[a-f0-9]{64})$")
+UPLOAD_PATH = re.compile(r"^/v2/(?P<name>.+)/blobs/uploads/(?P<session>[^/]*)$")
+
+
+class StandInRegistry:
+    """
+    In-memory OCI distribution registry.
+    
+    Requests to /v2/ must carry a bearer token obtained from /token with the
+    configured basic credentials.
+    
+    Args:
+        username: Username accepted by the token service
+        password: Password accepted by the token service
+        
+    Example:
+        >>> registry = StandInRegistry('user', 'secret')
+        >>> with StandInServer(registry.handle) as server:
+        ...     client = RegistryClient('owner/repo', 'user', 'secret', server.base_url)
+    """
+    
+    def __init__(self, username: str = "user", password: str = "secret") -> None:
+        self._credentials = base64.b64encode(f"{username}:{password}".encode()).decode()
+        self.token = "stand-in-token"
+        self.manifests: Dict[Tuple[str, str], Tuple[str, bytes]] = {}
+        self.tags: Dict[Tuple[str, str], str] = {}
+        self.blobs: Dict[Tuple[str, str], bytes] = {}
+        self.uploads: Dict[str, bytearray] = {}
+        self._lock = threading.Lock()
+    
+    def add_manifest(self, name: str, manifest: bytes, media_type: str, *tags: str) -> str:
+        """
+        Store a manifest directly, bypassing the API.
+        
+        Args:
+            name: Repository name
+            manifest: Manifest bytes
+            media_type: Manifest media type
+            tags: Tags pointing at the manifest
+            
+        Returns:
+            Manifest digest
+        """
+        digest = "sha256:" + hashlib.sha256(manifest).hexdigest()
+        with self._lock:
+            self.manifests[(name, digest)] = (media_type, manifest)
+            for tag in tags:
+                self.tags[(name, tag)] = digest
+        return digest
+    
+    def handle(self, request: StandInRequest) -> StandInResponse:
+        """Answer one request."""
+        url = urlsplit(request.path)
+        if url.path == "/token":
+            return self._token(request)
+        if request.headers.get("Authorization") != f"Bearer {self.token}":
+            scope = ""
+            match = MANIFEST_PATH.match(url.path) or BLOB_PATH.match(url.path) or UPLOAD_PATH.match(url.path)
+            if match:
+                scope = f',scope="repository:{match.group("name")}:pull,push"'
+            return 401, {
+                "WWW-Authenticate": f'Bearer realm="{self.base_url(request)}/token",service="stand-in"{scope}'
+            }, b""
+        match = MANIFEST_PATH.match(url.path)
+        if match:
+            return self._manifest(request, match.group("name"), match.group("reference"))
+        match = BLOB_PATH.match(url.path)
+        if match:
+            return self._blob(match.group("name"), match.group("digest"))
+        match = UPLOAD_PATH.match(url.path)
+        if match:
+            return self._upload(request, match.group("name"), match.group("session"))
+        return 404, {}, b'{"errors": [{"code": "NAME_UNKNOWN"}]}'
+    
+    def base_url(self, request: StandInRequest) -> str:
+        """Origin the client used to reach the registry."""
+        return f"http://{request.headers.get('Host', 'localhost')}"
+    
+    def _token(self, request: StandInRequest) -> StandInResponse:
+        """Issue a token for valid basic credentials."""
+        if request.headers.get("Authorization") != f"Basic {self._credentials}":
+            return 401, {}, b'{"errors": [{"code": "UNAUTHORIZED"}]}'
+        query = parse_qs(urlsplit(request.path).query)
+        if "service" not in query:
+            return 400, {}, b""
+        return 200, {"Content-Type": "application/json"}, json.dumps({"token": self.token}).encode()
+    
+    def _manifest(self, request: StandInRequest, name: str, reference: str) -> StandInResponse:
+        """Serve or store a manifest by tag or digest."""
+        if request.method == "PUT":
+            media_type = request.headers.get("Content-Type", "")
+            by_digest = reference.startswith("sha256:")
+            if by_digest and reference != "sha256:" + hashlib.sha256(request.body).hexdigest():
+                return 400, {}, b'{"errors": [{"code": "DIGEST_INVALID"}]}'
+            digest = self.add_manifest(name, request.body, media_type, *(() if by_digest else (reference,)))
+            return 201, {
+                "Docker-Content-Digest": digest,
+                "Location": f"/v2/{name}/manifests/{digest}",
+            }, b""
+        with self._lock:
+            digest = reference if reference.startswith("sha256:") else self.tags.get((name, reference), "")
+            stored = self.manifests.get((name, digest))
+        if stored is None:
+            return 404, {}, b'{"errors": [{"code": "MANIFEST_UNKNOWN"}]}'
+        media_type, manifest = stored
+        return 200, {
+            "Content-Type": media_type,
+            "Content-Length": str(len(manifest)),
+            "Docker-Content-Digest": digest,
+        }, manifest
+    
+    def _blob(self, name: str, digest: str) -> StandInResponse:
+        """Serve a blob."""
+        with self._lock:
+            blob = self.blobs.get((name, digest))
+        if blob is None:
+            return 404, {}, b'{"errors": [{"code": "BLOB_UNKNOWN"}]}'
+        return 200, {"Content-Length": str(len(blob)), "Docker-Content-Digest": digest}, blob
+    
+    def _upload(self, request: StandInRequest, name: str, session: str) -> StandInResponse:
+        """Open, append to or complete a blob upload session."""
+        if request.method == "POST":
+            session = str(uuid.uuid4())
+            with self._lock:
+                self.uploads[session] = bytearray()
+            return 202, {"Location": f"/v2/{name}/blobs/uploads/{session}", "Range": "0-0"}, b""
+        with self._lock:
+            data = self.uploads.get(session)
+        if data is None:
+            return 404, {}, b'{"errors": [{"code": "BLOB_UPLOAD_UNKNOWN"}]}'
+        status = {
+            "Location": f"/v2/{name}/blobs/uploads/{session}",
+            "Range": f"0-{max(len(data) - 1, 0)}",
+        }
+        if request.method == "GET":
+            return 204, status, b""
+        if request.method == "PATCH":
+            content_range = request.headers.get("Content-Range")
+            if content_range and int(content_range.split("-")[0]) != len(data):
+                return 416, status, b""
+            data.extend(request.body)
+            return 202, {**status, "Range": f"0-{len(data) - 1}"}, b""
+        if request.method == "PUT":
+            data.extend(request.body)
+            digest = parse_qs(urlsplit(request.path).query).get("digest", [""])[0]
+            if digest != "sha256:" + hashlib.sha256(data).hexdigest():
+                return 400, {}, b'{"errors": [{"code": "DIGEST_INVALID"}]}'
+            with self._lock:
+                self.blobs[(name, digest)] = bytes(data)
+                del self.uploads[session]
+            return 201, {
+                "Location": f"/v2/{name}/blobs/{digest}",
+                "Docker-Content-Digest": digest,
+            }, b""
+        return 405, {}, b""
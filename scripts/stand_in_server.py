@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Local stand-in HTTP server for exercising the scripts' network clients.
+
+Tests and benchmarks use this instead of the real GitHub API or container
+registry. The server runs on localhost in a background thread, supports
+HTTP/1.1 keep-alive and can serve over TLS with a throwaway self-signed
+certificate, so connection reuse and handshake costs behave as they would
+against the real service. It can also listen on a unix domain socket, to
+stand in for the Docker daemon.
+"""
+
+import os
+import socketserver
+import ssl
+import subprocess
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Connections the listening socket queues before they are accepted; the
+# socketserver default of 5 drops bursts of concurrent connections, which
+# then stall for a second before the client retries
+LISTEN_BACKLOG = 128
+
+
+class StandInRequest:
+    """
+    Request received by a stand-in server.
+    
+    Attributes:
+        method: HTTP method
+        path: Request path including any query string
+        headers: Request headers
+        body: Request body
+    """
+    
+    def __init__(self, method: str, path: str, headers: Dict[str, str], body: bytes) -> None:
+        self.method = method
+        self.path = path
+        self.headers = headers
+        self.body = body
+
+
+# Status code, response headers and response body
+StandInResponse = Tuple[int, Dict[str, str], bytes]
+
+Handler = Callable[[StandInRequest], StandInResponse]
+
+
+def generate_self_signed_certificate(directory: str) -> Tuple[str, str]:
+    """
+    Generate a self-signed certificate for localhost with the openssl CLI.
+    
+    Args:
+        directory: Directory to write the certificate and key to
+        
+    Returns:
+        Tuple of (certificate path, private key path)
+        
+    Raises:
+        subprocess.CalledProcessError: If openssl fails
+    """
+    certfile = os.path.join(directory, "cert.pem")
+    keyfile = os.path.join(directory, "key.pem")
+    subprocess.run(
+        [
+            "openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes",
+            "-keyout", keyfile, "-out", certfile, "-days", "1",
+            "-subj", "/CN=localhost", "-addext", "subjectAltName=DNS:localhost",
+        ],
+        check=True,
+        capture_output=True,
+        timeout=60
+    )
+    return certfile, keyfile
+
+
+class ThreadingTCPHTTPServer(ThreadingHTTPServer):
+    """HTTP server on a TCP port, one thread per connection."""
+    
+    daemon_threads = True
+    request_queue_size = LISTEN_BACKLOG
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingUnixStreamServer):
+    """HTTP server on a unix domain socket, one thread per connection."""
+    
+    daemon_threads = True
+    request_queue_size = LISTEN_BACKLOG
+
+
+class StandInServer:
+    """
+    Threaded HTTP/1.1 server on localhost that dispatches to a handler function.
+    
+    Use as a context manager. Every request is recorded in `requests` and every
+    accepted connection is counted in `connections`. With TLS, `ssl_context`
+    trusts the server's certificate, which is also written to `certfile` for
+    clients in other processes.
+    
+    Args:
+        handler: Function returning the response for each request
+        tls: Serve HTTPS with a self-signed certificate for localhost
+        unix_socket: Listen on this unix domain socket path instead of a TCP port
+        
+    Example:
+        >>> with StandInServer(lambda req: (200, {}, b"ok")) as server:
+        ...     print(server.base_url)
+        http://localhost:...
+    """
+    
+    def __init__(self, handler: Handler, tls: bool = False, unix_socket: Optional[str] = None) -> None:
+        self.handler = handler
+        self.tls = tls
+        self.unix_socket = unix_socket
+        self.requests: List[StandInRequest] = []
+        self.connections = 0
+        self.ssl_context: Optional[ssl.SSLContext] = None
+        self.certfile: Optional[str] = None
+        self._lock = threading.Lock()
+        self._tempdir: Optional[tempfile.TemporaryDirectory[str]] = None
+        self._httpd: Optional[socketserver.TCPServer] = None
+        self._thread: Optional[threading.Thread] = None
+    
+    @property
+    def base_url(self) -> str:
+        """Origin of the running server."""
+        assert self._httpd is not None, "server is not running"
+        assert self.unix_socket is None, "server listens on a unix socket"
+        scheme = "https" if self.tls else "http"
+        return f"{scheme}://localhost:{self._httpd.server_address[1]}"
+    
+    def _request_handler_class(self) -> type:
+        """Build the request handler class bound to this server."""
+        server = self
+        
+        class RequestHandler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            
+            def setup(self) -> None:
+                with server._lock:
+                    server.connections += 1
+                super().setup()
+            
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+            
+            def _handle(self) -> None:
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                request = StandInRequest(self.command, self.path, dict(self.headers), body)
+                with server._lock:
+                    server.requests.append(request)
+                status, headers, payload = server.handler(request)
+                try:
+                    self.send_response(status)
+                    if "Content-Length" not in headers:
+                        self.send_header("Content-Length", str(len(payload)))
+                    for name, value in headers.items():
+                        self.send_header(name, value)
+                    self.end_headers()
+                    if self.command != "HEAD" and payload:
+                        self.wfile.write(payload)
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client timed out or gave up before the response was ready
+                    self.close_connection = True
+            
+            do_GET = do_HEAD = do_POST = do_PUT = do_PATCH = do_DELETE = _handle
+        
+        return RequestHandler
+    
+    def __enter__(self) -> "StandInServer":
+        if self.unix_socket is not None:
+            self._httpd = ThreadingUnixHTTPServer(self.unix_socket, self._request_handler_class())
+        else:
+            self._httpd = ThreadingTCPHTTPServer(("localhost", 0), self._request_handler_class())
+        if self.tls:
+            self._tempdir = tempfile.TemporaryDirectory()
+            certfile, keyfile = generate_self_signed_certificate(self._tempdir.name)
+            server_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            server_context.load_cert_chain(certfile, keyfile)
+            self._httpd.socket = server_context.wrap_socket(self._httpd.socket, server_side=True)
+            self.ssl_context = ssl.create_default_context(cafile=certfile)
+            self.certfile = certfile
+        self._thread = threading.Thread(
+            target=self._httpd.serve_forever, kwargs={"poll_interval": 0.01}, daemon=True
+        )
+        self._thread.start()
+        return self
+    
+    def __exit__(self, *exc_info: Any) -> None:
+        assert self._httpd is not None and self._thread is not None
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self._thread.join()
+        if self._tempdir is not None:
+            self._tempdir.cleanup()
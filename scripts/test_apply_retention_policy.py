@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+Unit tests for apply_retention_policy.py script.
+
+Policies are evaluated over hand-built listings at a fixed time, with
+attestation indexes and image manifests served from a dictionary instead of
+the registry.
+"""
+
+import json
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+from urllib.error import HTTPError
+
+# Add parent directory to path to import the module in a way that works across environments
+script_dir = str(Path(__file__).resolve().parent)
+if script_dir not in sys.path:
+    sys.path.insert(0, script_dir)
+import apply_retention_policy
+from cleanup_pr_image import VersionIndex
+from github_actions_utils import PackageVersion
+
+# 2024-06-01T00:00:00Z
+NOW = 1717200000.0
+
+POLICY = {
+    "rules": [
+        {"action": "keep", "tags": "latest"},
+        {"action": "keep", "tags": "[0-9a-f]{40}", "newest": 2},
+        {"action": "delete", "tags": "[0-9a-f]{40}"},
+        {"action": "delete", "untagged": True, "older_than_days": 7},
+    ]
+}
+
+
+def sha(n):
+    """Commit SHA tag."""
+    return f"{n:040x}"
+
+
+def digest(n):
+    """Manifest digest."""
+    return f"sha256:{n:064x}"
+
+
+def referrers_tag(n):
+    """OCI referrers tag for the image with digest(n)."""
+    return digest(n).replace(":", "-")
+
+
+def created(day):
+    """Creation time on a day of May 2024."""
+    return f"2024-05-{day:02d}T12:00:00Z"
+
+
+def policy(spec=None):
+    """Build a policy from its JSON form."""
+    rules = [apply_retention_policy.RetentionRule.from_dict(rule) for rule in (spec or POLICY)["rules"]]
+    return apply_retention_policy.RetentionPolicy(rules)
+
+
+def referrers_index(*digests):
+    """Referrers index listing attestation manifests."""
+    return json.dumps({
+        "schemaVersion": 2,
+        "mediaType": "application/vnd.oci.image.index.v1+json",
+        "manifests": [{"digest": d, "mediaType": "application/vnd.oci.image.manifest.v1+json"} for d in digests],
+    }).encode()
+
+
+def image_index(*digests):
+    """Multi-platform image index listing platform and attestation manifests."""
+    return json.dumps({
+        "schemaVersion": 2,
+        "mediaType": "application/vnd.oci.image.index.v1+json",
+        "manifests": [{"digest": d, "mediaType": "application/vnd.oci.image.manifest.v1+json"} for d in digests],
+    }).encode()
+
+
+def image_manifest():
+    """Single-platform image manifest."""
+    return json.dumps({
+        "schemaVersion": 2,
+        "mediaType": "application/vnd.oci.image.manifest.v1+json",
+        "config": {"digest": digest(0), "mediaType": "application/vnd.oci.image.config.v1+json"},
+        "layers": [],
+    }).encode()
+
+
+class TestRules(unittest.TestCase):
+    """Test rule parsing and evaluation."""
+    
+    def test_first_matching_rule_decides(self):
+        """Test latest and the newest SHA tags are kept, older SHA tags and old untagged versions deleted."""
+        versions = [
+            PackageVersion(1, digest(1), [sha(1), "latest"], created(30)),
+            PackageVersion(2, digest(2), [sha(2)], created(29)),
+            PackageVersion(3, digest(3), [sha(3)], created(28)),
+            PackageVersion(4, digest(4), [sha(4)], created(27)),
+            PackageVersion(5, digest(5), [], created(1)),
+            PackageVersion(6, digest(6), [], created(30)),
+            PackageVersion(7, digest(7), ["pr-12"], created(1)),
+            PackageVersion(8, digest(8), [sha(8), "v1.0"], created(1)),
+        ]
+        
+        plan = policy().evaluate(VersionIndex(versions), lambda tag: b"{}", now=NOW)
+        
+        # The newest two SHA tags include the one latest also points at
+        self.assertEqual(sorted(plan.delete), [3, 4, 5])
+        self.assertEqual(sorted(plan.keep), [1, 2, 6, 7, 8])
+        self.assertEqual(plan.keep[7], "no rule matches")
+        self.assertEqual(plan.delete[4], "rule 3: delete tagged [0-9a-f]{40}")
+    
+    def test_unknown_age_is_never_old(self):
+        """Test that a version without a readable creation time is not deleted by age."""
+        versions = [PackageVersion(1, digest(1), [], ""), PackageVersion(2, digest(2), [], "yesterday")]
+        
+        plan = policy().evaluate(VersionIndex(versions), lambda tag: b"{}", now=NOW)
+        
+        self.assertEqual(plan.delete, {})
+    
+    def test_invalid_rules_rejected(self):
+        """Test that malformed rules raise ValueError."""
+        for rule in (
+            {"action": "purge", "untagged": True},
+            {"action": "keep"},
+            {"action": "keep", "tags": "latest", "untagged": True},
+            {"action": "keep", "tags": "("},
+            {"action": "delete", "untagged": True, "older_than": 7},
+            {"action": "keep", "tags": "x", "newest": -1},
+        ):
+            with self.subTest(rule=rule):
+                with self.assertRaises(ValueError):
+                    apply_retention_policy.RetentionRule.from_dict(rule)
+    
+    def test_load_names_bad_rule(self):
+        """Test that an invalid policy file reports which rule is wrong."""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "policy.json")
+            Path(path).write_text(json.dumps({"rules": [{"action": "keep", "tags": "latest"}, {"action": "x"}]}))
+            
+            with self.assertRaises(ValueError) as cm:
+                apply_retention_policy.RetentionPolicy.load(path)
+        
+        self.assertIn("Rule 2", str(cm.exception))
+
+
+class TestAttestations(unittest.TestCase):
+    """Test that attestations follow the images they describe."""
+    
+    def setUp(self):
+        self.versions = [
+            PackageVersion(1, digest(1), ["latest", sha(1)], created(30)),
+            PackageVersion(2, digest(2), [sha(2)], created(20)),
+            PackageVersion(3, digest(3), [sha(3)], created(10)),
+            PackageVersion(11, digest(11), [referrers_tag(1)], created(30)),
+            PackageVersion(12, digest(12), [], created(1)),
+            PackageVersion(13, digest(13), [referrers_tag(3)], created(10)),
+            PackageVersion(14, digest(14), [], created(1)),
+        ]
+        self.indexes = {
+            referrers_tag(1): referrers_index(digest(12)),
+            referrers_tag(3): referrers_index(digest(14)),
+            **{digest(n): image_manifest() for n in (1, 2, 3)},
+        }
+    
+    def test_attestations_follow_their_image(self):
+        """Test that attestations of kept images are kept and those of deleted images deleted."""
+        plan = policy().evaluate(VersionIndex(self.versions), self.indexes.__getitem__, now=NOW)
+        
+        self.assertEqual(sorted(plan.delete), [3, 13, 14])
+        self.assertEqual(plan.keep[12], "listed by kept attestations 11")
+        self.assertEqual(plan.delete[13], "attestations of deleted version 3")
+    
+    def test_unreadable_attestations_protect_untagged_versions(self):
+        """Test that no untagged version is deleted when an attestation index cannot be read."""
+        def fetch(tag):
+            if tag == referrers_tag(1):
+                raise HTTPError(tag, 500, "Internal Server Error", {}, None)
+            return self.indexes[tag]
+        
+        with patch('apply_retention_policy.github_actions_utils.github_action_log'):
+            plan = policy().evaluate(VersionIndex(self.versions), fetch, now=NOW)
+        
+        self.assertEqual(sorted(plan.delete), [3, 13])
+        self.assertEqual(plan.keep[12], "attestations could not be read")
+
+
+class TestImageIndexes(unittest.TestCase):
+    """Test that the manifests a kept image index lists are kept."""
+    
+    def setUp(self):
+        # latest is a multi-platform index over 21 and 22 with a provenance manifest 23;
+        # 24 is an old untagged manifest nothing lists
+        self.versions = [
+            PackageVersion(1, digest(1), ["latest", sha(1)], created(30)),
+            PackageVersion(21, digest(21), [], created(1)),
+            PackageVersion(22, digest(22), [], created(1)),
+            PackageVersion(23, digest(23), [], created(1)),
+            PackageVersion(24, digest(24), [], created(1)),
+        ]
+        self.manifests = {digest(1): image_index(digest(21), digest(22), digest(23))}
+    
+    def test_children_of_kept_index_kept(self):
+        """Test that platform and attestation manifests of a kept index are not deleted as untagged."""
+        plan = policy().evaluate(VersionIndex(self.versions), self.manifests.__getitem__, now=NOW)
+        
+        self.assertEqual(sorted(plan.delete), [24])
+        self.assertEqual(plan.keep[21], "listed by kept index 1")
+        self.assertEqual(plan.keep[23], "listed by kept index 1")
+    
+    def test_docker_manifest_list_and_index_without_media_type(self):
+        """Test that a Docker manifest list and an OCI index without mediaType are read as indexes."""
+        for media_type in ("application/vnd.docker.distribution.manifest.list.v2+json", None):
+            document = json.loads(self.manifests[digest(1)])
+            document.pop("mediaType")
+            if media_type:
+                document["mediaType"] = media_type
+            manifest = json.dumps(document).encode()
+            with self.subTest(media_type=media_type):
+                plan = policy().evaluate(VersionIndex(self.versions), lambda reference: manifest, now=NOW)
+                
+                self.assertEqual(sorted(plan.delete), [24])
+    
+    def test_unreadable_manifest_protects_untagged_versions(self):
+        """Test that no untagged version is deleted when a kept image's manifest cannot be read."""
+        def fetch(reference):
+            raise HTTPError(reference, 503, "Service Unavailable", {}, None)
+        
+        with patch('apply_retention_policy.github_actions_utils.github_action_log') as mock_log:
+            plan = policy().evaluate(VersionIndex(self.versions), fetch, now=NOW)
+        
+        self.assertEqual(plan.delete, {})
+        self.assertEqual(plan.keep[24], "an image manifest could not be read")
+        self.assertIn(f"Could not read manifest {digest(1)}", mock_log.call_args[0][1])
+
+
+class TestMain(unittest.TestCase):
+    """Test the script end to end with the API mocked."""
+    
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.policy_path = os.path.join(self.tmp.name, "policy.json")
+        Path(self.policy_path).write_text(json.dumps(POLICY))
+        versions = [PackageVersion(n, digest(n), [sha(n)], created(30 - n)) for n in range(1, 6)]
+        for patcher in (
+            patch('cleanup_pr_image.get_package_versions', return_value=iter(versions)),
+            patch('apply_retention_policy.oci_registry.RegistryClient'),
+            patch('apply_retention_policy.github_actions_utils.log_info'),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+    
+    def run_main(self, *extra):
+        argv = [
+            "apply_retention_policy.py", "--policy", self.policy_path, "--repository", "owner/repo",
+            "--owner", "owner", "--token", "token123", *extra,
+        ]
+        with patch('sys.argv', argv):
+            with self.assertRaises(SystemExit) as cm:
+                apply_retention_policy.main()
+        return cm.exception.code
+    
+    @patch('cleanup_pr_image.delete_package_versions')
+    def test_dry_run_deletes_nothing(self, mock_delete):
+        """Test that a dry run logs the plan without deleting."""
+        self.assertEqual(self.run_main("--dry-run"), 0)
+        
+        mock_delete.assert_not_called()
+    
+    @patch('cleanup_pr_image.delete_package_versions')
+    def test_plan_applied_concurrently(self, mock_delete):
+        """Test that planned deletes go through the bounded delete pool and failures fail the run."""
+        mock_delete.return_value = ([3, 4], [5])
+        
+        self.assertEqual(self.run_main("--max-workers", "3"), 1)
+        
+        owner, package, version_ids, token, max_workers = mock_delete.call_args[0]
+        self.assertEqual((owner, package, sorted(version_ids), max_workers), ("owner", "repo", [3, 4, 5], 3))
+    
+    def test_invalid_policy_fails(self):
+        """Test that an unreadable policy fails before anything is listed."""
+        Path(self.policy_path).write_text("{not json")
+        
+        with patch('apply_retention_policy.github_actions_utils.github_action_log') as mock_log:
+            self.assertEqual(self.run_main(), 1)
+        
+        self.assertIn("Invalid retention policy", mock_log.call_args[0][1])
+    
+    def test_listing_failure_fails(self):
+        """Test that a listing that fails with a server error is not read as a missing package."""
+        error = HTTPError("url", 502, "Bad Gateway", {}, None)
+        with patch('cleanup_pr_image.get_package_versions', side_effect=error), \
+                patch('apply_retention_policy.github_actions_utils.github_action_log') as mock_log:
+            self.assertEqual(self.run_main(), 1)
+        
+        self.assertIn("HTTP Error 502", mock_log.call_args[0][1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Unit tests for async_github_api.py module.
+
+Requests go to a local stand-in server, so the HTTP/1.1 handling, connection
+reuse and concurrency bound are exercised over real sockets.
+"""
+
+import asyncio
+import json
+import sys
+import threading
+import time
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+from urllib.error import HTTPError, URLError
+
+# Add parent directory to path to import the module in a way that works across environments
+script_dir = str(Path(__file__).resolve().parent)
+if script_dir not in sys.path:
+    sys.path.insert(0, script_dir)
+import async_github_api
+import github_actions_utils
+from stand_in_server import StandInServer
+
+VERSIONS_PATH = "/users/owner/packages/container/repo/versions"
+
+
+def api_version(vid, *tags):
+    """Package version as returned by the GitHub API."""
+    return {"id": vid, "name": f"sha256:{vid:064x}", "metadata": {"container": {"tags": list(tags)}}}
+
+
+def run(coroutine_function, server, **kwargs):
+    """Run a coroutine function with a client for the server and close the client afterwards."""
+    async def main():
+        async with async_github_api.AsyncGitHubAPIClient(
+            "token123", server.base_url, context=server.ssl_context, **kwargs
+        ) as client:
+            return client, await coroutine_function(client)
+    return asyncio.run(main())
+
+
+def scheduler(sleeps, **kwargs):
+    """Build a scheduler that records its waits instead of sleeping."""
+    async def async_sleep(seconds):
+        sleeps.append(seconds)
+    return github_actions_utils.RequestScheduler(async_sleep=async_sleep, **kwargs)
+
+
+class TestRequests(unittest.TestCase):
+    """Test single requests."""
+    
+    def test_list_versions_follows_next_links(self):
+        """Test that every page is fetched and decoded into package versions."""
+        def handler(request):
+            if "page=2" in request.path:
+                return 200, {}, json.dumps([api_version(3)]).encode()
+            link = f'<{server.base_url}{VERSIONS_PATH}?per_page=100&page=2>; rel="next"'
+            return 200, {"Link": link}, json.dumps([api_version(1, "pr-1"), api_version(2, "latest")]).encode()
+        
+        with StandInServer(handler) as server:
+            client, versions = run(lambda client: client.list_versions("owner", "repo"), server)
+        
+        self.assertEqual([(v.id, v.tags) for v in versions], [(1, ["pr-1"]), (2, ["latest"]), (3, [])])
+        self.assertEqual(server.requests[0].path, f"{VERSIONS_PATH}?per_page=100")
+        self.assertEqual(server.requests[0].headers["Authorization"], "Bearer token123")
+        self.assertEqual(client.connections, 1)
+    
+    def test_list_versions_not_found(self):
+        """Test that a missing package is reported as None."""
+        with StandInServer(lambda request: (404, {}, b'{"message": "Not Found"}')) as server:
+            _, versions = run(lambda client: client.list_versions("owner", "repo"), server)
+        
+        self.assertIsNone(versions)
+    
+    def test_get_version_over_tls(self):
+        """Test a request over TLS to a server with a self-signed certificate."""
+        body = json.dumps(api_version(7, "pr-7")).encode()
+        with StandInServer(lambda request: (200, {}, body), tls=True) as server:
+            _, version = run(lambda client: client.get_version("owner", "repo", 7), server)
+        
+        self.assertEqual((version.id, version.tags), (7, ["pr-7"]))
+        self.assertEqual(server.requests[0].path, f"{VERSIONS_PATH}/7")
+    
+    def test_server_errors_retried_then_raised(self):
+        """Test that 5xx responses to idempotent requests are retried by the scheduler and the last one raised."""
+        sleeps = []
+        with StandInServer(lambda request: (503, {}, b"unavailable")) as server:
+            with self.assertRaises(HTTPError) as cm:
+                run(
+                    lambda client: client.get_version("owner", "repo", 7), server,
+                    scheduler=scheduler(sleeps, max_attempts=3),
+                )
+        
+        self.assertEqual(cm.exception.code, 503)
+        self.assertEqual(len(server.requests), 3)
+        self.assertEqual(len(sleeps), 2)
+    
+    def test_rate_limit_wait_from_scheduler(self):
+        """Test that the scheduler's Retry-After handling applies to asyncio requests."""
+        statuses = [429, 200]
+        sleeps = []
+        
+        def handler(request):
+            status = statuses.pop(0)
+            return status, {"Retry-After": "7"} if status == 429 else {}, json.dumps(api_version(7)).encode()
+        
+        with StandInServer(handler) as server:
+            with patch('github_actions_utils.log_info'):
+                _, version = run(
+                    lambda client: client.get_version("owner", "repo", 7), server, scheduler=scheduler(sleeps)
+                )
+        
+        self.assertEqual(version.id, 7)
+        self.assertEqual(sleeps, [7.0])
+    
+    def test_request_outlasting_deadline_raises(self):
+        """Test that an attempt cut off by the shared deadline raises DeadlineExceeded and is not retried."""
+        def handler(request):
+            time.sleep(1.5)
+            return 200, {}, b"{}"
+        
+        deadline = github_actions_utils.Deadline()
+        deadline.start(1)
+        with patch('github_actions_utils.deadline', deadline), StandInServer(handler) as server:
+            with self.assertRaises(github_actions_utils.DeadlineExceeded) as cm:
+                run(lambda client: client.get_version("owner", "repo", 7), server, scheduler=scheduler([]))
+        
+        self.assertEqual(
+            str(cm.exception), f"GET {VERSIONS_PATH}/{{id}} timed out after 1s, using up the time budget of 1s"
+        )
+        self.assertEqual(len(server.requests), 1)
+    
+    def test_refuses_other_origin(self):
+        """Test that the token is never sent to another host."""
+        with StandInServer(lambda request: (200, {}, b"[]")) as server:
+            with self.assertRaises(URLError):
+                run(lambda client: client.request("GET", "https://example.com/versions"), server)
+        
+        self.assertEqual(server.requests, [])
+    
+    def test_chunked_response(self):
+        """Test that a body sent with chunked transfer coding is reassembled."""
+        async def serve(reader, writer):
+            while (await reader.readline()) not in (b"\r\n", b""):
+                pass
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n"
+                b"6\r\n[{\"id\"\r\n6;ext=1\r\n: 1}]\n\r\n0\r\nX-Trailer: 1\r\n\r\n"
+            )
+            await writer.drain()
+            writer.close()
+        
+        async def main():
+            server = await asyncio.start_server(serve, "localhost", 0)
+            port = server.sockets[0].getsockname()[1]
+            async with server:
+                async with async_github_api.AsyncGitHubAPIClient("token123", f"http://localhost:{port}") as client:
+                    return await client.request("GET", "/versions")
+        
+        response = asyncio.run(main())
+        
+        self.assertEqual(response.json(), [{"id": 1}])
+
+
+class TestBulkDeletes(unittest.TestCase):
+    """Test concurrent deletes."""
+    
+    def setUp(self):
+        patcher = patch('async_github_api.github_actions_utils.github_action_log')
+        self.mock_log = patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def test_concurrency_bounded_and_connections_reused(self):
+        """Test that no more than max_concurrency deletes are in flight and connections are reused."""
+        lock = threading.Lock()
+        in_flight = [0]
+        peak = [0]
+        
+        def handler(request):
+            with lock:
+                in_flight[0] += 1
+                peak[0] = max(peak[0], in_flight[0])
+            time.sleep(0.01)
+            with lock:
+                in_flight[0] -= 1
+            if request.path.endswith("/13"):
+                return 404, {}, b'{"message": "Not Found"}'
+            return 204, {}, b""
+        
+        with StandInServer(handler) as server:
+            client, (deleted, failed) = run(
+                lambda client: client.delete_versions("owner", "repo", range(40)), server, max_concurrency=4
+            )
+        
+        self.assertEqual(sorted(deleted), [vid for vid in range(40) if vid != 13])
+        self.assertEqual(failed, [13])
+        self.assertLessEqual(peak[0], 4)
+        self.assertLessEqual(server.connections, 4)
+        self.assertIn("HTTP 404", self.mock_log.call_args_list[0][0][1])
+    
+    def test_deadline_cancels_unfinished_deletes(self):
+        """Test that deletes still outstanding at the deadline are cancelled and reported as failed."""
+        def handler(request):
+            if int(request.path.rsplit("/", 1)[1]) >= 2:
+                time.sleep(0.5)
+            return 204, {}, b""
+        
+        with StandInServer(handler) as server:
+            start = time.monotonic()
+            _, (deleted, failed) = run(
+                lambda client: client.delete_versions("owner", "repo", range(6), timeout=0.2), server,
+                max_concurrency=2,
+            )
+            elapsed = time.monotonic() - start
+        
+        self.assertEqual(sorted(deleted), [0, 1])
+        self.assertEqual(sorted(failed), [2, 3, 4, 5])
+        self.assertLess(elapsed, 0.5)
+        self.assertIn("cancelled 4 unfinished deletes", self.mock_log.call_args[0][1])
+    
+    def test_retried_delete_answered_with_404_counts_as_deleted(self):
+        """Test that a 404 after a retried DELETE is a success, but a 404 on the first attempt is not."""
+        replies = {"1": [502, 404], "2": [404]}
+        
+        def handler(request):
+            return replies[request.path.rsplit("/", 1)[1]].pop(0), {}, b'{"message": "Not Found"}'
+        
+        with StandInServer(handler) as server, patch('github_actions_utils.log_info'):
+            _, (deleted, failed) = run(
+                lambda client: client.delete_versions("owner", "repo", [1, 2]), server, scheduler=scheduler([])
+            )
+        
+        self.assertEqual((deleted, failed), ([1], [2]))
+        self.assertEqual(len(server.requests), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
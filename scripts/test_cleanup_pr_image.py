@@ -6,16 +6,22 @@ These tests verify core functionality without requiring actual API calls or auth
 """
 
 import sys
+import time
 import unittest
 from unittest.mock import patch, MagicMock
 from pathlib import Path
+import io
 import json
+from contextlib import nullcontext
+from http.client import HTTPMessage
+from urllib.error import URLError
 
 # Add parent directory to path to import the module in a way that works across environments
 script_dir = str(Path(__file__).resolve().parent)
 if script_dir not in sys.path:
     sys.path.insert(0, script_dir)
 import cleanup_pr_image
+import github_actions_utils
 
 
 class TestArgumentParsing(unittest.TestCase):
@@ -38,11 +44,81 @@ class TestArgumentParsing(unittest.TestCase):
         self.assertEqual(args.repository, "owner/repo")
         self.assertEqual(args.owner, "owner")
         self.assertEqual(args.token, "ghp_test123")
+    
+    def test_parse_args_requires_pr_number_without_sweep(self):
+        """Test that --pr-number is required unless sweeping."""
+        test_args = [
+            "cleanup_pr_image.py",
+            "--repository", "owner/repo",
+            "--owner", "owner",
+            "--token", "ghp_test123"
+        ]
+        
+        with patch('sys.argv', test_args):
+            with self.assertRaises(SystemExit) as cm:
+                cleanup_pr_image.parse_args()
+        self.assertEqual(cm.exception.code, 2)
+    
+    def test_parse_args_sweep_requires_open_prs(self):
+        """Test that sweep mode refuses to run without an explicit open PR list."""
+        test_args = [
+            "cleanup_pr_image.py",
+            "--sweep",
+            "--repository", "owner/repo",
+            "--owner", "owner",
+            "--token", "ghp_test123"
+        ]
+        
+        with patch('sys.argv', test_args):
+            with self.assertRaises(SystemExit) as cm:
+                cleanup_pr_image.parse_args()
+        self.assertEqual(cm.exception.code, 2)
+    
+    def test_parse_args_sweep(self):
+        """Test parsing sweep mode arguments."""
+        test_args = [
+            "cleanup_pr_image.py",
+            "--sweep",
+            "--open-prs", "1,2",
+            "--max-workers", "4",
+            "--repository", "owner/repo",
+            "--owner", "owner",
+            "--token", "ghp_test123"
+        ]
+        
+        with patch('sys.argv', test_args):
+            args = cleanup_pr_image.parse_args()
+        
+        self.assertTrue(args.sweep)
+        self.assertEqual(args.open_prs, "1,2")
+        self.assertEqual(args.max_workers, 4)
+        self.assertIsNone(args.pr_number)
+
+
+def decoded(versions):
+    """Project package versions as returned by the GitHub API."""
+    return [github_actions_utils.PackageVersion.from_api(version) for version in versions]
 
 
 class TestVersionIdLookup(unittest.TestCase):
     """Test version ID lookup from package versions."""
     
+    def test_package_version_keeps_only_used_fields(self):
+        """Test that a decoded version keeps its ID, digest, tags and creation time and nothing else."""
+        package_version = github_actions_utils.PackageVersion.from_api({
+            "id": 123,
+            "name": DIGEST,
+            "url": "https://api.github.com/users/owner/packages/container/repo/versions/123",
+            "created_at": "2024-05-01T12:00:00Z",
+            "metadata": {"package_type": "container", "container": {"tags": ["pr-42"]}},
+        })
+        
+        self.assertEqual(
+            (package_version.id, package_version.name, package_version.tags, package_version.created_at),
+            (123, DIGEST, ["pr-42"], "2024-05-01T12:00:00Z"),
+        )
+        self.assertFalse(hasattr(package_version, "__dict__"))
+    
     def test_find_version_id_by_tag_found(self):
         """Test finding version ID when tag exists."""
         versions = [
@@ -64,7 +140,7 @@ class TestVersionIdLookup(unittest.TestCase):
             }
         ]
         
-        version_id = cleanup_pr_image.find_version_id_by_tag(versions, "pr-42")
+        version_id = cleanup_pr_image.find_version_id_by_tag(decoded(versions), "pr-42")
         self.assertEqual(version_id, 456)
     
     def test_find_version_id_by_tag_not_found(self):
@@ -80,7 +156,7 @@ class TestVersionIdLookup(unittest.TestCase):
             }
         ]
         
-        version_id = cleanup_pr_image.find_version_id_by_tag(versions, "pr-99")
+        version_id = cleanup_pr_image.find_version_id_by_tag(decoded(versions), "pr-99")
         self.assertIsNone(version_id)
     
     def test_find_version_id_with_missing_metadata(self):
@@ -93,34 +169,383 @@ class TestVersionIdLookup(unittest.TestCase):
             }
         ]
         
-        version_id = cleanup_pr_image.find_version_id_by_tag(versions, "pr-42")
+        version_id = cleanup_pr_image.find_version_id_by_tag(decoded(versions), "pr-42")
         self.assertIsNone(version_id)
 
 
+def api_response(status, body=b"", headers=None):
+    """Build a GitHub API client response."""
+    message = HTTPMessage()
+    for name, value in (headers or {}).items():
+        message[name] = value
+    return github_actions_utils.APIResponse(status, message, body)
+
+
+def mock_versions_page(versions, link=None):
+    """Build a streamed GitHub API client response holding a page of versions."""
+    response = api_response(200, headers={"Link": link} if link else {})
+    return nullcontext((response, io.BytesIO(json.dumps(versions).encode())))
+
+
+def version(vid, *tags):
+    """Build a package version as decoded from the GitHub API."""
+    return github_actions_utils.PackageVersion(vid, tags=list(tags))
+
+
+class TestSweepPlanning(unittest.TestCase):
+    """Test selection of stale PR images in sweep mode."""
+    
+    def test_parse_pr_numbers(self):
+        """Test that PR numbers can be separated by commas or whitespace."""
+        self.assertEqual(cleanup_pr_image.parse_pr_numbers("1, 2\n3 4,"), {1, 2, 3, 4})
+        self.assertEqual(cleanup_pr_image.parse_pr_numbers(""), set())
+    
+    def test_parse_pr_numbers_rejects_garbage(self):
+        """Test that non-numeric entries are rejected."""
+        with self.assertRaises(ValueError):
+            cleanup_pr_image.parse_pr_numbers("1, two")
+    
+    def test_find_stale_pr_versions(self):
+        """Test that only closed PR images are stale and shared versions are skipped."""
+        versions = [
+            version(1, "pr-10"),
+            version(2, "pr-11"),
+            version(3, "pr-12", "latest"),
+            version(4, "latest", "abc123"),
+            version(5),
+            version(6, "pr-13", "pr-11"),
+            version(7, "pr-14", "pr-15"),
+        ]
+        
+        stale, skipped = cleanup_pr_image.find_stale_pr_versions(versions, {11})
+        
+        self.assertEqual(stale, {1: ["pr-10"], 7: ["pr-14", "pr-15"]})
+        self.assertEqual(sorted(skipped), [2, 3, 6])
+
+
+class TestVersionIndex(unittest.TestCase):
+    """Test tag and digest lookups over a version listing."""
+    
+    def setUp(self):
+        self.versions = [
+            version(1, "pr-10"),
+            version(2, "latest", "abc123"),
+            version(3),
+            github_actions_utils.PackageVersion(4, DIGEST, ["pr-2", "pr-12"]),
+            version(5),
+        ]
+    
+    def test_lookups(self):
+        """Test lookups by tag, by digest, by prefix, and the untagged count."""
+        index = cleanup_pr_image.VersionIndex(self.versions)
+        
+        self.assertEqual(index.find("abc123"), 2)
+        self.assertEqual(index.find("pr-99", DIGEST), 4)
+        self.assertIsNone(index.find("pr-99"))
+        self.assertEqual(index.tags_with_prefix("pr-"), ["pr-10", "pr-12", "pr-2"])
+        self.assertEqual([v.id for v in index.versions_with_tag_prefix("pr-")], [1, 4])
+        self.assertEqual(index.untagged_count, 2)
+        self.assertEqual(len(index), 5)
+    
+    def test_listing_consumed_only_as_far_as_needed(self):
+        """Test that a lookup stops drawing from the listing once it has its answer."""
+        drawn = []
+        
+        def listing():
+            for v in self.versions:
+                drawn.append(v.id)
+                yield v
+        
+        index = cleanup_pr_image.VersionIndex(listing())
+        
+        self.assertEqual(index.find("pr-10"), 1)
+        self.assertEqual(index.find("pr-10"), 1)
+        self.assertEqual(drawn, [1])
+        self.assertEqual(index.find("latest"), 2)
+        self.assertEqual(drawn, [1, 2])
+        self.assertEqual(index.untagged_count, 2)
+        self.assertEqual(drawn, [1, 2, 3, 4, 5])
+
+
+class TestSweep(unittest.TestCase):
+    """Test concurrent deletion of stale PR images."""
+    
+    @patch('cleanup_pr_image.delete_package_version')
+    def test_delete_package_versions_reports_outcomes(self, mock_delete):
+        """Test that deleted and failed versions are reported separately."""
+        mock_delete.side_effect = lambda owner, package, vid, token: vid != 2
+        
+        deleted, failed = cleanup_pr_image.delete_package_versions(
+            "owner", "repo", [1, 2, 3], "token123", max_workers=2
+        )
+        
+        self.assertEqual(sorted(deleted), [1, 3])
+        self.assertEqual(failed, [2])
+    
+    @patch('cleanup_pr_image.delete_package_version')
+    def test_delete_package_versions_bounds_concurrency(self, mock_delete):
+        """Test that no more than max_workers deletes run at once."""
+        import threading
+        import time
+        
+        lock = threading.Lock()
+        in_flight = [0]
+        peak = [0]
+        
+        def slow_delete(owner, package, vid, token):
+            with lock:
+                in_flight[0] += 1
+                peak[0] = max(peak[0], in_flight[0])
+            time.sleep(0.01)
+            with lock:
+                in_flight[0] -= 1
+            return True
+        
+        mock_delete.side_effect = slow_delete
+        
+        deleted, failed = cleanup_pr_image.delete_package_versions(
+            "owner", "repo", range(20), "token123", max_workers=3
+        )
+        
+        self.assertEqual(len(deleted), 20)
+        self.assertEqual(failed, [])
+        self.assertLessEqual(peak[0], 3)
+    
+    @patch('cleanup_pr_image.delete_package_version')
+    def test_delete_package_versions_survives_worker_exception(self, mock_delete):
+        """Test that an unexpected exception counts as a failed delete."""
+        mock_delete.side_effect = RuntimeError("boom")
+        
+        deleted, failed = cleanup_pr_image.delete_package_versions(
+            "owner", "repo", [1], "token123", max_workers=1
+        )
+        
+        self.assertEqual(deleted, [])
+        self.assertEqual(failed, [1])
+    
+    @patch('cleanup_pr_image.delete_package_version')
+    @patch('cleanup_pr_image.get_package_versions')
+    def test_sweep_exit_code_reflects_failures(self, mock_get_versions, mock_delete):
+        """Test that the sweep fails when any stale version could not be deleted."""
+        mock_get_versions.return_value = iter([version(1, "pr-1"), version(2, "pr-2")])
+        mock_delete.side_effect = lambda owner, package, vid, token: vid == 1
+        
+        exit_code = cleanup_pr_image.sweep_stale_pr_images(
+            "owner", "repo", "token123", set(), max_workers=2
+        )
+        
+        self.assertEqual(exit_code, 1)
+    
+    @patch('cleanup_pr_image.delete_package_version')
+    @patch('cleanup_pr_image.get_package_versions')
+    def test_main_sweep_reads_open_prs_file(self, mock_get_versions, mock_delete):
+        """Test that open PRs are read from a file and their images kept."""
+        import tempfile
+        
+        mock_get_versions.return_value = iter([version(1, "pr-1"), version(2, "pr-2")])
+        mock_delete.return_value = True
+        
+        with tempfile.NamedTemporaryFile("w", suffix=".txt") as f:
+            f.write("2\n")
+            f.flush()
+            test_args = [
+                "cleanup_pr_image.py",
+                "--sweep",
+                "--open-prs-file", f.name,
+                "--repository", "owner/repo",
+                "--owner", "owner",
+                "--token", "token123"
+            ]
+            
+            with patch('sys.argv', test_args):
+                with self.assertRaises(SystemExit) as cm:
+                    cleanup_pr_image.main()
+        
+        self.assertEqual(cm.exception.code, 0)
+        mock_delete.assert_called_once_with("owner", "repo", 1, "token123")
+
+
+class TestCleanupTargets(unittest.TestCase):
+    """Test cleaning up several packages through one shared pool."""
+    
+    def test_parse_targets(self):
+        """Test that targets parse from PACKAGE:PATTERN and from a JSON file."""
+        import tempfile
+        
+        target = cleanup_pr_image.CleanupTarget.parse("Other-Image:pr-1*")
+        self.assertEqual((target.package, target.pattern, target.prefix), ("other-image", "pr-1*", "pr-1"))
+        for text in ("other-image", ":pr-*", "other-image:"):
+            with self.subTest(text=text):
+                with self.assertRaises(ValueError):
+                    cleanup_pr_image.CleanupTarget.parse(text)
+        
+        with tempfile.NamedTemporaryFile("w", suffix=".json") as f:
+            json.dump([{"package": "a", "tags": "pr-*"}, {"package": "b", "tags": "v1.?"}], f)
+            f.flush()
+            targets = cleanup_pr_image.load_targets(f.name)
+        self.assertEqual([(t.package, t.pattern) for t in targets], [("a", "pr-*"), ("b", "v1.?")])
+    
+    def test_find_target_versions(self):
+        """Test that versions are matched only when every tag matches a target."""
+        versions = [
+            version(1, "pr-10"),
+            version(2, "pr-11", "latest"),
+            version(3, "latest"),
+            version(4, "pr-12", "nightly"),
+            version(5),
+        ]
+        targets = [cleanup_pr_image.CleanupTarget("repo", "pr-*"), cleanup_pr_image.CleanupTarget("repo", "night*")]
+        
+        matched, skipped = cleanup_pr_image.find_target_versions(versions, targets)
+        
+        self.assertEqual(matched, {1: ["pr-10"], 4: ["pr-12", "nightly"]})
+        self.assertEqual(skipped, {2: ["pr-11", "latest"]})
+    
+    @patch('cleanup_pr_image.github_actions_utils.append_step_summary')
+    @patch('cleanup_pr_image.delete_package_version')
+    @patch('cleanup_pr_image.get_package_versions')
+    def test_cleanup_targets_shares_one_bounded_pool(self, mock_get_versions, mock_delete, mock_summary):
+        """Test that listings and deletes across packages never exceed max_workers and each package is reported."""
+        import threading
+        import time
+        
+        lock = threading.Lock()
+        in_flight = [0]
+        peak = [0]
+        
+        def timed(result):
+            with lock:
+                in_flight[0] += 1
+                peak[0] = max(peak[0], in_flight[0])
+            time.sleep(0.01)
+            with lock:
+                in_flight[0] -= 1
+            return result
+        
+        listings = {
+            "a": [version(n, f"pr-{n}") for n in range(1, 6)],
+            "b": [version(n, f"pr-{n}") for n in range(6, 11)] + [version(11, "pr-11", "latest")],
+        }
+        mock_get_versions.side_effect = lambda owner, package, token: timed(
+            iter(listings[package]) if package in listings else None
+        )
+        mock_delete.side_effect = lambda owner, package, vid, token: timed(vid != 7)
+        targets = [cleanup_pr_image.CleanupTarget.parse(text) for text in ("a:pr-*", "b:pr-*", "a:pr-*", "c:pr-*")]
+        
+        with patch('cleanup_pr_image.github_actions_utils.log_info'), \
+                patch('cleanup_pr_image.github_actions_utils.github_action_log'):
+            exit_code = cleanup_pr_image.cleanup_targets("owner", targets, "token123", max_workers=3)
+        
+        self.assertEqual(exit_code, 1)
+        self.assertLessEqual(peak[0], 3)
+        self.assertEqual(mock_get_versions.call_count, 3)
+        self.assertEqual(mock_delete.call_count, 10)
+        summary = mock_summary.call_args[0][0]
+        self.assertIn("| a | pr-* | 5 | 5 | 0 | 0 | ok |", summary)
+        self.assertIn("| b | pr-* | 5 | 4 | 1 | 1 | failed deletes |", summary)
+        self.assertIn("| c | pr-* | 0 | 0 | 0 | 0 | not found |", summary)
+    
+    @patch('cleanup_pr_image.cleanup_targets', return_value=0)
+    def test_main_targets_need_no_repository(self, mock_cleanup):
+        """Test that targets replace --repository and --pr-number."""
+        test_args = [
+            "cleanup_pr_image.py",
+            "--target", "a:pr-*",
+            "--target", "b:pr-42",
+            "--owner", "owner",
+            "--token", "token123"
+        ]
+        
+        with patch('sys.argv', test_args):
+            with self.assertRaises(SystemExit) as cm:
+                cleanup_pr_image.main()
+        
+        self.assertEqual(cm.exception.code, 0)
+        owner, targets, token, max_workers = mock_cleanup.call_args[0]
+        self.assertEqual([(t.package, t.pattern) for t in targets], [("a", "pr-*"), ("b", "pr-42")])
+        self.assertEqual(max_workers, cleanup_pr_image.DEFAULT_MAX_WORKERS)
+    
+    def test_parse_args_targets_exclude_sweep(self):
+        """Test that targets cannot be combined with a PR number or a sweep."""
+        test_args = [
+            "cleanup_pr_image.py",
+            "--target", "a:pr-*",
+            "--pr-number", "42",
+            "--owner", "owner",
+            "--token", "token123"
+        ]
+        
+        with patch('sys.argv', test_args):
+            with self.assertRaises(SystemExit) as cm:
+                cleanup_pr_image.parse_args()
+        self.assertEqual(cm.exception.code, 2)
+
+
 class TestGetPackageVersions(unittest.TestCase):
     """Test fetching package versions from GitHub API."""
     
-    @patch('cleanup_pr_image.urllib_request.urlopen')
-    def test_get_package_versions_success(self, mock_urlopen):
+    @patch('github_actions_utils.GitHubAPIClient.stream')
+    def test_get_package_versions_success(self, mock_stream):
         """Test successful package versions fetch."""
-        mock_response = MagicMock()
-        mock_response.read.return_value = json.dumps([
+        mock_stream.return_value = mock_versions_page([
             {"id": 123, "metadata": {"container": {"tags": ["latest"]}}}
-        ]).encode()
-        mock_urlopen.return_value.__enter__.return_value = mock_response
+        ])
         
         versions = cleanup_pr_image.get_package_versions("owner", "repo", "token123")
         
         self.assertIsNotNone(versions)
+        versions = list(versions)
         self.assertEqual(len(versions), 1)
-        self.assertEqual(versions[0]["id"], 123)
+        self.assertEqual(versions[0].id, 123)
+        self.assertEqual(versions[0].tags, ["latest"])
     
-    @patch('cleanup_pr_image.urllib_request.urlopen')
-    def test_get_package_versions_not_found(self, mock_urlopen):
+    @patch('github_actions_utils.GitHubAPIClient.stream')
+    def test_get_package_versions_requests_full_pages(self, mock_stream):
+        """Test that versions are requested 100 per page."""
+        mock_stream.return_value = mock_versions_page([])
+        
+        cleanup_pr_image.get_package_versions("owner", "repo", "token123")
+        
+        url, = mock_stream.call_args[0]
+        self.assertTrue(url.endswith("/versions?per_page=100"))
+    
+    @patch('github_actions_utils.GitHubAPIClient.stream')
+    def test_get_package_versions_follows_next_links(self, mock_stream):
+        """Test that later pages are fetched by following the Link header."""
+        next_url = "https://api.github.com/users/owner/packages/container/repo/versions?per_page=100&page=2"
+        mock_stream.side_effect = [
+            mock_versions_page([{"id": 1}], link=f'<{next_url}>; rel="next"'),
+            mock_versions_page([{"id": 2}]),
+        ]
+        
+        versions = list(cleanup_pr_image.get_package_versions("owner", "repo", "token123"))
+        
+        self.assertEqual([v.id for v in versions], [1, 2])
+        self.assertEqual(mock_stream.call_args_list[1][0][0], next_url)
+    
+    @patch('github_actions_utils.GitHubAPIClient.stream')
+    def test_get_package_versions_stops_when_tag_found(self, mock_stream):
+        """Test that no further pages are fetched once the tag has been found."""
+        next_url = "https://api.github.com/users/owner/packages/container/repo/versions?per_page=100&page=2"
+        mock_stream.side_effect = [
+            mock_versions_page(
+                [{"id": 1, "metadata": {"container": {"tags": ["pr-42"]}}}],
+                link=f'<{next_url}>; rel="next"'
+            ),
+        ]
+        
+        versions = cleanup_pr_image.get_package_versions("owner", "repo", "token123")
+        version_id = cleanup_pr_image.find_version_id_by_tag(versions, "pr-42")
+        
+        self.assertEqual(version_id, 1)
+        self.assertEqual(mock_stream.call_count, 1)
+    
+    @patch('github_actions_utils.GitHubAPIClient.stream')
+    def test_get_package_versions_not_found(self, mock_stream):
         """Test package versions fetch when package doesn't exist."""
         from urllib.error import HTTPError
         
-        mock_urlopen.side_effect = HTTPError(
+        mock_stream.side_effect = HTTPError(
             "url", 404, "Not Found", {}, None
         )
         
@@ -128,29 +553,104 @@ class TestGetPackageVersions(unittest.TestCase):
         
         self.assertIsNone(versions)
     
-    @patch('cleanup_pr_image.urllib_request.urlopen')
-    def test_get_package_versions_other_http_error(self, mock_urlopen):
-        """Test package versions fetch with other HTTP errors."""
+    @patch('github_actions_utils.GitHubAPIClient.stream')
+    def test_get_package_versions_other_http_error(self, mock_stream):
+        """Test that errors other than 404 are raised rather than read as a missing package."""
         from urllib.error import HTTPError
         
-        mock_urlopen.side_effect = HTTPError(
+        mock_stream.side_effect = HTTPError(
             "url", 500, "Internal Server Error", {}, None
         )
         
-        versions = cleanup_pr_image.get_package_versions("owner", "repo", "token123")
-        
-        self.assertIsNone(versions)
+        with self.assertRaises(HTTPError):
+            cleanup_pr_image.get_package_versions("owner", "repo", "token123")
+    
+    def test_persistent_server_error_fails_every_mode(self):
+        """Test that a listing that keeps failing with 502 exits 1 instead of finding no package."""
+        from stand_in_server import StandInServer
+        
+        with StandInServer(lambda request: (502, {}, b'{"message": "Bad Gateway"}')) as server:
+            client = github_actions_utils.GitHubAPIClient(
+                "token123", server.base_url,
+                scheduler=github_actions_utils.RequestScheduler(max_attempts=2, sleep=lambda seconds: None),
+            )
+            modes = {
+                "sweep": lambda: cleanup_pr_image.sweep_stale_pr_images("owner", "repo", "token123", set(), 2),
+                "targets": lambda: cleanup_pr_image.cleanup_targets(
+                    "owner", [cleanup_pr_image.CleanupTarget.parse("repo:pr-*")], "token123", 2
+                ),
+                "single": lambda: self.run_main(["--pr-number", "42"]),
+            }
+            with patch('cleanup_pr_image.GITHUB_API_URL', server.base_url), \
+                    patch('github_actions_utils.get_github_api_client', return_value=client), \
+                    patch('cleanup_pr_image.resolve_tag_digest', side_effect=URLError("no registry")), \
+                    patch('github_actions_utils.github_action_log') as mock_log, \
+                    patch('github_actions_utils.log_info'):
+                for mode, run in modes.items():
+                    with self.subTest(mode=mode):
+                        self.assertEqual(run(), 1)
+                        self.assertIn("HTTP Error 502", mock_log.call_args[0][1])
+            client.close()
+        
+        self.assertEqual(len(server.requests), 2 * len(modes))
+    
+    def test_time_budget_used_up_by_listing_fails_every_mode(self):
+        """Test that a listing outlasting --time-budget exits 1 naming it instead of finding no package."""
+        from stand_in_server import StandInServer
+        
+        def slow_handler(request):
+            time.sleep(1.5)
+            return 200, {'Content-Type': 'application/json'}, b'[]'
+        
+        with StandInServer(slow_handler) as server:
+            client = github_actions_utils.GitHubAPIClient(
+                "token123", server.base_url,
+                scheduler=github_actions_utils.RequestScheduler(sleep=lambda seconds: None),
+            )
+            modes = {
+                "sweep": ["--sweep", "--open-prs", "7"],
+                "targets": ["--target", "repo:pr-*"],
+                "single": ["--pr-number", "42"],
+            }
+            with patch('cleanup_pr_image.GITHUB_API_URL', server.base_url), \
+                    patch('github_actions_utils.get_github_api_client', return_value=client), \
+                    patch('github_actions_utils.deadline', github_actions_utils.Deadline()), \
+                    patch('cleanup_pr_image.resolve_tag_digest', side_effect=URLError("no registry")), \
+                    patch('github_actions_utils.append_step_summary'), \
+                    patch('github_actions_utils.github_action_log') as mock_log, \
+                    patch('github_actions_utils.log_info'):
+                for mode, args in modes.items():
+                    with self.subTest(mode=mode):
+                        self.assertEqual(self.run_main(args + ["--time-budget", "1"]), 1)
+                        message = mock_log.call_args[0][1]
+                        self.assertIn(
+                            "Cleanup failed: GET /users/owner/packages/container/repo/versions timed out after 1s, "
+                            "using up the time budget of 1s",
+                            message,
+                        )
+            client.close()
+        
+        # Running out of time is not retried
+        self.assertEqual(len(server.requests), len(modes))
+    
+    def run_main(self, args):
+        """Run main with arguments and return its exit code."""
+        argv = ["cleanup_pr_image.py", "--repository", "owner/repo", "--owner", "owner", "--token", "token123"]
+        with patch('sys.argv', argv + args):
+            try:
+                cleanup_pr_image.main()
+            except SystemExit as e:
+                return e.code
+        return 0
 
 
 class TestDeletePackageVersion(unittest.TestCase):
     """Test deleting package versions via GitHub API."""
     
-    @patch('cleanup_pr_image.urllib_request.urlopen')
-    def test_delete_package_version_success(self, mock_urlopen):
+    @patch('github_actions_utils.GitHubAPIClient.request')
+    def test_delete_package_version_success(self, mock_request):
         """Test successful package version deletion."""
-        mock_response = MagicMock()
-        mock_response.status = 204
-        mock_urlopen.return_value.__enter__.return_value = mock_response
+        mock_request.return_value = api_response(204)
         
         result = cleanup_pr_image.delete_package_version(
             "owner", "repo", 123, "token123"
@@ -158,12 +658,22 @@ class TestDeletePackageVersion(unittest.TestCase):
         
         self.assertTrue(result)
     
-    @patch('cleanup_pr_image.urllib_request.urlopen')
-    def test_delete_package_version_unexpected_status(self, mock_urlopen):
+    @patch('github_actions_utils.GitHubAPIClient.invalidate_cache')
+    @patch('github_actions_utils.GitHubAPIClient.request')
+    def test_delete_package_version_invalidates_cached_listing(self, mock_request, mock_invalidate):
+        """Test that a successful delete drops cached version listings of the package."""
+        mock_request.return_value = api_response(204)
+        
+        cleanup_pr_image.delete_package_version("owner", "repo", 123, "token123")
+        
+        mock_invalidate.assert_called_once_with(
+            "https://api.github.com/users/owner/packages/container/repo/versions"
+        )
+    
+    @patch('github_actions_utils.GitHubAPIClient.request')
+    def test_delete_package_version_unexpected_status(self, mock_request):
         """Test package version deletion with unexpected status code."""
-        mock_response = MagicMock()
-        mock_response.status = 200  # Unexpected, should be 204
-        mock_urlopen.return_value.__enter__.return_value = mock_response
+        mock_request.return_value = api_response(200)  # Unexpected, should be 204
         
         result = cleanup_pr_image.delete_package_version(
             "owner", "repo", 123, "token123"
@@ -171,25 +681,111 @@ class TestDeletePackageVersion(unittest.TestCase):
         
         self.assertFalse(result)
     
-    @patch('cleanup_pr_image.urllib_request.urlopen')
-    def test_delete_package_version_http_error(self, mock_urlopen):
+    @patch('github_actions_utils.GitHubAPIClient.request')
+    def test_delete_package_version_http_error(self, mock_request):
         """Test package version deletion with HTTP error."""
         from urllib.error import HTTPError
         
         mock_error = HTTPError("url", 403, "Forbidden", {}, None)
         mock_error.read = MagicMock(return_value=b"Access denied")
-        mock_urlopen.side_effect = mock_error
+        mock_request.side_effect = mock_error
         
         result = cleanup_pr_image.delete_package_version(
             "owner", "repo", 123, "token123"
         )
         
         self.assertFalse(result)
+    
+    def test_retried_delete_answered_with_404_counts_as_deleted(self):
+        """Test that a 404 after a retried DELETE is a success, but a 404 on the first attempt is not."""
+        from stand_in_server import StandInServer
+        
+        for statuses, expected in [([502, 404], True), ([404], False)]:
+            with self.subTest(statuses=statuses):
+                replies = list(statuses)
+                with StandInServer(lambda request: (replies.pop(0), {}, b'{"message": "Not Found"}')) as server:
+                    client = github_actions_utils.GitHubAPIClient(
+                        "token123", server.base_url,
+                        scheduler=github_actions_utils.RequestScheduler(sleep=lambda seconds: None),
+                    )
+                    with patch('cleanup_pr_image.GITHUB_API_URL', server.base_url), \
+                            patch('github_actions_utils.get_github_api_client', return_value=client), \
+                            patch('github_actions_utils.github_action_log'), \
+                            patch('github_actions_utils.log_info'):
+                        result = cleanup_pr_image.delete_package_version("owner", "repo", 123, "token123")
+                    client.close()
+                
+                self.assertEqual(result, expected)
+                self.assertEqual(len(server.requests), len(statuses))
+
+
+DIGEST = "sha256:" + "ab" * 32
+
+MAIN_ARGS = [
+    "cleanup_pr_image.py",
+    "--pr-number", "42",
+    "--repository", "owner/repo",
+    "--owner", "owner",
+    "--token", "token123"
+]
 
 
 class TestMainFunction(unittest.TestCase):
     """Test main function orchestration."""
     
+    def setUp(self):
+        # Resolve tags through a mock registry unless a test says otherwise
+        resolve_patch = patch('cleanup_pr_image.resolve_tag_digest', return_value=DIGEST)
+        self.mock_resolve = resolve_patch.start()
+        self.addCleanup(resolve_patch.stop)
+    
+    @patch('cleanup_pr_image.get_package_versions')
+    def test_main_unpublished_tag_skips_listing(self, mock_get_versions):
+        """Test that a tag missing from the registry needs no version listing."""
+        self.mock_resolve.return_value = None
+        
+        with patch('sys.argv', MAIN_ARGS):
+            with self.assertRaises(SystemExit) as cm:
+                cleanup_pr_image.main()
+        
+        self.assertEqual(cm.exception.code, 0)
+        self.mock_resolve.assert_called_once_with("owner/repo", "pr-42", "owner", "token123")
+        mock_get_versions.assert_not_called()
+    
+    @patch('cleanup_pr_image.delete_package_version')
+    @patch('cleanup_pr_image.get_package_versions')
+    def test_main_matches_version_by_digest(self, mock_get_versions, mock_delete):
+        """Test that the resolved digest identifies the version by its name."""
+        mock_get_versions.return_value = iter([
+            github_actions_utils.PackageVersion(1, "sha256:" + "00" * 32),
+            github_actions_utils.PackageVersion(2, DIGEST),
+        ])
+        mock_delete.return_value = True
+        
+        with patch('sys.argv', MAIN_ARGS):
+            with self.assertRaises(SystemExit) as cm:
+                cleanup_pr_image.main()
+        
+        self.assertEqual(cm.exception.code, 0)
+        mock_delete.assert_called_once_with("owner", "repo", 2, "token123")
+    
+    @patch('cleanup_pr_image.delete_package_version')
+    @patch('cleanup_pr_image.get_package_versions')
+    def test_main_falls_back_to_listing_when_registry_fails(self, mock_get_versions, mock_delete):
+        """Test that a registry failure falls back to finding the tag in the listing."""
+        from urllib.error import URLError
+        
+        self.mock_resolve.side_effect = URLError("registry unreachable")
+        mock_get_versions.return_value = iter([version(7, "pr-42")])
+        mock_delete.return_value = True
+        
+        with patch('sys.argv', MAIN_ARGS):
+            with self.assertRaises(SystemExit) as cm:
+                cleanup_pr_image.main()
+        
+        self.assertEqual(cm.exception.code, 0)
+        mock_delete.assert_called_once_with("owner", "repo", 7, "token123")
+    
     @patch('cleanup_pr_image.delete_package_version')
     @patch('cleanup_pr_image.find_version_id_by_tag')
     @patch('cleanup_pr_image.get_package_versions')
@@ -279,6 +875,33 @@ class TestMainFunction(unittest.TestCase):
                 cleanup_pr_image.main()
         
         self.assertEqual(cm.exception.code, 1)  # Expected: exits with error
+    
+    @patch('cleanup_pr_image.delete_package_version')
+    @patch('github_actions_utils.GitHubAPIClient.stream')
+    def test_main_later_page_failure(self, mock_stream, mock_delete):
+        """Test main fails loudly when a later page of versions cannot be fetched."""
+        from urllib.error import HTTPError
+        
+        next_url = "https://api.github.com/users/owner/packages/container/repo/versions?per_page=100&page=2"
+        mock_stream.side_effect = [
+            mock_versions_page([{"id": 1}], link=f'<{next_url}>; rel="next"'),
+            HTTPError(next_url, 500, "Internal Server Error", {}, None),
+        ]
+        
+        test_args = [
+            "cleanup_pr_image.py",
+            "--pr-number", "42",
+            "--repository", "owner/repo",
+            "--owner", "owner",
+            "--token", "token123"
+        ]
+        
+        with patch('sys.argv', test_args):
+            with self.assertRaises(SystemExit) as cm:
+                cleanup_pr_image.main()
+        
+        self.assertEqual(cm.exception.code, 1)
+        mock_delete.assert_not_called()
 
 
 if __name__ == "__main__":
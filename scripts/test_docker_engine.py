@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Unit tests for docker_engine.py module.
+
+These tests run the client against a fake Docker daemon served by the
+stand-in server on a unix socket in a temporary directory.
+"""
+
+import base64
+import json
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+from urllib.error import HTTPError, URLError
+from urllib.parse import parse_qs, unquote, urlsplit
+
+# Add parent directory to path to import the module in a way that works across environments
+script_dir = str(Path(__file__).resolve().parent)
+if script_dir not in sys.path:
+    sys.path.insert(0, script_dir)
+import docker_engine
+from stand_in_server import StandInServer
+
+IMAGE_ID = "sha256:" + "c" * 64
+PUSHED_DIGEST = "sha256:" + "d" * 64
+
+
+def ndjson(*records):
+    """Newline-delimited JSON body."""
+    return b"".join(json.dumps(record).encode() + b"\r\n" for record in records)
+
+
+class FakeDaemon:
+    """Minimal Docker daemon holding tagged images."""
+    
+    def __init__(self):
+        self.images = {}
+        self.loaded = []
+        self.push_error = None
+        self.push_garbage = None
+    
+    def handle(self, request):
+        parts = urlsplit(request.path)
+        path = unquote(parts.path)
+        query = {key: values[0] for key, values in parse_qs(parts.query).items()}
+        if path == "/images/load":
+            self.loaded.append(request.body)
+            self.images["candidate_image:latest"] = IMAGE_ID
+            return 200, {"Content-Type": "application/json"}, ndjson(
+                {"stream": "Loaded image: candidate_image:latest\n"}
+            )
+        name, _, action = path[len("/images/"):].rpartition("/")
+        image = self.images.get(name) or (name if name in self.images.values() else None)
+        if image is None:
+            return 404, {}, json.dumps({"message": f"No such image: {name}"}).encode()
+        if action == "json":
+            return 200, {}, json.dumps({"Id": image}).encode()
+        if action == "tag":
+            self.images[f"{query['repo']}:{query['tag']}"] = image
+            return 201, {}, b""
+        if action == "push":
+            progress = [
+                {"status": "The push refers to repository [ghcr.io/owner/repo]"},
+                {"status": "Pushing", "progressDetail": {"current": 1, "total": 2}, "id": "abc"},
+            ]
+            if self.push_garbage:
+                return 200, {}, ndjson(*progress) + self.push_garbage
+            if self.push_error:
+                return 200, {}, ndjson(*progress, {"error": self.push_error, "errorDetail": {}})
+            return 200, {}, ndjson(
+                *progress,
+                {"status": f"{query['tag']}: digest: {PUSHED_DIGEST} size: 1234"},
+                {"progressDetail": {}, "aux": {"Tag": query["tag"], "Digest": PUSHED_DIGEST, "Size": 1234}},
+            )
+        return 404, {}, b""
+
+
+def tag_image(daemon, name):
+    """Add an image under the reference push() is called with."""
+    daemon.images[name] = IMAGE_ID
+
+
+class TestDockerEngine(unittest.TestCase):
+    """Test the client against a fake daemon."""
+    
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.daemon = FakeDaemon()
+        self.server = StandInServer(self.daemon.handle, unix_socket=os.path.join(self.tmp.name, "docker.sock"))
+        self.server.__enter__()
+        self.addCleanup(self.server.__exit__)
+        self.engine = docker_engine.DockerEngine(self.server.unix_socket)
+    
+    def test_load_streams_archive(self):
+        """Test that the archive is sent as the body and progress is reported."""
+        image_tar = os.path.join(self.tmp.name, "image.tar")
+        Path(image_tar).write_bytes(b"tar contents" * 1000)
+        records = []
+        
+        self.engine.load(image_tar, records.append)
+        
+        self.assertEqual(self.daemon.loaded, [b"tar contents" * 1000])
+        request = self.server.requests[0]
+        self.assertEqual(request.path, "/images/load?quiet=1")
+        self.assertEqual(request.headers["Content-Type"], "application/x-tar")
+        self.assertEqual(records, [{"stream": "Loaded image: candidate_image:latest\n"}])
+    
+    def test_image_id(self):
+        """Test that image IDs are looked up and missing images give None."""
+        self.daemon.images["candidate_image:latest"] = IMAGE_ID
+        
+        self.assertEqual(self.engine.image_id("candidate_image:latest"), IMAGE_ID)
+        self.assertEqual(self.engine.image_id(IMAGE_ID), IMAGE_ID)
+        self.assertIsNone(self.engine.image_id("missing:latest"))
+    
+    def test_tag(self):
+        """Test that the target reference is split into repository and tag."""
+        self.daemon.images["candidate_image:latest"] = IMAGE_ID
+        
+        self.engine.tag("candidate_image:latest", "ghcr.io/owner/repo:pr-42")
+        
+        self.assertEqual(self.daemon.images["ghcr.io/owner/repo:pr-42"], IMAGE_ID)
+    
+    def test_tag_missing_image(self):
+        """Test that tagging an image that does not exist raises the daemon's message."""
+        with self.assertRaises(HTTPError) as cm:
+            self.engine.tag("missing:latest", "ghcr.io/owner/repo:latest")
+        self.assertEqual(cm.exception.code, 404)
+        self.assertIn("No such image", cm.exception.msg)
+    
+    def test_push_reads_digest_from_aux(self):
+        """Test that the digest comes from the aux record and credentials are sent."""
+        tag_image(self.daemon, "ghcr.io/owner/repo")
+        records = []
+        
+        digest = self.engine.push(
+            "ghcr.io/owner/repo:latest", docker_engine.registry_auth("owner", "token", "ghcr.io"), records.append
+        )
+        
+        self.assertEqual(digest, PUSHED_DIGEST)
+        self.assertEqual(len(records), 4)
+        request = self.server.requests[0]
+        self.assertEqual(urlsplit(request.path).query, "tag=latest")
+        auth = json.loads(base64.urlsafe_b64decode(request.headers["X-Registry-Auth"]))
+        self.assertEqual(auth, {"username": "owner", "password": "token", "serveraddress": "ghcr.io"})
+    
+    def test_push_error_in_stream(self):
+        """Test that an error record in the progress stream fails the push."""
+        tag_image(self.daemon, "ghcr.io/owner/repo")
+        self.daemon.push_error = "denied: permission_denied"
+        
+        with self.assertRaises(URLError) as cm:
+            self.engine.push("ghcr.io/owner/repo:latest", "e30=")
+        self.assertIn("denied", str(cm.exception.reason))
+    
+    def test_push_malformed_progress_line(self):
+        """Test that a progress line that is not a JSON object fails the push with URLError."""
+        tag_image(self.daemon, "ghcr.io/owner/repo")
+        for garbage in (b'{"status": "Pushing\n', b'["not", "a", "record"]\n'):
+            with self.subTest(garbage=garbage):
+                self.daemon.push_garbage = garbage
+                
+                with self.assertRaises(URLError):
+                    self.engine.push("ghcr.io/owner/repo:latest", "e30=")
+    
+    def test_unreachable_daemon(self):
+        """Test that a missing socket raises URLError."""
+        engine = docker_engine.DockerEngine(os.path.join(self.tmp.name, "missing.sock"))
+        
+        with self.assertRaises(URLError):
+            engine.image_id("candidate_image:latest")
+
+
+class TestHelpers(unittest.TestCase):
+    """Test reference splitting and daemon discovery."""
+    
+    def test_split_reference(self):
+        """Test references with and without tags and registry ports."""
+        cases = {
+            "ghcr.io/owner/repo:pr-42": ("ghcr.io/owner/repo", "pr-42"),
+            "ghcr.io/owner/repo": ("ghcr.io/owner/repo", "latest"),
+            "localhost:5000/repo": ("localhost:5000/repo", "latest"),
+            "localhost:5000/repo:abc123": ("localhost:5000/repo", "abc123"),
+        }
+        for reference, expected in cases.items():
+            with self.subTest(reference=reference):
+                self.assertEqual(docker_engine.split_reference(reference), expected)
+    
+    def test_engine_from_environment(self):
+        """Test that DOCKER_HOST is honoured and a missing socket gives None."""
+        with tempfile.NamedTemporaryFile() as sock:
+            with patch.dict("os.environ", {"DOCKER_HOST": f"unix://{sock.name}"}):
+                self.assertEqual(docker_engine.engine_from_environment().socket_path, sock.name)
+        with patch.dict("os.environ", {"DOCKER_HOST": "tcp://docker:2375"}):
+            self.assertIsNone(docker_engine.engine_from_environment())
+        with patch.dict("os.environ", {"DOCKER_HOST": "unix:///nonexistent/docker.sock"}):
+            self.assertIsNone(docker_engine.engine_from_environment())
+
+
+if __name__ == "__main__":
+    unittest.main()
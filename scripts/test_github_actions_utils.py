@@ -5,11 +5,18 @@ Unit tests for github_actions_utils.py module.
 These tests verify the shared GitHub Actions utilities work correctly.
 """
 
+import json
+import os
+import pstats
 import sys
+import tempfile
+import time
 import unittest
-from io import StringIO
+from http.client import HTTPMessage
+from io import BytesIO, StringIO
 from unittest.mock import patch, MagicMock
 from pathlib import Path
+from urllib.error import HTTPError, URLError
 from urllib.request import Request
 
 # Add parent directory to path to import the module in a way that works across environments
@@ -17,6 +24,7 @@ script_dir = str(Path(__file__).resolve().parent)
 if script_dir not in sys.path:
     sys.path.insert(0, script_dir)
 import github_actions_utils
+from stand_in_server import StandInServer
 
 
 class TestGitHubActionsLogging(unittest.TestCase):
@@ -52,6 +60,18 @@ class TestGitHubActionsLogging(unittest.TestCase):
         output = captured_stdout.getvalue()
         self.assertEqual(output, 'myvar=myvalue\n')
     
+    def test_append_step_summary(self):
+        """Test that step summaries are appended to GITHUB_STEP_SUMMARY and skipped without it."""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "summary.md")
+            with patch.dict(os.environ, {"GITHUB_STEP_SUMMARY": path}):
+                github_actions_utils.append_step_summary("one\n")
+                github_actions_utils.append_step_summary("two\n")
+            with patch.dict(os.environ, {"GITHUB_STEP_SUMMARY": ""}):
+                github_actions_utils.append_step_summary("three\n")
+            
+            self.assertEqual(Path(path).read_text(), "one\ntwo\n")
+    
     def test_multiple_log_levels(self):
         """Test different log levels produce correct output."""
         levels_and_messages = [
@@ -100,6 +120,835 @@ class TestGitHubAPIHeaders(unittest.TestCase):
             '2022-11-28',
             'X-GitHub-Api-Version header should be set to 2022-11-28'
         )
+    
+    
+    def test_github_api_headers_match_request_headers(self):
+        """Test that the header dictionary matches what is added to requests."""
+        headers = github_actions_utils.github_api_headers('test_token_12345')
+        
+        self.assertEqual(headers['Authorization'], 'Bearer test_token_12345')
+        self.assertEqual(headers['X-GitHub-Api-Version'], '2022-11-28')
+
+
+def json_handler(request):
+    """Stand-in handler echoing the request method and path as JSON."""
+    if request.path.startswith('/missing'):
+        return 404, {}, b'{"message": "Not Found"}'
+    if request.path.startswith('/close'):
+        return 200, {'Connection': 'close'}, b'{}'
+    if request.path.startswith('/list'):
+        return 200, {'Content-Type': 'application/json'}, json.dumps([{'id': i} for i in range(1000)]).encode()
+    body = f'{{"method": "{request.method}", "path": "{request.path}"}}'.encode()
+    return 200, {'Content-Type': 'application/json'}, body
+
+
+class TestGitHubAPIClient(unittest.TestCase):
+    """Test the keep-alive GitHub API client against a local stand-in server."""
+    
+    def test_request_decodes_json_and_sends_headers(self):
+        """Test that responses are decoded and standard headers are sent."""
+        with StandInServer(json_handler) as server:
+            client = github_actions_utils.GitHubAPIClient('token123', server.base_url)
+            response = client.request('GET', '/users/owner/packages')
+            client.close()
+        
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.json(), {'method': 'GET', 'path': '/users/owner/packages'})
+        headers = server.requests[0].headers
+        self.assertEqual(headers['Authorization'], 'Bearer token123')
+        self.assertEqual(headers['X-GitHub-Api-Version'], '2022-11-28')
+        self.assertIn('User-Agent', headers)
+    
+    def test_requests_reuse_connection(self):
+        """Test that sequential requests share one persistent connection."""
+        with StandInServer(json_handler) as server:
+            client = github_actions_utils.GitHubAPIClient('token123', server.base_url)
+            for _ in range(5):
+                client.request('GET', '/versions')
+            client.request('DELETE', '/versions/1')
+            client.close()
+        
+        self.assertEqual(len(server.requests), 6)
+        self.assertEqual(server.connections, 1)
+    
+    def test_tls_requests_reuse_connection(self):
+        """Test that connections are reused over HTTPS, paying for one handshake."""
+        with StandInServer(json_handler, tls=True) as server:
+            client = github_actions_utils.GitHubAPIClient(
+                'token123', server.base_url, context=server.ssl_context
+            )
+            for _ in range(3):
+                client.request('GET', '/versions')
+            client.close()
+        
+        self.assertEqual(server.connections, 1)
+    
+    def test_absolute_url_on_same_origin(self):
+        """Test that absolute URLs on the API origin, such as Link headers, are accepted."""
+        with StandInServer(json_handler) as server:
+            client = github_actions_utils.GitHubAPIClient('token123', server.base_url)
+            response = client.request('GET', f'{server.base_url}/versions?page=2')
+            client.close()
+        
+        self.assertEqual(response.json()['path'], '/versions?page=2')
+    
+    def test_absolute_url_on_other_origin_is_refused(self):
+        """Test that the token is never sent to another host."""
+        with StandInServer(json_handler) as server:
+            client = github_actions_utils.GitHubAPIClient('token123', server.base_url)
+            with self.assertRaises(URLError):
+                client.request('GET', 'https://example.com/versions?page=2')
+        
+        self.assertEqual(server.requests, [])
+    
+    def test_error_status_raises_http_error(self):
+        """Test that error statuses raise HTTPError with a readable body."""
+        with StandInServer(json_handler) as server:
+            client = github_actions_utils.GitHubAPIClient('token123', server.base_url)
+            with self.assertRaises(HTTPError) as cm:
+                client.request('GET', '/missing')
+            # The connection stays usable after an error response
+            client.request('GET', '/versions')
+            client.close()
+        
+        self.assertEqual(cm.exception.code, 404)
+        self.assertEqual(cm.exception.read(), b'{"message": "Not Found"}')
+        self.assertEqual(server.connections, 1)
+    
+    def test_connection_closed_by_server_is_replaced(self):
+        """Test that a connection the server closes is not reused."""
+        with StandInServer(json_handler) as server:
+            client = github_actions_utils.GitHubAPIClient('token123', server.base_url)
+            client.request('GET', '/close')
+            client.request('GET', '/versions')
+            client.close()
+        
+        self.assertEqual(server.connections, 2)
+    
+    def test_unreachable_server_raises_url_error(self):
+        """Test that connection failures raise URLError."""
+        with StandInServer(json_handler) as server:
+            base_url = server.base_url
+        client = github_actions_utils.GitHubAPIClient('token123', base_url)
+        
+        with self.assertRaises(URLError):
+            client.request('GET', '/versions')
+    
+    def test_stream_decodes_body_as_it_is_read(self):
+        """Test that a streamed body decodes element by element and the connection is then reused."""
+        with StandInServer(json_handler) as server:
+            client = github_actions_utils.GitHubAPIClient('token123', server.base_url)
+            with client.stream('/list') as (response, body):
+                ids = [item['id'] for item in github_actions_utils.iter_json_array(body, block_size=100)]
+            client.request('GET', '/versions')
+            client.close()
+        
+        self.assertEqual(response.status, 200)
+        self.assertEqual(ids, list(range(1000)))
+        self.assertEqual(server.connections, 1)
+    
+    def test_stream_error_status_raises_http_error(self):
+        """Test that a streamed request with an error status raises HTTPError with its body."""
+        with StandInServer(json_handler) as server:
+            client = github_actions_utils.GitHubAPIClient('token123', server.base_url)
+            with self.assertRaises(HTTPError) as cm:
+                with client.stream('/missing'):
+                    pass
+            client.close()
+        
+        self.assertEqual(cm.exception.code, 404)
+        self.assertEqual(cm.exception.read(), b'{"message": "Not Found"}')
+    
+    def test_get_github_api_client_is_shared(self):
+        """Test that callers share one client per token."""
+        first = github_actions_utils.get_github_api_client('token-a')
+        
+        self.assertIs(github_actions_utils.get_github_api_client('token-a'), first)
+        self.assertIsNot(github_actions_utils.get_github_api_client('token-b'), first)
+
+
+def etag_handler(request):
+    """Stand-in handler answering conditional requests for a fixed resource."""
+    if request.headers.get('If-None-Match') == '"v1"':
+        return 304, {'ETag': '"v1"'}, b''
+    return 200, {'ETag': '"v1"', 'Link': '<x?page=2>; rel="next"'}, b'[{"id": 1}]'
+
+
+class TestParseNextLink(unittest.TestCase):
+    """Test Link header parsing for pagination."""
+    
+    def test_parse_next_link_with_next_and_last(self):
+        """Test that the next URL is extracted when several relations are present."""
+        link = (
+            '<https://api.github.com/x?per_page=100&page=2>; rel="next", '
+            '<https://api.github.com/x?per_page=100&page=9>; rel="last"'
+        )
+        self.assertEqual(
+            github_actions_utils.parse_next_link(link),
+            "https://api.github.com/x?per_page=100&page=2"
+        )
+    
+    def test_parse_next_link_on_last_page(self):
+        """Test that no URL is returned on the last page."""
+        link = '<https://api.github.com/x?page=1>; rel="prev", <https://api.github.com/x?page=1>; rel="first"'
+        self.assertIsNone(github_actions_utils.parse_next_link(link))
+    
+    def test_parse_next_link_without_header(self):
+        """Test that a missing header means there is no next page."""
+        self.assertIsNone(github_actions_utils.parse_next_link(None))
+
+
+class TestIterJsonArray(unittest.TestCase):
+    """Test decoding a JSON array from a stream element by element."""
+    
+    def decode(self, data, block_size=1):
+        return list(github_actions_utils.iter_json_array(BytesIO(data), block_size))
+    
+    def test_elements_split_across_blocks(self):
+        """Test that elements, numbers and multi-byte characters cut by block boundaries decode whole."""
+        data = json.dumps([{'tags': ['pr-1', 'caf\u00e9']}, 12345, [1, [2]], 'x', None], ensure_ascii=False)
+        
+        for block_size in (1, 2, 3, 7, 4096):
+            with self.subTest(block_size=block_size):
+                self.assertEqual(self.decode(data.encode(), block_size), json.loads(data))
+    
+    def test_empty_array_and_whitespace(self):
+        """Test that empty arrays and insignificant whitespace are accepted."""
+        self.assertEqual(self.decode(b' [ ] '), [])
+        self.assertEqual(self.decode(b'\n[\n  {"id": 1} ,\n  {"id": 2}\n]\n'), [{'id': 1}, {'id': 2}])
+    
+    def test_elements_yielded_before_the_rest_is_read(self):
+        """Test that an element is available before the stream has been read to the end."""
+        stream = BytesIO(b'[{"id": 1}, ' + b' ' * 100_000 + b'{"id": 2}]')
+        elements = github_actions_utils.iter_json_array(stream, block_size=64)
+        
+        self.assertEqual(next(elements), {'id': 1})
+        self.assertLess(stream.tell(), 1000)
+    
+    def test_malformed_input_raises(self):
+        """Test that anything but a well-formed array raises ValueError."""
+        for data in (b'{"id": 1}', b'', b'[{"id": 1}', b'[{"id": 1} {"id": 2}]', b'[{"id": 1},', b'[{"id": }]'):
+            with self.subTest(data=data):
+                with self.assertRaises(ValueError):
+                    self.decode(data, block_size=4)
+
+
+class TestResponseCache(unittest.TestCase):
+    """Test the on-disk conditional request cache."""
+    
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tempdir.cleanup)
+    
+    def response(self, body=b'[]', **headers):
+        """Build a 200 response with the given headers."""
+        message = HTTPMessage()
+        for name, value in headers.items():
+            message[name.replace('_', '-')] = value
+        return github_actions_utils.APIResponse(200, message, body)
+    
+    def test_put_and_get_round_trip(self):
+        """Test that stored responses come back with their validators."""
+        cache = github_actions_utils.ResponseCache(self.tempdir.name)
+        cache.put('https://api/x', self.response(b'[1]', ETag='"abc"', Last_Modified='Mon'))
+        
+        conditions, response = cache.get('https://api/x')
+        
+        self.assertEqual(conditions, {'If-None-Match': '"abc"', 'If-Modified-Since': 'Mon'})
+        self.assertEqual(response.json(), [1])
+        self.assertEqual(response.headers['ETag'], '"abc"')
+    
+    def test_response_without_validator_is_not_stored(self):
+        """Test that responses that cannot be revalidated are not cached."""
+        cache = github_actions_utils.ResponseCache(self.tempdir.name)
+        cache.put('https://api/x', self.response())
+        
+        self.assertIsNone(cache.get('https://api/x'))
+    
+    def test_least_recently_used_entries_are_evicted(self):
+        """Test that the cache stays within its size bound, evicting the oldest first."""
+        cache = github_actions_utils.ResponseCache(self.tempdir.name, max_bytes=400)
+        body = b'x' * 100
+        cache.put('https://api/a', self.response(body, ETag='"a"'))
+        cache.put('https://api/b', self.response(body, ETag='"b"'))
+        # Make 'a' the least recently used, then use 'b'
+        os.utime(cache._entry_path('https://api/a'), (time.time() - 60, time.time() - 60))
+        cache.get('https://api/b')
+        cache.put('https://api/c', self.response(body, ETag='"c"'))
+        
+        self.assertIsNone(cache.get('https://api/a'))
+        self.assertIsNotNone(cache.get('https://api/b'))
+        self.assertIsNotNone(cache.get('https://api/c'))
+    
+    def test_invalidate_by_prefix(self):
+        """Test that invalidation removes every entry under a URL."""
+        cache = github_actions_utils.ResponseCache(self.tempdir.name)
+        cache.put('https://api/pkg/versions?page=1', self.response(ETag='"1"'))
+        cache.put('https://api/pkg/versions?page=2', self.response(ETag='"2"'))
+        cache.put('https://api/other/versions', self.response(ETag='"3"'))
+        
+        removed = cache.invalidate('https://api/pkg/versions')
+        
+        self.assertEqual(removed, 2)
+        self.assertIsNone(cache.get('https://api/pkg/versions?page=1'))
+        self.assertIsNotNone(cache.get('https://api/other/versions'))
+    
+    def test_client_serves_not_modified_from_cache(self):
+        """Test that a 304 is answered with the stored body and headers."""
+        cache = github_actions_utils.ResponseCache(self.tempdir.name)
+        with StandInServer(etag_handler) as server:
+            client = github_actions_utils.GitHubAPIClient('token123', server.base_url, cache=cache)
+            first = client.request('GET', '/versions')
+            with patch('sys.stderr', StringIO()):
+                second = client.request('GET', '/versions')
+            client.close()
+        
+        self.assertNotIn('If-None-Match', server.requests[0].headers)
+        self.assertEqual(server.requests[1].headers['If-None-Match'], '"v1"')
+        self.assertEqual(second.status, 200)
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second.headers['Link'], '<x?page=2>; rel="next"')
+    
+    def test_stream_writes_cache_as_it_reads(self):
+        """Test that a streamed body is stored while it is read and served on a 304."""
+        cache = github_actions_utils.ResponseCache(self.tempdir.name)
+        with StandInServer(etag_handler) as server:
+            client = github_actions_utils.GitHubAPIClient('token123', server.base_url, cache=cache)
+            with client.stream('/versions') as (response, body):
+                self.assertNotIsInstance(body, BytesIO)
+                first = list(github_actions_utils.iter_json_array(body, block_size=1))
+            with patch('sys.stderr', StringIO()):
+                with client.stream('/versions') as (second_response, body):
+                    second = list(github_actions_utils.iter_json_array(body))
+            client.close()
+        
+        self.assertEqual(server.requests[1].headers['If-None-Match'], '"v1"')
+        self.assertEqual(second_response.status, 200)
+        self.assertEqual(second, first)
+        self.assertEqual(first, [{'id': 1}])
+    
+    def test_stream_left_with_error_stores_nothing(self):
+        """Test that a body abandoned by an exception is not cached."""
+        cache = github_actions_utils.ResponseCache(self.tempdir.name)
+        with StandInServer(etag_handler) as server:
+            client = github_actions_utils.GitHubAPIClient('token123', server.base_url, cache=cache)
+            with self.assertRaises(KeyError):
+                with client.stream('/versions') as (response, body):
+                    raise KeyError('id')
+            client.close()
+        
+        self.assertIsNone(cache.get(f'{server.base_url}/versions'))
+        self.assertEqual(os.listdir(self.tempdir.name), [])
+    
+    def test_client_invalidate_cache(self):
+        """Test that invalidation makes the next request unconditional."""
+        cache = github_actions_utils.ResponseCache(self.tempdir.name)
+        with StandInServer(etag_handler) as server:
+            client = github_actions_utils.GitHubAPIClient('token123', server.base_url, cache=cache)
+            client.request('GET', '/pkg/versions?page=1')
+            client.invalidate_cache('/pkg/versions')
+            client.request('GET', '/pkg/versions?page=1')
+            client.close()
+        
+        self.assertNotIn('If-None-Match', server.requests[1].headers)
+
+
+class FakeClock:
+    """Clock whose time only moves when the code under test sleeps."""
+    
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+    
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+    
+    def time(self):
+        return self.now
+
+
+def scheduler_with(clock, **kwargs):
+    """Build a scheduler driven by a fake clock."""
+    return github_actions_utils.RequestScheduler(
+        sleep=clock.sleep, clock=clock.time, wall_clock=clock.time, **kwargs
+    )
+
+
+def status_response(status, body=b'', **headers):
+    """Build a response with the given status and headers."""
+    message = HTTPMessage()
+    for name, value in headers.items():
+        message[name.replace('_', '-')] = value
+    return github_actions_utils.APIResponse(status, message, body)
+
+
+class TestRequestScheduler(unittest.TestCase):
+    """Test rate limit pacing and retries."""
+    
+    def setUp(self):
+        stderr_patch = patch('sys.stderr', StringIO())
+        stderr_patch.start()
+        self.addCleanup(stderr_patch.stop)
+        self.clock = FakeClock()
+    
+    def test_retries_transient_server_errors(self):
+        """Test that idempotent requests are retried after a 502."""
+        scheduler = scheduler_with(self.clock)
+        send = MagicMock(side_effect=[status_response(502), status_response(502), status_response(200)])
+        
+        response = scheduler.call('GET', send)
+        
+        self.assertEqual(response.status, 200)
+        self.assertEqual(send.call_count, 3)
+        self.assertEqual(len(self.clock.sleeps), 2)
+        self.assertAlmostEqual(scheduler.throttled_seconds, sum(self.clock.sleeps))
+    
+    def test_backoff_is_jittered_and_capped(self):
+        """Test that backoff delays stay within the exponential envelope and the cap."""
+        scheduler = scheduler_with(self.clock, base_delay=1.0, max_delay=5.0)
+        
+        for attempt in range(1, 10):
+            with self.subTest(attempt=attempt):
+                delay = scheduler._backoff(attempt)
+                self.assertGreaterEqual(delay, 0)
+                self.assertLessEqual(delay, min(5.0, 2 ** attempt))
+    
+    def test_non_idempotent_requests_are_not_retried(self):
+        """Test that a POST is sent only once."""
+        scheduler = scheduler_with(self.clock)
+        send = MagicMock(return_value=status_response(502))
+        
+        response = scheduler.call('POST', send)
+        
+        self.assertEqual(response.status, 502)
+        self.assertEqual(send.call_count, 1)
+        self.assertEqual(self.clock.sleeps, [])
+    
+    def test_client_errors_are_not_retried(self):
+        """Test that a 404 or a permission error is returned straight away."""
+        scheduler = scheduler_with(self.clock)
+        for status in (403, 404):
+            with self.subTest(status=status):
+                send = MagicMock(return_value=status_response(status))
+                self.assertEqual(scheduler.call('GET', send).status, status)
+                self.assertEqual(send.call_count, 1)
+    
+    def test_retry_after_is_honoured(self):
+        """Test that the server's Retry-After is used for secondary rate limits."""
+        scheduler = scheduler_with(self.clock)
+        send = MagicMock(side_effect=[status_response(403, Retry_After='7'), status_response(200)])
+        
+        scheduler.call('DELETE', send)
+        
+        self.assertEqual(self.clock.sleeps, [7.0])
+    
+    def test_primary_rate_limit_waits_for_reset(self):
+        """Test that an exhausted rate limit waits until the reset time."""
+        scheduler = scheduler_with(self.clock)
+        limited = status_response(
+            403, X_RateLimit_Remaining='0', X_RateLimit_Reset=str(int(self.clock.now) + 30)
+        )
+        send = MagicMock(side_effect=[limited, status_response(200)])
+        
+        scheduler.call('GET', send)
+        
+        self.assertEqual(self.clock.sleeps, [31.0])
+    
+    def test_secondary_rate_limit_without_headers_waits_a_minute(self):
+        """Test that a secondary rate limit without guidance waits at least a minute."""
+        scheduler = scheduler_with(self.clock)
+        limited = status_response(403, b'{"message": "You have exceeded a secondary rate limit"}')
+        send = MagicMock(side_effect=[limited, status_response(200)])
+        
+        scheduler.call('GET', send)
+        
+        self.assertGreaterEqual(self.clock.sleeps[0], 60.0)
+    
+    def test_requests_are_paced_before_hitting_the_limit(self):
+        """Test that a request waits for the reset once the allowance is used up."""
+        scheduler = scheduler_with(self.clock, min_remaining=1)
+        nearly_limited = status_response(
+            200, X_RateLimit_Remaining='1', X_RateLimit_Reset=str(int(self.clock.now) + 10)
+        )
+        send = MagicMock(return_value=nearly_limited)
+        
+        scheduler.call('GET', send)
+        self.assertEqual(self.clock.sleeps, [])
+        send.return_value = status_response(200)
+        scheduler.call('GET', send)
+        
+        self.assertEqual(self.clock.sleeps, [11.0])
+    
+    def test_time_budget_stops_retries(self):
+        """Test that no retry is made when its wait would exceed the time budget."""
+        scheduler = scheduler_with(self.clock, time_budget=5.0)
+        send = MagicMock(side_effect=[status_response(429, Retry_After='60'), status_response(200)])
+        
+        response = scheduler.call('GET', send)
+        
+        self.assertEqual(response.status, 429)
+        self.assertEqual(send.call_count, 1)
+        self.assertEqual(self.clock.sleeps, [])
+    
+    def test_time_budget_is_per_request(self):
+        """Test that a shared scheduler still retries after its time budget has passed since it was built."""
+        scheduler = scheduler_with(self.clock, time_budget=5.0)
+        self.clock.sleep(600)
+        send = MagicMock(side_effect=[status_response(502), status_response(200)])
+        
+        response = scheduler.call('DELETE', send)
+        
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.attempts, 2)
+        self.assertEqual(send.call_count, 2)
+    
+    def test_connection_errors_are_retried_then_raised(self):
+        """Test that network errors are retried up to the attempt limit."""
+        scheduler = scheduler_with(self.clock, max_attempts=3)
+        send = MagicMock(side_effect=URLError('connection refused'))
+        
+        with self.assertRaises(URLError):
+            scheduler.call('GET', send)
+        
+        self.assertEqual(send.call_count, 3)
+        self.assertEqual(len(self.clock.sleeps), 2)
+    
+    def test_client_retries_through_scheduler(self):
+        """Test that the API client retries a transient failure from the server."""
+        statuses = [502, 200]
+        
+        def flaky_handler(request):
+            return statuses.pop(0), {}, b'{}'
+        
+        with StandInServer(flaky_handler) as server:
+            client = github_actions_utils.GitHubAPIClient(
+                'token123', server.base_url, scheduler=scheduler_with(self.clock)
+            )
+            response = client.request('GET', '/versions')
+            client.close()
+        
+        self.assertEqual(response.status, 200)
+        self.assertEqual(len(server.requests), 2)
+
+
+class TestDeadline(unittest.TestCase):
+    """Test the overall time budget and the timeouts drawn from it."""
+    
+    def setUp(self):
+        self.clock = FakeClock()
+        self.deadline = github_actions_utils.Deadline(clock=self.clock.time)
+    
+    def test_fixed_timeouts_without_budget(self):
+        """Test that without a budget every call keeps its fixed timeout."""
+        self.deadline.record_transfer('docker_load', 100_000_000, 1.0)
+        
+        self.assertEqual(self.deadline.timeout('load_image', 300, 100_000_000, 'docker_load'), 300)
+    
+    def test_timeouts_capped_by_remaining_budget(self):
+        """Test that timeouts shrink as the budget is used and a call past it fails naming its phase."""
+        self.deadline.start(100)
+        self.assertEqual(self.deadline.timeout('docker_tag', 60), 60)
+        
+        self.clock.sleep(70)
+        self.assertEqual(self.deadline.timeout('docker_tag', 60), 30)
+        
+        self.clock.sleep(30)
+        with self.assertRaises(github_actions_utils.DeadlineExceeded) as cm:
+            self.deadline.timeout('docker_push', 600)
+        self.assertEqual(cm.exception.phase, 'docker_push')
+        self.assertIsInstance(cm.exception, OSError)
+        self.assertIn('time budget of 100s used up before docker_push', str(cm.exception))
+    
+    def test_transfer_timeouts_scaled_by_measured_throughput(self):
+        """Test that a transfer gets a multiple of its expected time at the throughput measured so far."""
+        self.deadline.start(3600)
+        # Nothing measured yet: the fixed timeout, or longer at the assumed throughput for a large transfer
+        self.assertEqual(self.deadline.timeout('docker_push', 600, 100_000_000, 'docker_push'), 600)
+        self.assertAlmostEqual(
+            self.deadline.timeout('docker_push', 600, 4_000_000_000, 'docker_push'),
+            github_actions_utils.TRANSFER_SLACK * 4_000_000_000 / github_actions_utils.ASSUMED_TRANSFER_THROUGHPUT,
+        )
+        
+        self.deadline.record_transfer('docker_push', 50_000_000, 1.0)
+        self.deadline.record_transfer('docker_push', 50_000_000, 1.0)
+        
+        # 4 GB at 50 MB/s is 80s, and it may take TRANSFER_SLACK times as long
+        self.assertEqual(self.deadline.timeout('docker_push', 600, 4_000_000_000, 'docker_push'), 320)
+        self.assertEqual(
+            self.deadline.timeout('docker_push', 600, 1000, 'docker_push'), github_actions_utils.MIN_TRANSFER_TIMEOUT
+        )
+        # Other kinds of transfer keep their own measurements
+        self.assertEqual(self.deadline.timeout('load_image', 300, 1000, 'docker_load'), 300)
+    
+    def test_timeout_message_says_when_budget_ran_out(self):
+        """Test that a timed out call reports whether it used up the budget."""
+        self.deadline.start(100)
+        self.assertEqual(self.deadline.timeout_message('Image push', 60), 'Image push timed out after 60s')
+        
+        self.clock.sleep(100)
+        self.assertEqual(
+            self.deadline.timeout_message('Image push', 60),
+            'Image push timed out after 60s, using up the time budget of 100s',
+        )
+    
+    def test_connection_pool_refuses_requests_past_budget(self):
+        """Test that pooled requests take their timeout from the shared deadline."""
+        self.deadline.start(10)
+        with patch.object(github_actions_utils, 'deadline', self.deadline):
+            with StandInServer(json_handler) as server:
+                client = github_actions_utils.GitHubAPIClient('token123', server.base_url)
+                client.request('GET', '/versions')
+                self.clock.sleep(10)
+                with self.assertRaises(github_actions_utils.DeadlineExceeded) as cm:
+                    client.request('DELETE', '/versions/1')
+                client.close()
+        
+        self.assertIn('used up before DELETE /versions/{id}', str(cm.exception))
+        self.assertEqual(len(server.requests), 1)
+    
+    def test_request_outlasting_budget_raises_deadline_exceeded(self):
+        """Test that a request cut off by the last of the budget is not retried as a network error."""
+        def slow_handler(request):
+            time.sleep(1.5)
+            return json_handler(request)
+        
+        deadline = github_actions_utils.Deadline()
+        deadline.start(1)
+        with patch.object(github_actions_utils, 'deadline', deadline):
+            with StandInServer(slow_handler) as server:
+                client = github_actions_utils.GitHubAPIClient(
+                    'token123', server.base_url,
+                    scheduler=github_actions_utils.RequestScheduler(sleep=lambda seconds: None),
+                )
+                with self.assertRaises(github_actions_utils.DeadlineExceeded) as cm:
+                    client.request('GET', '/versions/1')
+                client.close()
+        
+        self.assertEqual(cm.exception.phase, 'GET /versions/{id}')
+        self.assertEqual(
+            str(cm.exception), 'GET /versions/{id} timed out after 1s, using up the time budget of 1s'
+        )
+        self.assertEqual(len(server.requests), 1)
+
+
+class TestTracing(unittest.TestCase):
+    """Test recording spans and writing them out."""
+    
+    def setUp(self):
+        self.tracer = github_actions_utils.Tracer()
+        patcher = patch.object(github_actions_utils, 'tracer', self.tracer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def test_context_manager_records_span(self):
+        """Test that a span records its name, attributes, duration and outcome."""
+        with github_actions_utils.span('docker_push', tag='latest') as span:
+            github_actions_utils.annotate(bytes=1000)
+        
+        self.assertEqual(self.tracer.spans, [span])
+        self.assertEqual(span.attributes, {'tag': 'latest', 'bytes': 1000})
+        self.assertGreaterEqual(span.duration, 0)
+        self.assertEqual(span.outcome, 'ok')
+    
+    def test_decorator_times_every_call(self):
+        """Test that a decorated function gets one span per call, nested in any open span."""
+        @github_actions_utils.span('docker_tag')
+        def tag(target):
+            github_actions_utils.annotate(target=target)
+        
+        with github_actions_utils.span('publish'):
+            tag('pr-1')
+            tag('pr-2')
+        
+        self.assertEqual([span.name for span in self.tracer.spans], ['docker_tag', 'docker_tag', 'publish'])
+        self.assertEqual(
+            [span.attributes for span in self.tracer.spans[:2]], [{'target': 'pr-1'}, {'target': 'pr-2'}]
+        )
+        self.assertEqual(self.tracer.spans[2].attributes, {})
+    
+    def test_outcomes(self):
+        """Test that exceptions and failing exits are recorded as the outcome."""
+        with self.assertRaises(URLError):
+            with github_actions_utils.span('fetch'):
+                raise URLError('refused')
+        with self.assertRaises(SystemExit):
+            with github_actions_utils.span('push'):
+                sys.exit(1)
+        
+        self.assertEqual([span.outcome for span in self.tracer.spans], ['URLError', 'exit 1'])
+    
+    def test_annotate_without_span(self):
+        """Test that annotating outside any span does nothing."""
+        github_actions_utils.annotate(bytes=1)
+        
+        self.assertEqual(self.tracer.spans, [])
+    
+    def test_write_summary_and_trace(self):
+        """Test that the step summary table and Chrome trace are written at exit."""
+        with github_actions_utils.span('load_image'):
+            github_actions_utils.annotate(bytes=2_000_000)
+        with github_actions_utils.span('delete_package_version'):
+            pass
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            summary, trace = f'{tmp}/summary.md', f'{tmp}/trace.json'
+            with patch.dict('os.environ', {'GITHUB_STEP_SUMMARY': summary, 'SCRIPT_TRACE_FILE': trace}):
+                self.tracer.write()
+            table = Path(summary).read_text()
+            events = json.loads(Path(trace).read_text())['traceEvents']
+        
+        self.assertIn('| Phase | Calls | Total (s) | Max (s) | MB | Failed |', table)
+        self.assertRegex(table, r'\| load_image \| 1 \| [0-9.]+ \| [0-9.]+ \| 2 \| 0 \|')
+        self.assertEqual([event['name'] for event in events], ['load_image', 'delete_package_version'])
+        self.assertEqual(events[0]['ph'], 'X')
+        self.assertEqual(events[0]['args'], {'bytes': '2000000', 'outcome': 'ok'})
+    
+    def test_nothing_written_without_spans(self):
+        """Test that a run without spans leaves the step summary alone."""
+        with tempfile.TemporaryDirectory() as tmp:
+            with patch.dict('os.environ', {'GITHUB_STEP_SUMMARY': f'{tmp}/summary.md'}):
+                self.tracer.write()
+            self.assertFalse(os.path.exists(f'{tmp}/summary.md'))
+
+
+class TestMetrics(unittest.TestCase):
+    """Test the metrics registry and its OpenMetrics output."""
+    
+    def setUp(self):
+        self.registry = github_actions_utils.MetricsRegistry(enabled=True)
+    
+    def test_disabled_registry_records_nothing(self):
+        """Test that updates are dropped while the registry is disabled."""
+        registry = github_actions_utils.MetricsRegistry()
+        registry.counter('pushes', 'Pushes').inc()
+        registry.histogram('latency', 'Latency').observe(0.2)
+        
+        self.assertEqual(registry.render(), '# EOF\n')
+    
+    def test_counter_and_gauge(self):
+        """Test that counters total per label set and gauges keep the last value."""
+        pushed = self.registry.counter('push_bytes', 'Bytes pushed')
+        pushed.inc(100, mode='registry')
+        pushed.inc(50, mode='registry')
+        pushed.inc(7, mode='docker')
+        self.registry.gauge('layers', 'Layers in the image').set(3)
+        
+        self.assertIs(self.registry.counter('push_bytes', 'Bytes pushed'), pushed)
+        self.assertEqual(self.registry.render(), "\n".join([
+            '# TYPE push_bytes counter',
+            '# HELP push_bytes Bytes pushed',
+            'push_bytes_total{mode="docker"} 7.0',
+            'push_bytes_total{mode="registry"} 150.0',
+            '# TYPE layers gauge',
+            '# HELP layers Layers in the image',
+            'layers 3.0',
+            '# EOF',
+        ]) + "\n")
+    
+    def test_histogram_buckets_are_cumulative(self):
+        """Test that bucket counts accumulate up to +Inf, with the sum and count."""
+        latency = self.registry.histogram('latency', 'Latency', buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 3.0):
+            latency.observe(value, method='GET')
+        
+        lines = self.registry.render().splitlines()
+        
+        self.assertEqual(lines[2:], [
+            'latency_bucket{method="GET",le="0.1"} 2',
+            'latency_bucket{method="GET",le="1.0"} 3',
+            'latency_bucket{method="GET",le="+Inf"} 4',
+            'latency_sum{method="GET"} 3.65',
+            'latency_count{method="GET"} 4',
+            '# EOF',
+        ])
+    
+    def test_label_values_are_escaped(self):
+        """Test that quotes, backslashes and newlines in label values are escaped."""
+        self.registry.counter('errors', 'Errors').inc(reason='say "no"\\\n')
+        
+        self.assertIn('errors_total{reason="say \\"no\\"\\\\\\n"} 1.0', self.registry.render())
+    
+    def test_endpoint_label(self):
+        """Test that IDs, digests and upload sessions are replaced so endpoints stay few."""
+        digest = 'sha256:' + 'a' * 64
+        cases = {
+            '/users/owner/packages/container/repo/versions?per_page=100&page=2':
+                '/users/owner/packages/container/repo/versions',
+            '/users/owner/packages/container/repo/versions/12345': '/users/owner/packages/container/repo/versions/{id}',
+            f'/v2/owner/repo/blobs/{digest}': '/v2/owner/repo/blobs/{digest}',
+            '/v2/owner/repo/manifests/pr-42': '/v2/owner/repo/manifests/{reference}',
+            '/v2/owner/repo/blobs/uploads/0f3c-session?digest=x': '/v2/owner/repo/blobs/uploads/{session}',
+        }
+        for path, expected in cases.items():
+            with self.subTest(path=path):
+                self.assertEqual(github_actions_utils.endpoint_label(path), expected)
+    
+    def test_write_to_metrics_file(self):
+        """Test that the metrics are written to SCRIPT_METRICS_FILE."""
+        self.registry.counter('deletes', 'Deletes').inc(result='http_204')
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            path = f'{tmp}/metrics.prom'
+            with patch.dict('os.environ', {'SCRIPT_METRICS_FILE': path}):
+                self.registry.write()
+            text = Path(path).read_text()
+        
+        self.assertIn('deletes_total{result="http_204"} 1.0', text)
+        self.assertTrue(text.endswith('# EOF\n'))
+    
+    def test_spans_observe_phase_histogram(self):
+        """Test that each finished span is observed in the phase duration histogram."""
+        histogram = github_actions_utils.PHASE_SECONDS
+        self.addCleanup(histogram.values.clear)
+        
+        with patch.object(github_actions_utils.metrics, 'enabled', True):
+            with patch.object(github_actions_utils, 'tracer', github_actions_utils.Tracer()):
+                with github_actions_utils.span('docker_push'):
+                    pass
+        
+        self.assertEqual(list(histogram.values), [(('outcome', 'ok'), ('phase', 'docker_push'))])
+
+
+class TestProfiling(unittest.TestCase):
+    """Test the opt-in profiling hook around main()."""
+    
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        patcher = patch.object(sys, 'argv', ['scripts/push_image.py'])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def test_off_by_default(self):
+        """Test that without SCRIPT_PROFILE main() is simply called and nothing is written."""
+        main = MagicMock()
+        
+        with patch.dict('os.environ', {'SCRIPT_PROFILE_DIR': self.tmp.name}):
+            os.environ.pop('SCRIPT_PROFILE', None)
+            github_actions_utils.run_profiled(main)
+        
+        main.assert_called_once_with()
+        self.assertEqual(os.listdir(self.tmp.name), [])
+    
+    @patch('github_actions_utils.log_info')
+    def test_profiles_written_when_main_exits(self, mock_log):
+        """Test that CPU and memory profiles are written even when main() calls sys.exit."""
+        def main():
+            data = [bytes(1024) for _ in range(100)]
+            sys.exit(len(data) - 100)
+        
+        env = {'SCRIPT_PROFILE': 'cpu, memory', 'SCRIPT_PROFILE_DIR': f'{self.tmp.name}/profile'}
+        with patch.dict('os.environ', env):
+            with self.assertRaises(SystemExit):
+                github_actions_utils.run_profiled(main)
+        
+        stats = pstats.Stats(f'{self.tmp.name}/profile/push_image.prof')
+        self.assertTrue(any(name == 'main' for _, _, name in stats.stats))
+        memory = Path(f'{self.tmp.name}/profile/push_image_memory.txt').read_text()
+        self.assertIn('Peak RSS:', memory)
+        self.assertIn('Peak traced Python memory:', memory)
+        self.assertIn('allocation sites', memory)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Unit tests for image_archive.py module.
+
+These tests index archives written with Python's tarfile module in each of
+the tar formats and compare the results with what tarfile itself reads.
+"""
+
+import io
+import sys
+import tarfile
+import tempfile
+import unittest
+from pathlib import Path
+
+# Add parent directory to path to import the module in a way that works across environments
+script_dir = str(Path(__file__).resolve().parent)
+if script_dir not in sys.path:
+    sys.path.insert(0, script_dir)
+import image_archive
+
+MEMBERS = {
+    "manifest.json": b'[{"Config": "config.json"}]',
+    "blobs/sha256/" + "a" * 64: b"layer contents " * 100,
+    "empty": b"",
+    "deeply/" + "nested/" * 20 + "name-longer-than-one-hundred-bytes": b"long name",
+}
+
+
+def write_archive(path, members, tar_format=tarfile.PAX_FORMAT, directory=None):
+    """Write the members, and optionally an empty directory, to an archive."""
+    with tarfile.open(path, "w", format=tar_format) as archive:
+        for name, data in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+        if directory:
+            info = tarfile.TarInfo(directory)
+            info.type = tarfile.DIRTYPE
+            archive.addfile(info)
+
+
+class TestImageArchive(unittest.TestCase):
+    """Test indexing and reading archive members."""
+    
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = f"{self.tmp.name}/image.tar"
+    
+    def tearDown(self):
+        self.tmp.cleanup()
+    
+    def test_index_matches_tarfile(self):
+        """Test that offsets, sizes and contents match tarfile for every format."""
+        for tar_format in (tarfile.PAX_FORMAT, tarfile.GNU_FORMAT):
+            with self.subTest(tar_format=tar_format):
+                write_archive(self.path, MEMBERS, tar_format)
+                
+                with image_archive.ImageArchive(self.path) as archive, tarfile.open(self.path) as expected:
+                    self.assertEqual(archive.names(), expected.getnames())
+                    for info in expected.getmembers():
+                        member = archive.getmember(info.name)
+                        self.assertEqual((member.offset, member.size), (info.offset_data, info.size))
+                        self.assertEqual(bytes(archive.read(info.name)), MEMBERS[info.name])
+    
+    def test_ustar_prefix_names(self):
+        """Test that ustar names split across the prefix and name fields are joined."""
+        name = "prefix/" * 15 + "file"
+        write_archive(self.path, {name: b"data"}, tarfile.USTAR_FORMAT)
+        
+        with image_archive.ImageArchive(self.path) as archive:
+            self.assertEqual(bytes(archive.read(name)), b"data")
+    
+    def test_read_is_zero_copy_view(self):
+        """Test that members are served as views of the mapped file."""
+        write_archive(self.path, MEMBERS)
+        
+        with image_archive.ImageArchive(self.path) as archive:
+            view = archive.read("manifest.json")
+            self.assertIsInstance(view, memoryview)
+            self.assertTrue(view.readonly)
+            del view
+    
+    def test_directories_are_not_files(self):
+        """Test that directories are indexed but cannot be read as files."""
+        write_archive(self.path, MEMBERS, directory="blobs/")
+        
+        with image_archive.ImageArchive(self.path) as archive:
+            self.assertIn("blobs", archive)
+            with self.assertRaises(ValueError):
+                archive.read("blobs")
+    
+    def test_links_read_as_their_target(self):
+        """Test that symbolic and hard links, including long link names, serve the target's contents."""
+        target = "deeply/" + "nested/" * 20 + "layer.tar"
+        for tar_format in (tarfile.PAX_FORMAT, tarfile.GNU_FORMAT):
+            with self.subTest(tar_format=tar_format):
+                with tarfile.open(self.path, "w", format=tar_format) as archive:
+                    info = tarfile.TarInfo(target)
+                    info.size = 5
+                    archive.addfile(info, io.BytesIO(b"layer"))
+                    for name, link_type, link_name in [
+                        ("abc/layer.tar", tarfile.SYMTYPE, "../" + target),
+                        ("def/layer.tar", tarfile.LNKTYPE, target),
+                        ("ghi/layer.tar", tarfile.SYMTYPE, "../abc/layer.tar"),
+                    ]:
+                        info = tarfile.TarInfo(name)
+                        info.type = link_type
+                        info.linkname = link_name
+                        archive.addfile(info)
+                
+                with image_archive.ImageArchive(self.path) as archive:
+                    for name in ("abc/layer.tar", "def/layer.tar", "ghi/layer.tar"):
+                        self.assertEqual(bytes(archive.read(name)), b"layer")
+                        self.assertEqual(archive.getmember(name).offset, archive.getmember(target).offset)
+    
+    def test_dangling_and_looping_links(self):
+        """Test that links to nothing or to themselves are not files."""
+        with tarfile.open(self.path, "w") as archive:
+            for name, link_name in [("dangling", "missing"), ("loop", "loop")]:
+                info = tarfile.TarInfo(name)
+                info.type = tarfile.SYMTYPE
+                info.linkname = link_name
+                archive.addfile(info)
+        
+        with image_archive.ImageArchive(self.path) as archive:
+            for name in ("dangling", "loop"):
+                with self.assertRaises(ValueError):
+                    archive.read(name)
+    
+    def test_missing_member(self):
+        """Test that reading a member that does not exist raises ValueError."""
+        write_archive(self.path, MEMBERS)
+        
+        with image_archive.ImageArchive(self.path) as archive:
+            with self.assertRaises(ValueError):
+                archive.read("index.json")
+    
+    def test_truncated_archive(self):
+        """Test that an archive cut off partway through a member is rejected."""
+        write_archive(self.path, MEMBERS)
+        data = Path(self.path).read_bytes()
+        Path(self.path).write_bytes(data[:1600])
+        
+        with self.assertRaises(ValueError) as cm:
+            image_archive.ImageArchive(self.path)
+        self.assertIn("Truncated", str(cm.exception))
+    
+    def test_corrupt_header(self):
+        """Test that a header with a bad checksum is rejected."""
+        write_archive(self.path, MEMBERS)
+        data = bytearray(Path(self.path).read_bytes())
+        data[0] ^= 0xFF
+        Path(self.path).write_bytes(bytes(data))
+        
+        with self.assertRaises(ValueError) as cm:
+            image_archive.ImageArchive(self.path)
+        self.assertIn("Corrupt", str(cm.exception))
+    
+    def test_empty_file(self):
+        """Test that an empty file is rejected."""
+        Path(self.path).write_bytes(b"")
+        
+        with self.assertRaises(ValueError):
+            image_archive.ImageArchive(self.path)
+    
+    def test_close_with_live_view(self):
+        """Test that closing while a view is still referenced does not fail."""
+        write_archive(self.path, MEMBERS)
+        
+        archive = image_archive.ImageArchive(self.path)
+        view = archive.read("manifest.json")
+        archive.close()
+        del view
+
+
+if __name__ == "__main__":
+    unittest.main()
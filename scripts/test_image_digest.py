@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Unit tests for image_digest.py module.
+
+These tests read small `docker save` archives built in a temporary directory.
+"""
+
+import gzip
+import io
+import json
+import sys
+import tarfile
+import tempfile
+import unittest
+from pathlib import Path
+
+# Add parent directory to path to import the module in a way that works across environments
+script_dir = str(Path(__file__).resolve().parent)
+if script_dir not in sys.path:
+    sys.path.insert(0, script_dir)
+import image_archive
+import image_digest
+from archive_fixtures import image_config, sha256, write_archive, write_members
+
+
+def write_oci_archive(path, layers, manifest_digest=None):
+    """
+    Write an archive in the OCI layout Docker 25 and later save.
+    
+    Args:
+        path: Archive path
+        layers: Layer contents, base layer first
+        manifest_digest: Digest index.json claims for the manifest, if not its own
+        
+    Returns:
+        Stored manifest bytes
+    """
+    config = image_config(layers)
+    # Pretty-printed, as written by Docker, so not the bytes a rebuild would produce
+    manifest = json.dumps({
+        "schemaVersion": 2,
+        "mediaType": image_digest.OCI_MANIFEST_MEDIA_TYPE,
+        "config": {"mediaType": image_digest.OCI_CONFIG_MEDIA_TYPE, "digest": sha256(config), "size": len(config)},
+        "layers": [
+            {"mediaType": image_digest.OCI_LAYER_MEDIA_TYPE, "digest": sha256(layer), "size": len(layer)}
+            for layer in layers
+        ],
+    }, indent=2).encode()
+    index = json.dumps({
+        "schemaVersion": 2,
+        "manifests": [{
+            "mediaType": image_digest.OCI_MANIFEST_MEDIA_TYPE,
+            "digest": manifest_digest or sha256(manifest),
+            "size": len(manifest),
+        }],
+    }).encode()
+    members = {f"blobs/sha256/{sha256(data)[7:]}": data for data in [config] + layers}
+    members[f"blobs/sha256/{(manifest_digest or sha256(manifest))[7:]}"] = manifest
+    members["index.json"] = index
+    members["oci-layout"] = b'{"imageLayoutVersion": "1.0.0"}'
+    write_members(path, members)
+    return manifest
+
+
+class TestReadArchiveImage(unittest.TestCase):
+    """Test reading images from `docker save` archives."""
+    
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = f"{self.tmp.name}/image.tar"
+    
+    def tearDown(self):
+        self.tmp.cleanup()
+    
+    def read(self):
+        """Read the test archive."""
+        with image_archive.ImageArchive(self.path) as archive:
+            return image_digest.read_archive_image(archive)
+    
+    def test_legacy_layout(self):
+        """Test that legacy layer digests come from the config's diff_ids."""
+        config = write_archive(self.path, [b"base layer", b"top layer"])
+        
+        image = self.read()
+        
+        self.assertEqual(image.config.digest, sha256(config))
+        self.assertEqual([layer.digest for layer in image.layers], [sha256(b"base layer"), sha256(b"top layer")])
+        self.assertEqual(image.layers[0].media_type, image_digest.OCI_LAYER_MEDIA_TYPE)
+    
+    def test_legacy_layout_with_linked_layer(self):
+        """Test that a layer `docker save` stores as a symlink to an identical one is read through the link."""
+        config = image_config([b"shared layer", b"shared layer"])
+        config_name = f"{sha256(config)[7:]}.json"
+        with tarfile.open(self.path, "w") as archive:
+            for name, data in [(config_name, config), ("0/layer.tar", b"shared layer")]:
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                archive.addfile(info, io.BytesIO(data))
+            info = tarfile.TarInfo("1/layer.tar")
+            info.type = tarfile.SYMTYPE
+            info.linkname = "../0/layer.tar"
+            archive.addfile(info)
+            manifest = json.dumps([{"Config": config_name, "Layers": ["0/layer.tar", "1/layer.tar"]}]).encode()
+            info = tarfile.TarInfo("manifest.json")
+            info.size = len(manifest)
+            archive.addfile(info, io.BytesIO(manifest))
+        
+        image = self.read()
+        
+        self.assertEqual([layer.digest for layer in image.layers], [sha256(b"shared layer")] * 2)
+        self.assertEqual(image.layers[1].size, len(b"shared layer"))
+        self.assertEqual(image_digest.verify_archive(self.path)[0], len(config) + 2 * len(b"shared layer"))
+    
+    def test_digest_named_blobs(self):
+        """Test that blobs named by digest in manifest.json use those digests."""
+        config = write_archive(self.path, [b"layer"], oci_layout=True)
+        
+        image = self.read()
+        
+        self.assertEqual(image.config.digest, sha256(config))
+        self.assertEqual(image.layers[0].digest, sha256(b"layer"))
+    
+    def test_gzip_layer_media_type(self):
+        """Test that compressed layers are pushed with the gzip media type."""
+        write_archive(self.path, [gzip.compress(b"layer")], oci_layout=True)
+        
+        self.assertEqual(self.read().layers[0].media_type, image_digest.OCI_GZIP_LAYER_MEDIA_TYPE)
+    
+    def test_built_manifest_describes_blobs(self):
+        """Test that the manifest built for manifest.json lists the config and layers."""
+        write_archive(self.path, [b"layer"])
+        
+        image = self.read()
+        manifest = json.loads(image.manifest)
+        
+        self.assertEqual(manifest["config"]["digest"], image.config.digest)
+        self.assertEqual(manifest["layers"], [{
+            "mediaType": image_digest.OCI_LAYER_MEDIA_TYPE,
+            "digest": sha256(b"layer"),
+            "size": 5,
+        }])
+        self.assertEqual(image.digest, sha256(image.manifest))
+    
+    def test_oci_layout_manifest_used_verbatim(self):
+        """Test that the manifest index.json names is pushed byte for byte."""
+        manifest = write_oci_archive(self.path, [b"base layer", b"top layer"])
+        
+        image = self.read()
+        
+        self.assertEqual(image.manifest, manifest)
+        self.assertEqual(image.digest, sha256(manifest))
+        self.assertEqual(image.media_type, image_digest.OCI_MANIFEST_MEDIA_TYPE)
+        self.assertEqual([layer.member for layer in image.layers], [
+            f"blobs/sha256/{sha256(b'base layer')[7:]}",
+            f"blobs/sha256/{sha256(b'top layer')[7:]}",
+        ])
+    
+    def test_oci_layout_manifest_must_match_digest(self):
+        """Test that a stored manifest that does not match index.json is rejected."""
+        write_oci_archive(self.path, [b"layer"], manifest_digest=sha256(b"something else"))
+        
+        with self.assertRaises(ValueError) as cm:
+            self.read()
+        self.assertIn("does not match", str(cm.exception))
+    
+    def test_archive_without_manifest(self):
+        """Test that an archive without manifest.json is rejected."""
+        write_members(self.path, {})
+        
+        with self.assertRaises(ValueError):
+            self.read()
+
+
+class TestArchiveManifestDigest(unittest.TestCase):
+    """Test computing the manifest digest of an archive."""
+    
+    def test_digest_is_deterministic(self):
+        """Test that the same archive always gives the same digest."""
+        with tempfile.TemporaryDirectory() as tmp:
+            first, second = f"{tmp}/first.tar", f"{tmp}/second.tar"
+            write_archive(first, [b"base layer", b"top layer"])
+            write_archive(second, [b"base layer", b"top layer"])
+            
+            self.assertEqual(
+                image_digest.archive_manifest_digest(first),
+                image_digest.archive_manifest_digest(second),
+            )
+    
+    
+    def test_config_digest_from_manifest_json(self):
+        """Test that the image ID is read from the config's name in both layouts."""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = f"{tmp}/image.tar"
+            for oci_layout in (False, True):
+                with self.subTest(oci_layout=oci_layout):
+                    config = write_archive(path, [b"layer"], oci_layout=oci_layout)
+                    
+                    self.assertEqual(image_digest.archive_config_digest(path), sha256(config))
+
+
+def corrupt_member(path, name, position=0, mask=0xFF):
+    """Flip bits of one byte of an archive member's contents in place."""
+    with tarfile.open(path) as archive:
+        offset = archive.getmember(name).offset_data + position
+    with open(path, "r+b") as f:
+        f.seek(offset)
+        byte = f.read(1)
+        f.seek(offset)
+        f.write(bytes([byte[0] ^ mask]))
+
+
+class TestVerifyArchive(unittest.TestCase):
+    """Test re-hashing blobs against their digests."""
+    
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = f"{self.tmp.name}/image.tar"
+    
+    def tearDown(self):
+        self.tmp.cleanup()
+    
+    def test_intact_archives_pass(self):
+        """Test that intact archives in both layouts verify and report their size."""
+        layers = [b"base layer" * 1000, b"top layer"]
+        for writer in (write_archive, write_oci_archive):
+            with self.subTest(writer=writer.__name__):
+                writer(self.path, layers)
+                
+                size, seconds = image_digest.verify_archive(self.path, workers=2)
+                
+                self.assertGreater(size, sum(len(layer) for layer in layers))
+                self.assertGreaterEqual(seconds, 0)
+    
+    def test_corrupt_legacy_layer(self):
+        """Test that a legacy layer that does not match its diff_id is named."""
+        write_archive(self.path, [b"base layer", b"top layer"])
+        corrupt_member(self.path, "1/layer.tar")
+        
+        with self.assertRaises(ValueError) as cm:
+            image_digest.verify_archive(self.path)
+        self.assertIn("1/layer.tar", str(cm.exception))
+    
+    def test_corrupt_legacy_config(self):
+        """Test that a legacy config is checked against its file name."""
+        config = write_archive(self.path, [b"layer"])
+        # Change the case of a letter so the config is still valid JSON
+        corrupt_member(self.path, f"{sha256(config)[7:]}.json", config.index(b"amd64"), 0x20)
+        
+        with self.assertRaises(ValueError) as cm:
+            image_digest.verify_archive(self.path)
+        self.assertIn(f"{sha256(config)[7:]}.json", str(cm.exception))
+    
+    def test_corrupt_oci_layout_blob(self):
+        """Test that an OCI layout blob that does not match its name is named."""
+        write_oci_archive(self.path, [b"base layer", b"top layer"])
+        name = f"blobs/sha256/{sha256(b'top layer')[7:]}"
+        corrupt_member(self.path, name)
+        
+        with self.assertRaises(ValueError) as cm:
+            image_digest.verify_archive(self.path)
+        self.assertIn(name, str(cm.exception))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Unit tests for oci_registry.py module.
+
+These tests run the registry client against a local in-memory registry stand-in.
+"""
+
+import sys
+import unittest
+from pathlib import Path
+from urllib.error import HTTPError, URLError
+
+# Add parent directory to path to import the module in a way that works across environments
+script_dir = str(Path(__file__).resolve().parent)
+if script_dir not in sys.path:
+    sys.path.insert(0, script_dir)
+import oci_registry
+from registry_stand_in import StandInRegistry
+from stand_in_server import StandInServer
+
+OCI_MANIFEST = "application/vnd.oci.image.manifest.v1+json"
+
+
+class TestBearerChallenge(unittest.TestCase):
+    """Test parsing of WWW-Authenticate challenges."""
+    
+    def test_parse_bearer_challenge(self):
+        """Test that realm, service and scope are extracted."""
+        challenge = oci_registry.parse_bearer_challenge(
+            'Bearer realm="https://ghcr.io/token",service="ghcr.io",scope="repository:o/r:pull"'
+        )
+        
+        self.assertEqual(challenge, {
+            "realm": "https://ghcr.io/token",
+            "service": "ghcr.io",
+            "scope": "repository:o/r:pull",
+        })
+    
+    def test_parse_basic_challenge(self):
+        """Test that non-Bearer challenges are not treated as token challenges."""
+        self.assertIsNone(oci_registry.parse_bearer_challenge('Basic realm="registry"'))
+
+
+class TestResolveTag(unittest.TestCase):
+    """Test tag resolution against a registry stand-in."""
+    
+    def setUp(self):
+        self.registry = StandInRegistry("owner", "token123")
+        self.digest = self.registry.add_manifest("owner/repo", b'{"layers": []}', OCI_MANIFEST, "pr-42")
+    
+    def test_resolve_existing_tag(self):
+        """Test that a tag resolves to its digest after authenticating."""
+        with StandInServer(self.registry.handle) as server:
+            client = oci_registry.RegistryClient("Owner/Repo", "owner", "token123", server.base_url)
+            digest = client.resolve_tag("pr-42")
+            client.close()
+        
+        self.assertEqual(digest, self.digest)
+        methods = [(r.method, r.path.split("?")[0]) for r in server.requests]
+        self.assertEqual(methods, [
+            ("HEAD", "/v2/owner/repo/manifests/pr-42"),
+            ("GET", "/token"),
+            ("HEAD", "/v2/owner/repo/manifests/pr-42"),
+        ])
+    
+    def test_resolve_reuses_token(self):
+        """Test that later requests reuse the token without another challenge."""
+        with StandInServer(self.registry.handle) as server:
+            client = oci_registry.RegistryClient("owner/repo", "owner", "token123", server.base_url)
+            client.resolve_tag("pr-42")
+            client.resolve_tag("pr-42")
+            client.close()
+        
+        self.assertEqual(len(server.requests), 4)
+    
+    def test_resolve_missing_tag(self):
+        """Test that a tag that does not exist resolves to None."""
+        with StandInServer(self.registry.handle) as server:
+            client = oci_registry.RegistryClient("owner/repo", "owner", "token123", server.base_url)
+            digest = client.resolve_tag("pr-99")
+            client.close()
+        
+        self.assertIsNone(digest)
+    
+    def test_bad_credentials(self):
+        """Test that rejected credentials raise HTTPError."""
+        with StandInServer(self.registry.handle) as server:
+            client = oci_registry.RegistryClient("owner/repo", "owner", "wrong", server.base_url)
+            with self.assertRaises(HTTPError) as cm:
+                client.resolve_tag("pr-42")
+            client.close()
+        
+        self.assertEqual(cm.exception.code, 401)
+    
+    def test_credentials_not_sent_to_plaintext_realm_elsewhere(self):
+        """Test that credentials never go over plain HTTP to another origin."""
+        def handler(request):
+            return 401, {"WWW-Authenticate": 'Bearer realm="http://example.com/token"'}, b""
+        
+        with StandInServer(handler) as server:
+            client = oci_registry.RegistryClient("owner/repo", "owner", "token123", server.base_url)
+            with self.assertRaises(URLError):
+                client.resolve_tag("pr-42")
+            client.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
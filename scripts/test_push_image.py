@@ -5,10 +5,16 @@ Unit tests for push_image.py script.
 These tests verify core functionality without requiring Docker or actual image operations.
 """
 
+import base64
+import io
+import json
 import sys
+import tarfile
+import tempfile
 import unittest
-from unittest.mock import patch, MagicMock
+from unittest.mock import ANY, patch, MagicMock
 from pathlib import Path
+from urllib.error import HTTPError, URLError
 
 # Add parent directory to path to import the module in a way that works across environments
 script_dir = str(Path(__file__).resolve().parent)
@@ -17,22 +23,27 @@ if script_dir not in sys.path:
 import push_image
 
 
+def stream_output(output):
+    """Stand-in for run_streaming that hands each line of some output to the callback."""
+    def run(command, timeout, on_line):
+        for line in output.splitlines(keepends=True):
+            on_line(line)
+    return run
+
+
 class TestDigestExtraction(unittest.TestCase):
     """Test digest extraction from docker push output."""
     
-    @patch('push_image.subprocess.run')
+    @patch('push_image.push_progress.run_streaming')
     def test_docker_push_extracts_digest_from_valid_output(self, mock_run):
         """Test that docker_push correctly extracts digest from valid output."""
-        # Mock subprocess.run to return valid docker push output
-        mock_result = MagicMock()
-        mock_result.stdout = """
+        # Feed docker push output to the line callback as it would be streamed
+        mock_run.side_effect = stream_output("""
 The push refers to repository [ghcr.io/test/repo]
 abc123: Pushed
 def456: Pushed
 latest: digest: sha256:1234567890abcdef1234567890abcdef1234567890abcdef1234567890abcdef size: 1234
-        """
-        mock_result.stderr = ""
-        mock_run.return_value = mock_result
+        """)
         
         # Call the actual docker_push function
         digest = push_image.docker_push("ghcr.io/test/repo:latest")
@@ -41,62 +52,40 @@ latest: digest: sha256:1234567890abcdef1234567890abcdef1234567890abcdef123456789
         self.assertEqual(digest, "sha256:1234567890abcdef1234567890abcdef1234567890abcdef1234567890abcdef")
         self.assertTrue(digest.startswith("sha256:"))
         self.assertEqual(len(digest), 71)  # "sha256:" (7) + 64 hex chars
+        self.assertEqual(mock_run.call_args[0][:2], (["docker", "push", "ghcr.io/test/repo:latest"], 600))
     
-    @patch('push_image.subprocess.run')
-    def test_docker_push_fails_with_invalid_output(self, mock_run):
-        """Test that docker_push exits when digest cannot be extracted."""
-        # Mock subprocess.run to return invalid output
-        mock_result = MagicMock()
-        mock_result.stdout = "No digest here"
-        mock_result.stderr = ""
-        mock_run.return_value = mock_result
+    @patch('push_image.push_progress.run_streaming')
+    def test_docker_push_without_digest_in_output(self, mock_run):
+        """Test that docker_push returns None when the output has no digest."""
+        mock_run.side_effect = stream_output("No digest here")
         
-        # Should exit with error
-        with self.assertRaises(SystemExit) as cm:
-            push_image.docker_push("ghcr.io/test/repo:latest")
-        self.assertEqual(cm.exception.code, 1)
+        # The digest is looked up in the registry instead, so this is not an error here
+        self.assertIsNone(push_image.docker_push("ghcr.io/test/repo:latest"))
     
-    @patch('push_image.subprocess.run')
-    def test_docker_push_handles_calledprocesserror_with_stderr(self, mock_run):
-        """Test that docker_push handles CalledProcessError with stderr correctly."""
+    @patch('push_image.github_actions_utils.github_action_log')
+    @patch('push_image.push_progress.run_streaming')
+    def test_docker_push_reports_output_tail_on_failure(self, mock_run, mock_log):
+        """Test that a failed push is reported with the last lines of its output."""
         import subprocess
-        # Mock subprocess.run to raise CalledProcessError with stderr
-        mock_run.side_effect = subprocess.CalledProcessError(
-            returncode=1,
-            cmd=['docker', 'push', 'test'],
-            stderr="Permission denied"
-        )
         
-        # Should exit with error
-        with self.assertRaises(SystemExit) as cm:
-            push_image.docker_push("ghcr.io/test/repo:latest")
-        self.assertEqual(cm.exception.code, 1)
-    
-    @patch('push_image.subprocess.run')
-    def test_docker_push_handles_calledprocesserror_without_stderr(self, mock_run):
-        """Test that docker_push handles CalledProcessError when stderr is None."""
-        import subprocess
-        # Mock subprocess.run to raise CalledProcessError with None stderr
-        error = subprocess.CalledProcessError(
-            returncode=1,
-            cmd=['docker', 'push', 'test']
-        )
-        error.stderr = None
-        mock_run.side_effect = error
+        def fail(command, timeout, on_line):
+            stream_output("abc123def456: Pushing\ndenied: permission_denied")(command, timeout, on_line)
+            raise subprocess.CalledProcessError(1, command)
+        mock_run.side_effect = fail
         
-        # Should exit with error without AttributeError
+        # Should exit with error
         with self.assertRaises(SystemExit) as cm:
             push_image.docker_push("ghcr.io/test/repo:latest")
         self.assertEqual(cm.exception.code, 1)
+        self.assertIn("denied: permission_denied", mock_log.call_args[0][1])
     
-    @patch('push_image.subprocess.run')
+    @patch('push_image.push_progress.run_streaming')
     def test_docker_push_handles_timeout(self, mock_run):
         """Test that docker_push handles TimeoutExpired correctly."""
         import subprocess
-        # Mock subprocess.run to raise TimeoutExpired
         mock_run.side_effect = subprocess.TimeoutExpired(
             cmd=['docker', 'push', 'test'],
-            timeout=60
+            timeout=600
         )
         
         # Should exit with error
@@ -219,14 +208,15 @@ class TestMainFunctionTagging(unittest.TestCase):
             push_image.main()
         
         # Verify PR tag was used
-        mock_tag.assert_called_once_with("candidate_image:latest", "ghcr.io/owner/repo:pr-42")
-        mock_push.assert_called_once_with("ghcr.io/owner/repo:pr-42")
+        mock_tag.assert_called_once_with("candidate_image:latest", "ghcr.io/owner/repo:pr-42", ANY)
+        mock_push.assert_called_once_with("ghcr.io/owner/repo:pr-42", ANY, ANY, ANY)
         
         # Verify outputs were set correctly
         output_calls = [call[0] for call in mock_output.call_args_list]
         self.assertIn(('digest', 'sha256:abc123'), output_calls)
         self.assertIn(('tag', 'ghcr.io/owner/repo:pr-42'), output_calls)
     
+    @patch.dict('os.environ', {'GITHUB_TOKEN': ''})
     @patch('push_image.docker_push')
     @patch('push_image.docker_tag')
     @patch('push_image.load_image')
@@ -247,7 +237,7 @@ class TestMainFunctionTagging(unittest.TestCase):
             push_image.main()
         
         # Verify both SHA and latest tags were used
-        tag_calls = [call[0] for call in mock_tag.call_args_list]
+        tag_calls = [call[0][:2] for call in mock_tag.call_args_list]
         self.assertIn(("candidate_image:latest", "ghcr.io/owner/repo:abc123def"), tag_calls)
         self.assertIn(("candidate_image:latest", "ghcr.io/owner/repo:latest"), tag_calls)
         
@@ -260,6 +250,536 @@ class TestMainFunctionTagging(unittest.TestCase):
         output_calls = [call[0] for call in mock_output.call_args_list]
         self.assertIn(('digest', 'sha256:def456'), output_calls)
         self.assertIn(('tag', 'ghcr.io/owner/repo:latest'), output_calls)
+    
+    
+    @patch.dict('os.environ', {'GITHUB_TOKEN': 'token123', 'GITHUB_ACTOR': 'owner'})
+    @patch('push_image.oci_registry.RegistryClient.resolve_tag', return_value="sha256:def456")
+    @patch('push_image.registry_push.retag')
+    @patch('push_image.docker_push')
+    @patch('push_image.docker_tag')
+    @patch('push_image.load_image')
+    @patch('github_actions_utils.set_github_output')
+    def test_main_event_retags_latest_with_credentials(
+        self, mock_output, mock_load, mock_tag, mock_push, mock_retag, mock_resolve
+    ):
+        """Test that latest and extra tags are retagged rather than pushed again."""
+        mock_push.return_value = "sha256:def456"
+        
+        test_args = [
+            "push_image.py",
+            "--event-name", "push",
+            "--repository", "owner/repo",
+            "--sha", "abc123def",
+            "--image-tar", "/path/to/image.tar",
+            "--extra-tag", "v1",
+            "--extra-tag", "stable"
+        ]
+        
+        with patch('sys.argv', test_args):
+            push_image.main()
+        
+        mock_push.assert_called_once_with("ghcr.io/owner/repo:abc123def", ANY, ANY, ANY)
+        self.assertEqual(mock_retag.call_args[0][1:], ("sha256:def456", ["latest", "v1", "stable"]))
+        output_calls = [call[0] for call in mock_output.call_args_list]
+        self.assertIn(('tag', 'ghcr.io/owner/repo:latest'), output_calls)
+
+
+class TestImageCache(unittest.TestCase):
+    """Test skipping docker load when the daemon already has the image."""
+    
+    IMAGE_ID = "sha256:" + "c" * 64
+    
+    def setUp(self):
+        patcher = patch('push_image.image_digest.archive_config_digest', return_value=self.IMAGE_ID)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    @patch('push_image.docker_tag')
+    @patch('push_image.github_actions_utils.log_info')
+    @patch('push_image.subprocess.run')
+    def test_cache_hit_skips_load(self, mock_run, mock_log, mock_tag):
+        """Test that an image already in the daemon is tagged rather than loaded."""
+        mock_run.return_value = MagicMock(returncode=0, stdout=self.IMAGE_ID + "\n")
+        
+        push_image.load_image("image.tar")
+        
+        mock_run.assert_called_once()
+        self.assertEqual(mock_run.call_args[0][0][:3], ["docker", "image", "inspect"])
+        mock_tag.assert_called_once_with(self.IMAGE_ID, "candidate_image:latest", None)
+        self.assertIn("Image cache hit", mock_log.call_args_list[0][0][0])
+    
+    @patch('push_image.github_actions_utils.log_info')
+    @patch('push_image.subprocess.run')
+    def test_cache_miss_loads(self, mock_run, mock_log):
+        """Test that the archive is loaded when the daemon does not have the image."""
+        mock_run.side_effect = [
+            MagicMock(returncode=1, stdout=""),
+            MagicMock(returncode=0, stdout="Loaded image: candidate_image:latest"),
+        ]
+        
+        push_image.load_image("image.tar")
+        
+        self.assertEqual(mock_run.call_args[0][0], ["docker", "load", "-i", "image.tar"])
+        self.assertIn("Image cache miss", mock_log.call_args_list[0][0][0])
+    
+    @patch('push_image.subprocess.run')
+    def test_unreadable_archive_loads(self, mock_run):
+        """Test that the archive is still loaded when its image ID cannot be read."""
+        mock_run.return_value = MagicMock(returncode=0, stdout="")
+        
+        with patch('push_image.image_digest.archive_config_digest', side_effect=ValueError("bad")):
+            push_image.load_image("image.tar")
+        
+        mock_run.assert_called_once()
+        self.assertEqual(mock_run.call_args[0][0][:2], ["docker", "load"])
+
+
+class TestDockerEngineMode(unittest.TestCase):
+    """Test loading, tagging and pushing through the Docker Engine API."""
+    
+    def setUp(self):
+        self.engine = MagicMock()
+    
+    @patch('push_image.push_progress.run_streaming')
+    def test_push_uses_engine_with_credentials(self, mock_run):
+        """Test that the digest comes from the engine's push and the CLI is not run."""
+        def push(image, auth, on_progress, timeout):
+            on_progress({"progressDetail": {}, "aux": {"Tag": "pr-42", "Digest": "sha256:fromengine"}})
+            return "sha256:fromengine"
+        self.engine.push.side_effect = push
+        
+        digest = push_image.docker_push("ghcr.io/owner/repo:pr-42", self.engine, "auth")
+        
+        self.assertEqual(digest, "sha256:fromengine")
+        self.engine.push.assert_called_once_with("ghcr.io/owner/repo:pr-42", "auth", ANY, 600)
+        mock_run.assert_not_called()
+    
+    @patch('push_image.push_progress.run_streaming')
+    def test_push_without_credentials_uses_cli(self, mock_run):
+        """Test that pushes without credentials go through the CLI, which has the login."""
+        mock_run.side_effect = stream_output("latest: digest: sha256:" + "a" * 64)
+        
+        push_image.docker_push("ghcr.io/owner/repo:pr-42", self.engine, None)
+        
+        self.engine.push.assert_not_called()
+        mock_run.assert_called_once()
+    
+    @patch('push_image.image_digest.archive_config_digest', side_effect=ValueError("unreadable"))
+    def test_load_uses_engine(self, mock_config_digest):
+        """Test that the archive is loaded through the engine."""
+        push_image.load_image("image.tar", self.engine)
+        
+        self.engine.load.assert_called_once_with("image.tar", push_image.log_progress, 300)
+    
+    def test_engine_failure_exits(self):
+        """Test that an error from the engine fails the step."""
+        self.engine.tag.side_effect = URLError("denied")
+        
+        with self.assertRaises(SystemExit) as cm:
+            push_image.docker_tag("candidate_image:latest", "ghcr.io/owner/repo:latest", self.engine)
+        self.assertEqual(cm.exception.code, 1)
+    
+    @patch.dict('os.environ', {'GITHUB_TOKEN': 'token123', 'GITHUB_ACTOR': 'owner'})
+    @patch('push_image.oci_registry.RegistryClient.resolve_tag', return_value="sha256:def456")
+    @patch('push_image.docker_push', return_value="sha256:def456")
+    @patch('push_image.docker_tag')
+    @patch('push_image.load_image')
+    @patch('github_actions_utils.set_github_output')
+    def test_main_passes_engine_and_credentials(self, mock_output, mock_load, mock_tag, mock_push, mock_resolve):
+        """Test that docker mode hands the engine and registry credentials down."""
+        args = [
+            "push_image.py",
+            "--event-name", "pull_request",
+            "--repository", "owner/repo",
+            "--sha", "abc123",
+            "--pr-number", "42",
+            "--image-tar", "/path/to/image.tar"
+        ]
+        with patch('push_image.docker_engine.engine_from_environment', return_value=self.engine), \
+                patch('sys.argv', args):
+            push_image.main()
+        
+        mock_load.assert_called_once_with("/path/to/image.tar", self.engine)
+        image, engine, auth, size = mock_push.call_args[0]
+        self.assertIs(engine, self.engine)
+        self.assertEqual(json.loads(base64.urlsafe_b64decode(auth))["password"], "token123")
+
+
+class TestDockerModeDigest(unittest.TestCase):
+    """Test where docker push mode takes the attested digest from."""
+    
+    ARGS = [
+        "push_image.py",
+        "--event-name", "pull_request",
+        "--repository", "owner/repo",
+        "--sha", "abc123",
+        "--pr-number", "42",
+        "--image-tar", "/path/to/image.tar"
+    ]
+    
+    def setUp(self):
+        for target in ('push_image.load_image', 'push_image.docker_tag'):
+            patcher = patch(target)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+    
+    @patch.dict('os.environ', {'GITHUB_TOKEN': 'token123', 'GITHUB_ACTOR': 'owner'})
+    @patch('push_image.oci_registry.RegistryClient.resolve_tag', return_value="sha256:fromregistry")
+    @patch('push_image.docker_push', return_value=None)
+    @patch('github_actions_utils.set_github_output')
+    def test_registry_digest_used_when_output_has_none(self, mock_output, mock_push, mock_resolve):
+        """Test that the registry's digest is used when the push output has none."""
+        with patch('sys.argv', self.ARGS):
+            push_image.main()
+        
+        mock_resolve.assert_called_once_with("pr-42")
+        self.assertIn(('digest', 'sha256:fromregistry'), [call[0] for call in mock_output.call_args_list])
+    
+    @patch.dict('os.environ', {'GITHUB_TOKEN': 'token123', 'GITHUB_ACTOR': 'owner'})
+    @patch('push_image.oci_registry.RegistryClient.resolve_tag', return_value="sha256:fromregistry")
+    @patch('push_image.docker_push', return_value="sha256:fromoutput")
+    @patch('github_actions_utils.set_github_output')
+    def test_mismatched_digests_exit(self, mock_output, mock_push, mock_resolve):
+        """Test that a push output digest the registry disagrees with is an error."""
+        with patch('sys.argv', self.ARGS):
+            with self.assertRaises(SystemExit) as cm:
+                push_image.main()
+        
+        self.assertEqual(cm.exception.code, 1)
+        mock_output.assert_not_called()
+    
+    @patch.dict('os.environ', {'GITHUB_TOKEN': ''})
+    @patch('push_image.docker_push', return_value=None)
+    @patch('github_actions_utils.set_github_output')
+    def test_no_digest_anywhere_exits(self, mock_output, mock_push):
+        """Test that without registry access or a digest in the output the push fails."""
+        with patch('sys.argv', self.ARGS):
+            with self.assertRaises(SystemExit) as cm:
+                push_image.main()
+        
+        self.assertEqual(cm.exception.code, 1)
+    
+    @patch.dict('os.environ', {'GITHUB_TOKEN': ''})
+    @patch('push_image.image_digest.verify_archive', return_value=(2_000_000, 0.5))
+    @patch('push_image.docker_push', return_value="sha256:abc123")
+    @patch('github_actions_utils.set_github_output')
+    def test_verify_runs_before_push(self, mock_output, mock_push, mock_verify):
+        """Test that --verify checks the archive before pushing."""
+        with patch('sys.argv', self.ARGS + ["--verify", "--verify-workers", "3"]):
+            push_image.main()
+        
+        mock_verify.assert_called_once_with("/path/to/image.tar", 3)
+        mock_push.assert_called_once()
+    
+    @patch('push_image.image_digest.verify_archive', side_effect=ValueError("Blob 1/layer.tar is corrupt"))
+    @patch('push_image.docker_push')
+    def test_verify_failure_stops_push(self, mock_push, mock_verify):
+        """Test that a corrupt archive fails before anything is pushed."""
+        with patch('sys.argv', self.ARGS + ["--verify"]):
+            with self.assertRaises(SystemExit) as cm:
+                push_image.main()
+        
+        self.assertEqual(cm.exception.code, 1)
+        mock_push.assert_not_called()
+    
+    @patch.dict('os.environ', {'GITHUB_TOKEN': ''})
+    @patch('github_actions_utils.github_action_log')
+    @patch('push_image.docker_push', side_effect=push_image.github_actions_utils.DeadlineExceeded("docker_push", 5))
+    @patch('github_actions_utils.set_github_output')
+    def test_exhausted_time_budget_exits(self, mock_output, mock_push, mock_log):
+        """Test that running out of --time-budget fails the push and names the phase."""
+        self.addCleanup(push_image.github_actions_utils.deadline.start, None)
+        with patch('sys.argv', self.ARGS + ["--time-budget", "5"]):
+            with self.assertRaises(SystemExit) as cm:
+                push_image.main()
+        
+        self.assertEqual(cm.exception.code, 1)
+        mock_output.assert_not_called()
+        self.assertIn("time budget of 5s used up before docker_push", mock_log.call_args[0][1])
+
+
+class TestMalformedArchive(unittest.TestCase):
+    """Test that archives with malformed metadata fail cleanly rather than with a traceback."""
+    
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = f"{self.tmp.name}/image.tar"
+        # Two layers but only one diff ID in the config
+        config = json.dumps({"rootfs": {"type": "layers", "diff_ids": ["sha256:" + "a" * 64]}}).encode()
+        members = {
+            "config.json": config,
+            "0/layer.tar": b"base layer",
+            "1/layer.tar": b"top layer",
+            "manifest.json": json.dumps([
+                {"Config": "config.json", "Layers": ["0/layer.tar", "1/layer.tar"]}
+            ]).encode(),
+        }
+        with tarfile.open(self.path, "w") as archive:
+            for name, data in members.items():
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                archive.addfile(info, io.BytesIO(data))
+    
+    @patch('push_image.github_actions_utils.log_info')
+    @patch('push_image.github_actions_utils.github_action_log')
+    def test_truncated_diff_ids_fail_verification(self, mock_log, mock_info):
+        """Test that a config with fewer diff IDs than layers exits 1 with an error."""
+        with self.assertRaises(SystemExit) as cm:
+            push_image.verify_image(self.path, 2)
+        
+        self.assertEqual(cm.exception.code, 1)
+        self.assertIn("Image archive failed verification", mock_log.call_args[0][1])
+    
+    @patch('push_image.github_actions_utils.log_info')
+    def test_truncated_diff_ids_are_a_publish_cache_miss(self, mock_info):
+        """Test that the publish cache check treats the malformed archive as a miss."""
+        client = MagicMock()
+        
+        self.assertIsNone(push_image.published_digest(client, self.path, "pr-42"))
+        client.resolve_tag.assert_not_called()
+
+
+class TestRegistryPushMode(unittest.TestCase):
+    """Test pushing straight from the archive in registry push mode."""
+    
+    def setUp(self):
+        env = patch.dict('os.environ', {'GITHUB_TOKEN': 'token123', 'GITHUB_ACTOR': 'owner'})
+        env.start()
+        self.addCleanup(env.stop)
+    
+    @patch('push_image.load_image')
+    @patch('push_image.registry_push.push_archive')
+    @patch('github_actions_utils.set_github_output')
+    def test_pr_event_pushes_archive_without_loading(self, mock_output, mock_push, mock_load):
+        """Test that registry mode pushes the archive and never loads the image."""
+        mock_push.return_value = "sha256:abc123"
+        
+        test_args = [
+            "push_image.py",
+            "--event-name", "pull_request",
+            "--repository", "Owner/Repo",
+            "--sha", "abc123",
+            "--pr-number", "42",
+            "--image-tar", "/path/to/image.tar",
+            "--push-mode", "registry"
+        ]
+        
+        with patch('sys.argv', test_args):
+            push_image.main()
+        
+        mock_load.assert_not_called()
+        client, image_tar, tag = mock_push.call_args[0]
+        self.assertEqual(client.repository, "owner/repo")
+        self.assertEqual((image_tar, tag), ("/path/to/image.tar", "pr-42"))
+        output_calls = [call[0] for call in mock_output.call_args_list]
+        self.assertIn(('digest', 'sha256:abc123'), output_calls)
+        self.assertIn(('tag', 'ghcr.io/Owner/Repo:pr-42'), output_calls)
+    
+    @patch('push_image.registry_push.retag')
+    @patch('push_image.registry_push.push_archive')
+    @patch('github_actions_utils.set_github_output')
+    def test_main_event_pushes_sha_then_retags_latest(self, mock_output, mock_push, mock_retag):
+        """Test that registry mode pushes the SHA tag once and retags it as latest."""
+        mock_push.return_value = "sha256:def456"
+        
+        test_args = [
+            "push_image.py",
+            "--event-name", "push",
+            "--repository", "owner/repo",
+            "--sha", "abc123def",
+            "--image-tar", "/path/to/image.tar",
+            "--push-mode", "registry"
+        ]
+        
+        with patch('sys.argv', test_args):
+            push_image.main()
+        
+        self.assertEqual([call[0][2] for call in mock_push.call_args_list], ["abc123def"])
+        mock_retag.assert_called_once()
+        self.assertEqual(mock_retag.call_args[0][1:], ("sha256:def456", ["latest"]))
+        output_calls = [call[0] for call in mock_output.call_args_list]
+        self.assertIn(('digest', 'sha256:def456'), output_calls)
+        self.assertIn(('tag', 'ghcr.io/owner/repo:latest'), output_calls)
+    
+    @patch('push_image.registry_push.push_archive')
+    def test_registry_error_exits(self, mock_push):
+        """Test that a registry error exits with an error."""
+        mock_push.side_effect = HTTPError("https://ghcr.io/v2/", 403, "Forbidden", None, None)
+        client = MagicMock()
+        
+        with self.assertRaises(SystemExit) as cm:
+            push_image.registry_push_archive(client, "/path/to/image.tar", "pr-42")
+        self.assertEqual(cm.exception.code, 1)
+    
+    @patch('push_image.registry_push.push_archive')
+    def test_unreadable_archive_exits(self, mock_push):
+        """Test that an archive that cannot be read exits with an error."""
+        mock_push.side_effect = FileNotFoundError("/path/to/image.tar")
+        client = MagicMock()
+        
+        with self.assertRaises(SystemExit) as cm:
+            push_image.registry_push_archive(client, "/path/to/image.tar", "pr-42")
+        self.assertEqual(cm.exception.code, 1)
+    
+    @patch('push_image.registry_push.retag')
+    def test_retag_error_exits(self, mock_retag):
+        """Test that a failed retag exits with an error."""
+        mock_retag.side_effect = URLError("connection refused")
+        
+        with self.assertRaises(SystemExit) as cm:
+            push_image.retag_image(MagicMock(), "sha256:abc123", ["latest"])
+        self.assertEqual(cm.exception.code, 1)
+    
+    def test_registry_mode_requires_token(self):
+        """Test that registry mode fails fast without GITHUB_TOKEN."""
+        test_args = [
+            "push_image.py",
+            "--event-name", "push",
+            "--repository", "owner/repo",
+            "--sha", "abc123def",
+            "--image-tar", "/path/to/image.tar",
+            "--push-mode", "registry"
+        ]
+        
+        with patch.dict('os.environ', {'GITHUB_TOKEN': ''}), patch('sys.argv', test_args):
+            with self.assertRaises(SystemExit) as cm:
+                push_image.parse_args()
+        self.assertEqual(cm.exception.code, 2)
+
+
+class TestPublishCache(unittest.TestCase):
+    """Test skipping the push when the tag already points at the archive's image."""
+    
+    ARGS = [
+        "push_image.py",
+        "--event-name", "push",
+        "--repository", "owner/repo",
+        "--sha", "abc123def",
+        "--image-tar", "/path/to/image.tar"
+    ]
+    
+    def setUp(self):
+        patchers = [
+            patch.dict('os.environ', {'GITHUB_TOKEN': 'token123', 'GITHUB_ACTOR': 'owner'}),
+            patch('push_image.image_digest.archive_manifest_digest', return_value="sha256:local"),
+            patch('push_image.registry_push.retag'),
+            patch('push_image.github_actions_utils.log_info'),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+    
+    @patch('push_image.oci_registry.RegistryClient.resolve_tag', return_value="sha256:local")
+    @patch('push_image.registry_push.push_archive')
+    @patch('github_actions_utils.set_github_output')
+    def test_registry_mode_skips_unchanged_image(self, mock_output, mock_push, mock_resolve):
+        """Test that registry mode uploads nothing when the tag already has the archive's digest."""
+        with patch('sys.argv', self.ARGS + ["--push-mode", "registry"]):
+            push_image.main()
+        
+        mock_resolve.assert_called_once_with("abc123def")
+        mock_push.assert_not_called()
+        self.assertEqual(push_image.registry_push.retag.call_args[0][1:], ("sha256:local", ["latest"]))
+        output_calls = [call[0] for call in mock_output.call_args_list]
+        self.assertIn(('digest', 'sha256:local'), output_calls)
+        self.assertIn(('tag', 'ghcr.io/owner/repo:latest'), output_calls)
+        messages = [call[0][0] for call in push_image.github_actions_utils.log_info.call_args_list]
+        self.assertIn("Publish cache hit: owner/repo:abc123def already points at sha256:local, skipping the push",
+                      messages)
+    
+    @patch('push_image.oci_registry.RegistryClient.resolve_tag')
+    @patch('push_image.oci_registry.RegistryClient.get_manifest')
+    @patch('push_image.image_digest.archive_config_digest', return_value="sha256:config")
+    @patch('push_image.docker_push')
+    @patch('push_image.load_image')
+    @patch('github_actions_utils.set_github_output')
+    def test_docker_mode_skips_load_and_push(
+        self, mock_output, mock_load, mock_push, mock_config, mock_get_manifest, mock_resolve
+    ):
+        """Test that docker mode neither loads nor pushes when the tag's manifest has the archive's config."""
+        # As pushed by the daemon: recompressed layers, so not the manifest computed from the archive
+        manifest = json.dumps({
+            "schemaVersion": 2,
+            "mediaType": "application/vnd.docker.distribution.manifest.v2+json",
+            "config": {"digest": "sha256:config", "size": 1000},
+            "layers": [{"digest": "sha256:recompressed", "size": 2000}],
+        }).encode()
+        mock_get_manifest.return_value = ("application/vnd.docker.distribution.manifest.v2+json", manifest)
+        pushed = push_image.image_digest.sha256_digest(manifest)
+        
+        with patch('sys.argv', self.ARGS):
+            push_image.main()
+        
+        mock_get_manifest.assert_called_once_with("abc123def")
+        mock_resolve.assert_not_called()
+        push_image.image_digest.archive_manifest_digest.assert_not_called()
+        mock_load.assert_not_called()
+        mock_push.assert_not_called()
+        self.assertEqual(push_image.registry_push.retag.call_args[0][1:], (pushed, ["latest"]))
+        self.assertIn(('digest', pushed), [call[0] for call in mock_output.call_args_list])
+        messages = [call[0][0] for call in push_image.github_actions_utils.log_info.call_args_list]
+        self.assertIn(f"Publish cache hit: owner/repo:abc123def already points at {pushed}, skipping the push",
+                      messages)
+    
+    @patch('push_image.oci_registry.RegistryClient.get_manifest')
+    @patch('push_image.image_digest.archive_config_digest', return_value="sha256:config")
+    def test_docker_mode_other_image_is_a_miss(self, mock_config, mock_get_manifest):
+        """Test that docker mode pushes over a tag that is missing, another image, or not an image manifest."""
+        outcomes = {
+            "missing": HTTPError("https://ghcr.io/v2/", 404, "Not Found", None, None),
+            "other image": ("", json.dumps({"config": {"digest": "sha256:other"}}).encode()),
+            "index": ("", json.dumps({"manifests": [{"digest": "sha256:config"}]}).encode()),
+            "not json": ("", b"<html>"),
+            "forbidden": HTTPError("https://ghcr.io/v2/", 403, "Forbidden", None, None),
+        }
+        for name, outcome in outcomes.items():
+            with self.subTest(outcome=name):
+                if isinstance(outcome, Exception):
+                    mock_get_manifest.side_effect = outcome
+                else:
+                    mock_get_manifest.side_effect = None
+                    mock_get_manifest.return_value = outcome
+                client = push_image.oci_registry.RegistryClient("owner/repo", "owner", "token123")
+                
+                self.assertIsNone(
+                    push_image.published_digest(client, "/path/to/image.tar", "pr-42", by_config=True)
+                )
+    
+    @patch('push_image.oci_registry.RegistryClient.resolve_tag', return_value="sha256:other")
+    @patch('push_image.registry_push.push_archive', return_value="sha256:local")
+    @patch('github_actions_utils.set_github_output')
+    def test_changed_image_is_pushed(self, mock_output, mock_push, mock_resolve):
+        """Test that a tag pointing at another image is pushed over."""
+        with patch('sys.argv', self.ARGS + ["--push-mode", "registry"]):
+            push_image.main()
+        
+        mock_push.assert_called_once()
+        self.assertIn(('digest', 'sha256:local'), [call[0] for call in mock_output.call_args_list])
+    
+    @patch('push_image.oci_registry.RegistryClient.resolve_tag')
+    def test_lookup_failure_is_a_miss(self, mock_resolve):
+        """Test that a tag that is missing or cannot be looked up means pushing."""
+        for outcome in [None, URLError("connection refused"),
+                        HTTPError("https://ghcr.io/v2/", 403, "Forbidden", None, None)]:
+            with self.subTest(outcome=outcome):
+                if isinstance(outcome, Exception):
+                    mock_resolve.side_effect = outcome
+                else:
+                    mock_resolve.side_effect = None
+                    mock_resolve.return_value = outcome
+                client = push_image.oci_registry.RegistryClient("owner/repo", "owner", "token123")
+                
+                self.assertIsNone(push_image.published_digest(client, "/path/to/image.tar", "pr-42"))
+    
+    @patch('push_image.oci_registry.RegistryClient.resolve_tag')
+    def test_unreadable_archive_is_a_miss(self, mock_resolve):
+        """Test that an archive whose digest cannot be computed is pushed without asking the registry."""
+        push_image.image_digest.archive_manifest_digest.side_effect = ValueError("no manifest.json")
+        client = push_image.oci_registry.RegistryClient("owner/repo", "owner", "token123")
+        
+        self.assertIsNone(push_image.published_digest(client, "/path/to/image.tar", "pr-42"))
+        mock_resolve.assert_not_called()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Unit tests for push_progress.py module.
+
+Progress is fed from canned CLI output and Engine API records with a fake
+clock; run_streaming is run against small Python child processes.
+"""
+
+import subprocess
+import sys
+import time
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+# Add parent directory to path to import the module in a way that works across environments
+script_dir = str(Path(__file__).resolve().parent)
+if script_dir not in sys.path:
+    sys.path.insert(0, script_dir)
+import push_progress
+from test_github_actions_utils import FakeClock
+
+DIGEST = "sha256:" + "a" * 64
+
+
+class TestPushProgress(unittest.TestCase):
+    """Test coalescing push progress into log lines."""
+    
+    def setUp(self):
+        self.clock = FakeClock()
+        self.progress = push_progress.PushProgress(interval=10, tail_lines=3, clock=self.clock.time)
+        patcher = patch('push_progress.github_actions_utils.log_info')
+        self.mock_log = patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def logged(self):
+        """Messages logged so far."""
+        return [call[0][0] for call in self.mock_log.call_args_list]
+    
+    def test_cli_progress_is_coalesced(self):
+        """Test that layer lines are only summarised once the interval has passed."""
+        for line in ["aaaaaaaaaaaa: Preparing\n", "bbbbbbbbbbbb: Preparing\n", "aaaaaaaaaaaa: Pushed\n"]:
+            self.progress.line(line)
+        self.assertEqual(self.logged(), [])
+        
+        self.clock.sleep(12)
+        self.progress.line("bbbbbbbbbbbb: Layer already exists\n")
+        
+        self.assertEqual(self.logged(), ["Pushed 2/2 layers after 12s"])
+    
+    def test_engine_progress_reports_throughput(self):
+        """Test that byte counts from progress records give MB sent and MB/s."""
+        for elapsed, current in ((0, 10_000_000), (10, 20_000_000)):
+            self.clock.sleep(elapsed)
+            self.progress.record({
+                "status": "Pushing", "id": "layer1", "progressDetail": {"current": current, "total": 40_000_000},
+            })
+        
+        self.assertEqual(self.logged(), ["Pushed 0/1 layers, 20 MB sent (2.0 MB/s) after 10s"])
+        
+        self.clock.sleep(10)
+        self.progress.record({"status": "Pushed", "id": "layer1", "progressDetail": {}})
+        self.assertEqual(self.logged()[-1], "Pushed 1/1 layers, 40 MB sent (2.0 MB/s) after 20s")
+    
+    def test_digest_logged_as_soon_as_seen(self):
+        """Test that the digest is picked up from CLI output and aux records without waiting."""
+        self.progress.line(f"latest: digest: {DIGEST} size: 1234\n")
+        self.assertEqual(self.progress.digest, DIGEST)
+        self.assertEqual(self.logged(), [f"Digest: {DIGEST}"])
+        
+        engine_progress = push_progress.PushProgress(clock=self.clock.time)
+        engine_progress.record({"progressDetail": {}, "aux": {"Tag": "latest", "Digest": DIGEST, "Size": 1234}})
+        self.assertEqual(engine_progress.digest, DIGEST)
+    
+    def test_tail_is_bounded(self):
+        """Test that only the last lines of output are kept."""
+        for index in range(1000):
+            self.progress.line(f"line {index}\n")
+        
+        self.assertEqual(self.progress.output(), "line 997\nline 998\nline 999")
+
+
+class TestRunStreaming(unittest.TestCase):
+    """Test running a command and handling its output line by line."""
+    
+    def python(self, code):
+        return [sys.executable, "-c", code]
+    
+    def test_lines_from_both_streams(self):
+        """Test that standard output and error both reach the callback."""
+        lines = []
+        
+        push_progress.run_streaming(
+            self.python("import sys; print('out', flush=True); print('err', file=sys.stderr)"), 30, lines.append
+        )
+        
+        self.assertEqual(sorted(lines), ["err\n", "out\n"])
+    
+    def test_lines_arrive_before_exit(self):
+        """Test that a line is handled while the command is still running."""
+        arrived = []
+        
+        push_progress.run_streaming(
+            self.python("import time; print('first', flush=True); time.sleep(1)"),
+            30,
+            lambda line: arrived.append(time.monotonic()),
+        )
+        
+        self.assertEqual(len(arrived), 1)
+        self.assertGreater(time.monotonic() - arrived[0], 0.5)
+    
+    def test_failure(self):
+        """Test that a non-zero exit raises CalledProcessError."""
+        with self.assertRaises(subprocess.CalledProcessError) as cm:
+            push_progress.run_streaming(self.python("raise SystemExit(3)"), 30, lambda line: None)
+        self.assertEqual(cm.exception.returncode, 3)
+    
+    def test_timeout_kills_command(self):
+        """Test that a command that runs past the timeout is killed."""
+        with self.assertRaises(subprocess.TimeoutExpired):
+            push_progress.run_streaming(self.python("import time; time.sleep(30)"), 0.2, lambda line: None)
+
+
+if __name__ == "__main__":
+    unittest.main()
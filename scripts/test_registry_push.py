@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+Unit tests for registry_push.py module.
+
+These tests push small `docker save` archives built in a temporary directory to
+a local in-memory registry stand-in.
+"""
+
+import json
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+from urllib.error import HTTPError, URLError
+
+# Add parent directory to path to import the module in a way that works across environments
+script_dir = str(Path(__file__).resolve().parent)
+if script_dir not in sys.path:
+    sys.path.insert(0, script_dir)
+import image_digest
+import oci_registry
+import registry_push
+from archive_fixtures import sha256, write_archive
+from registry_stand_in import StandInRegistry
+from stand_in_server import StandInServer
+
+
+class TestPushArchive(unittest.TestCase):
+    """Test pushing archives to a registry stand-in."""
+    
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = f"{self.tmp.name}/image.tar"
+        self.layers = [b"base layer " * 100, b"top layer"]
+        self.config = write_archive(self.path, self.layers)
+        self.registry = StandInRegistry("owner", "token123")
+    
+    def tearDown(self):
+        self.tmp.cleanup()
+    
+    def push(self, server, tag, chunk_size=registry_push.DEFAULT_CHUNK_SIZE):
+        """Push the test archive to the stand-in under a tag."""
+        client = oci_registry.RegistryClient("owner/repo", "owner", "token123", server.base_url)
+        try:
+            return registry_push.push_archive(client, self.path, tag, chunk_size)
+        finally:
+            client.close()
+    
+    def test_push_uploads_blobs_and_manifest(self):
+        """Test that every blob is uploaded and the tag resolves to the manifest."""
+        with StandInServer(self.registry.handle) as server:
+            digest = self.push(server, "pr-42")
+        
+        self.assertEqual(self.registry.tags[("owner/repo", "pr-42")], digest)
+        for data in [self.config] + self.layers:
+            self.assertEqual(self.registry.blobs[("owner/repo", sha256(data))], data)
+        media_type, manifest = self.registry.manifests[("owner/repo", digest)]
+        self.assertEqual(media_type, image_digest.OCI_MANIFEST_MEDIA_TYPE)
+        self.assertEqual(digest, sha256(manifest))
+    
+    def test_push_skips_existing_blobs(self):
+        """Test that a second push only checks blobs and stores the manifest."""
+        with StandInServer(self.registry.handle) as server:
+            first = self.push(server, "abc123")
+            del server.requests[:]
+            second = self.push(server, "latest")
+        
+        self.assertEqual(first, second)
+        methods = {request.method for request in server.requests if not request.path.startswith("/token")}
+        self.assertEqual(methods, {"HEAD", "PUT"})
+    
+    def test_push_large_blob_in_chunks(self):
+        """Test that blobs larger than the chunk size are uploaded in chunks."""
+        with StandInServer(self.registry.handle) as server:
+            self.push(server, "pr-42", chunk_size=256)
+        
+        patches = [request for request in server.requests if request.method == "PATCH"]
+        self.assertEqual(len(patches), 5)
+        self.assertEqual(patches[1].headers["Content-Range"], "256-511")
+        self.assertEqual(self.registry.blobs[("owner/repo", sha256(self.layers[0]))], self.layers[0])
+    
+    def test_push_returns_digest_computed_from_archive(self):
+        """Test that the pushed digest is the one computed before uploading."""
+        expected = image_digest.archive_manifest_digest(self.path)
+        
+        with StandInServer(self.registry.handle) as server:
+            digest = self.push(server, "pr-42")
+        
+        self.assertEqual(digest, expected)
+    
+    def test_push_rejects_registry_digest_mismatch(self):
+        """Test that a registry reporting another digest fails the push."""
+        def handler(request):
+            status, headers, body = self.registry.handle(request)
+            if request.method == "PUT" and "/manifests/" in request.path and status == 201:
+                headers = {**headers, "Docker-Content-Digest": "sha256:" + "0" * 64}
+            return status, headers, body
+        
+        with StandInServer(handler) as server:
+            with self.assertRaises(URLError):
+                self.push(server, "pr-42")
+    
+    def test_failed_blob_cancels_queued_uploads(self):
+        """Test that a failed upload is raised at once, not after the blobs ahead of it, and queued ones dropped."""
+        write_archive(self.path, [b"layer %d" % index * (10 - index) for index in range(6)])
+        started = []
+        
+        def push_blob(client, archive, blob, chunk_size, state):
+            started.append(blob.digest)
+            if len(started) == 1:
+                # The largest blob is still uploading when the next one fails
+                time.sleep(0.5)
+            elif len(started) == 2:
+                raise HTTPError("https://registry/v2/", 403, "Forbidden", {}, None)
+            else:
+                time.sleep(0.2)
+            return True
+        
+        with patch('registry_push.push_blob', side_effect=push_blob):
+            with self.assertRaises(HTTPError):
+                registry_push.push_archive(MagicMock(), self.path, "pr-42", workers=2)
+        
+        # Uploads already running when the failure is seen finish; the rest never start
+        self.assertLessEqual(len(started), 3)
+
+
+def failing_patches(handler, failures):
+    """
+    Wrap a stand-in handler so that chosen PATCH requests fail with 503.
+    
+    Args:
+        handler: Handler to wrap
+        failures: Predicate called with the 1-based count of PATCH requests seen
+    """
+    seen = []
+    
+    def wrapped(request):
+        if request.method == "PATCH":
+            seen.append(request)
+            if failures(len(seen)):
+                return 503, {}, b""
+        return handler(request)
+    
+    return wrapped
+
+
+class TestResumableUpload(unittest.TestCase):
+    """Test chunk retries and resuming uploads from a state file."""
+    
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = f"{self.tmp.name}/image.tar"
+        self.state_path = f"{self.tmp.name}/upload_state.json"
+        self.layer = b"0123456789" * 110
+        write_archive(self.path, [self.layer])
+        self.registry = StandInRegistry("owner", "token123")
+    
+    def tearDown(self):
+        self.tmp.cleanup()
+    
+    def push(self, server, state=None):
+        """Push the test archive in 256 byte chunks."""
+        client = oci_registry.RegistryClient("owner/repo", "owner", "token123", server.base_url)
+        try:
+            return registry_push.push_archive(client, self.path, "pr-42", 256, state=state)
+        finally:
+            client.close()
+    
+    def content_ranges(self, server):
+        """Content-Range of every PATCH that reached the server."""
+        return [r.headers["Content-Range"] for r in server.requests if r.method == "PATCH"]
+    
+    def test_failed_chunk_resent_from_committed_offset(self):
+        """Test that a failed chunk is resent after asking the registry for its offset."""
+        handler = failing_patches(self.registry.handle, lambda count: count == 2)
+        with StandInServer(handler) as server:
+            self.push(server)
+        
+        self.assertEqual(self.registry.blobs[("owner/repo", sha256(self.layer))], self.layer)
+        self.assertEqual(self.content_ranges(server)[:3], ["0-255", "256-511", "256-511"])
+        self.assertIn("GET", [r.method for r in server.requests if "/blobs/uploads/" in r.path])
+    
+    def test_retried_run_resumes_from_state_file(self):
+        """Test that a later run carries on from the offset the failed run recorded."""
+        handler = failing_patches(self.registry.handle, lambda count: count > 2)
+        with StandInServer(handler) as server:
+            with self.assertRaises(HTTPError):
+                self.push(server, registry_push.UploadState(self.state_path))
+        
+        with open(self.state_path, encoding="utf-8") as f:
+            [entry] = json.load(f)["uploads"].values()
+        self.assertEqual(entry["offset"], 512)
+        
+        with StandInServer(self.registry.handle) as server:
+            self.push(server, registry_push.UploadState(self.state_path))
+        
+        self.assertEqual(self.content_ranges(server), ["512-767", "768-1023", "1024-1099"])
+        self.assertEqual(self.registry.blobs[("owner/repo", sha256(self.layer))], self.layer)
+        self.assertFalse(Path(self.state_path).exists())
+    
+    def test_expired_session_starts_again(self):
+        """Test that a session the registry no longer knows is restarted from zero."""
+        state = registry_push.UploadState(self.state_path)
+        state.record(f"owner/repo@{sha256(self.layer)}", "/v2/owner/repo/blobs/uploads/gone", 512)
+        
+        with StandInServer(self.registry.handle) as server:
+            self.push(server, registry_push.UploadState(self.state_path))
+        
+        self.assertEqual(self.content_ranges(server)[0], "0-255")
+        self.assertEqual(self.registry.blobs[("owner/repo", sha256(self.layer))], self.layer)
+    
+    def test_unreadable_state_file_ignored(self):
+        """Test that a corrupt state file does not stop the push."""
+        Path(self.state_path).write_text("not json")
+        
+        with StandInServer(self.registry.handle) as server:
+            self.push(server, registry_push.UploadState(self.state_path))
+        
+        self.assertEqual(self.registry.blobs[("owner/repo", sha256(self.layer))], self.layer)
+
+
+class TestRetag(unittest.TestCase):
+    """Test adding tags to a pushed manifest."""
+    
+    def setUp(self):
+        self.registry = StandInRegistry("owner", "token123")
+        self.digest = self.registry.add_manifest(
+            "owner/repo", b'{"layers": []}', image_digest.OCI_MANIFEST_MEDIA_TYPE, "abc123"
+        )
+    
+    def test_retag_stores_manifest_under_each_tag(self):
+        """Test that each tag costs one manifest PUT and no blob requests."""
+        with StandInServer(self.registry.handle) as server:
+            client = oci_registry.RegistryClient("owner/repo", "owner", "token123", server.base_url)
+            client.resolve_tag("abc123")
+            del server.requests[:]
+            registry_push.retag(client, self.digest, ["latest", "v1"])
+            client.close()
+        
+        self.assertEqual(self.registry.tags[("owner/repo", "latest")], self.digest)
+        self.assertEqual(self.registry.tags[("owner/repo", "v1")], self.digest)
+        self.assertEqual([(r.method, r.path) for r in server.requests], [
+            ("GET", f"/v2/owner/repo/manifests/{self.digest}"),
+            ("PUT", "/v2/owner/repo/manifests/latest"),
+            ("PUT", "/v2/owner/repo/manifests/v1"),
+        ])
+    
+    def test_retag_without_tags_sends_nothing(self):
+        """Test that retagging with no tags makes no requests."""
+        client = MagicMock()
+        
+        registry_push.retag(client, self.digest, [])
+        
+        client.get_manifest.assert_not_called()
+    
+    def test_retag_rejects_changed_digest(self):
+        """Test that a registry storing a different manifest is reported."""
+        client = MagicMock()
+        client.get_manifest.return_value = (image_digest.OCI_MANIFEST_MEDIA_TYPE, b"{}")
+        client.put_manifest.return_value = "sha256:other"
+        
+        with self.assertRaises(URLError):
+            registry_push.retag(client, self.digest, ["latest"])
+
+
+if __name__ == "__main__":
+    unittest.main()